@@ -0,0 +1,627 @@
+"""Streaming alerts on the live MQTT feed: threshold and staleness rules, evaluated as each reading arrives.
+
+Subscribes to ghanode/sensor and the compact ghanode/sensor/cbor like
+latest.py, runs each message through sensor_pipeline.py and hands every valid
+reading to the rules in the same callback, so an alert goes out milliseconds
+after the reading instead of a Grafana poll interval plus one OpenSearch query
+per rule later, and the cost does not grow with the number of greenhouses.
+
+Each sensor keeps one ring buffer per (field, window length) the rules use,
+holding that window's readings with a running sum and monotonic min/max
+deques: min, max, mean and rate of change cost O(1) amortized per reading,
+however long the window. Window time is the reading's @timestamp; a reading
+older than the newest one in its window is counted as late and left out. A
+rule fires once when its condition starts to hold for a sensor and resolves
+once when it stops. Staleness is about arrival time: the sensors a staleness
+rule covers are kept least recently heard first and swept every second, and a
+sweep only touches the ones that have gone silent. Only sensors heard since
+the start can go stale.
+
+Rules are a JSON list, from the ALERTS_RULES file or else DEFAULT_RULES:
+
+    {"name": "too-hot", "field": "temperature_c", "stat": "max", "op": ">", "value": 35, "window_s": 300}
+    {"name": "heating-fast", "field": "temperature_c", "stat": "rate", "op": ">", "value": 1.5, "window_s": 600}
+    {"name": "silent", "stale_after_s": 900, "sensors": "gh1-*"}
+
+stat is value (the newest reading), min, max, mean or rate (per minute, oldest
+to newest reading in the window); sensors is an optional fnmatch pattern.
+Alerts are printed and also sent to ALERTS_WEBHOOK_URL (a JSON POST) and
+ALERTS_SMTP_HOST / ALERTS_SMTP_TO (one mail each) when set; each sink delivers
+from its own queue and thread, so a slow one never holds up evaluation.
+
+    python alerts.py serve                               # rules from ALERTS_RULES, or DEFAULT_RULES
+    python alerts.py receive --port 8083                 # webhook stand-in: prints and keeps what it is sent
+    python alerts.py bench --sensors 500 --rules 20      # rule evaluations per second, ring buffers vs rescans
+"""
+import argparse
+import fnmatch
+import json
+import operator
+import os
+import queue
+import random
+import smtplib
+import threading
+import time
+import urllib.request
+from collections import OrderedDict, deque
+from datetime import datetime, timedelta, timezone
+from email.message import EmailMessage
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import sensor_pipeline
+from latency import latency_summary
+from latest import MqttFeed
+
+OPS = {">": operator.gt, ">=": operator.ge, "<": operator.lt, "<=": operator.le}
+STATS = ("value", "min", "max", "mean", "rate")
+FIELDS = ("temperature_c", "humidity_pct", "light")
+
+DEFAULT_RULES = [
+    {"name": "too-hot", "field": "temperature_c", "stat": "max", "op": ">", "value": 35, "window_s": 300},
+    {"name": "too-cold", "field": "temperature_c", "stat": "min", "op": "<", "value": 5, "window_s": 300},
+    {"name": "heating-fast", "field": "temperature_c", "stat": "rate", "op": ">", "value": 1.5, "window_s": 600},
+    {"name": "humid", "field": "humidity_pct", "stat": "mean", "op": ">", "value": 90, "window_s": 900},
+    {"name": "silent", "stale_after_s": 900},
+]
+
+
+def settings():
+    return {
+        "mqtt": {
+            "host": os.getenv("MQTT_HOST", "mqtt"),
+            "port": int(os.getenv("MQTT_PORT", "1883")),
+            "username": os.getenv("MQTT_USER", "ghasensor"),
+            "password": os.getenv("MQTT_PASS", ""),
+            "topic": os.getenv("MQTT_TOPIC", "ghanode/sensor"),
+            "compact_topic": os.getenv("MQTT_COMPACT_TOPIC", "ghanode/sensor/cbor"),
+            "client_id": os.getenv("MQTT_CLIENT_ID", "ghanode-alerts"),
+        },
+        "rules": os.getenv("ALERTS_RULES", ""),
+        "webhook_url": os.getenv("ALERTS_WEBHOOK_URL", ""),
+        "smtp": {
+            "host": os.getenv("ALERTS_SMTP_HOST", ""),
+            "port": int(os.getenv("ALERTS_SMTP_PORT", "25")),
+            "sender": os.getenv("ALERTS_SMTP_FROM", "alerts@gha.local"),
+            "to": [a for a in os.getenv("ALERTS_SMTP_TO", "").split(",") if a],
+        },
+        "port": int(os.getenv("ALERTS_RECEIVER_PORT", "8083")),
+    }
+
+
+# --- rules -------------------------------------------------------------------
+
+
+class Rule:
+    """One rule from the JSON list; raises ValueError naming the rule when it is malformed."""
+
+    def __init__(self, spec):
+        self.name = spec.get("name")
+        if not isinstance(self.name, str) or not self.name:
+            raise ValueError(f"rule without a name: {spec!r}")
+        self.sensors = spec.get("sensors")
+        self.stale_after_s = spec.get("stale_after_s")
+        self.kind = "stale" if self.stale_after_s is not None else "threshold"
+        try:
+            if self.kind == "stale":
+                self.stale_after_s = float(self.stale_after_s)
+                if self.stale_after_s <= 0:
+                    raise ValueError("stale_after_s must be positive")
+                return
+            self.field = spec["field"]
+            self.stat = spec.get("stat", "value")
+            if self.stat not in STATS:
+                raise ValueError(f"stat must be one of {', '.join(STATS)}")
+            self.op_name = spec["op"]
+            self.op = OPS[self.op_name]
+            self.value = float(spec["value"])
+            self.window_s = float(spec.get("window_s", 0))
+            if self.window_s < 0:
+                raise ValueError("window_s must not be negative")
+        except KeyError as e:
+            raise ValueError(f"rule {self.name}: missing or unknown {e}") from None
+        except (TypeError, ValueError) as e:
+            raise ValueError(f"rule {self.name}: {e}") from None
+
+    def covers(self, sensor_id):
+        return self.sensors is None or fnmatch.fnmatchcase(sensor_id, self.sensors)
+
+
+def load_rules(path=None):
+    specs = DEFAULT_RULES
+    if path:
+        with open(path) as f:
+            specs = json.load(f)
+    rules = [Rule(spec) for spec in specs]
+    names = [rule.name for rule in rules]
+    if len(set(names)) != len(names):
+        raise ValueError(f"duplicate rule names in {path or 'DEFAULT_RULES'}")
+    return rules
+
+
+# --- sliding windows ---------------------------------------------------------
+
+
+class Window:
+    """The readings of the last ``seconds`` (at most ``capacity``), with min/max/mean/rate in O(1) amortized.
+
+    Every sample is one (t, v) tuple shared by the ring buffer and the
+    monotonic deques, so eviction recognises it in them by identity.
+    """
+
+    __slots__ = ("seconds", "capacity", "samples", "_min", "_max", "_sum")
+
+    def __init__(self, seconds, capacity=4096):
+        self.seconds = seconds
+        self.capacity = capacity
+        self.samples = deque()
+        self._min = deque()
+        self._max = deque()
+        self._sum = 0.0
+
+    def __len__(self):
+        return len(self.samples)
+
+    def push(self, t, v):
+        """Add reading ``v`` at epoch seconds ``t``; False (and nothing changes) when it is late or a repeat."""
+        samples = self.samples
+        if samples:
+            last = samples[-1]
+            if t < last[0] or (t == last[0] and v == last[1]):
+                return False
+        sample = (t, v)
+        samples.append(sample)
+        self._sum += v
+        low, high = self._min, self._max
+        while low and low[-1][1] >= v:
+            low.pop()
+        low.append(sample)
+        while high and high[-1][1] <= v:
+            high.pop()
+        high.append(sample)
+        horizon = t - self.seconds
+        while samples[0][0] < horizon or len(samples) > self.capacity:
+            old = samples.popleft()
+            self._sum -= old[1]
+            if low[0] is old:
+                low.popleft()
+            if high[0] is old:
+                high.popleft()
+        return True
+
+    def stat(self, name):
+        samples = self.samples
+        if name == "value":
+            return samples[-1][1]
+        if name == "min":
+            return self._min[0][1]
+        if name == "max":
+            return self._max[0][1]
+        if name == "mean":
+            return self._sum / len(samples)
+        first, last = samples[0], samples[-1]
+        if last[0] <= first[0]:
+            return None
+        return (last[1] - first[1]) / (last[0] - first[0]) * 60.0
+
+
+def scan_stat(samples, name):
+    """``Window.stat`` by rescanning every sample, as a query per rule would: for the benchmark and the tests."""
+    values = [v for _, v in samples]
+    if name == "value":
+        return values[-1]
+    if name == "min":
+        return min(values)
+    if name == "max":
+        return max(values)
+    if name == "mean":
+        return sum(values) / len(values)
+    (t0, v0), (t1, v1) = samples[0], samples[-1]
+    return None if t1 <= t0 else (v1 - v0) / (t1 - t0) * 60.0
+
+
+class ScanWindow(Window):
+    """Same ring buffer, but every stat is a rescan (bench --compare)."""
+
+    __slots__ = ()
+
+    def stat(self, name):
+        return scan_stat(self.samples, name)
+
+
+# --- engine ------------------------------------------------------------------
+
+
+def _epoch_s(value):
+    if isinstance(value, datetime):
+        return value.timestamp()
+    ts = sensor_pipeline.parse_timestamp(value)
+    return None if ts is None else ts.timestamp()
+
+
+class _Sensor:
+    __slots__ = ("checks", "stale_rules")
+
+    def __init__(self, checks, stale_rules):
+        self.checks = checks
+        self.stale_rules = stale_rules
+
+
+class AlertEngine:
+    """Evaluates ``rules`` against each offered reading and calls ``sink(alert)`` on every firing/resolved change."""
+
+    def __init__(self, rules, sink, clock=time.time, window_class=Window):
+        self.rules = rules
+        self.sink = sink
+        self.clock = clock
+        self.window_class = window_class
+        self._sensors = {}
+        self._firing = set()
+        # Per staleness rule: sensor -> last arrival, least recently heard first; and the ones already alerted.
+        self._heard = {rule.name: OrderedDict() for rule in rules if rule.kind == "stale"}
+        self._silent = {rule.name: set() for rule in rules if rule.kind == "stale"}
+        self._lock = threading.Lock()
+        self.readings = 0
+        self.late = 0
+        self.evaluations = 0
+        self.alerts = 0
+
+    def firing(self):
+        with self._lock:
+            return sorted(self._firing)
+
+    def _sensor(self, sensor_id):
+        sensor = self._sensors.get(sensor_id)
+        if sensor is None:
+            windows, checks = {}, []
+            for rule in self.rules:
+                if rule.kind == "threshold" and rule.covers(sensor_id):
+                    key = (rule.field, rule.window_s)
+                    if key not in windows:
+                        windows[key] = self.window_class(rule.window_s)
+                    checks.append((rule, windows[key]))
+            stale = [rule for rule in self.rules if rule.kind == "stale" and rule.covers(sensor_id)]
+            sensor = self._sensors[sensor_id] = _Sensor(checks, stale)
+        return sensor
+
+    def _change(self, rule, sensor_id, firing, observed, now, reading_at=None):
+        key = (rule.name, sensor_id)
+        if firing == (key in self._firing):
+            return
+        if firing:
+            self._firing.add(key)
+        else:
+            self._firing.discard(key)
+        alert = {
+            "rule": rule.name,
+            "sensor_id": sensor_id,
+            "state": "firing" if firing else "resolved",
+            "observed": observed,
+            "at": sensor_pipeline.stamp(datetime.fromtimestamp(now, timezone.utc)),
+        }
+        if rule.kind == "stale":
+            alert["stale_after_s"] = rule.stale_after_s
+        else:
+            alert.update(field=rule.field, stat=rule.stat, op=rule.op_name, threshold=rule.value,
+                         window_s=rule.window_s, reading_at=reading_at)
+        self.alerts += 1
+        self.sink(alert)
+
+    def offer(self, doc):
+        """Evaluate the rules for one stored reading (sensor_pipeline.to_document); returns how many ran."""
+        sensor_id = doc.get("sensor_id")
+        t = _epoch_s(doc.get("@timestamp"))
+        if not isinstance(sensor_id, str) or t is None:
+            return 0
+        now = self.clock()
+        evaluated = 0
+        with self._lock:
+            self.readings += 1
+            sensor = self._sensor(sensor_id)
+            for rule in sensor.stale_rules:
+                heard = self._heard[rule.name]
+                heard[sensor_id] = now
+                heard.move_to_end(sensor_id)
+                silent = self._silent[rule.name]
+                if sensor_id in silent:
+                    silent.discard(sensor_id)
+                    self._change(rule, sensor_id, False, 0.0, now)
+            pushed, late = {}, False
+            for rule, window in sensor.checks:
+                ok = pushed.get(id(window))
+                if ok is None:
+                    value = doc.get(rule.field)
+                    ok = sensor_pipeline.is_numeric(value) and window.push(t, float(value))
+                    late = late or (not ok and len(window) > 0 and t < window.samples[-1][0])
+                    pushed[id(window)] = ok
+                if not ok:
+                    continue
+                observed = window.stat(rule.stat)
+                evaluated += 1
+                self._change(rule, sensor_id, observed is not None and rule.op(observed, rule.value), observed, now,
+                             doc.get("@timestamp"))
+            self.evaluations += evaluated
+            self.late += late
+        return evaluated
+
+    def sweep(self):
+        """Fire the staleness rules for sensors silent for longer than their limit; returns how many went stale."""
+        now = self.clock()
+        stale = 0
+        with self._lock:
+            for rule in self.rules:
+                if rule.kind != "stale":
+                    continue
+                heard, silent = self._heard[rule.name], self._silent[rule.name]
+                cutoff = now - rule.stale_after_s
+                while heard:
+                    sensor_id, last = next(iter(heard.items()))
+                    if last >= cutoff:
+                        break
+                    heard.popitem(last=False)
+                    silent.add(sensor_id)
+                    self._change(rule, sensor_id, True, round(now - last, 3), now)
+                    stale += 1
+        return stale
+
+    def stats(self):
+        return {"sensors": len(self._sensors), "readings": self.readings, "late": self.late,
+                "evaluations": self.evaluations, "alerts": self.alerts, "firing": len(self._firing)}
+
+
+# --- sinks -------------------------------------------------------------------
+
+
+def log_sink(alert):
+    print(f"[alerts] {alert['state']} {alert['rule']} {alert['sensor_id']} observed={alert['observed']}")
+
+
+def webhook_sink(url, timeout=5):
+    def deliver(alert):
+        request = urllib.request.Request(url, data=json.dumps(alert).encode("utf-8"),
+                                         headers={"Content-Type": "application/json"}, method="POST")
+        with urllib.request.urlopen(request, timeout=timeout) as response:
+            response.read()
+
+    return deliver
+
+
+def smtp_sink(host, port, sender, to, timeout=10):
+    def deliver(alert):
+        message = EmailMessage()
+        message["Subject"] = f"[gha] {alert['state']}: {alert['rule']} on {alert['sensor_id']}"
+        message["From"] = sender
+        message["To"] = ", ".join(to)
+        message.set_content(json.dumps(alert, indent=2))
+        with smtplib.SMTP(host, port, timeout=timeout) as smtp:
+            smtp.send_message(message)
+
+    return deliver
+
+
+class QueuedSink:
+    """Delivers from a bounded queue on its own thread; when the queue is full the alert is dropped and counted."""
+
+    def __init__(self, name, deliver, queue_size=1000):
+        self.name = name
+        self.deliver = deliver
+        self.queue = queue.Queue(maxsize=queue_size)
+        self.delivered = 0
+        self.failed = 0
+        self.dropped = 0
+        self._thread = threading.Thread(target=self._run, name=f"alerts-{name}", daemon=True)
+        self._thread.start()
+
+    def __call__(self, alert):
+        try:
+            self.queue.put_nowait(alert)
+        except queue.Full:
+            self.dropped += 1
+
+    def _run(self):
+        while True:
+            alert = self.queue.get()
+            if alert is None:
+                return
+            try:
+                self.deliver(alert)
+                self.delivered += 1
+            except Exception as e:
+                self.failed += 1
+                print(f"[alerts] {self.name} delivery failed: {e!r}")
+            finally:
+                self.queue.task_done()
+
+    def close(self, timeout=10):
+        self.queue.put(None)
+        self._thread.join(timeout)
+
+
+def fan_out(sinks):
+    def sink(alert):
+        for s in sinks:
+            s(alert)
+
+    return sink
+
+
+def make_sinks(s):
+    sinks = [log_sink]
+    if s["webhook_url"]:
+        sinks.append(QueuedSink("webhook", webhook_sink(s["webhook_url"])))
+    smtp = s["smtp"]
+    if smtp["host"] and smtp["to"]:
+        sinks.append(QueuedSink("smtp", smtp_sink(smtp["host"], smtp["port"], smtp["sender"], smtp["to"])))
+    return sinks
+
+
+# --- webhook stand-in --------------------------------------------------------
+
+
+class ReceiverHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    server_version = "gha-alerts"
+
+    def log_message(self, format, *args):
+        pass
+
+    def _send(self, status, body=b""):
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_POST(self):
+        try:
+            alert = json.loads(self.rfile.read(int(self.headers.get("Content-Length") or 0)))
+        except ValueError:
+            self._send(400, b'{"error": "expected a JSON alert"}')
+            return
+        self.server.received.append(alert)
+        print(f"[receiver] {json.dumps(alert)}")
+        self._send(204)
+
+    def do_GET(self):
+        if self.path.rstrip("/") != "/alerts":
+            self._send(404, b'{"error": "not found"}')
+            return
+        self._send(200, json.dumps(list(self.server.received)).encode("utf-8"))
+
+
+class Receiver(ThreadingHTTPServer):
+    """Webhook stand-in: keeps the last ``keep`` alerts it was sent (GET /alerts)."""
+
+    daemon_threads = True
+
+    def __init__(self, address, keep=1000):
+        super().__init__(address, ReceiverHandler)
+        self.received = deque(maxlen=keep)
+
+
+# --- serve -------------------------------------------------------------------
+
+
+def serve(rules, mqtt_settings, sinks, sweep_every=1.0, stats_every=60.0):
+    engine = AlertEngine(rules, fan_out(sinks))
+    feed = MqttFeed(engine, mqtt_settings, tag="alerts").start()
+    print(f"[alerts] {len(rules)} rules: {', '.join(rule.name for rule in rules)}")
+    next_stats = time.monotonic() + stats_every
+    try:
+        while True:
+            time.sleep(sweep_every)
+            engine.sweep()
+            if time.monotonic() >= next_stats:
+                print(f"[alerts] {json.dumps(dict(engine.stats(), rejected=feed.rejected))}")
+                next_stats += stats_every
+    except KeyboardInterrupt:
+        pass
+    finally:
+        feed.stop()
+        for sink in sinks:
+            if isinstance(sink, QueuedSink):
+                sink.close()
+    return 0
+
+
+# --- benchmark ---------------------------------------------------------------
+
+
+def bench_rules(n, windows=(60, 300, 900)):
+    """``n`` threshold rules cycling through fields, stats and window lengths, plus one staleness rule."""
+    specs = []
+    for i in range(n):
+        field, stat, window_s = FIELDS[i % len(FIELDS)], STATS[i % len(STATS)], windows[i % len(windows)]
+        specs.append({"name": f"bench-{i}", "field": field, "stat": stat, "op": ">", "value": 1e9, "window_s": window_s})
+    specs.append({"name": "bench-silent", "stale_after_s": 900})
+    return [Rule(spec) for spec in specs]
+
+
+def bench_readings(sensors, n, interval=5.0, seed=0):
+    """``n`` readings round-robin over ``sensors``, each sensor every ``interval`` seconds, values on a random walk."""
+    rng = random.Random(seed)
+    start = datetime(2025, 9, 24, tzinfo=timezone.utc)
+    state = [[20.0, 50.0, 300.0] for _ in range(sensors)]
+    docs = []
+    for i in range(n):
+        values = state[i % sensors]
+        for k in range(3):
+            values[k] += rng.uniform(-0.5, 0.5)
+        docs.append({
+            "sensor_id": f"bench-{i % sensors:05d}",
+            "@timestamp": sensor_pipeline.stamp(start + timedelta(seconds=(i // sensors) * interval)),
+            "temperature_c": values[0], "humidity_pct": values[1], "light": values[2],
+        })
+    return docs
+
+
+def bench(sensors=500, readings=200000, rules=20, window_class=Window, sample_every=100):
+    rule_set = bench_rules(rules)
+    docs = bench_readings(sensors, readings)
+    engine = AlertEngine(rule_set, lambda alert: None, window_class=window_class)
+    samples = []
+    started = time.perf_counter()
+    for i, doc in enumerate(docs):
+        if i % sample_every:
+            engine.offer(doc)
+        else:
+            t0 = time.perf_counter()
+            engine.offer(doc)
+            samples.append(time.perf_counter() - t0)
+    elapsed = time.perf_counter() - started
+    sweep_started = time.perf_counter()
+    engine.sweep()
+    per_reading = {k: (round(v * 1e6, 1) if isinstance(v, float) else v) for k, v in latency_summary(samples).items()}
+    return {
+        "windows": window_class.__name__,
+        "sensors": sensors,
+        "readings": readings,
+        "rules": len(rule_set),
+        "readings_per_sec": round(readings / elapsed, 1),
+        "rule_evaluations_per_sec": round(engine.evaluations / elapsed, 1),
+        "per_reading_us": per_reading,
+        "sweep_us": round((time.perf_counter() - sweep_started) * 1e6, 1),
+        "max_window_len": max(len(w) for s in engine._sensors.values() for _, w in s.checks),
+    }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    sub = parser.add_subparsers(dest="command", required=True)
+    serve_parser = sub.add_parser("serve", help="subscribe and alert")
+    serve_parser.add_argument("--rules", help="JSON rules file (default ALERTS_RULES, else DEFAULT_RULES)")
+    serve_parser.add_argument("--check", action="store_true", help="only load and print the rules")
+    receive_parser = sub.add_parser("receive", help="webhook stand-in that prints what it is sent")
+    receive_parser.add_argument("--port", type=int, help="HTTP port (default ALERTS_RECEIVER_PORT or 8083)")
+    bench_parser = sub.add_parser("bench", help="rule evaluations per second, no broker involved")
+    bench_parser.add_argument("--sensors", type=int, default=500)
+    bench_parser.add_argument("--readings", type=int, default=200000)
+    bench_parser.add_argument("--rules", type=int, default=20)
+    bench_parser.add_argument("--compare", action="store_true", help="also time stats that rescan the window")
+    args = parser.parse_args(argv)
+
+    s = settings()
+    if args.command == "bench":
+        results = [bench(args.sensors, args.readings, args.rules)]
+        if args.compare:
+            results.append(bench(args.sensors, args.readings, args.rules, window_class=ScanWindow))
+        print(json.dumps(results, indent=2))
+        return 0
+    if args.command == "receive":
+        server = Receiver(("0.0.0.0", args.port or s["port"]))
+        print(f"[receiver] listening on :{server.server_address[1]}")
+        try:
+            server.serve_forever()
+        except KeyboardInterrupt:
+            pass
+        return 0
+    rules = load_rules(args.rules or s["rules"] or None)
+    if args.check:
+        for rule in rules:
+            print(f"[alerts] {rule.name}: {rule.kind}")
+        return 0
+    return serve(rules, s["mqtt"], make_sinks(s))
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
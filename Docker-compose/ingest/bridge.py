@@ -0,0 +1,361 @@
+"""MQTT -> OpenSearch ingest bridge, an optional replacement for filebeat + logstash.
+
+Subscribes to ghanode/sensor, runs every message through sensor_pipeline.py
+(the same validation and routing as logstash.conf) and writes to OpenSearch
+with the _bulk API. Compact CBOR readings (compact.py) on MQTT_COMPACT_TOPIC go
+through the same validation; filebeat's mqtt input cannot carry binary
+payloads, so this bridge is their ingest path (the compact-ingest service in
+docker-compose.yml runs it for that topic alone, with MQTT_TOPIC empty).
+Batches are flushed when they reach BRIDGE_BATCH_SIZE events,
+BRIDGE_BATCH_BYTES bytes or BRIDGE_FLUSH_INTERVAL seconds, whichever is first.
+
+Backpressure: readings wait in a queue of BRIDGE_QUEUE_SIZE events. When it is
+full the MQTT network thread blocks, so QoS 1 acks stop and the broker holds
+the rest (the session is persistent), instead of the bridge buffering without
+bound while OpenSearch is slow or down. Retryable bulk failures (connection
+errors, 429, 5xx) are retried with backoff; events OpenSearch rejects outright
+are logged and dropped, as the logstash opensearch output does without a DLQ.
+Readings are written under sensor_pipeline.document_id(), so a QoS 1
+redelivery or a retried bulk request overwrites its first copy instead of
+duplicating it. With REGISTRY_URL set, readings get their greenhouse from the
+cached sensor registry (registry.py), as logstash's translate filter does.
+
+    python bridge.py                                # settings from the environment
+    docker compose -f docker-compose-tests.yml -f docker-compose-tests-bridge.yml up -d --build
+"""
+import asyncio
+import json
+import os
+import random
+import resource
+import signal
+import threading
+import time
+from datetime import datetime, timezone
+
+import paho.mqtt.client as mqtt
+from opensearchpy import OpenSearch
+from opensearchpy.exceptions import ConnectionError as OpenSearchConnectionError
+from opensearchpy.exceptions import TransportError
+
+import sensor_pipeline
+
+RETRYABLE_STATUS = {429, 502, 503, 504}
+_STOP = object()
+
+
+def opensearch_settings():
+    return {
+        "host": os.getenv("OS_HOST", "opensearch"),
+        "port": int(os.getenv("OS_PORT", "9200")),
+        "username": os.getenv("OS_USER", "admin"),
+        "password": os.getenv("PASSWORD_OPENSEARCH", ""),
+    }
+
+
+def settings():
+    return {
+        "mqtt": {
+            "host": os.getenv("MQTT_HOST", "mqtt"),
+            "port": int(os.getenv("MQTT_PORT", "1883")),
+            "username": os.getenv("MQTT_USER", "ghasensor"),
+            "password": os.getenv("MQTT_PASS", ""),
+            "topic": os.getenv("MQTT_TOPIC", "ghanode/sensor"),
+            "compact_topic": os.getenv("MQTT_COMPACT_TOPIC", "ghanode/sensor/cbor"),
+            "client_id": os.getenv("MQTT_CLIENT_ID", "ghanode-ingest-bridge"),
+        },
+        "opensearch": opensearch_settings(),
+        "batch_size": int(os.getenv("BRIDGE_BATCH_SIZE", "500")),
+        "batch_bytes": int(os.getenv("BRIDGE_BATCH_BYTES", str(5 * 1024 * 1024))),
+        "flush_interval": float(os.getenv("BRIDGE_FLUSH_INTERVAL", "1.0")),
+        "queue_size": int(os.getenv("BRIDGE_QUEUE_SIZE", "10000")),
+        "concurrency": int(os.getenv("BRIDGE_CONCURRENCY", "2")),
+        "stats_interval": float(os.getenv("BRIDGE_STATS_INTERVAL", "30")),
+    }
+
+
+def make_opensearch_client(host, port, username, password):
+    return OpenSearch(
+        hosts=[{"host": host, "port": int(port)}],
+        http_auth=(username, password),
+        use_ssl=True,
+        verify_certs=False,
+        ssl_show_warn=False,
+        http_compress=True,
+    )
+
+
+def rss_mb():
+    """Current resident set size; peak RSS where /proc is not available."""
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE") / 1e6
+    except (OSError, ValueError, IndexError):
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1e3
+
+
+def encode(message, received_at=None):
+    """One raw MQTT message -> the bulk action and source lines for it."""
+    return _bulk_lines(*sensor_pipeline.process(message, received_at, sensor_pipeline.FILEBEAT_FIELDS))
+
+
+def encode_all(message, received_at=None):
+    """encode() for a message that may be a batch envelope: one bulk item per reading."""
+    return [_bulk_lines(*pair) for pair in sensor_pipeline.process_all(message, received_at, sensor_pipeline.FILEBEAT_FIELDS)]
+
+
+def encode_compact_all(data, received_at=None):
+    """encode_all() for a compact CBOR payload."""
+    pairs = sensor_pipeline.process_compact_all(data, received_at, sensor_pipeline.FILEBEAT_FIELDS)
+    return [_bulk_lines(*pair) for pair in pairs]
+
+
+def _bulk_lines(index, event):
+    doc_id = sensor_pipeline.document_id(event)
+    if doc_id is None:
+        action = '{"index":{"_index":' + json.dumps(index) + "}}\n"
+    else:
+        action = '{"index":{"_index":' + json.dumps(index) + ',"_id":' + json.dumps(doc_id) + "}}\n"
+    return (action + json.dumps(sensor_pipeline.to_document(event), default=str) + "\n").encode("utf-8")
+
+
+class BridgeStats:
+    def __init__(self):
+        self.messages = 0
+        self.received = 0
+        self.indexed = 0
+        self.rejected = 0
+        self.retried = 0
+        self.bulk_requests = 0
+        self.backpressure_waits = 0
+        self.max_queue_depth = 0
+        self.started = time.time()
+
+    def snapshot(self, queue_depth=0):
+        elapsed = max(time.time() - self.started, 1e-9)
+        return {
+            "messages": self.messages,
+            "received": self.received,
+            "indexed": self.indexed,
+            "rejected": self.rejected,
+            "retried": self.retried,
+            "bulk_requests": self.bulk_requests,
+            "backpressure_waits": self.backpressure_waits,
+            "queue_depth": queue_depth,
+            "max_queue_depth": self.max_queue_depth,
+            "indexed_per_sec": round(self.indexed / elapsed, 1),
+            "rss_mb": round(rss_mb(), 1),
+        }
+
+
+class IngestBridge:
+    def __init__(
+        self,
+        client,
+        mqtt_settings,
+        batch_size=500,
+        batch_bytes=5 * 1024 * 1024,
+        flush_interval=1.0,
+        queue_size=10000,
+        concurrency=2,
+        stats_interval=30.0,
+        max_retry_delay=30.0,
+    ):
+        self.client = client
+        self.mqtt_settings = mqtt_settings
+        self.batch_size = batch_size
+        self.batch_bytes = batch_bytes
+        self.flush_interval = flush_interval
+        self.queue_size = queue_size
+        self.concurrency = concurrency
+        self.stats_interval = stats_interval
+        self.max_retry_delay = max_retry_delay
+        self.stats = BridgeStats()
+        self.subscribed = threading.Event()
+        self.loop = None
+        self.queue = None
+        self._stopped = None
+        self._in_flight = set()
+
+    # --- MQTT side (paho network thread) ------------------------------------
+
+    def _topics(self):
+        s = self.mqtt_settings
+        return [t for t in (s.get("topic"), s.get("compact_topic")) if t]
+
+    def _on_connect(self, client, userdata, flags, rc):
+        if rc != 0:
+            print(f"[bridge] MQTT connect failed rc={rc}")
+            return
+        client.subscribe([(topic, 1) for topic in self._topics()])
+
+    def _on_subscribe(self, client, userdata, mid, granted_qos):
+        print(f"[bridge] subscribed to {', '.join(self._topics())} (granted qos {granted_qos})")
+        self.subscribed.set()
+
+    def _on_message(self, client, userdata, msg):
+        try:
+            if msg.topic == self.mqtt_settings.get("compact_topic"):
+                items = encode_compact_all(msg.payload, datetime.now(timezone.utc))
+            else:
+                items = encode_all(msg.payload.decode("utf-8", errors="replace"), datetime.now(timezone.utc))
+        except Exception as e:
+            print(f"[bridge] could not encode message: {e!r}")
+            return
+        self.stats.messages += 1
+        for item in items:
+            self.stats.received += 1
+            if self.queue.full():
+                self.stats.backpressure_waits += 1
+            # Blocks this thread (and with it the PUBACK for the message) until there is room.
+            asyncio.run_coroutine_threadsafe(self.queue.put(item), self.loop).result()
+
+    def _connect_mqtt(self):
+        s = self.mqtt_settings
+        client = mqtt.Client(client_id=s.get("client_id", ""), clean_session=not s.get("client_id"))
+        client.username_pw_set(s["username"], s["password"])
+        client.on_connect = self._on_connect
+        client.on_subscribe = self._on_subscribe
+        client.on_message = self._on_message
+        client.reconnect_delay_set(min_delay=1, max_delay=30)
+        client.connect_async(s["host"], int(s["port"]), keepalive=30)
+        client.loop_start()
+        return client
+
+    # --- OpenSearch side (event loop) ---------------------------------------
+
+    async def _next_batch(self):
+        """Wait for the first event, then fill up until size, bytes or flush interval is hit."""
+        item = await self.queue.get()
+        if item is _STOP:
+            return None, True
+        batch, size = [item], len(item)
+        deadline = self.loop.time() + self.flush_interval
+        while len(batch) < self.batch_size and size < self.batch_bytes:
+            if self.queue.empty():
+                timeout = deadline - self.loop.time()
+                if timeout <= 0:
+                    break
+                try:
+                    item = await asyncio.wait_for(self.queue.get(), timeout)
+                except asyncio.TimeoutError:
+                    break
+            else:
+                item = self.queue.get_nowait()
+            if item is _STOP:
+                return batch, True
+            batch.append(item)
+            size += len(item)
+        return batch, False
+
+    async def _batcher(self):
+        slots = asyncio.Semaphore(self.concurrency)
+        while True:
+            self.stats.max_queue_depth = max(self.stats.max_queue_depth, self.queue.qsize())
+            batch, stopping = await self._next_batch()
+            if batch:
+                await slots.acquire()
+                task = asyncio.create_task(self._send(batch))
+                self._in_flight.add(task)
+                task.add_done_callback(lambda t: (self._in_flight.discard(t), slots.release()))
+            if stopping:
+                break
+        if self._in_flight:
+            await asyncio.gather(*self._in_flight)
+
+    async def _send(self, batch):
+        delay = 0.1
+        while batch:
+            self.stats.bulk_requests += 1
+            try:
+                res = await asyncio.to_thread(self.client.bulk, body=b"".join(batch))
+            except (OpenSearchConnectionError, TransportError) as e:
+                status = getattr(e, "status_code", None)
+                if isinstance(status, int) and status not in RETRYABLE_STATUS:
+                    self.stats.rejected += len(batch)
+                    print(f"[bridge] bulk request of {len(batch)} events rejected ({status}): {e}")
+                    return
+                self.stats.retried += len(batch)
+                print(f"[bridge] bulk request failed ({e}); retrying {len(batch)} events in {delay:.1f}s")
+            else:
+                retry = []
+                for item, result in zip(batch, res["items"]):
+                    (outcome,) = result.values()
+                    status = outcome.get("status", 200)
+                    if status < 300:
+                        self.stats.indexed += 1
+                    elif status in RETRYABLE_STATUS:
+                        retry.append(item)
+                    else:
+                        self.stats.rejected += 1
+                        print(f"[bridge] event rejected by {outcome.get('_index')} ({status}): {outcome.get('error')}")
+                if not retry:
+                    return
+                self.stats.retried += len(retry)
+                batch = retry
+            await asyncio.sleep(random.uniform(delay / 2, delay))
+            delay = min(delay * 2, self.max_retry_delay)
+
+    async def _report_stats(self):
+        while True:
+            await asyncio.sleep(self.stats_interval)
+            print(f"[bridge] {json.dumps(self.stats.snapshot(self.queue.qsize()))}")
+
+    async def run(self):
+        self.loop = asyncio.get_running_loop()
+        self.queue = asyncio.Queue(self.queue_size)
+        self._stopped = asyncio.Event()
+        self.stats = BridgeStats()
+        mqtt_client = self._connect_mqtt()
+        batcher = asyncio.create_task(self._batcher())
+        reporter = asyncio.create_task(self._report_stats()) if self.stats_interval > 0 else None
+        await self._stopped.wait()
+
+        # Stop taking messages first (loop_stop joins a network thread that may be waiting on the queue).
+        mqtt_client.disconnect()
+        await asyncio.to_thread(mqtt_client.loop_stop)
+        await self.queue.put(_STOP)
+        await batcher
+        if reporter is not None:
+            reporter.cancel()
+        snapshot = self.stats.snapshot(self.queue.qsize())
+        print(f"[bridge] stopped {json.dumps(snapshot)}")
+        return snapshot
+
+    def stop(self):
+        """Thread-safe: flush what is queued and return from run()."""
+        if self.loop is not None:
+            self.loop.call_soon_threadsafe(self._stopped.set)
+
+
+def main():
+    # registry.py imports this module.
+    from registry import install_from_env
+
+    s = settings()
+    install_from_env()
+    client = make_opensearch_client(**s["opensearch"])
+    bridge = IngestBridge(
+        client,
+        s["mqtt"],
+        batch_size=s["batch_size"],
+        batch_bytes=s["batch_bytes"],
+        flush_interval=s["flush_interval"],
+        queue_size=s["queue_size"],
+        concurrency=s["concurrency"],
+        stats_interval=s["stats_interval"],
+    )
+
+    async def serve():
+        loop = asyncio.get_running_loop()
+        for sig in (signal.SIGINT, signal.SIGTERM):
+            loop.add_signal_handler(sig, bridge.stop)
+        return await bridge.run()
+
+    print(f"[bridge] {s['mqtt']['host']}:{s['mqtt']['port']} -> {s['opensearch']['host']}:{s['opensearch']['port']}")
+    asyncio.run(serve())
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -0,0 +1,363 @@
+"""Compact binary sensor payloads: a CBOR (RFC 8949) map with small integer keys.
+
+A JSON reading spends most of its bytes on field names ("Sensor ID" alone is
+11). On ghanode/sensor/cbor nodes publish the same reading as a CBOR map whose
+well-known keys are integers (KEYS below, also inside the maps of a batch
+envelope's ``readings``); any other key is a text string and is carried through
+as is, so new fields need no schema change. Readings use the shortest exact
+encoding: an integer, a half/single/double float, or a decimal fraction (tag 4,
+[exponent, mantissa]) -- 21.37 is 6 bytes instead of a 9-byte double, and
+decodes to exactly the float the JSON text would. A numeric timestamp is epoch
+seconds and becomes an ISO 8601 string on decode.
+
+``decode_reading`` returns the dict ``json.loads`` would give for the JSON
+form, so sensor_pipeline.transform_compact validates and routes it exactly
+like a JSON message (minus the % / Z+200 text fix-ups, which only concern
+JSON firmware). The codec is plain Python with no dependencies, so nodes and
+tools can copy this one file.
+
+    python compact.py encode '{"Sensor ID": "gh1-a", "temperature": 21.37, "humidity": 45.2, "light": 300}'
+    python compact.py decode a500656768312d61...
+    python compact.py bench --readings 20000     # bytes per reading, encode/decode and pipeline CPU vs JSON
+"""
+import argparse
+import json
+import math
+import random
+import struct
+import sys
+import time
+from datetime import datetime, timezone
+from decimal import Decimal
+
+KEYS = {0: "Sensor ID", 1: "temperature", 2: "humidity", 3: "light", 4: "timestamp", 5: "published_at", 6: "test_run_id",
+        7: "readings", 8: "seq"}
+CODES = {name: code for code, name in KEYS.items()}
+TIMESTAMP_CODE = CODES["timestamp"]
+READINGS_CODE = CODES["readings"]
+DECIMAL_FRACTION_TAG = 4
+# A batch envelope nests four levels (map, readings array, map, decimal fraction); anything much deeper is
+# malformed, and without a limit a few thousand array headers exhaust Python's recursion limit.
+MAX_DEPTH = 16
+
+_HALF = struct.Struct(">e")
+_SINGLE = struct.Struct(">f")
+_DOUBLE = struct.Struct(">d")
+_POWERS = [10.0**k for k in range(23)]
+
+
+# --- encoding -------------------------------------------------------------------
+
+
+def _head(major, n):
+    if n < 24:
+        return bytes((major << 5 | n,))
+    if n < 0x100:
+        return bytes((major << 5 | 24, n))
+    if n < 0x10000:
+        return bytes((major << 5 | 25,)) + n.to_bytes(2, "big")
+    if n < 0x100000000:
+        return bytes((major << 5 | 26,)) + n.to_bytes(4, "big")
+    if n < 0x10000000000000000:
+        return bytes((major << 5 | 27,)) + n.to_bytes(8, "big")
+    raise ValueError(f"integer {n} does not fit in 64 bits")
+
+
+def _int(n):
+    return _head(0, n) if n >= 0 else _head(1, -1 - n)
+
+
+def _float(x):
+    if not math.isfinite(x):
+        raise ValueError(f"{x!r} has no JSON equivalent")
+    for prefix, fmt in ((b"\xf9", _HALF), (b"\xfa", _SINGLE)):
+        try:
+            packed = fmt.pack(x)
+        except (OverflowError, struct.error):
+            continue
+        if fmt.unpack(packed)[0] == x:
+            return prefix + packed
+    sign, digits, exponent = Decimal(repr(x)).as_tuple()
+    if isinstance(exponent, int):
+        mantissa = int("".join(map(str, digits))) * (-1 if sign else 1)
+        fraction = b"\xc4\x82" + _int(exponent) + _int(mantissa)
+        if len(fraction) < 9:
+            return fraction
+    return b"\xfb" + _DOUBLE.pack(x)
+
+
+def _encode(value, out):
+    if value is None:
+        out.append(b"\xf6")
+    elif value is True:
+        out.append(b"\xf5")
+    elif value is False:
+        out.append(b"\xf4")
+    elif isinstance(value, int):
+        out.append(_int(value))
+    elif isinstance(value, float):
+        out.append(_float(value))
+    elif isinstance(value, str):
+        data = value.encode("utf-8")
+        out.append(_head(3, len(data)))
+        out.append(data)
+    elif isinstance(value, (list, tuple)):
+        out.append(_head(4, len(value)))
+        for item in value:
+            _encode(item, out)
+    elif isinstance(value, dict):
+        out.append(_head(5, len(value)))
+        for key, item in value.items():
+            _encode(key, out)
+            _encode(item, out)
+    else:
+        raise TypeError(f"cannot encode {type(value).__name__}")
+
+
+def encode(value):
+    """CBOR for a JSON-compatible value (dict keys may also be ints)."""
+    out = []
+    _encode(value, out)
+    return b"".join(out)
+
+
+def _coded(payload):
+    coded = {}
+    for key, value in payload.items():
+        if key == "readings" and isinstance(value, list):
+            value = [_coded(r) if isinstance(r, dict) else r for r in value]
+        coded[CODES.get(key, key)] = value
+    return coded
+
+
+def encode_reading(payload):
+    """A reading (or batch envelope) in its JSON shape ({"Sensor ID": ..., "temperature": ...}) as compact CBOR."""
+    return encode(_coded(payload))
+
+
+def reading(sensor_id, temperature, humidity, light, timestamp=None, **extra):
+    """Compact payload for one reading; ``timestamp`` is epoch seconds (int or float) or an ISO string."""
+    payload = {0: sensor_id, 1: temperature, 2: humidity, 3: light}
+    if timestamp is not None:
+        payload[TIMESTAMP_CODE] = timestamp
+    for key, value in extra.items():
+        payload[CODES.get(key, key)] = value
+    return encode(payload)
+
+
+# --- decoding -------------------------------------------------------------------
+
+
+def _length(data, pos, info):
+    if info < 24:
+        return info, pos
+    if info > 27:
+        raise ValueError(f"unsupported additional information {info} (indefinite lengths are not used)")
+    size = 1 << (info - 24)
+    if pos + size > len(data):
+        raise ValueError("payload is truncated")
+    return int.from_bytes(data[pos : pos + size], "big"), pos + size
+
+
+def _decimal_fraction(exponent, mantissa):
+    # m / 10**k and m * 10**k are correctly rounded while both operands are exact doubles,
+    # which covers every sensor reading; anything else takes the (slower) decimal string route.
+    if -(2**53) < mantissa < 2**53 and -22 <= exponent <= 22:
+        number = mantissa / _POWERS[-exponent] if exponent < 0 else mantissa * _POWERS[exponent]
+    else:
+        number = float(f"{mantissa}e{exponent}")
+    if not math.isfinite(number):
+        raise ValueError(f"decimal fraction [{exponent}, {mantissa}] overflows a double")
+    return number
+
+
+def _decode(data, pos, depth=0):
+    initial = data[pos]
+    pos += 1
+    if initial < 0x18:  # the map keys and most small integers
+        return initial, pos
+    major, info = initial >> 5, initial & 0x1F
+    if major == 7:
+        if info == 20:
+            return False, pos
+        if info == 21:
+            return True, pos
+        if info in (22, 23):
+            return None, pos
+        if info == 25:
+            value = _HALF.unpack_from(data, pos)[0]
+            pos += 2
+        elif info == 26:
+            value = _SINGLE.unpack_from(data, pos)[0]
+            pos += 4
+        elif info == 27:
+            value = _DOUBLE.unpack_from(data, pos)[0]
+            pos += 8
+        else:
+            raise ValueError(f"unsupported simple value {info}")
+        if not math.isfinite(value):
+            raise ValueError(f"{value!r} has no JSON equivalent")
+        return value, pos
+    n, pos = _length(data, pos, info)
+    if major == 0:
+        return n, pos
+    if major == 1:
+        return -1 - n, pos
+    if major == 3:
+        end = pos + n
+        if end > len(data):
+            raise ValueError("text string runs past the end of the payload")
+        return str(data[pos:end], "utf-8"), end
+    if major >= 4 and depth >= MAX_DEPTH:
+        raise ValueError(f"items nested more than {MAX_DEPTH} deep")
+    if major == 4:
+        items = []
+        for _ in range(n):
+            item, pos = _decode(data, pos, depth + 1)
+            items.append(item)
+        return items, pos
+    if major == 5:
+        mapping = {}
+        for _ in range(n):
+            key, pos = _decode(data, pos, depth + 1)
+            value, pos = _decode(data, pos, depth + 1)
+            if type(key) is not str and type(key) is not int:
+                raise ValueError(f"map key {key!r} is neither text nor an integer")
+            mapping[key] = value
+        return mapping, pos
+    if major == 6:
+        value, pos = _decode(data, pos, depth + 1)
+        if n == DECIMAL_FRACTION_TAG:
+            if not (type(value) is list and len(value) == 2 and type(value[0]) is int and type(value[1]) is int):
+                raise ValueError("decimal fraction must be [exponent, mantissa]")
+            return _decimal_fraction(value[0], value[1]), pos
+        return value, pos  # other tags carry no meaning here
+    raise ValueError("byte strings have no JSON equivalent")
+
+
+def decode(data):
+    """The value in one CBOR item; ValueError if the payload is malformed or has trailing bytes."""
+    try:
+        value, pos = _decode(data, 0)
+    except (IndexError, struct.error) as e:
+        raise ValueError("payload is truncated") from e
+    except (UnicodeDecodeError, OverflowError) as e:
+        raise ValueError(str(e)) from e
+    if pos != len(data):
+        raise ValueError(f"{len(data) - pos} trailing bytes after the CBOR item")
+    return value
+
+
+def _iso(seconds):
+    # Round to the millisecond first: 1758700000.123 is stored as 1758700000.1229999 and must not become .122.
+    whole, millis = divmod(round(seconds * 1000), 1000)
+    text = "%04d-%02d-%02dT%02d:%02d:%02d" % time.gmtime(whole)[:6]
+    return f"{text}.{millis:03d}Z" if millis else text + "Z"
+
+
+def _jsonable(value):
+    if isinstance(value, dict):
+        return {str(k): _jsonable(v) for k, v in value.items()}
+    if isinstance(value, list):
+        return [_jsonable(v) for v in value]
+    return value
+
+
+def decode_reading(data):
+    """Compact payload -> the dict json.loads would return for its JSON form (a non-map comes back as is)."""
+    value = decode(data)
+    return _named(value) if isinstance(value, dict) else value
+
+
+def _named(value):
+    payload = {}
+    for key, item in value.items():
+        if key == READINGS_CODE and type(item) is list:
+            item = [_named(r) if type(r) is dict else _jsonable(r) for r in item]
+        elif type(item) in (dict, list):
+            item = _jsonable(item)
+        if key == TIMESTAMP_CODE and type(item) in (int, float):
+            try:
+                item = _iso(item)
+            except (OverflowError, OSError, ValueError):
+                pass  # left numeric; the date filter fails on it as it would on the JSON number
+        payload[KEYS.get(key, str(key)) if type(key) is int else key] = item
+    return payload
+
+
+# --- benchmark ------------------------------------------------------------------
+
+
+def sample_readings(n, seed=0):
+    rng = random.Random(seed)
+    start = 1758700000
+    return [
+        {
+            "Sensor ID": f"gh{rng.randint(1, 9)}-node-{rng.randint(1, 40):02d}",
+            "temperature": round(rng.uniform(-5, 40), rng.choice([1, 2])),
+            "humidity": round(rng.uniform(20, 100), 1),
+            "light": rng.choice([rng.randint(0, 65535), round(rng.uniform(0, 2000), 1)]),
+            "timestamp": start + i * 30,
+        }
+        for i in range(n)
+    ]
+
+
+def _cpu_us(fn, items):
+    started = time.process_time()
+    for item in items:
+        fn(item)
+    return round((time.process_time() - started) / len(items) * 1e6, 2)
+
+
+def bench(readings=20000, seed=0):
+    """Bytes per reading and CPU per reading (microseconds) for the JSON and compact paths."""
+    import sensor_pipeline
+
+    samples = sample_readings(readings, seed)
+    json_payloads = [json.dumps(dict(r, timestamp=_iso(r["timestamp"]))) for r in samples]
+    cbor_payloads = [encode_reading(r) for r in samples]
+    received_at = datetime.now(timezone.utc)
+    fields = sensor_pipeline.FILEBEAT_FIELDS
+    json_bytes = sum(len(p.encode("utf-8")) for p in json_payloads)
+    cbor_bytes = sum(len(p) for p in cbor_payloads)
+    return {
+        "readings": readings,
+        "bytes_per_reading": {"json": round(json_bytes / readings, 1), "cbor": round(cbor_bytes / readings, 1)},
+        "size_ratio": round(cbor_bytes / json_bytes, 3),
+        "cpu_us_per_reading": {
+            "json_encode": _cpu_us(json.dumps, samples),
+            "cbor_encode": _cpu_us(encode_reading, samples),
+            "json_decode": _cpu_us(json.loads, json_payloads),
+            "cbor_decode": _cpu_us(decode_reading, cbor_payloads),
+            "json_pipeline": _cpu_us(lambda p: sensor_pipeline.process(p, received_at, fields), json_payloads),
+            "cbor_pipeline": _cpu_us(lambda p: sensor_pipeline.process_compact(p, received_at, fields), cbor_payloads),
+        },
+    }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    sub = parser.add_subparsers(dest="command", required=True)
+    encode_parser = sub.add_parser("encode", help="JSON reading -> compact payload (hex)")
+    encode_parser.add_argument("json")
+    decode_parser = sub.add_parser("decode", help="compact payload (hex) -> JSON reading")
+    decode_parser.add_argument("hex")
+    bench_parser = sub.add_parser("bench", help="bytes and CPU per reading, JSON vs compact")
+    bench_parser.add_argument("--readings", type=int, default=20000)
+    bench_parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args(argv)
+
+    if args.command == "encode":
+        data = encode_reading(json.loads(args.json))
+        print(data.hex())
+        print(f"[compact] {len(data)} bytes (JSON {len(args.json.encode('utf-8'))})", file=sys.stderr)
+    elif args.command == "decode":
+        print(json.dumps(decode_reading(bytes.fromhex(args.hex))))
+    else:
+        print(json.dumps(bench(args.readings, args.seed), indent=2))
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
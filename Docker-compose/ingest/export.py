@@ -0,0 +1,453 @@
+"""Export sensor history from sensors-* to Parquet or CSV in constant memory.
+
+Readings of the given sensor_ids (every sensor when none is given) with
+@timestamp in [since, until) are read from one point-in-time with
+search_after (replay_errors.stream_pages), split into N disjoint slices that
+are read in parallel. Pages pass through a bounded queue into the writer, a
+generator pipeline from end to end, so at most a few pages per slice are in
+memory however many rows match. There is no 10k hit cap. Rows are in
+@timestamp order within a slice, and across the whole export when there is
+one slice.
+
+Parquet (pyarrow, imported only when asked for) gets one row group per
+--row-group rows and a UTC millisecond timestamp column. CSV can be split into
+files of --chunk-rows rows, and is gzipped when the name ends in .gz. Progress
+lines and the final report give rows per second, MB written and peak RSS.
+
+    python export.py write --sensor gh1-a --sensor gh1-b --since 2025-03-01 --until 2025-10-01 --out season.parquet
+    python export.py write --since now-30d --out readings.csv.gz --chunk-rows 1000000 --slices 4
+    python export.py serve                 # :8084, GET /export?sensor_id=gh1-a&since=2025-03-01&format=csv
+"""
+import argparse
+import csv
+import gzip
+import io
+import json
+import os
+import queue
+import resource
+import threading
+import time
+from datetime import datetime, timezone
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlsplit
+
+from opensearchpy.exceptions import NotFoundError
+
+from bridge import make_opensearch_client, opensearch_settings, rss_mb
+from replay_errors import stream_pages
+from rollup import RAW_INDICES
+
+COLUMNS = ("@timestamp", "sensor_id", "temperature_c", "humidity_pct", "light")
+FORMATS = ("csv", "parquet")
+_DONE = object()
+
+
+def settings():
+    return {
+        "opensearch": opensearch_settings(),
+        "port": int(os.getenv("EXPORT_PORT", "8084")),
+        "slices": int(os.getenv("EXPORT_SLICES", "2")),
+    }
+
+
+def peak_rss_mb():
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1e3
+
+
+def build_query(sensors=None, since=None, until=None, sensor_field="sensor_id"):
+    filters = []
+    if sensors:
+        filters.append({"terms": {sensor_field: list(sensors)}})
+    if since or until:
+        bounds = {}
+        if since:
+            bounds["gte"] = since
+        if until:
+            bounds["lt"] = until
+        filters.append({"range": {"@timestamp": bounds}})
+    return {"bool": {"filter": filters}} if filters else {"match_all": {}}
+
+
+def _put(buffer, item, stop):
+    while not stop.is_set():
+        try:
+            buffer.put(item, timeout=0.5)
+            return True
+        except queue.Full:
+            continue
+    return False
+
+
+def sliced_pages(client, indices, query, slices=1, page_size=5000, keep_alive="5m", depth=2):
+    """Pages from ``slices`` parallel readers of one PIT, in arrival order; at most ``depth`` per slice wait.
+
+    The readers stop, and the PIT is deleted, when the consumer is done or
+    gives up early.
+    """
+    pit_id = client.create_pit(index=indices, keep_alive=keep_alive)["pit_id"]
+    buffer = queue.Queue(depth * slices)
+    stop = threading.Event()
+
+    def read(i):
+        spec = {"id": i, "max": slices} if slices > 1 else None
+        try:
+            for page in stream_pages(client, indices, query, page_size, keep_alive, list(COLUMNS), spec, pit_id):
+                if not _put(buffer, page, stop):
+                    return
+            _put(buffer, _DONE, stop)
+        except Exception as e:
+            _put(buffer, e, stop)
+
+    readers = [threading.Thread(target=read, args=(i,), name=f"export-slice-{i}", daemon=True) for i in range(slices)]
+    for reader in readers:
+        reader.start()
+    try:
+        done = 0
+        while done < slices:
+            item = buffer.get()
+            if item is _DONE:
+                done += 1
+            elif isinstance(item, Exception):
+                raise item
+            else:
+                yield item
+    finally:
+        stop.set()
+        for reader in readers:
+            reader.join(timeout=5)
+        try:
+            client.delete_pit(body={"pit_id": [pit_id]})
+        except NotFoundError:
+            pass
+
+
+# --- writers -----------------------------------------------------------------
+
+
+class _Counting(io.RawIOBase):
+    """Counts what goes through to ``stream`` (left open)."""
+
+    def __init__(self, stream):
+        self.stream = stream
+        self.bytes = 0
+
+    def writable(self):
+        return True
+
+    def write(self, data):
+        self.stream.write(data)
+        self.bytes += len(data)
+        return len(data)
+
+
+class CsvWriter:
+    """CSV with a header row, into ``path`` (split every ``chunk_rows`` rows when set) or a binary ``stream``."""
+
+    def __init__(self, path=None, chunk_rows=0, stream=None):
+        self.path = path
+        self.chunk_rows = chunk_rows
+        self.stream = stream
+        self.files = []
+        self.bytes = 0
+        self.parts = 0
+        self._file = self._out = self._writer = None
+        self._rows_in_file = 0
+
+    def _part(self, n):
+        if not self.chunk_rows:
+            return self.path
+        stem, ext = self.path, ""
+        for suffix in (".csv.gz", ".csv", ".gz"):
+            if self.path.endswith(suffix):
+                stem, ext = self.path[: -len(suffix)], suffix
+                break
+        return f"{stem}-{n:05d}{ext}"
+
+    def _open(self):
+        if self.stream is not None:
+            self._file = _Counting(self.stream)
+            raw = self._file
+        else:
+            path = self._part(len(self.files))
+            self.files.append(path)
+            raw = self._file = gzip.open(path, "wb") if path.endswith(".gz") else open(path, "wb")
+        self._out = io.TextIOWrapper(raw, encoding="utf-8", newline="", write_through=True)
+        self._writer = csv.writer(self._out)
+        self._writer.writerow(COLUMNS)
+        self._rows_in_file = 0
+        self.parts += 1
+
+    def _close_file(self):
+        if self._out is None:
+            return
+        self._out.flush()
+        self._out.detach()
+        if self.stream is not None:
+            self.bytes += self._file.bytes
+        else:
+            self._file.close()
+            self.bytes += os.path.getsize(self.files[-1])
+        self._file = self._out = self._writer = None
+
+    def write(self, hits):
+        while hits:
+            if self._writer is None:
+                self._open()
+            room = len(hits) if not self.chunk_rows else self.chunk_rows - self._rows_in_file
+            batch, hits = hits[:room], hits[room:]
+            self._writer.writerows([[hit["_source"].get(c, "") for c in COLUMNS] for hit in batch])
+            self._rows_in_file += len(batch)
+            if self.chunk_rows and self._rows_in_file >= self.chunk_rows:
+                self._close_file()
+
+    def close(self):
+        if not self.parts:
+            self._open()
+        self._close_file()
+        return {"files": self.files, "bytes": self.bytes}
+
+
+class ParquetWriter:
+    """Parquet into ``where`` (a path or a binary stream), one row group per ``row_group`` rows."""
+
+    def __init__(self, where, row_group=100_000):
+        try:
+            import pyarrow as pa
+            import pyarrow.parquet as pq
+        except ImportError:
+            raise SystemExit("Parquet export needs pyarrow (pip install pyarrow); or write CSV") from None
+        self.pa = pa
+        self.where = where
+        self.row_group = row_group
+        self.schema = pa.schema([
+            ("@timestamp", pa.timestamp("ms", tz="UTC")),
+            ("sensor_id", pa.string()),
+            ("temperature_c", pa.float64()),
+            ("humidity_pct", pa.float64()),
+            ("light", pa.float64()),
+        ])
+        self._counting = None if isinstance(where, str) else _Counting(where)
+        self._writer = pq.ParquetWriter(where if self._counting is None else self._counting, self.schema)
+        self._columns = {name: [] for name in COLUMNS}
+        self._buffered = 0
+
+    def write(self, hits):
+        columns = self._columns
+        for hit in hits:
+            src = hit["_source"]
+            # The first sort value is @timestamp as epoch ms: no date parsing per row.
+            columns["@timestamp"].append(hit["sort"][0])
+            for name in COLUMNS[1:]:
+                columns[name].append(src.get(name))
+        self._buffered += len(hits)
+        if self._buffered >= self.row_group:
+            self._flush()
+
+    def _flush(self):
+        if not self._buffered:
+            return
+        arrays = [self.pa.array(self._columns[f.name], type=f.type) for f in self.schema]
+        self._writer.write_table(self.pa.Table.from_arrays(arrays, schema=self.schema), row_group_size=self.row_group)
+        self._columns = {name: [] for name in COLUMNS}
+        self._buffered = 0
+
+    def close(self):
+        self._flush()
+        self._writer.close()
+        if self._counting is not None:
+            return {"files": [], "bytes": self._counting.bytes}
+        return {"files": [self.where], "bytes": os.path.getsize(self.where)}
+
+
+def make_writer(fmt, path=None, stream=None, chunk_rows=0, row_group=100_000):
+    if fmt == "parquet":
+        return ParquetWriter(path if stream is None else stream, row_group)
+    return CsvWriter(path, chunk_rows, stream)
+
+
+def format_for(path):
+    return "parquet" if path.endswith(".parquet") else "csv"
+
+
+# --- export ------------------------------------------------------------------
+
+
+class ExportProgress:
+    def __init__(self, every=10.0, log=print):
+        self.every = every
+        self.log = log
+        self.total = 0
+        self.rows = 0
+        self.pages = 0
+        self.started = time.time()
+        self._last_report = self.started
+        self.rss_start_mb = round(rss_mb(), 1)
+
+    def report(self):
+        elapsed = max(time.time() - self.started, 1e-9)
+        return {
+            "total": self.total,
+            "rows": self.rows,
+            "pages": self.pages,
+            "elapsed_s": round(elapsed, 2),
+            "rows_per_sec": round(self.rows / elapsed, 1),
+            "rss_start_mb": self.rss_start_mb,
+            "rss_mb": round(rss_mb(), 1),
+            "peak_rss_mb": round(peak_rss_mb(), 1),
+        }
+
+    def tick(self, force=False):
+        now = time.time()
+        if not force and now - self._last_report < self.every:
+            return
+        self._last_report = now
+        r = self.report()
+        self.log(f"[export] {self.rows}/{self.total} rows, {r['rows_per_sec']}/s, rss {r['rss_mb']} MB "
+                 f"(peak {r['peak_rss_mb']} MB)")
+
+
+def export(client, writer, indices=RAW_INDICES, query=None, slices=1, page_size=5000, progress=None):
+    """Stream every matching reading into ``writer``; returns the report (rows, throughput, RSS, files, bytes)."""
+    progress = progress or ExportProgress()
+    try:
+        for page in sliced_pages(client, indices, query or {"match_all": {}}, slices, page_size):
+            progress.total += page.get("total", 0)
+            writer.write(page["hits"])
+            progress.rows += len(page["hits"])
+            progress.pages += 1
+            progress.tick()
+    finally:
+        written = writer.close()
+    progress.tick(force=True)
+    report = progress.report()
+    report.update(written, slices=slices, mb_written=round(written["bytes"] / 1e6, 2))
+    return report
+
+
+# --- HTTP --------------------------------------------------------------------
+
+
+class _Chunked(io.RawIOBase):
+    """HTTP/1.1 chunked transfer encoding over the handler's socket."""
+
+    def __init__(self, wfile):
+        self.wfile = wfile
+
+    def writable(self):
+        return True
+
+    def write(self, data):
+        if data:
+            self.wfile.write(f"{len(data):x}\r\n".encode("ascii") + bytes(data) + b"\r\n")
+        return len(data)
+
+    def end(self):
+        self.wfile.write(b"0\r\n\r\n")
+
+
+class ExportHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    server_version = "gha-export"
+
+    def log_message(self, format, *args):
+        pass
+
+    def _error(self, status, message):
+        body = json.dumps({"error": message}).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_GET(self):
+        url = urlsplit(self.path)
+        if url.path not in ("/export", "/export/"):
+            self._error(404, "not found")
+            return
+        params = parse_qs(url.query)
+        fmt = params.get("format", ["csv"])[0]
+        if fmt not in FORMATS:
+            self._error(400, f"format must be one of {', '.join(FORMATS)}")
+            return
+        sensors = [s for v in params.get("sensor_id", []) for s in v.split(",") if s]
+        query = build_query(sensors, params.get("since", [None])[0], params.get("until", [None])[0],
+                            self.server.sensor_field)
+        self.send_response(200)
+        self.send_header("Content-Type", "application/vnd.apache.parquet" if fmt == "parquet" else "text/csv")
+        self.send_header("Content-Disposition", f'attachment; filename="readings.{fmt}"')
+        self.send_header("Transfer-Encoding", "chunked")
+        self.end_headers()
+        body = _Chunked(self.wfile)
+        try:
+            report = export(self.server.client, make_writer(fmt, stream=body), self.server.indices, query,
+                            self.server.slices, progress=ExportProgress(log=lambda line: None))
+        except Exception as e:
+            # The status line is long gone: dropping the connection without the last chunk marks the body incomplete.
+            print(f"[export] {self.path} failed: {e!r}")
+            self.close_connection = True
+            return
+        body.end()
+        print(f"[export] {self.path}: {report['rows']} rows, {report['rows_per_sec']}/s")
+
+
+class ExportServer(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def __init__(self, address, client, indices=RAW_INDICES, slices=2, sensor_field="sensor_id"):
+        super().__init__(address, ExportHandler)
+        self.client = client
+        self.indices = indices
+        self.slices = slices
+        self.sensor_field = sensor_field
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    sub = parser.add_subparsers(dest="command", required=True)
+    write_parser = sub.add_parser("write", help="export to a file")
+    write_parser.add_argument("--out", required=True, help=".parquet, or .csv / .csv.gz")
+    write_parser.add_argument("--sensor", action="append", help="sensor_id to export (repeatable; default all)")
+    write_parser.add_argument("--since", help="@timestamp >= this (date math allowed)")
+    write_parser.add_argument("--until", help="@timestamp < this")
+    write_parser.add_argument("--chunk-rows", type=int, default=0, help="CSV: start a new file every N rows")
+    write_parser.add_argument("--row-group", type=int, default=100_000, help="Parquet: rows per row group")
+    write_parser.add_argument("--progress-every", type=float, default=10.0, help="seconds between progress lines")
+    write_parser.add_argument("--json", help="also write the final report to this file")
+    serve_parser = sub.add_parser("serve", help="stream exports over HTTP")
+    serve_parser.add_argument("--port", type=int, help="HTTP port (default EXPORT_PORT or 8084)")
+    for p in (write_parser, serve_parser):
+        p.add_argument("--indices", default=RAW_INDICES, help="indices to read (default %(default)s)")
+        p.add_argument("--slices", type=int, help="parallel sliced readers (default EXPORT_SLICES or 2)")
+        p.add_argument("--sensor-field", default="sensor_id",
+                       help="sensor_id.keyword for indices created before provision.py's templates")
+    args = parser.parse_args(argv)
+
+    s = settings()
+    client = make_opensearch_client(**s["opensearch"])
+    slices = args.slices or s["slices"]
+    if args.command == "serve":
+        server = ExportServer(("0.0.0.0", args.port or s["port"]), client, args.indices, slices, args.sensor_field)
+        print(f"[export] listening on :{server.server_address[1]}")
+        try:
+            server.serve_forever()
+        except KeyboardInterrupt:
+            pass
+        return 0
+
+    fmt = format_for(args.out)
+    writer = make_writer(fmt, args.out, chunk_rows=args.chunk_rows, row_group=args.row_group)
+    query = build_query(args.sensor, args.since, args.until, args.sensor_field)
+    started = datetime.now(timezone.utc).isoformat(timespec="seconds")
+    report = export(client, writer, args.indices, query, slices, progress=ExportProgress(args.progress_every))
+    report.update(format=fmt, started=started)
+    print(json.dumps(report, indent=2))
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump(report, f, indent=2)
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -0,0 +1,61 @@
+"""Percentiles and histograms for latency samples (seconds), shared by the reports."""
+import math
+
+
+def percentile(values, p):
+    """Nearest-rank percentile of an unsorted sequence; None when it is empty."""
+    if not values:
+        return None
+    return _ranked(sorted(values), p)
+
+
+def _ranked(ordered, p):
+    rank = max(1, math.ceil(p / 100.0 * len(ordered)))
+    return ordered[min(rank, len(ordered)) - 1]
+
+
+def latency_summary(values, ps=(50, 95, 99)):
+    summary = {"count": len(values)}
+    ordered = sorted(values)
+    for p in ps:
+        summary[f"p{p}"] = _ranked(ordered, p) if ordered else None
+    summary["max"] = ordered[-1] if ordered else None
+    return summary
+
+
+# Bucket upper bounds in seconds: 1ms .. ~17min, three per decade.
+HISTOGRAM_BOUNDS = tuple(m * 10.0**e for e in range(-3, 3) for m in (1, 2, 5)) + (math.inf,)
+
+
+def histogram(values, bounds=HISTOGRAM_BOUNDS):
+    """[(upper_bound, count), ...] with each value counted in the first bucket it fits; negatives go to the first."""
+    counts = [0] * len(bounds)
+    for v in values:
+        for i, bound in enumerate(bounds):
+            if v <= bound:
+                counts[i] += 1
+                break
+    return list(zip(bounds, counts))
+
+
+def format_seconds(value):
+    if value is None:
+        return "-"
+    if value == math.inf:
+        return "inf"
+    if abs(value) < 1:
+        return f"{value * 1000:.0f}ms" if abs(value) >= 0.001 or value == 0 else f"{value * 1e6:.0f}us"
+    return f"{value:.2f}s"
+
+
+def render_histogram(buckets, width=40):
+    """ASCII bars, one line per bucket between the first and last non-empty one."""
+    filled = [i for i, (_, count) in enumerate(buckets) if count]
+    if not filled:
+        return []
+    peak = max(count for _, count in buckets)
+    lines = []
+    for bound, count in buckets[filled[0] : filled[-1] + 1]:
+        bar = "#" * max(1 if count else 0, round(width * count / peak))
+        lines.append(f"  <= {format_seconds(bound):>7} {count:>8} {bar}")
+    return lines
@@ -0,0 +1,382 @@
+"""Latest validated reading per sensor, kept in memory and served over HTTP.
+
+Subscribes to ghanode/sensor and the compact ghanode/sensor/cbor, runs each
+message through sensor_pipeline.py and keeps the newest valid reading (by
+@timestamp) per sensor_id, already encoded as JSON, so a lookup is a dict
+access and a write of cached bytes. On start it also warms up from OpenSearch
+with one composite aggregation (top_hits per sensor) over the recent daily
+indices; the subscription is opened first and the newer reading always wins, so
+nothing published during warm-up is lost. History queries stay with OpenSearch.
+The API has no authentication and answers for every greenhouse, so it is only
+reachable on the compose network; nginx does not route to it.
+
+    GET  /latest/<sensor_id>                 one reading, 404 if the sensor is unknown
+    GET  /latest?sensor_id=a&sensor_id=b     {"a": {...}, "b": null}; without sensor_id: every sensor
+    POST /latest  {"sensor_ids": ["a", "b"]}  same as the GET batch
+    GET  /health                             sensor count, updates, warm-up and MQTT state
+
+    python latest.py serve                          # :8081, warm up from the last 7 days
+    python latest.py serve --warm-since now-30d
+    python latest.py bench --sensors 500            # lookup latency, in-process and over HTTP
+"""
+import argparse
+import http.client
+import json
+import os
+import random
+import threading
+import time
+from datetime import datetime, timezone
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, unquote, urlsplit
+
+import paho.mqtt.client as mqtt
+
+import sensor_pipeline
+from bridge import make_opensearch_client, opensearch_settings
+from latency import latency_summary
+
+DEFAULT_INDICES = "sensors-*,-sensors-errors-*,-sensors-rollup-*"
+READING_FIELDS = ("sensor_id", "@timestamp", "temperature_c", "humidity_pct", "light")
+
+
+def settings():
+    return {
+        "mqtt": {
+            "host": os.getenv("MQTT_HOST", "mqtt"),
+            "port": int(os.getenv("MQTT_PORT", "1883")),
+            "username": os.getenv("MQTT_USER", "ghasensor"),
+            "password": os.getenv("MQTT_PASS", ""),
+            "topic": os.getenv("MQTT_TOPIC", "ghanode/sensor"),
+            "compact_topic": os.getenv("MQTT_COMPACT_TOPIC", "ghanode/sensor/cbor"),
+            "client_id": os.getenv("MQTT_CLIENT_ID", "ghanode-latest"),
+        },
+        "opensearch": opensearch_settings(),
+        "port": int(os.getenv("LATEST_PORT", "8081")),
+    }
+
+
+def _epoch_ms(value):
+    ts = sensor_pipeline.parse_timestamp(value)
+    return None if ts is None else int(ts.timestamp() * 1000)
+
+
+class LatestReadings:
+    """sensor_id -> (timestamp ms, reading as JSON bytes). Lookups take no lock."""
+
+    def __init__(self):
+        self._readings = {}
+        self._lock = threading.Lock()
+        self.updates = 0
+        self.out_of_order = 0
+
+    def __len__(self):
+        return len(self._readings)
+
+    def offer(self, doc):
+        """Keep ``doc`` (a stored reading) if it is newer than what we have for its sensor."""
+        sensor_id = doc.get("sensor_id")
+        ms = _epoch_ms(doc.get("@timestamp"))
+        if sensor_id is None or ms is None:
+            return False
+        sensor_id = sensor_pipeline.ruby_to_s(sensor_id)
+        body = json.dumps({k: doc[k] for k in READING_FIELDS if k in doc}).encode("utf-8")
+        with self._lock:
+            current = self._readings.get(sensor_id)
+            if current is not None and current[0] > ms:
+                self.out_of_order += 1
+                return False
+            self._readings[sensor_id] = (ms, body)
+            self.updates += 1
+        return True
+
+    def get(self, sensor_id):
+        entry = self._readings.get(sensor_id)
+        return None if entry is None else entry[1]
+
+    def many(self, sensor_ids=None):
+        """A JSON object of sensor_id -> reading (null when unknown); every sensor when ``sensor_ids`` is None."""
+        readings = self._readings
+        if sensor_ids is None:
+            sensor_ids = sorted(readings)
+        parts = []
+        for sensor_id in sensor_ids:
+            entry = readings.get(sensor_id)
+            parts.append(json.dumps(sensor_id).encode("utf-8") + b":" + (b"null" if entry is None else entry[1]))
+        return b"{" + b",".join(parts) + b"}"
+
+
+def warm_up(client, readings, indices=DEFAULT_INDICES, since="now-7d", sensor_field="sensor_id", page_size=500):
+    """Offer the newest stored reading of every sensor seen since ``since``; returns how many sensors were read."""
+    after, seen = None, 0
+    while True:
+        composite = {"size": page_size, "sources": [{"sensor_id": {"terms": {"field": sensor_field}}}]}
+        if after is not None:
+            composite["after"] = after
+        latest = {"top_hits": {"size": 1, "sort": [{"@timestamp": "desc"}], "_source": list(READING_FIELDS)}}
+        body = {
+            "size": 0,
+            "query": {"range": {"@timestamp": {"gte": since}}},
+            "aggs": {"sensors": {"composite": composite, "aggs": {"latest": latest}}},
+        }
+        res = client.search(index=indices, body=body, ignore_unavailable=True, allow_no_indices=True)
+        agg = res.get("aggregations", {}).get("sensors", {"buckets": []})
+        for bucket in agg["buckets"]:
+            for hit in bucket["latest"]["hits"]["hits"]:
+                readings.offer(hit["_source"])
+            seen += 1
+        after = agg.get("after_key")
+        if after is None or len(agg["buckets"]) < page_size:
+            return seen
+
+
+class MqttFeed:
+    """Feeds every valid reading on the topic into ``readings`` (anything with an ``offer(doc)``, e.g. alerts.py)."""
+
+    def __init__(self, readings, mqtt_settings, tag="latest"):
+        self.readings = readings
+        self.mqtt_settings = mqtt_settings
+        self.tag = tag
+        self.connected = threading.Event()
+        self.subscribed = threading.Event()
+        self.rejected = 0
+        self._client = None
+
+    def _topics(self):
+        s = self.mqtt_settings
+        return [t for t in (s.get("topic"), s.get("compact_topic")) if t]
+
+    def _on_connect(self, client, userdata, flags, rc):
+        if rc != 0:
+            print(f"[{self.tag}] MQTT connect failed rc={rc}")
+            return
+        self.connected.set()
+        client.subscribe([(topic, 1) for topic in self._topics()])
+
+    def _on_disconnect(self, client, userdata, rc):
+        self.connected.clear()
+
+    def _on_subscribe(self, client, userdata, mid, granted_qos):
+        print(f"[{self.tag}] subscribed to {', '.join(self._topics())}")
+        self.subscribed.set()
+
+    def _on_message(self, client, userdata, msg):
+        received_at = datetime.now(timezone.utc)
+        try:
+            if msg.topic == self.mqtt_settings.get("compact_topic"):
+                events = sensor_pipeline.transform_compact_all(msg.payload, received_at)
+            else:
+                events = sensor_pipeline.transform_all(msg.payload.decode("utf-8", errors="replace"), received_at)
+        except Exception as e:
+            print(f"[{self.tag}] could not process message: {e!r}")
+            return
+        for event in events:
+            if event.get("pipeline_errors"):
+                self.rejected += 1
+            else:
+                self.readings.offer(sensor_pipeline.to_document(event))
+
+    def start(self):
+        s = self.mqtt_settings
+        # A fresh session each time: whatever was missed is in OpenSearch and comes back with the warm-up.
+        client = mqtt.Client(client_id=s.get("client_id", ""), clean_session=True)
+        client.username_pw_set(s["username"], s["password"])
+        client.on_connect = self._on_connect
+        client.on_disconnect = self._on_disconnect
+        client.on_subscribe = self._on_subscribe
+        client.on_message = self._on_message
+        client.reconnect_delay_set(min_delay=1, max_delay=30)
+        client.connect_async(s["host"], int(s["port"]), keepalive=30)
+        client.loop_start()
+        self._client = client
+        return self
+
+    def stop(self):
+        if self._client is not None:
+            self._client.disconnect()
+            self._client.loop_stop()
+
+
+class LatestHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    server_version = "gha-latest"
+    # Headers and body are separate writes; with Nagle on, keep-alive clients wait out a delayed ACK for the body.
+    disable_nagle_algorithm = True
+
+    def log_message(self, format, *args):
+        pass
+
+    def _send(self, status, body):
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.send_header("Cache-Control", "no-store")
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _error(self, status, message):
+        self._send(status, json.dumps({"error": message}).encode("utf-8"))
+
+    def do_GET(self):
+        url = urlsplit(self.path)
+        readings = self.server.readings
+        if url.path == "/health":
+            self._send(200, json.dumps(self.server.health()).encode("utf-8"))
+        elif url.path in ("/latest", "/latest/"):
+            ids = [i for v in parse_qs(url.query).get("sensor_id", []) for i in v.split(",") if i]
+            self._send(200, readings.many(ids or None))
+        elif url.path.startswith("/latest/"):
+            body = readings.get(unquote(url.path[len("/latest/"):]))
+            if body is None:
+                self._error(404, "unknown sensor")
+            else:
+                self._send(200, body)
+        else:
+            self._error(404, "not found")
+
+    def do_POST(self):
+        if urlsplit(self.path).path not in ("/latest", "/latest/"):
+            self._error(404, "not found")
+            return
+        try:
+            request = json.loads(self.rfile.read(int(self.headers.get("Content-Length") or 0)) or b"{}")
+            ids = request["sensor_ids"]
+            if not isinstance(ids, list) or not all(isinstance(i, str) for i in ids):
+                raise ValueError
+        except (ValueError, KeyError, TypeError):
+            self._error(400, 'expected {"sensor_ids": ["...", ...]}')
+            return
+        self._send(200, self.server.readings.many(ids))
+
+
+class LatestServer(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def __init__(self, address, readings, feed=None):
+        super().__init__(address, LatestHandler)
+        self.readings = readings
+        self.feed = feed
+        self.warm = threading.Event()
+
+    def health(self):
+        return {
+            "sensors": len(self.readings),
+            "updates": self.readings.updates,
+            "out_of_order": self.readings.out_of_order,
+            "rejected": self.feed.rejected if self.feed else 0,
+            "warm": self.warm.is_set(),
+            "mqtt_connected": self.feed.connected.is_set() if self.feed else False,
+        }
+
+
+def serve(client, mqtt_settings, port, indices=DEFAULT_INDICES, since="now-7d", sensor_field="sensor_id"):
+    readings = LatestReadings()
+    feed = MqttFeed(readings, mqtt_settings).start()
+    server = LatestServer(("0.0.0.0", port), readings, feed)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    print(f"[latest] listening on :{port}")
+
+    started = time.perf_counter()
+    while True:
+        try:
+            sensors = warm_up(client, readings, indices, since, sensor_field)
+            break
+        except Exception as e:
+            print(f"[latest] warm-up failed ({e!r}); retrying in 5s")
+            time.sleep(5)
+    server.warm.set()
+    print(f"[latest] warmed up {sensors} sensors from {indices} in {time.perf_counter() - started:.2f}s")
+    try:
+        threading.Event().wait()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        feed.stop()
+        server.shutdown()
+    return 0
+
+
+# --- benchmark ---------------------------------------------------------------
+
+
+def _timed(fn, n):
+    samples = []
+    for _ in range(n):
+        started = time.perf_counter()
+        fn()
+        samples.append(time.perf_counter() - started)
+    return {k: (round(v * 1e6, 1) if isinstance(v, float) else v) for k, v in latency_summary(samples).items()}
+
+
+def bench(sensors=500, lookups=5000, batch=50, client=None, indices=DEFAULT_INDICES, sensor_field="sensor_id"):
+    """Lookup latency in microseconds; with ``client``, also the sort-desc search this replaces."""
+    readings = LatestReadings()
+    ids = [f"bench-{i:05d}" for i in range(sensors)]
+    for sensor_id in ids:
+        readings.offer({"sensor_id": sensor_id, "@timestamp": sensor_pipeline.stamp(),
+                        "temperature_c": 21.5, "humidity_pct": 45.0, "light": 300.0})
+    server = LatestServer(("127.0.0.1", 0), readings)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    conn = http.client.HTTPConnection("127.0.0.1", server.server_address[1])
+
+    def request(method, path, body=None):
+        conn.request(method, path, body=body, headers={"Content-Type": "application/json"} if body else {})
+        response = conn.getresponse()
+        response.read()
+        assert response.status == 200, response.status
+
+    report = {"sensors": sensors, "batch": batch, "unit": "us"}
+    try:
+        report["in_process"] = _timed(lambda: readings.get(random.choice(ids)), lookups)
+        report["http_single"] = _timed(lambda: request("GET", f"/latest/{random.choice(ids)}"), lookups)
+        sample = min(batch, sensors)
+        report["http_batch"] = _timed(
+            lambda: request("POST", "/latest", json.dumps({"sensor_ids": random.sample(ids, sample)})),
+            max(1, lookups // 10),
+        )
+    finally:
+        conn.close()
+        server.shutdown()
+        server.server_close()
+
+    if client is not None:
+        res = client.search(index=indices, body={"size": 0, "aggs": {"s": {"terms": {"field": sensor_field, "size": 50}}}},
+                            ignore_unavailable=True, allow_no_indices=True)
+        live = [b["key"] for b in res.get("aggregations", {}).get("s", {}).get("buckets", [])]
+        if live:
+            def search():
+                client.search(index=indices, body={"size": 1, "sort": [{"@timestamp": "desc"}],
+                                                   "query": {"term": {sensor_field: random.choice(live)}}})
+            report["opensearch_sort_desc"] = _timed(search, min(200, lookups))
+    return report
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    sub = parser.add_subparsers(dest="command", required=True)
+    serve_parser = sub.add_parser("serve", help="subscribe, warm up and serve lookups")
+    serve_parser.add_argument("--port", type=int, help="HTTP port (default LATEST_PORT or 8081)")
+    serve_parser.add_argument("--indices", default=DEFAULT_INDICES, help="indices to warm up from (default %(default)s)")
+    serve_parser.add_argument("--warm-since", default="now-7d", help="only sensors with a reading since this")
+    serve_parser.add_argument("--sensor-field", default="sensor_id",
+                              help="sensor_id.keyword for indices created before provision.py's templates")
+    bench_parser = sub.add_parser("bench", help="lookup latency, in-process and over HTTP")
+    bench_parser.add_argument("--sensors", type=int, default=500)
+    bench_parser.add_argument("--lookups", type=int, default=5000)
+    bench_parser.add_argument("--batch", type=int, default=50)
+    bench_parser.add_argument("--opensearch", action="store_true", help="also time the sort-desc search per sensor")
+    bench_parser.add_argument("--sensor-field", default="sensor_id")
+    args = parser.parse_args(argv)
+
+    s = settings()
+    if args.command == "bench":
+        client = make_opensearch_client(**s["opensearch"]) if args.opensearch else None
+        report = bench(args.sensors, args.lookups, args.batch, client, sensor_field=args.sensor_field)
+        print(json.dumps(report, indent=2))
+        return 0
+    client = make_opensearch_client(**s["opensearch"])
+    return serve(client, s["mqtt"], args.port or s["port"], args.indices, args.warm_since, args.sensor_field)
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
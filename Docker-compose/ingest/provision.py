@@ -0,0 +1,528 @@
+"""Index templates and ISM policies for the daily sensor indices.
+
+Installs composable templates for sensors-*, it-sensors-*, sensors-errors-* and
+the sensors-rollup-* indices rollup.py writes; the integration suites' it-run-*
+indices share them. The mappings are explicit and ``dynamic: false``, so stray
+payload keys stay in _source without becoming fields. sensor_id is a keyword,
+readings are floats that reject strings, and every index has one shard, no
+replicas and best_compression. Each family also gets an ISM policy that
+force-merges yesterday's index and deletes it after the retention. The policies
+never make an index read-only or block writes to it. Late readings still land
+in their day's index: batch envelopes flushed after midnight, nodes whose clocks
+are behind, QoS 1 redeliveries from persistent sessions, and readings that
+replay_errors.py recovers (it also deletes from the error indices). A write
+block would answer those with 403s that the logstash output retries forever.
+Reading indices also get a default ingest pipeline that stamps
+``stages.indexed``, the last hop stage_report.py measures.
+
+Indices are named per day by the logstash output rather than written through
+an alias, so the daily name is the rollover; the policies start at the
+force-merge step.
+
+    python provision.py apply                  # install or update templates and policies
+    python provision.py check                  # exit 1 if the cluster differs from this file
+    python provision.py check --strict         # ... or if any existing index predates the templates
+    python provision.py bench --docs 200000    # dynamic vs templated: store size and query latency
+"""
+import argparse
+import fnmatch
+import json
+import os
+import random
+import statistics
+import time
+import uuid
+
+from opensearchpy.exceptions import NotFoundError
+
+from bridge import make_opensearch_client, opensearch_settings
+
+SENSORS_RETENTION = os.getenv("SENSORS_RETENTION", "400d")
+ERRORS_RETENTION = os.getenv("ERRORS_RETENTION", "30d")
+IT_RETENTION = os.getenv("IT_RETENTION", "2d")
+ROLLUP_RETENTION = os.getenv("ROLLUP_RETENTION", "1825d")
+
+_KEYWORD = {"type": "keyword", "ignore_above": 256}
+_READING = {"type": "float", "coerce": False}
+_STAGE = {"type": "date"}
+
+INGEST_PIPELINES = {
+    "gha-stage-stamps": {
+        "description": "Stamp stages.indexed with the ingest time (see stage_report.py)",
+        "processors": [
+            # No override: replayed readings keep the stamp from their first write.
+            {
+                "set": {
+                    "field": "stages.indexed",
+                    "value": "{{_ingest.timestamp}}",
+                    "override": False,
+                    "ignore_failure": True,
+                }
+            },
+        ],
+    },
+}
+
+COMPONENT_TEMPLATES = {
+    "gha-sensors-settings": {
+        "template": {
+            "settings": {
+                "index": {
+                    "number_of_shards": 1,
+                    "number_of_replicas": 0,
+                    "codec": "best_compression",
+                    "refresh_interval": "5s",
+                }
+            }
+        }
+    },
+    "gha-sensors-common": {
+        "template": {
+            "mappings": {
+                "dynamic": False,
+                "properties": {
+                    "@timestamp": {"type": "date"},
+                    "sensor_id": _KEYWORD,
+                    # From the sensor registry (registry.py): greenhouse panels filter on greenhouse_id.
+                    "greenhouse_id": _KEYWORD,
+                    "greenhouse_title": _KEYWORD,
+                    "owner_id": _KEYWORD,
+                    "tags": _KEYWORD,
+                    "app": _KEYWORD,
+                    "input": {"properties": {"type": _KEYWORD}},
+                    # Test traffic can end up in these indices; keep what the suites search on.
+                    "test_run_id": _KEYWORD,
+                    "test_case_id": _KEYWORD,
+                    "golden_id": _KEYWORD,
+                    "fuzz_group": _KEYWORD,
+                    "seq": {"type": "long"},
+                    "published_at": {"type": "double"},
+                },
+            }
+        }
+    },
+    "gha-sensors-stages": {
+        "template": {
+            "settings": {"index": {"default_pipeline": "gha-stage-stamps"}},
+            "mappings": {
+                "properties": {
+                    "stages": {
+                        "properties": {
+                            stage: _STAGE
+                            for stage in ("published", "received", "filter_in", "filter_out", "indexed")
+                        }
+                    },
+                },
+            },
+        }
+    },
+    "gha-sensors-readings": {
+        "template": {
+            "mappings": {
+                "properties": {"temperature_c": _READING, "humidity_pct": _READING, "light": _READING},
+            }
+        }
+    },
+    "gha-sensors-errors": {
+        "template": {
+            "mappings": {
+                "properties": {
+                    "pipeline_errors": _KEYWORD,
+                    "temperature_raw": _KEYWORD,
+                    "humidity_raw": _KEYWORD,
+                    "light_raw": _KEYWORD,
+                    "message": {"type": "text"},
+                },
+            }
+        }
+    },
+    "gha-sensors-rollup": {
+        "template": {
+            "mappings": {
+                "dynamic": False,
+                "properties": {
+                    "@timestamp": {"type": "date"},
+                    "sensor_id": _KEYWORD,
+                    "interval": _KEYWORD,
+                    "doc_count": {"type": "long"},
+                    **{
+                        f"{field}_{stat}": {"type": "long" if stat == "count" else "double"}
+                        for field in ("temperature_c", "humidity_pct", "light")
+                        for stat in ("count", "min", "max", "sum", "avg")
+                    },
+                },
+            }
+        }
+    },
+}
+
+INDEX_TEMPLATES = {
+    "gha-sensors": {
+        "index_patterns": ["sensors-*"],
+        "composed_of": ["gha-sensors-settings", "gha-sensors-common", "gha-sensors-stages", "gha-sensors-readings"],
+        "priority": 100,
+    },
+    "gha-it-sensors": {
+        "index_patterns": ["it-sensors-*", "it-run-*-sensors"],
+        "composed_of": ["gha-sensors-settings", "gha-sensors-common", "gha-sensors-stages", "gha-sensors-readings"],
+        "priority": 100,
+        # Tests poll for visibility; do not make them wait for a 5s refresh.
+        "template": {"settings": {"index": {"refresh_interval": "1s"}}},
+    },
+    "gha-sensors-errors": {
+        "index_patterns": ["sensors-errors-*", "it-run-*-errors"],
+        "composed_of": ["gha-sensors-settings", "gha-sensors-common", "gha-sensors-stages", "gha-sensors-errors"],
+        "priority": 200,
+    },
+    "gha-sensors-rollup": {
+        "index_patterns": ["sensors-rollup-*", "it-run-*-rollup-*"],
+        "composed_of": ["gha-sensors-settings", "gha-sensors-rollup"],
+        "priority": 300,
+    },
+}
+
+
+def _policy(description, patterns, priority, retention, merge=True):
+    """hot -> (next day: force-merge) -> delete after ``retention``.
+
+    No read_only step: late and replayed readings keep arriving in old daily indices (see the module docstring).
+    A write after the merge only adds a small segment. ``merge=False`` skips the warm step, for indices that are
+    written to for longer than a day.
+    """
+    to_delete = [{"state_name": "delete", "conditions": {"min_index_age": retention}}]
+    states = [{"name": "hot", "actions": [], "transitions": to_delete}]
+    if merge:
+        states = [
+            {"name": "hot", "actions": [], "transitions": [{"state_name": "warm", "conditions": {"min_index_age": "1d"}}]},
+            {"name": "warm", "actions": [{"force_merge": {"max_num_segments": 1}}], "transitions": to_delete},
+        ]
+    states.append({"name": "delete", "actions": [{"delete": {}}], "transitions": []})
+    return {
+        "policy": {
+            "description": description,
+            "default_state": "hot",
+            "states": states,
+            "ism_template": [{"index_patterns": patterns, "priority": priority}],
+        }
+    }
+
+
+ISM_POLICIES = {
+    "gha-sensors": _policy("Daily sensor readings", ["sensors-*"], 100, SENSORS_RETENTION),
+    "gha-sensors-errors": _policy(
+        "Rejected sensor readings", ["sensors-errors-*", "it-run-*-errors"], 200, ERRORS_RETENTION
+    ),
+    "gha-it-sensors": _policy("Integration test readings", ["it-sensors-*", "it-run-*-sensors"], 100, IT_RETENTION),
+    # Rollup indices are monthly/yearly and keep being written, so they are never made read-only.
+    "gha-sensors-rollup": _policy(
+        "Sensor rollups", ["sensors-rollup-*", "it-run-*-rollup-*"], 300, ROLLUP_RETENTION, merge=False
+    ),
+}
+
+
+# --- comparison helpers ----------------------------------------------------
+
+
+def flatten(value, prefix=""):
+    """Nested dicts -> {"a.b.c": "leaf"}; leaves are stringified the way OpenSearch echoes settings back."""
+    out = {}
+    if isinstance(value, dict):
+        for key, sub in value.items():
+            out.update(flatten(sub, f"{prefix}{key}."))
+    elif isinstance(value, list):
+        out[prefix[:-1]] = json.dumps(value, sort_keys=True)
+    else:
+        out[prefix[:-1]] = str(value).lower() if isinstance(value, bool) else str(value)
+    return out
+
+
+def _settings_keys(settings):
+    """{"index": {"codec": ..}} and {"codec": ..} both -> {"index.codec": ..}."""
+    flat = flatten(settings or {})
+    return {k if k.startswith("index.") else f"index.{k}": v for k, v in flat.items()}
+
+
+def diff(desired, live):
+    """Keys of ``desired`` (flattened) that are missing or different in ``live``."""
+    return {k: (v, live.get(k)) for k, v in desired.items() if live.get(k) != v}
+
+
+def template_for(index):
+    """The index template OpenSearch would pick for ``index``: highest priority matching pattern."""
+    matching = [
+        (spec["priority"], name)
+        for name, spec in INDEX_TEMPLATES.items()
+        if any(fnmatch.fnmatchcase(index, pattern) for pattern in spec["index_patterns"])
+    ]
+    return max(matching)[1] if matching else None
+
+
+def composed(name):
+    """The settings and mappings an index created from template ``name`` should get."""
+    spec = INDEX_TEMPLATES[name]
+    settings, properties, mappings = {}, {}, {}
+    for part in [COMPONENT_TEMPLATES[c]["template"] for c in spec["composed_of"]] + [spec.get("template", {})]:
+        settings.update(_settings_keys(part.get("settings")))
+        part_mappings = part.get("mappings", {})
+        properties.update(part_mappings.get("properties", {}))
+        mappings.update({k: v for k, v in part_mappings.items() if k != "properties"})
+    mappings["properties"] = properties
+    return settings, mappings
+
+
+def _without_retry(value):
+    if isinstance(value, dict):
+        return {k: _without_retry(v) for k, v in value.items() if k != "retry"}
+    if isinstance(value, list):
+        return [_without_retry(v) for v in value]
+    return value
+
+
+def _policy_view(policy):
+    """The parts of a policy we own, without the ids, timestamps and retry defaults OpenSearch adds."""
+    return {
+        "default_state": policy.get("default_state"),
+        "states": _without_retry(policy.get("states")),
+        "ism_template": [
+            {"index_patterns": t.get("index_patterns"), "priority": t.get("priority")}
+            for t in policy.get("ism_template") or []
+        ],
+    }
+
+
+# --- apply / check -----------------------------------------------------------
+
+
+def apply(client):
+    # Pipelines first: an index template naming a missing default_pipeline breaks writes.
+    for name, body in INGEST_PIPELINES.items():
+        client.ingest.put_pipeline(id=name, body=body)
+        print(f"[provision] ingest pipeline {name}")
+    for name, body in COMPONENT_TEMPLATES.items():
+        client.cluster.put_component_template(name=name, body=body)
+        print(f"[provision] component template {name}")
+    for name, body in INDEX_TEMPLATES.items():
+        client.indices.put_index_template(name=name, body=body)
+        print(f"[provision] index template {name} -> {', '.join(body['index_patterns'])}")
+    ism = client.plugins.index_management
+    for name, body in ISM_POLICIES.items():
+        try:
+            current = ism.get_policy(policy=name)
+        except NotFoundError:
+            ism.put_policy(policy=name, body=body)
+            print(f"[provision] ISM policy {name} created")
+            continue
+        if _policy_view(current["policy"]) == _policy_view(body["policy"]):
+            print(f"[provision] ISM policy {name} unchanged")
+            continue
+        ism.put_policy(
+            policy=name,
+            body=body,
+            params={"if_seq_no": current["_seq_no"], "if_primary_term": current["_primary_term"]},
+        )
+        # Managed indices keep the policy version they started with; move them to this one at their next transition.
+        patterns = ",".join(body["policy"]["ism_template"][0]["index_patterns"])
+        ism.change_policy(index=patterns, body={"policy_id": name})
+        print(f"[provision] ISM policy {name} updated (applies to indices as they change state)")
+    _unblock_writes(client)
+
+
+def _unblock_writes(client):
+    """Lift the write block earlier policy versions put on day-old indices (their read_only step)."""
+    patterns = ",".join(p for name in ("gha-sensors", "gha-sensors-errors", "gha-it-sensors")
+                        for p in INDEX_TEMPLATES[name]["index_patterns"])
+    settings = client.indices.get_settings(index=patterns, name="index.blocks.write", ignore_unavailable=True,
+                                           allow_no_indices=True, expand_wildcards="open")
+    blocked = sorted(i for i, s in settings.items()
+                     if str(s["settings"].get("index", {}).get("blocks", {}).get("write")).lower() == "true")
+    if blocked:
+        client.indices.put_settings(index=",".join(blocked), body={"index.blocks.write": False})
+        print(f"[provision] write block lifted on {len(blocked)} indices: {', '.join(blocked)}")
+
+
+def check(client, strict=False):
+    """Returns a list of problems; template/policy drift always counts, index drift only with ``strict``."""
+    problems, warnings = [], []
+
+    for name, body in INGEST_PIPELINES.items():
+        try:
+            live = client.ingest.get_pipeline(id=name)[name]
+        except NotFoundError:
+            problems.append(f"ingest pipeline {name} is missing")
+            continue
+        if live.get("processors") != body["processors"]:
+            problems.append(f"ingest pipeline {name} differs from provision.py")
+
+    for name, body in COMPONENT_TEMPLATES.items():
+        try:
+            live = client.cluster.get_component_template(name=name)["component_templates"][0]["component_template"]
+        except NotFoundError:
+            problems.append(f"component template {name} is missing")
+            continue
+        want, got = body["template"], live.get("template", {})
+        delta = diff(_settings_keys(want.get("settings")), _settings_keys(got.get("settings")))
+        delta.update(diff(flatten(want.get("mappings", {})), flatten(got.get("mappings", {}))))
+        if delta:
+            problems.append(f"component template {name} differs: {delta}")
+
+    for name, body in INDEX_TEMPLATES.items():
+        try:
+            live = client.indices.get_index_template(name=name)["index_templates"][0]["index_template"]
+        except NotFoundError:
+            problems.append(f"index template {name} is missing")
+            continue
+        for key in ("index_patterns", "composed_of", "priority"):
+            if live.get(key) != body[key]:
+                problems.append(f"index template {name}: {key} is {live.get(key)!r}, expected {body[key]!r}")
+        delta = diff(
+            _settings_keys(body.get("template", {}).get("settings")),
+            _settings_keys(live.get("template", {}).get("settings")),
+        )
+        if delta:
+            problems.append(f"index template {name} settings differ: {delta}")
+
+    for name, body in ISM_POLICIES.items():
+        try:
+            live = client.plugins.index_management.get_policy(policy=name)["policy"]
+        except NotFoundError:
+            problems.append(f"ISM policy {name} is missing")
+            continue
+        if _policy_view(live) != _policy_view(body["policy"]):
+            problems.append(f"ISM policy {name} differs from provision.py")
+
+    patterns = ",".join(p for spec in INDEX_TEMPLATES.values() for p in spec["index_patterns"])
+    indices = client.indices.get(index=patterns, ignore_unavailable=True, allow_no_indices=True)
+    for index, info in sorted(indices.items()):
+        template = template_for(index)
+        settings, mappings = composed(template)
+        delta = diff(settings, _settings_keys(info.get("settings")))
+        delta.update(diff(flatten(mappings), flatten(info.get("mappings", {}))))
+        if delta:
+            warnings.append(f"index {index} does not match {template} ({len(delta)} differences, e.g. {next(iter(delta))})")
+
+    for w in warnings:
+        print(f"[provision] WARNING {w}")
+    for p in problems:
+        print(f"[provision] DRIFT {p}")
+    return problems + (warnings if strict else [])
+
+
+# --- benchmark ---------------------------------------------------------------
+
+
+def _bench_docs(n, sensors, stray_keys):
+    start = time.time() - 7 * 86400
+    for i in range(n):
+        doc = {
+            "@timestamp": time.strftime("%Y-%m-%dT%H:%M:%S.000Z", time.gmtime(start + i * 7 * 86400 / n)),
+            "sensor_id": f"gh-{i % sensors:04d}",
+            "temperature_c": round(random.uniform(12, 32), 2),
+            "humidity_pct": round(random.uniform(30, 90), 1),
+            "light": round(random.uniform(0, 20000), 1),
+            "tags": ["mqtt", "ghanode"],
+            "app": "ghanode_sensor",
+            "input": {"type": "mqtt"},
+        }
+        # Firmware debug keys: the thing dynamic mapping turns into ever more fields.
+        for k in random.sample(range(stray_keys), 3) if stray_keys else []:
+            doc[f"debug_{k}"] = random.random()
+        yield doc
+
+
+def _store_bytes(client, index):
+    return client.indices.stats(index=index, metric="store")["indices"][index]["primaries"]["store"]["size_in_bytes"]
+
+
+def _field_count(client, index):
+    mapping = client.indices.get_mapping(index=index)[index]["mappings"]
+    return sum(1 for k in flatten(mapping) if k.endswith(".type"))
+
+
+def _panel_query(sensor_field, sensor):
+    """What a Grafana time-series panel asks for: one sensor, 24h, hourly averages."""
+    return {
+        "size": 0,
+        "query": {"bool": {"filter": [{"term": {sensor_field: sensor}}, {"range": {"@timestamp": {"gte": "now-2d"}}}]}},
+        "aggs": {
+            "per_hour": {
+                "date_histogram": {"field": "@timestamp", "fixed_interval": "1h"},
+                "aggs": {"t": {"avg": {"field": "temperature_c"}}, "h": {"avg": {"field": "humidity_pct"}}},
+            }
+        },
+    }
+
+
+def bench(client, docs=200000, sensors=50, stray_keys=40, queries=200, keep=False):
+    run = uuid.uuid4().hex[:8]
+    settings, mappings = composed("gha-sensors")
+    targets = {
+        f"bench-dynamic-{run}": {"settings": {"index": {"number_of_shards": 1, "number_of_replicas": 0}}},
+        f"bench-templated-{run}": {"settings": settings, "mappings": mappings},
+    }
+    report = {"docs": docs, "sensors": sensors, "stray_keys": stray_keys}
+    try:
+        for index, body in targets.items():
+            client.indices.create(index=index, body=body)
+            batch = []
+            for doc in _bench_docs(docs, sensors, stray_keys):
+                batch.append(json.dumps({"index": {"_index": index}}) + "\n" + json.dumps(doc) + "\n")
+                if len(batch) == 5000:
+                    client.bulk(body="".join(batch))
+                    batch = []
+            if batch:
+                client.bulk(body="".join(batch))
+            client.indices.refresh(index=index)
+            client.indices.forcemerge(index=index, max_num_segments=1)
+            sensor_field = "sensor_id.keyword" if "dynamic" in index else "sensor_id"
+            latencies = []
+            for _ in range(queries):
+                body = _panel_query(sensor_field, f"gh-{random.randrange(sensors):04d}")
+                t0 = time.perf_counter()
+                client.search(index=index, body=body, request_cache=False)
+                latencies.append((time.perf_counter() - t0) * 1000)
+            latencies.sort()
+            kind = "dynamic" if "dynamic" in index else "templated"
+            report[kind] = {
+                "store_mb": round(_store_bytes(client, index) / 1e6, 2),
+                "mapped_fields": _field_count(client, index),
+                "query_ms_p50": round(statistics.median(latencies), 2),
+                "query_ms_p95": round(latencies[int(len(latencies) * 0.95) - 1], 2),
+            }
+            print(f"[provision] {kind}: {report[kind]}")
+    finally:
+        if not keep:
+            client.indices.delete(index=",".join(targets), ignore_unavailable=True)
+    dyn, tpl = report["dynamic"], report["templated"]
+    report["store_saving_pct"] = round(100 * (1 - tpl["store_mb"] / dyn["store_mb"]), 1) if dyn["store_mb"] else None
+    return report
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    sub = parser.add_subparsers(dest="command", required=True)
+    sub.add_parser("apply", help="install or update templates and ISM policies")
+    check_parser = sub.add_parser("check", help="compare the live cluster with this file")
+    check_parser.add_argument("--strict", action="store_true", help="also fail on existing indices that differ")
+    bench_parser = sub.add_parser("bench", help="dynamic vs templated index: store size and panel query latency")
+    bench_parser.add_argument("--docs", type=int, default=200000)
+    bench_parser.add_argument("--sensors", type=int, default=50)
+    bench_parser.add_argument("--stray-keys", type=int, default=40, help="distinct junk keys sprinkled over payloads")
+    bench_parser.add_argument("--queries", type=int, default=200)
+    bench_parser.add_argument("--keep", action="store_true", help="do not delete the bench indices")
+    args = parser.parse_args(argv)
+
+    client = make_opensearch_client(**opensearch_settings())
+    if args.command == "apply":
+        apply(client)
+        return 0
+    if args.command == "check":
+        problems = check(client, strict=args.strict)
+        print(f"[provision] {'OK' if not problems else f'{len(problems)} problem(s)'}")
+        return 1 if problems else 0
+    report = bench(client, args.docs, args.sensors, args.stray_keys, args.queries, args.keep)
+    print(json.dumps(report, indent=2))
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
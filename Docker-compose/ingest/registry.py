@@ -0,0 +1,510 @@
+"""Sensor registry: which greenhouse each sensor belongs to, cached locally for ingest-time enrichment.
+
+Greenhouses live in PocketBase; the REGISTRY_COLLECTION collection (default
+``sensor_registry``) has one record per sensor with the text fields
+``sensor_id``, ``greenhouse_id`` (the record id in ``<user>_greenhouses``),
+``greenhouse_title`` and ``owner_id``. Every reading of a registered sensor
+gets the last three merged in at ingest, so "all readings of greenhouse X" is
+one term query on greenhouse_id instead of a terms query over a sensor list
+the client resolved first.
+
+The ingest path never asks PocketBase about an event:
+
+* The whole collection is read in pages of REGISTRY_PAGE_SIZE records into a
+  dict that is swapped in whole; a lookup is a dict access.
+* It is read again every REGISTRY_TTL seconds, and REGISTRY_DEBOUNCE seconds
+  after PocketBase's realtime API reports a change to the collection (or
+  after POST /invalidate), so a burst of edits costs one reload. A dropped
+  realtime connection counts as a change, since edits may have been missed.
+* A failed reload keeps the last table. REGISTRY_FILE holds the table as the
+  dictionary of logstash's translate filter (sensor_id -> JSON object) and is
+  the warm start after a restart, before PocketBase has answered.
+
+sensor_pipeline.use_registry() puts a registry on the reference pipeline;
+install_from_env() does that for bridge.py and replay_errors.py when
+REGISTRY_URL is set. REGISTRY_REQUIRED is false by default. An unknown sensor's
+reading is then indexed as usual, just without greenhouse fields. The
+collection starts out empty and existing nodes are registered one by one, and
+until they all are, rejecting unknown sensors would send every live reading to
+the error index. Set REGISTRY_REQUIRED=true once the registry is complete
+(logstash.conf reads the same variable). A reading of an unknown sensor then
+fails validation with ``unknown_sensor`` and goes to the error index. Once the
+sensor is registered, ``replay_errors.py --error unknown_sensor`` writes it
+where it belongs.
+
+    GET  /stats        sensors, table version and age, reloads, failures, invalidations
+    POST /invalidate   reload now (for a PocketBase hook, or by hand)
+
+    python registry.py serve                             # :8085, keeps REGISTRY_FILE in step for logstash
+    python registry.py bench --greenhouses 20 --sensors 10
+    python registry.py bench --ingest-only               # enrichment cost per reading, no OpenSearch
+"""
+import argparse
+import json
+import os
+import random
+import threading
+import time
+import urllib.request
+import uuid
+from datetime import datetime, timedelta, timezone
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlencode
+
+import sensor_pipeline
+from bridge import make_opensearch_client, opensearch_settings
+from latency import latency_summary
+from provision import composed
+
+ENRICHED_FIELDS = ("greenhouse_id", "greenhouse_title", "owner_id")
+
+
+def settings():
+    return {
+        "url": os.getenv("REGISTRY_URL", ""),
+        "collection": os.getenv("REGISTRY_COLLECTION", "sensor_registry"),
+        "token": os.getenv("REGISTRY_TOKEN", ""),
+        "file": os.getenv("REGISTRY_FILE", ""),
+        "ttl": float(os.getenv("REGISTRY_TTL", "300")),
+        "debounce": float(os.getenv("REGISTRY_DEBOUNCE", "1.0")),
+        "page_size": int(os.getenv("REGISTRY_PAGE_SIZE", "500")),
+        "timeout": float(os.getenv("REGISTRY_TIMEOUT", "10")),
+        "required": os.getenv("REGISTRY_REQUIRED", "false") == "true",
+        "port": int(os.getenv("REGISTRY_PORT", "8085")),
+    }
+
+
+def build_table(records):
+    """sensor_id -> the fields its readings get; records without a sensor_id or greenhouse_id are left out."""
+    table = {}
+    for record in records:
+        sensor_id = record.get("sensor_id")
+        if not isinstance(sensor_id, str) or not sensor_id.strip() or not record.get("greenhouse_id"):
+            continue
+        table[sensor_id.strip()] = {f: record[f] for f in ENRICHED_FIELDS if record.get(f) not in (None, "")}
+    return table
+
+
+def write_dictionary(table, path):
+    """The table as translate's dictionary (values are the JSON its json filter merges in), replaced atomically."""
+    tmp = f"{path}.tmp"
+    with open(tmp, "w") as f:
+        json.dump({sensor_id: json.dumps(entry, sort_keys=True) for sensor_id, entry in sorted(table.items())}, f)
+    os.replace(tmp, path)
+
+
+def read_dictionary(path):
+    try:
+        with open(path) as f:
+            return {sensor_id: json.loads(value) for sensor_id, value in json.load(f).items()}
+    except (OSError, ValueError, AttributeError) as e:
+        print(f"[registry] cannot read {path}: {e!r}")
+        return {}
+
+
+class PocketBase:
+    """The registry collection over PocketBase's REST and realtime APIs."""
+
+    def __init__(self, url, collection, token="", page_size=500, timeout=10.0):
+        self.url = url.rstrip("/")
+        self.collection = collection
+        self.token = token
+        self.page_size = page_size
+        self.timeout = timeout
+        self.pages = 0
+
+    def _request(self, path, body=None, timeout=None):
+        headers = {"Accept": "application/json"}
+        if self.token:
+            headers["Authorization"] = self.token
+        data = None
+        if body is not None:
+            data = json.dumps(body).encode()
+            headers["Content-Type"] = "application/json"
+        request = urllib.request.Request(f"{self.url}{path}", data=data, headers=headers)
+        return urllib.request.urlopen(request, timeout=timeout or self.timeout)
+
+    def records(self):
+        """Every record of the collection, a page at a time; skipTotal spares PocketBase a count per page."""
+        fields = ",".join(("sensor_id",) + ENRICHED_FIELDS)
+        page = 1
+        while True:
+            query = urlencode({"page": page, "perPage": self.page_size, "skipTotal": 1, "fields": fields})
+            with self._request(f"/api/collections/{self.collection}/records?{query}") as response:
+                items = json.loads(response.read())["items"]
+            self.pages += 1
+            yield from items
+            if len(items) < self.page_size:
+                return
+            page += 1
+
+    def watch(self, on_change, stop, idle_timeout=330.0):
+        """Follow the realtime stream, calling ``on_change(action, record)`` per change, until it ends or ``stop``.
+
+        True if the subscription was made, i.e. changes could have been missed
+        once this returns. PocketBase drops idle clients after five minutes;
+        the caller reconnects.
+        """
+        subscribed = False
+        with self._request("/api/realtime", timeout=idle_timeout) as stream:
+            event, data = None, []
+            for raw in stream:
+                if stop.is_set():
+                    break
+                line = raw.decode("utf-8").rstrip("\r\n")
+                if line.startswith("event:"):
+                    event = line[6:].strip()
+                elif line.startswith("data:"):
+                    data.append(line[5:].strip())
+                elif not line and event is not None:
+                    message = json.loads("\n".join(data) or "{}")
+                    if event == "PB_CONNECT":
+                        body = {"clientId": message["clientId"], "subscriptions": [f"{self.collection}/*"]}
+                        self._request("/api/realtime", body).close()
+                        subscribed = True
+                    elif event.startswith(self.collection):
+                        on_change(message.get("action"), message.get("record") or {})
+                    event, data = None, []
+        return subscribed
+
+
+class SensorRegistry:
+    """The table the ingest path reads; only ever reloaded in bulk, in the background."""
+
+    def __init__(self, load, ttl=300.0, debounce=1.0, path=None, clock=time.monotonic):
+        self.load = load
+        self.ttl = ttl
+        self.debounce = debounce
+        self.path = path
+        self.clock = clock
+        self.table = read_dictionary(path) if path and os.path.exists(path) else {}
+        self.version = 0
+        self.loaded_at = None
+        self.reloads = 0
+        self.failures = 0
+        self.invalidations = 0
+        self.last_error = None
+        self._changed = threading.Event()
+        self._stop = threading.Event()
+        self._threads = []
+
+    def get(self, sensor_id, default=None):
+        return self.table.get(sensor_id, default)
+
+    def __len__(self):
+        return len(self.table)
+
+    def reload(self):
+        """Read the whole collection and swap it in; False, with the old table kept, if that failed."""
+        try:
+            table = build_table(self.load())
+        except (OSError, ValueError, KeyError) as e:
+            self.failures += 1
+            self.last_error = repr(e)
+            print(f"[registry] reload failed, keeping {len(self.table)} sensors: {e!r}")
+            return False
+        self.reloads += 1
+        self.loaded_at = self.clock()
+        if table != self.table or self.version == 0:
+            self.table = table
+            self.version += 1
+            if self.path:
+                write_dictionary(table, self.path)
+            print(f"[registry] {len(table)} sensors (version {self.version})")
+        return True
+
+    def invalidate(self, reason=""):
+        self.invalidations += 1
+        if reason:
+            print(f"[registry] invalidated: {reason}")
+        self._changed.set()
+
+    def due_in(self):
+        return 0.0 if self.loaded_at is None else max(0.0, self.loaded_at + self.ttl - self.clock())
+
+    def run(self):
+        """Reload when the TTL runs out or a debounce after an invalidation; failed reloads back off."""
+        delay = 1.0
+        while not self._stop.is_set():
+            if self._changed.wait(self.due_in()):
+                self._stop.wait(self.debounce)  # one reload for a burst of edits
+                self._changed.clear()
+            if self._stop.is_set():
+                break
+            if self.reload():
+                delay = 1.0
+            else:
+                self._stop.wait(delay)
+                delay = min(delay * 2, max(self.ttl, 1.0))
+
+    def watch(self, source):
+        def changed(action, record):
+            self.invalidate(f"{action} {record.get('sensor_id')}")
+
+        delay = 1.0
+        while not self._stop.is_set():
+            subscribed = False
+            try:
+                subscribed = source.watch(changed, self._stop)
+            except (OSError, ValueError, KeyError) as e:
+                print(f"[registry] realtime stream failed: {e!r}")
+            if self._stop.is_set():
+                break
+            if subscribed:
+                self.invalidate("realtime stream reconnecting")
+                delay = 1.0
+            self._stop.wait(delay)
+            delay = min(delay * 2, 60.0)
+
+    def start(self, source=None):
+        """Load once, then keep the table fresh in the background; ``source.watch`` adds change-driven reloads."""
+        self.reload()
+        self._threads = [threading.Thread(target=self.run, name="registry-reload", daemon=True)]
+        if source is not None:
+            watcher = threading.Thread(target=self.watch, args=(source,), name="registry-watch", daemon=True)
+            self._threads.append(watcher)
+        for thread in self._threads:
+            thread.start()
+        return self
+
+    def stop(self, timeout=5.0):
+        self._stop.set()
+        self._changed.set()
+        for thread in self._threads:
+            thread.join(timeout)
+
+    def stats(self):
+        return {
+            "sensors": len(self.table),
+            "version": self.version,
+            "age_s": None if self.loaded_at is None else round(self.clock() - self.loaded_at, 1),
+            "reloads": self.reloads,
+            "failures": self.failures,
+            "invalidations": self.invalidations,
+            "last_error": self.last_error,
+        }
+
+
+def from_settings(s):
+    source = PocketBase(s["url"], s["collection"], s["token"], s["page_size"], s["timeout"])
+    return SensorRegistry(source.records, s["ttl"], s["debounce"], s["file"] or None), source
+
+
+def install_from_env(watch=True):
+    """Enrich sensor_pipeline's readings from PocketBase if REGISTRY_URL is set; the started registry, or None."""
+    s = settings()
+    if not s["url"]:
+        return None
+    registry, source = from_settings(s)
+    registry.start(source if watch else None)
+    sensor_pipeline.use_registry(registry, s["required"])
+    print(f"[registry] {s['url']} {s['collection']}: {len(registry)} sensors, required={s['required']}")
+    return registry
+
+
+# --- serve -------------------------------------------------------------------
+
+
+class RegistryHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    server_version = "gha-registry"
+
+    def log_message(self, format, *args):
+        pass
+
+    def _send(self, status, body):
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_GET(self):
+        if self.path.rstrip("/") != "/stats":
+            self._send(404, b'{"error": "not found"}')
+            return
+        self._send(200, json.dumps(self.server.registry.stats()).encode())
+
+    def do_POST(self):
+        self.rfile.read(int(self.headers.get("Content-Length") or 0))
+        if self.path.rstrip("/") != "/invalidate":
+            self._send(404, b'{"error": "not found"}')
+            return
+        self.server.registry.invalidate("POST /invalidate")
+        self._send(202, b'{"invalidated": true}')
+
+
+class RegistryServer(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def __init__(self, address, registry):
+        super().__init__(address, RegistryHandler)
+        self.registry = registry
+
+
+def serve(s):
+    registry, source = from_settings(s)
+    if s["file"] and not os.path.exists(s["file"]):
+        write_dictionary({}, s["file"])  # translate will not start without one
+    server = RegistryServer(("0.0.0.0", s["port"]), registry)
+    print(f"[registry] :{s['port']} {s['url']} {s['collection']} -> {s['file'] or '(no file)'}, ttl {s['ttl']:.0f}s")
+    registry.start(source)
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        registry.stop()
+    return 0
+
+
+# --- benchmark ---------------------------------------------------------------
+
+
+def bench_table(greenhouses, sensors):
+    return {
+        f"gh{g:03d}-s{s:03d}": {"greenhouse_id": f"gh{g:03d}", "greenhouse_title": f"Greenhouse {g}",
+                                "owner_id": "bench"}
+        for g in range(greenhouses)
+        for s in range(sensors)
+    }
+
+
+def bench_messages(sensor_ids, n):
+    start = datetime.now(timezone.utc) - timedelta(days=2)
+    step = 2 * 86400 / max(n, 1)
+    for i in range(n):
+        yield json.dumps({
+            "Sensor ID": sensor_ids[i % len(sensor_ids)],
+            "seq": i,
+            "timestamp": sensor_pipeline.stamp(start + timedelta(seconds=i * step)),
+            "temperature": round(random.uniform(12, 32), 2),
+            "humidity": round(random.uniform(30, 90), 1),
+            "light": round(random.uniform(0, 20000), 1),
+        })
+
+
+def bench_ingest(greenhouses=20, sensors=10, readings=50000, rounds=5):
+    """Readings/s through the reference pipeline with and without enrichment; leaves no registry installed.
+
+    The two are timed in alternating rounds and the best round of each is
+    kept, so a noisy neighbour does not land on one side only.
+    """
+    table = bench_table(greenhouses, sensors)
+    messages = list(bench_messages(list(table), readings))
+    received_at = datetime.now(timezone.utc)
+    best = {"plain": None, "enriched": None}
+    try:
+        for _ in range(rounds):
+            for name, registry in (("plain", None), ("enriched", table)):
+                sensor_pipeline.use_registry(registry, required=registry is not None)
+                t0 = time.perf_counter()
+                pairs = sensor_pipeline.process_batch(messages, received_at)
+                took = time.perf_counter() - t0
+                best[name] = took if best[name] is None else min(best[name], took)
+                if registry is not None and not all(event.get("greenhouse_id") for _, event in pairs):
+                    raise AssertionError("enriched run left readings without greenhouse_id")
+                del pairs
+    finally:
+        sensor_pipeline.use_registry(None)
+    report = {"readings": readings, "sensors": len(table)}
+    for name, took in best.items():
+        report[f"{name}_per_s"] = round(readings / took)
+        report[f"{name}_us_per_reading"] = round(took / readings * 1e6, 2)
+    report["overhead_pct"] = round(100 * (best["enriched"] / best["plain"] - 1), 1)
+    print(f"[registry] ingest: {report}")
+    return report
+
+
+def greenhouse_query(clause):
+    """A greenhouse dashboard panel: hourly averages over two days, narrowed by ``clause``."""
+    return {
+        "size": 0,
+        "track_total_hits": True,
+        "query": {"bool": {"filter": [clause, {"range": {"@timestamp": {"gte": "now-2d"}}}]}},
+        "aggs": {
+            "per_hour": {
+                "date_histogram": {"field": "@timestamp", "fixed_interval": "1h"},
+                "aggs": {"t": {"avg": {"field": "temperature_c"}}, "h": {"avg": {"field": "humidity_pct"}}},
+            }
+        },
+    }
+
+
+def bench_queries(client, greenhouses=20, sensors=10, docs=200000, queries=200, keep=False):
+    """Per-greenhouse panel latency: terms over the greenhouse's sensors vs a term on the enriched greenhouse_id."""
+    table = bench_table(greenhouses, sensors)
+    members = {}
+    for sensor_id, entry in table.items():
+        members.setdefault(entry["greenhouse_id"], []).append(sensor_id)
+    index = f"bench-registry-{uuid.uuid4().hex[:8]}"
+    index_settings, mappings = composed("gha-sensors")
+    client.indices.create(index=index, body={"settings": index_settings, "mappings": mappings})
+    report = {"docs": docs, "greenhouses": greenhouses, "sensors_per_greenhouse": sensors}
+    sensor_pipeline.use_registry(table, required=True)
+    try:
+        batch = []
+        for _, event in sensor_pipeline.process_batch(bench_messages(list(table), docs)):
+            batch.append(json.dumps({"index": {"_index": index}}) + "\n"
+                         + json.dumps(sensor_pipeline.to_document(event), default=str) + "\n")
+            if len(batch) == 5000:
+                client.bulk(body="".join(batch))
+                batch = []
+        if batch:
+            client.bulk(body="".join(batch))
+        client.indices.refresh(index=index)
+        client.indices.forcemerge(index=index, max_num_segments=1)
+        plans = {
+            "client_side": lambda gh: {"terms": {"sensor_id": members[gh]}},
+            "enriched": lambda gh: {"term": {"greenhouse_id": gh}},
+        }
+        for gh in list(members)[:3]:
+            counts = {name: client.search(index=index, body=greenhouse_query(plan(gh)))["hits"]["total"]["value"]
+                      for name, plan in plans.items()}
+            if len(set(counts.values())) != 1:
+                raise AssertionError(f"{gh}: the two queries disagree: {counts}")
+        for name, plan in plans.items():
+            latencies = []
+            for _ in range(queries):
+                body = greenhouse_query(plan(random.choice(list(members))))
+                t0 = time.perf_counter()
+                client.search(index=index, body=body, request_cache=False)
+                latencies.append(time.perf_counter() - t0)
+            summary = latency_summary(latencies)
+            report[name] = {f"query_ms_p{p}": round(summary[f"p{p}"] * 1000, 2) for p in (50, 95)}
+            print(f"[registry] {name}: {report[name]}")
+    finally:
+        sensor_pipeline.use_registry(None)
+        if not keep:
+            client.indices.delete(index=index, ignore_unavailable=True)
+    client_side, enriched = report["client_side"]["query_ms_p50"], report["enriched"]["query_ms_p50"]
+    report["speedup_p50"] = round(client_side / max(enriched, 0.001), 2)
+    return report
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    sub = parser.add_subparsers(dest="command", required=True)
+    sub.add_parser("serve", help="keep REGISTRY_FILE in step with PocketBase, serve /stats and /invalidate")
+    bench_parser = sub.add_parser("bench", help="enrichment cost per reading and per-greenhouse query latency")
+    bench_parser.add_argument("--greenhouses", type=int, default=20)
+    bench_parser.add_argument("--sensors", type=int, default=10, help="sensors per greenhouse")
+    bench_parser.add_argument("--readings", type=int, default=50000, help="readings for the ingest timing")
+    bench_parser.add_argument("--docs", type=int, default=200000, help="documents in the query bench index")
+    bench_parser.add_argument("--queries", type=int, default=200)
+    bench_parser.add_argument("--ingest-only", action="store_true", help="skip the OpenSearch part")
+    bench_parser.add_argument("--keep", action="store_true", help="do not delete the bench index")
+    args = parser.parse_args(argv)
+
+    if args.command == "serve":
+        return serve(settings())
+    report = {"ingest": bench_ingest(args.greenhouses, args.sensors, args.readings)}
+    if not args.ingest_only:
+        client = make_opensearch_client(**opensearch_settings())
+        report["queries"] = bench_queries(client, args.greenhouses, args.sensors, args.docs, args.queries, args.keep)
+    print(json.dumps(report, indent=2))
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
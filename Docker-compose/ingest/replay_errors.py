@@ -0,0 +1,268 @@
+"""Replay the sensors-errors-* dead-letter indices through the current rules.
+
+Error documents are streamed with a point-in-time and search_after, one page at
+a time (the next page is fetched while the current one is written), so memory
+stays flat however many documents match. Each one is run through
+sensor_pipeline.py again: from its original ``message`` when it has one,
+otherwise from ``sensor_id`` and the ``*_raw`` fields. Its ``@timestamp`` is
+used as the receive time, so recovered readings keep their original timestamp
+and land in the sensors-* index of that day. They are bulk-written with the
+error document's _id, so re-running a replay does not duplicate anything.
+
+    python replay_errors.py --dry-run                               # count what would be recovered
+    python replay_errors.py --since 2025-09-01 --error invalid_humidity
+    python replay_errors.py --delete                                # also drop replayed error docs
+    python replay_errors.py --error unknown_sensor                  # once the sensors are registered (REGISTRY_URL)
+"""
+import argparse
+import json
+import queue
+import threading
+import time
+
+from opensearchpy.exceptions import NotFoundError
+
+import sensor_pipeline
+from bridge import make_opensearch_client, opensearch_settings
+from registry import install_from_env
+
+DEFAULT_INDICES = sensor_pipeline.ERROR_INDEX_PREFIX + "*"
+# Tags the pipeline itself adds; everything else (filebeat's) is carried over.
+PIPELINE_TAGS = {"ingest_error", "_jsonparsefailure", "_dateparsefailure", "_timestampparsefailure"}
+REPLAYED_TAG = "replayed"
+_DONE = object()
+
+
+def rebuild_message(doc):
+    message = doc.get("message")
+    if isinstance(message, str):
+        return message
+    payload = {}
+    if doc.get("sensor_id") is not None:
+        payload["Sensor ID"] = doc["sensor_id"]
+    for _, name in sensor_pipeline.READINGS:
+        if f"{name}_raw" in doc:
+            payload[name] = doc[f"{name}_raw"]
+    return json.dumps(payload)
+
+
+def carried_fields(doc):
+    fields = {k: doc[k] for k in ("app", "input") if k in doc}
+    tags = doc.get("tags")
+    tags = tags if isinstance(tags, list) else [] if tags is None else [tags]
+    fields["tags"] = [t for t in tags if t not in PIPELINE_TAGS and t != REPLAYED_TAG] + [REPLAYED_TAG]
+    return fields
+
+
+def revalidate(doc):
+    """An error document -> (index, document) under the current rules, or None if it still fails."""
+    received_at = sensor_pipeline.parse_timestamp(doc.get("@timestamp"))
+    if received_at is None:
+        return None
+    index, event = sensor_pipeline.process(rebuild_message(doc), received_at, carried_fields(doc))
+    if event.get("pipeline_errors"):
+        return None
+    # Keep the original trip's stage stamps; the replay's own would skew stage_report.py.
+    if isinstance(doc.get("stages"), dict):
+        event["stages"] = doc["stages"]
+    else:
+        event.pop("stages", None)
+    return index, sensor_pipeline.to_document(event)
+
+
+def build_query(since=None, until=None, errors=None):
+    filters = []
+    if since or until:
+        bounds = {}
+        if since:
+            bounds["gte"] = since
+        if until:
+            bounds["lt"] = until
+        filters.append({"range": {"@timestamp": bounds}})
+    if errors:
+        filters.append({"terms": {"pipeline_errors": errors}})
+    return {"bool": {"filter": filters}} if filters else {"match_all": {}}
+
+
+def stream_pages(client, indices, query, page_size=1000, keep_alive="5m", source=None, slice_spec=None, pit_id=None):
+    """Yield pages of hits from a point-in-time over ``indices``; the PIT is deleted afterwards.
+
+    ``source`` limits the returned _source fields. ``slice_spec`` ({"id": i,
+    "max": n}) reads only the i-th of n disjoint slices; with ``pit_id`` the
+    caller's PIT (shared by the slices, export.py) is used and left open.
+
+    Sorted by @timestamp with _doc as tiebreaker, which is exact for the
+    single-shard daily indices this stack creates.
+    """
+    owned = pit_id is None
+    if owned:
+        pit_id = client.create_pit(index=indices, keep_alive=keep_alive)["pit_id"]
+    try:
+        search_after = None
+        while True:
+            body = {
+                "size": page_size,
+                "query": query,
+                "pit": {"id": pit_id, "keep_alive": keep_alive},
+                "sort": [{"@timestamp": "asc"}, {"_doc": "asc"}],
+                "track_total_hits": search_after is None,
+            }
+            if source is not None:
+                body["_source"] = source
+            if slice_spec is not None:
+                body["slice"] = slice_spec
+            if search_after is not None:
+                body["search_after"] = search_after
+            res = client.search(body=body)
+            pit_id = res.get("pit_id", pit_id)
+            hits = res["hits"]["hits"]
+            if search_after is None:
+                yield {"total": res["hits"]["total"]["value"], "hits": hits}
+            else:
+                yield {"hits": hits}
+            if len(hits) < page_size:
+                return
+            search_after = hits[-1]["sort"]
+    finally:
+        if owned:
+            try:
+                client.delete_pit(body={"pit_id": [pit_id]})
+            except NotFoundError:
+                pass
+
+
+def prefetch(pages, depth=2):
+    """Run the ``pages`` generator on a thread, at most ``depth`` pages ahead of the consumer."""
+    buffer = queue.Queue(depth)
+
+    def produce():
+        try:
+            for page in pages:
+                buffer.put(page)
+            buffer.put(_DONE)
+        except Exception as e:
+            buffer.put(e)
+
+    threading.Thread(target=produce, daemon=True).start()
+    while True:
+        item = buffer.get()
+        if item is _DONE:
+            return
+        if isinstance(item, Exception):
+            raise item
+        yield item
+
+
+def _bulk(client, lines):
+    res = client.bulk(body="".join(lines))
+    return [next(iter(item.values())) for item in res["items"]]
+
+
+class ReplayProgress:
+    def __init__(self, every=10.0):
+        self.every = every
+        self.total = None
+        self.scanned = 0
+        self.recovered = 0
+        self.still_invalid = 0
+        self.write_failures = 0
+        self.deleted = 0
+        self.started = time.time()
+        self._last_report = self.started
+
+    def report(self):
+        elapsed = max(time.time() - self.started, 1e-9)
+        return {
+            "total": self.total,
+            "scanned": self.scanned,
+            "recovered": self.recovered,
+            "still_invalid": self.still_invalid,
+            "write_failures": self.write_failures,
+            "deleted": self.deleted,
+            "elapsed_s": round(elapsed, 1),
+            "docs_per_sec": round(self.scanned / elapsed, 1),
+        }
+
+    def tick(self, force=False):
+        now = time.time()
+        if not force and now - self._last_report < self.every:
+            return
+        self._last_report = now
+        r = self.report()
+        eta = ""
+        if self.total and r["docs_per_sec"]:
+            eta = f" eta={(self.total - self.scanned) / r['docs_per_sec']:.0f}s"
+        print(
+            f"[replay] {self.scanned}/{self.total} scanned, {self.recovered} recovered, "
+            f"{self.still_invalid} still invalid, {self.deleted} deleted, {r['docs_per_sec']}/s{eta}"
+        )
+
+
+def replay(client, indices=DEFAULT_INDICES, query=None, page_size=1000, delete=False, dry_run=False, progress=None):
+    progress = progress or ReplayProgress()
+    pages = stream_pages(client, indices, query or {"match_all": {}}, page_size=page_size)
+    for page in prefetch(pages):
+        if "total" in page:
+            progress.total = page["total"]
+        writes, sources = [], []
+        for hit in page["hits"]:
+            progress.scanned += 1
+            result = revalidate(hit["_source"])
+            if result is None:
+                progress.still_invalid += 1
+                continue
+            index, doc = result
+            writes.append(json.dumps({"index": {"_index": index, "_id": hit["_id"]}}) + "\n" + json.dumps(doc) + "\n")
+            sources.append(hit)
+        if writes and dry_run:
+            progress.recovered += len(writes)
+        elif writes:
+            written = []
+            for hit, outcome in zip(sources, _bulk(client, writes)):
+                if outcome.get("status", 500) < 300:
+                    written.append(hit)
+                else:
+                    progress.write_failures += 1
+                    print(f"[replay] could not write {hit['_index']}/{hit['_id']}: {outcome.get('error')}")
+            progress.recovered += len(written)
+            if delete and written:
+                deletes = [json.dumps({"delete": {"_index": h["_index"], "_id": h["_id"]}}) + "\n" for h in written]
+                progress.deleted += sum(1 for o in _bulk(client, deletes) if o.get("status", 500) < 300)
+        progress.tick()
+    progress.tick(force=True)
+    return progress.report()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--indices", default=DEFAULT_INDICES, help="error indices to replay (default %(default)s)")
+    parser.add_argument("--since", help="only error docs with @timestamp >= this (date math allowed)")
+    parser.add_argument("--until", help="only error docs with @timestamp < this")
+    parser.add_argument("--error", action="append", help="only docs with this pipeline error (repeatable)")
+    parser.add_argument("--page-size", type=int, default=1000)
+    parser.add_argument("--delete", action="store_true", help="delete error docs once their reading is written")
+    parser.add_argument("--dry-run", action="store_true", help="re-validate only, write nothing")
+    parser.add_argument("--progress-every", type=float, default=10.0, help="seconds between progress lines")
+    parser.add_argument("--json", help="also write the final report to this file")
+    args = parser.parse_args(argv)
+
+    client = make_opensearch_client(**opensearch_settings())
+    install_from_env(watch=False)
+    report = replay(
+        client,
+        indices=args.indices,
+        query=build_query(args.since, args.until, args.error),
+        page_size=args.page_size,
+        delete=args.delete and not args.dry_run,
+        dry_run=args.dry_run,
+        progress=ReplayProgress(args.progress_every),
+    )
+    print(json.dumps(report, indent=2))
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump(report, f, indent=2)
+    return 1 if report["write_failures"] else 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
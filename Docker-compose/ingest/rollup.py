@@ -0,0 +1,275 @@
+"""Per-sensor downsampling of the daily sensor indices into sensors-rollup-*.
+
+Every run folds new raw readings into 1-minute buckets (sensors-rollup-1m-YYYY.MM)
+and complete 1-minute buckets into 1-hour ones (sensors-rollup-1h-YYYY). A
+bucket document holds count/min/max/sum/avg of temperature_c, humidity_pct and
+light for one sensor_id; its _id is sensor_id + bucket start, so re-running a
+window overwrites rather than duplicates.
+
+A watermark per resolution (kept in gha-rollup-state) records how far the
+rollup is complete. A run only reads from the watermark minus --lateness up
+to now minus --settle, so readings that arrive a little late are still folded
+in and nothing is ever re-aggregated from scratch.
+
+    python rollup.py run                        # one incremental pass (cron)
+    python rollup.py run --every 60             # keep going, one pass a minute
+    python rollup.py bench --queries 30         # panel latency on raw vs rollup, 24h / 7d / 30d
+"""
+import argparse
+import json
+import random
+import statistics
+import time
+from datetime import datetime, timezone
+
+from opensearchpy.exceptions import NotFoundError
+
+from bridge import make_opensearch_client, opensearch_settings
+
+RAW_INDICES = "sensors-*,-sensors-errors-*,-sensors-rollup-*"
+ROLLUP_PREFIX = "sensors-rollup-"
+STATE_INDEX = "gha-rollup-state"
+FIELDS = ("temperature_c", "humidity_pct", "light")
+INTERVAL_MS = {"1m": 60_000, "1h": 3_600_000}
+_DURATION_MS = {"s": 1000, "m": 60_000, "h": 3_600_000, "d": 86_400_000}
+
+
+def parse_duration(text):
+    """'10m' -> 600000"""
+    return int(text[:-1]) * _DURATION_MS[text[-1]]
+
+
+def align(ms, interval_ms):
+    return ms - ms % interval_ms
+
+
+def iso(ms):
+    ts = datetime.fromtimestamp(ms / 1000, timezone.utc)
+    return ts.strftime("%Y-%m-%dT%H:%M:%S.") + f"{ts.microsecond // 1000:03d}Z"
+
+
+def rollup_index(interval, bucket_ms, prefix=ROLLUP_PREFIX):
+    ts = datetime.fromtimestamp(bucket_ms / 1000, timezone.utc)
+    return f"{prefix}{interval}-" + (ts.strftime("%Y.%m") if interval == "1m" else ts.strftime("%Y"))
+
+
+def source_aggs(interval):
+    """Per-bucket metrics: stats over raw readings for 1m, re-aggregated 1m columns for 1h."""
+    if interval == "1m":
+        return {f: {"stats": {"field": f}} for f in FIELDS}
+    aggs = {"readings": {"sum": {"field": "doc_count"}}}
+    for f in FIELDS:
+        aggs[f"{f}_count"] = {"sum": {"field": f"{f}_count"}}
+        aggs[f"{f}_min"] = {"min": {"field": f"{f}_min"}}
+        aggs[f"{f}_max"] = {"max": {"field": f"{f}_max"}}
+        aggs[f"{f}_sum"] = {"sum": {"field": f"{f}_sum"}}
+    return aggs
+
+
+def bucket_doc(interval, bucket):
+    sensor_id, start = bucket["key"]["sensor_id"], int(bucket["key"]["bucket"])
+    readings = bucket["doc_count"] if interval == "1m" else int(bucket["readings"]["value"] or 0)
+    doc = {"@timestamp": iso(start), "sensor_id": sensor_id, "interval": interval, "doc_count": readings}
+    for f in FIELDS:
+        if interval == "1m":
+            stats = bucket[f]
+            count, low, high, total = stats["count"], stats["min"], stats["max"], stats["sum"]
+        else:
+            count = int(bucket[f"{f}_count"]["value"] or 0)
+            low, high, total = bucket[f"{f}_min"]["value"], bucket[f"{f}_max"]["value"], bucket[f"{f}_sum"]["value"]
+        doc[f"{f}_count"] = int(count)
+        if count:
+            doc.update({f"{f}_min": low, f"{f}_max": high, f"{f}_sum": total, f"{f}_avg": total / count})
+    return doc
+
+
+def composite_buckets(client, index, start_ms, end_ms, interval, sensor_field="sensor_id", page_size=1000):
+    """All (sensor_id, bucket) composite buckets in [start_ms, end_ms), one page at a time."""
+    after = None
+    while True:
+        composite = {
+            "size": page_size,
+            "sources": [
+                {"sensor_id": {"terms": {"field": sensor_field}}},
+                {"bucket": {"date_histogram": {"field": "@timestamp", "fixed_interval": interval}}},
+            ],
+        }
+        if after is not None:
+            composite["after"] = after
+        body = {
+            "size": 0,
+            "query": {"range": {"@timestamp": {"gte": start_ms, "lt": end_ms, "format": "epoch_millis"}}},
+            "aggs": {"rollup": {"composite": composite, "aggs": source_aggs(interval)}},
+        }
+        res = client.search(index=index, body=body, ignore_unavailable=True, allow_no_indices=True)
+        agg = res.get("aggregations", {}).get("rollup", {"buckets": []})
+        yield from agg["buckets"]
+        after = agg.get("after_key")
+        if after is None or len(agg["buckets"]) < page_size:
+            return
+
+
+def get_watermark(client, key, state_index=STATE_INDEX):
+    try:
+        return client.get(index=state_index, id=key)["_source"]["watermark"]
+    except NotFoundError:
+        return None
+
+
+def set_watermark(client, key, ms, state_index=STATE_INDEX):
+    client.index(index=state_index, id=key, body={"watermark": ms, "updated_at": iso(int(time.time() * 1000))})
+
+
+def earliest(client, index):
+    res = client.search(index=index, body={"size": 0, "aggs": {"first": {"min": {"field": "@timestamp"}}}},
+                        ignore_unavailable=True, allow_no_indices=True)
+    value = res.get("aggregations", {}).get("first", {}).get("value")
+    return int(value) if value is not None else None
+
+
+def roll(client, interval, source, end_ms, lateness_ms, prefix=ROLLUP_PREFIX, state_index=STATE_INDEX,
+         sensor_field="sensor_id", batch_size=1000):
+    """Fold ``source`` into ``interval`` buckets up to ``end_ms``; returns (buckets written, new watermark)."""
+    step = INTERVAL_MS[interval]
+    end_ms = align(end_ms, step)
+    key = prefix + interval
+    watermark = get_watermark(client, key, state_index)
+    if watermark is None:
+        first = earliest(client, source)
+        if first is None:
+            return 0, None
+        start_ms = align(first, step)
+    else:
+        start_ms = align(watermark - lateness_ms, step)
+    if start_ms >= end_ms:
+        return 0, watermark
+
+    written, lines = 0, []
+    for bucket in composite_buckets(client, source, start_ms, end_ms, interval, sensor_field):
+        doc = bucket_doc(interval, bucket)
+        start = int(bucket["key"]["bucket"])
+        action = {"index": {"_index": rollup_index(interval, start, prefix), "_id": f"{doc['sensor_id']}:{start}"}}
+        lines.append(json.dumps(action) + "\n" + json.dumps(doc) + "\n")
+        if len(lines) >= batch_size:
+            written += _flush(client, lines)
+            lines = []
+    if lines:
+        written += _flush(client, lines)
+    set_watermark(client, key, end_ms, state_index)
+    return written, end_ms
+
+
+def _flush(client, lines):
+    res = client.bulk(body="".join(lines))
+    failed = [item for item in res["items"] if next(iter(item.values())).get("status", 500) >= 300]
+    if failed:
+        raise RuntimeError(f"{len(failed)} rollup writes failed, first: {failed[0]}")
+    return len(lines)
+
+
+def run_once(client, settle_ms=120_000, lateness_ms=600_000, raw_indices=RAW_INDICES, prefix=ROLLUP_PREFIX,
+             state_index=STATE_INDEX, sensor_field="sensor_id"):
+    t0 = time.perf_counter()
+    now = int(time.time() * 1000)
+    opts = {"prefix": prefix, "state_index": state_index, "sensor_field": sensor_field}
+    written_1m, mark_1m = roll(client, "1m", raw_indices, now - settle_ms, lateness_ms, **opts)
+    if mark_1m is not None:
+        client.indices.refresh(index=prefix + "1m-*", ignore_unavailable=True, allow_no_indices=True)
+    # 1h only consumes hours the 1m rollup has completely covered.
+    written_1h, mark_1h = (0, None) if mark_1m is None else roll(client, "1h", prefix + "1m-*", mark_1m, lateness_ms, **opts)
+    report = {
+        "buckets_1m": written_1m,
+        "buckets_1h": written_1h,
+        "watermark_1m": iso(mark_1m) if mark_1m else None,
+        "watermark_1h": iso(mark_1h) if mark_1h else None,
+        "seconds": round(time.perf_counter() - t0, 3),
+    }
+    print(f"[rollup] {json.dumps(report)}")
+    return report
+
+
+# --- benchmark -----------------------------------------------------------------
+
+# Roughly what Grafana's auto interval picks for a ~1000px wide panel, and the coarsest rollup that still fills
+# that interval exactly; both sides of the comparison bucket at the same fixed_interval.
+BENCH_RANGES = {"24h": ("1m", "1m"), "7d": ("10m", "1m"), "30d": ("1h", "1h")}
+
+
+def _raw_panel(sensor, range_key, interval):
+    return {
+        "size": 0,
+        "query": {"bool": {"filter": [{"term": {"sensor_id": sensor}}, {"range": {"@timestamp": {"gte": f"now-{range_key}"}}}]}},
+        "aggs": {
+            "series": {
+                "date_histogram": {"field": "@timestamp", "fixed_interval": interval},
+                "aggs": {f: {"avg": {"field": f}} for f in FIELDS},
+            }
+        },
+    }
+
+
+def _rollup_panel(sensor, range_key, interval):
+    aggs = {}
+    for f in FIELDS:
+        aggs[f"{f}_sum"] = {"sum": {"field": f"{f}_sum"}}
+        aggs[f"{f}_count"] = {"sum": {"field": f"{f}_count"}}
+    body = _raw_panel(sensor, range_key, interval)
+    body["aggs"]["series"]["aggs"] = aggs
+    return body
+
+
+def _timed(client, index, body, runs):
+    latencies = []
+    for _ in range(runs):
+        t0 = time.perf_counter()
+        client.search(index=index, body=body, request_cache=False, ignore_unavailable=True, allow_no_indices=True)
+        latencies.append((time.perf_counter() - t0) * 1000)
+    latencies.sort()
+    return {"p50_ms": round(statistics.median(latencies), 2), "p95_ms": round(latencies[int(len(latencies) * 0.95) - 1], 2)}
+
+
+def bench(client, queries=30):
+    sensors = client.search(
+        index=RAW_INDICES,
+        body={"size": 0, "aggs": {"s": {"terms": {"field": "sensor_id", "size": 20}}}},
+        ignore_unavailable=True,
+        allow_no_indices=True,
+    )["aggregations"]["s"]["buckets"]
+    if not sensors:
+        raise SystemExit("[rollup] no raw readings to benchmark against")
+    report = {}
+    for range_key, (interval, rollup_res) in BENCH_RANGES.items():
+        sensor = random.choice(sensors)["key"]
+        raw = _timed(client, RAW_INDICES, _raw_panel(sensor, range_key, interval), queries)
+        rolled = _timed(client, f"{ROLLUP_PREFIX}{rollup_res}-*", _rollup_panel(sensor, range_key, interval), queries)
+        report[range_key] = {"interval": interval, "rollup": rollup_res, "raw": raw, "rollup_latency": rolled}
+        print(f"[rollup] {range_key}: raw {raw} vs {rollup_res} rollup {rolled}")
+    return report
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    sub = parser.add_subparsers(dest="command", required=True)
+    run_parser = sub.add_parser("run", help="one incremental rollup pass")
+    run_parser.add_argument("--every", type=float, help="repeat every N seconds instead of exiting")
+    run_parser.add_argument("--settle", default="2m", help="leave the newest readings alone this long")
+    run_parser.add_argument("--lateness", default="10m", help="re-read this far behind the watermark")
+    run_parser.add_argument("--sensor-field", default="sensor_id",
+                            help="sensor_id.keyword for indices created before provision.py's templates")
+    bench_parser = sub.add_parser("bench", help="panel query latency on raw vs rollup indices")
+    bench_parser.add_argument("--queries", type=int, default=30)
+    args = parser.parse_args(argv)
+
+    client = make_opensearch_client(**opensearch_settings())
+    if args.command == "bench":
+        print(json.dumps(bench(client, args.queries), indent=2))
+        return 0
+    while True:
+        run_once(client, parse_duration(args.settle), parse_duration(args.lateness), sensor_field=args.sensor_field)
+        if not args.every:
+            return 0
+        time.sleep(args.every)
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -0,0 +1,549 @@
+"""Pure-Python reference implementation of logstash/pipeline/logstash.conf.
+
+Mirrors the filter chain (``%`` stripping, ``Z+200`` offset fix-ups, json,
+renames, date, the ruby validation block) and the output routing, so payloads
+can be checked in bulk without the Docker stack:
+
+    results = process_batch(messages)          # [(index, document), ...]
+    index, event = process_compact(data)       # a CBOR payload from ghanode/sensor/cbor (compact.py)
+    document_id(event)                         # the _id it is written under, None for an OpenSearch-assigned one
+    use_registry(table, required=True)         # greenhouse enrichment, as the translate filter (registry.py)
+
+Keep this file in step with logstash.conf; tests/integration/golden_corpus.py
+replays a corpus through the real pipeline and diffs it against this module.
+"""
+import json
+import math
+import re
+from datetime import datetime, timezone
+from decimal import Decimal
+
+import compact
+
+RUN_INDEX_PREFIX = "it-run-"
+ERROR_INDEX_PREFIX = "sensors-errors-"
+IT_INDEX_PREFIX = "it-sensors-"
+SENSOR_INDEX_PREFIX = "sensors-"
+MAX_DOC_ID_BYTES = 512
+
+RENAMES = (("Sensor ID", "sensor_id"), ("temperature", "temperature_c"), ("humidity", "humidity_pct"))
+READINGS = (("temperature_c", "temperature"), ("humidity_pct", "humidity"), ("light", "light"))
+# What the filebeat mqtt input adds to every event (filebeat/filebeat.yml).
+FILEBEAT_FIELDS = {"tags": ["mqtt", "ghanode"], "app": "ghanode_sensor", "input": {"type": "mqtt"}}
+
+_OFFSET_FIXUP = re.compile(r"Z\+([123]00)")
+# logstash conditionals use Ruby regexps, where ^ anchors at every line start.
+_IT_SENSOR = re.compile(r"^it-sensors-", re.M)
+_TEST_RUN_ID = re.compile(r"[a-z0-9]{1,32}")
+# Kernel#Float: decimal with single underscores between digits, or a 0x hex literal.
+_RUBY_FLOAT_STRICT = re.compile(
+    r"[+-]?(?:"
+    r"0[xX][0-9a-fA-F]+(?:_[0-9a-fA-F]+)*(?:\.[0-9a-fA-F]+(?:_[0-9a-fA-F]+)*)?(?:[pP][+-]?\d+)?"
+    r"|(?:\d+(?:_\d+)*(?:\.\d+(?:_\d+)*)?|\.\d+(?:_\d+)*)(?:[eE][+-]?\d+(?:_\d+)*)?"
+    r")"
+)
+# String#to_f: the longest leading decimal number, 0.0 if there is none.
+_RUBY_TO_F_PREFIX = re.compile(r"\s*([+-]?(?:\d+(?:_\d+)*)?(?:\.\d+(?:_\d+)*)?)([eE][+-]?\d+(?:_\d+)*)?")
+_ISO_DATE = re.compile(r"(\d{4})(?:-(\d{2})(?:-(\d{2}))?)?$")
+_ISO_DATETIME_PREFIX = re.compile(r"\d{4}-\d{2}-\d{2}[T ]\d{2}")
+
+
+def _reject_constant(name):
+    # JrJackson refuses NaN/Infinity literals, which makes the whole payload invalid JSON.
+    raise ValueError(f"invalid JSON constant {name}")
+
+
+_json_decoder = json.JSONDecoder(parse_constant=_reject_constant)
+
+
+_NUMERIC_TYPES = (int, float)
+
+
+def is_numeric(value):
+    # type() rather than isinstance(): bool is an int subclass but not a Ruby Numeric.
+    return type(value) in _NUMERIC_TYPES
+
+
+def ruby_to_s(value):
+    if value is None:
+        return ""
+    if value is True:
+        return "true"
+    if value is False:
+        return "false"
+    if isinstance(value, float):
+        return ruby_float_to_s(value)
+    if isinstance(value, str):
+        return value
+    if isinstance(value, list):
+        return "[" + ", ".join(_ruby_inspect(v) for v in value) + "]"
+    if isinstance(value, dict):
+        return _ruby_inspect(value)
+    return str(value)
+
+
+def _ruby_inspect(value):
+    if value is None:
+        return "nil"
+    if isinstance(value, str):
+        return json.dumps(value, ensure_ascii=False)
+    if isinstance(value, dict):
+        return "{" + ", ".join(f"{_ruby_inspect(k)}=>{_ruby_inspect(v)}" for k, v in value.items()) + "}"
+    return ruby_to_s(value)
+
+
+def ruby_float_to_s(value):
+    if math.isnan(value):
+        return "NaN"
+    if math.isinf(value):
+        return "Infinity" if value > 0 else "-Infinity"
+    if value == 0:
+        return "-0.0" if math.copysign(1.0, value) < 0 else "0.0"
+    sign, digit_tuple, exponent = Decimal(repr(value)).as_tuple()
+    digits = "".join(map(str, digit_tuple))
+    decpt = len(digits) + exponent
+    digits = digits.rstrip("0") or "0"
+    prefix = "-" if sign else ""
+    if -4 < decpt <= 15:
+        if decpt <= 0:
+            return f"{prefix}0.{'0' * -decpt}{digits}"
+        if decpt >= len(digits):
+            return f"{prefix}{digits}{'0' * (decpt - len(digits))}.0"
+        return f"{prefix}{digits[:decpt]}.{digits[decpt:]}"
+    mantissa = digits[0] + "." + (digits[1:] or "0")
+    exp = decpt - 1
+    return f"{prefix}{mantissa}e{'+' if exp >= 0 else '-'}{abs(exp):02d}"
+
+
+def ruby_float_valid(value):
+    """Kernel#Float(value.to_s.strip.tr(",", ".")) succeeds -- the ruby filter's numeric_value?."""
+    if value is None:
+        return False
+    if is_numeric(value):
+        return True
+    s = ruby_to_s(value).strip()
+    if not s:
+        return False
+    return _RUBY_FLOAT_STRICT.fullmatch(s.replace(",", ".")) is not None
+
+
+def ruby_to_f(value):
+    """value.to_f for numerics, value.to_s.strip.tr(",", ".").to_f otherwise."""
+    if is_numeric(value):
+        try:
+            return float(value)
+        except OverflowError:
+            return math.inf if value > 0 else -math.inf
+    s = ruby_to_s(value).strip().replace(",", ".")
+    m = _RUBY_TO_F_PREFIX.match(s)
+    number, exp = m.group(1), m.group(2)
+    if not number.strip("+-").strip("."):
+        return 0.0
+    return float((number + (exp or "")).replace("_", ""))
+
+
+def parse_timestamp(value):
+    """The date filter: ISO8601 or yyyy-MM-dd'T'HH:mm:ssZ, timezone UTC, millisecond precision."""
+    s = ruby_to_s(value).strip()
+    m = _ISO_DATE.match(s)
+    if m:
+        year, month, day = int(m.group(1)), int(m.group(2) or 1), int(m.group(3) or 1)
+        try:
+            return datetime(year, month, day, tzinfo=timezone.utc)
+        except ValueError:
+            return None
+    if not _ISO_DATETIME_PREFIX.match(s):
+        return None
+    try:
+        parsed = datetime.fromisoformat(s)
+    except ValueError:
+        return None
+    if parsed.tzinfo is None:
+        parsed = parsed.replace(tzinfo=timezone.utc)
+    parsed = parsed.astimezone(timezone.utc)
+    return parsed.replace(microsecond=parsed.microsecond // 1000 * 1000)
+
+
+def stamp(ts=None):
+    """A stage stamp as logstash writes it: LogStash::Timestamp#to_s, UTC with milliseconds."""
+    ts = (ts or datetime.now(timezone.utc)).astimezone(timezone.utc)
+    return ts.strftime("%Y-%m-%dT%H:%M:%S.") + f"{ts.microsecond // 1000:03d}Z"
+
+
+def _stamp_out(event):
+    if not isinstance(event.get("stages"), dict):
+        event["stages"] = {}
+    published = event.get("published_at")
+    if is_numeric(published) and math.isfinite(published):
+        try:
+            event["stages"]["published"] = stamp(datetime.fromtimestamp(published, timezone.utc))
+        except (OverflowError, OSError, ValueError):
+            pass
+    event["stages"]["filter_out"] = stamp()
+
+
+def _add_tag(event, tag):
+    tags = event.get("tags")
+    if not isinstance(tags, list):
+        tags = [] if tags is None else [tags]
+        event["tags"] = tags
+    if tag not in tags:
+        tags.append(tag)
+
+
+def transform(message, received_at=None, fields=None):
+    """Run one raw MQTT message through the filter section and return the resulting event.
+
+    ``@timestamp`` starts out as ``received_at`` (filebeat's receive time) and is a
+    timezone-aware datetime. ``stages`` gets the same stamps logstash.conf adds.
+    filebeat/beats metadata fields are not modelled unless passed as ``fields``;
+    a ``tags`` list in there is copied, not shared. A batch envelope becomes
+    several events; use transform_all for messages that may be one.
+    """
+    return _single(transform_all(message, received_at, fields))
+
+
+def transform_all(message, received_at=None, fields=None):
+    """transform() for a message that may be a batch envelope: the list of events it becomes."""
+    if received_at is None:
+        received_at = datetime.now(timezone.utc)
+
+    # mutate { gsub => ["message", "%", ""] } and the Z+200 -> +0200 fix-ups
+    if "%" in message:
+        message = message.replace("%", "")
+    if "Z+" in message:
+        message = _OFFSET_FIXUP.sub(r"+0\1", message)
+    event = _new_event(message, received_at, fields)
+
+    # json { source => "message" skip_on_invalid_json => true }
+    try:
+        parsed = _json_decoder.decode(message)
+    except ValueError:
+        parsed = None
+    else:
+        if isinstance(parsed, dict):
+            _merge(event, parsed)
+        else:
+            _add_tag(event, "_jsonparsefailure")
+    return _split(event, parsed)
+
+
+def transform_compact(data, received_at=None, fields=None):
+    """transform() for a compact CBOR payload (ingest/compact.py) from ghanode/sensor/cbor."""
+    return _single(transform_compact_all(data, received_at, fields))
+
+
+def transform_compact_all(data, received_at=None, fields=None):
+    """transform_all() for a compact CBOR payload.
+
+    The decoded map takes the place of the parsed JSON; there is no message text
+    to fix up. Error documents keep the JSON rendering of the payload as
+    ``message`` (the hex bytes if it could not be decoded, tagged
+    ``_cborparsefailure``), so replay_errors.py can re-validate them.
+    """
+    if received_at is None:
+        received_at = datetime.now(timezone.utc)
+    event = _new_event(None, received_at, fields)
+    try:
+        parsed = compact.decode_reading(data)
+    except ValueError:
+        parsed = None
+    if isinstance(parsed, dict):
+        _merge(event, parsed)
+    else:
+        _add_tag(event, "_cborparsefailure")
+    events = _split(event, parsed)
+    for event in events:
+        if event.get("message") is not None:
+            continue  # a batch reading, which carries its own single-reading message
+        if "pipeline_errors" in event:
+            event["message"] = bytes(data).hex() if parsed is None else json.dumps(parsed, ensure_ascii=False)
+        else:
+            event.pop("message", None)
+    return events
+
+
+def _single(events):
+    if len(events) != 1:
+        raise ValueError(f"batch envelope with {len(events)} readings; use transform_all")
+    return events[0]
+
+
+def _split(event, parsed):
+    """The batch envelope block: one event per entry of ``readings``, each re-parsed from a one-reading message.
+
+    That message is the envelope's other fields with the reading's own on top,
+    serialized as LogStash::Json.dump does, so each reading is validated,
+    routed and replayed exactly as if it had been published on its own.
+    """
+    readings = event.get("readings")
+    if readings is None or readings is False:
+        return [_validate(event)]
+    del event["readings"]
+    if not isinstance(readings, list) or not readings:
+        _add_tag(event, "_batchfailure")
+        return [_validate(event)]
+    shared = {k: v for k, v in parsed.items() if k != "readings"}
+    events = []
+    for reading in readings:
+        item = dict(event)
+        item["stages"] = dict(event["stages"])
+        if isinstance(event.get("tags"), list):
+            item["tags"] = list(event["tags"])
+        # Parsing the dumped message gives back the merged dict, so it is merged directly
+        # and only serialized for the error documents that keep it.
+        if isinstance(reading, dict):
+            reading = {**shared, **reading}
+            _merge(item, reading)
+        else:
+            _add_tag(item, "_jsonparsefailure")
+        item = _validate(item)
+        if "pipeline_errors" in item:
+            item["message"] = java_json_dumps(reading)
+        events.append(item)
+    return events
+
+
+def java_double_to_s(value):
+    """Double.toString, which LogStash::Json.dump (Jackson) uses for floats."""
+    if value == 0:
+        return "-0.0" if math.copysign(1.0, value) < 0 else "0.0"
+    if 1e-3 <= abs(value) < 1e7:
+        return ruby_float_to_s(value)
+    sign, digit_tuple, exponent = Decimal(repr(value)).as_tuple()
+    digits = "".join(map(str, digit_tuple)).rstrip("0") or "0"
+    exp = len(digit_tuple) + exponent - 1
+    return f"{'-' if sign else ''}{digits[0]}.{digits[1:] or '0'}E{exp}"
+
+
+def java_json_dumps(value):
+    """LogStash::Json.dump: compact JSON, non-ASCII as is, floats as Double.toString."""
+    if isinstance(value, float):
+        return java_double_to_s(value)
+    if isinstance(value, dict):
+        return "{" + ",".join(f"{json.dumps(k, ensure_ascii=False)}:{java_json_dumps(v)}" for k, v in value.items()) + "}"
+    if isinstance(value, list):
+        return "[" + ",".join(java_json_dumps(v) for v in value) + "]"
+    return json.dumps(value, ensure_ascii=False)
+
+
+def _new_event(message, received_at, fields):
+    event = {"message": message, "@timestamp": received_at}
+    event["stages"] = {"received": stamp(received_at), "filter_in": stamp()}
+    if fields:
+        event.update(fields)
+        if isinstance(event.get("tags"), list):
+            event["tags"] = list(event["tags"])
+    return event
+
+
+def _merge(event, parsed):
+    for key, value in parsed.items():
+        if key == "@timestamp":
+            ts = parse_timestamp(value) if isinstance(value, str) else None
+            if ts is None:
+                event["_@timestamp"] = value
+                _add_tag(event, "_timestampparsefailure")
+            else:
+                event["@timestamp"] = ts
+        else:
+            event[key] = value
+
+
+def _validate(event):
+    """The rename, date and ruby stages, on an event that already holds the payload's fields."""
+    # mutate { rename => ... }
+    for source, target in RENAMES:
+        if source in event:
+            event[target] = event.pop(source)
+
+    # translate { source => "sensor_id" ... } and json { source => "[@metadata][registry]" }
+    entry = None
+    if _registry is not None:
+        entry = _lookup(event.get("sensor_id"))
+        if entry:
+            event.update(entry)
+
+    # if [timestamp] { date { ... } }
+    ts_value = event.get("timestamp")
+    if ts_value is not None and ts_value is not False:
+        ts = parse_timestamp(ts_value)
+        if ts is None:
+            _add_tag(event, "_dateparsefailure")
+        else:
+            event["@timestamp"] = ts
+    event["@metadata"] = {"doc_id": _document_id(event)}
+
+    # ruby { ... }
+    t = event.get("temperature_c")
+    h = event.get("humidity_pct")
+    l = event.get("light")
+    if (
+        type(t) in _NUMERIC_TYPES
+        and type(h) in _NUMERIC_TYPES
+        and type(l) in _NUMERIC_TYPES
+        and event.get("sensor_id") is not None
+        and (entry or not _registry_required)
+    ):
+        # Fast path for the common well-formed reading.
+        event["temperature_c"] = ruby_to_f(t)
+        event["humidity_pct"] = ruby_to_f(h)
+        event["light"] = ruby_to_f(l)
+        event.pop("message", None)
+        event.pop("timestamp", None)
+        _stamp_out(event)
+        return event
+
+    errors = []
+    if event.get("sensor_id") is None:
+        errors.append("missing_sensor_id")
+    values = [("temperature_c", "temperature", t), ("humidity_pct", "humidity", h), ("light", "light", l)]
+    for _, name, value in values:
+        if value is None:
+            errors.append(f"missing_{name}")
+    for _, name, value in values:
+        if value is not None and not ruby_float_valid(value):
+            errors.append(f"invalid_{name}")
+    if _registry_required and not entry and event.get("sensor_id") is not None:
+        errors.append("unknown_sensor")
+
+    if errors:
+        event["pipeline_errors"] = errors
+        _add_tag(event, "ingest_error")
+        for field, name, value in values:
+            if value is not None:
+                event[f"{name}_raw"] = ruby_to_s(value)
+            event.pop(field, None)
+    else:
+        for field, _, value in values:
+            event[field] = ruby_to_f(value)
+        event.pop("message", None)
+        event.pop("timestamp", None)
+    _stamp_out(event)
+    return event
+
+
+def _document_id(event):
+    """The ruby block after the date filter: sensor id plus the payload's ``seq``, or else its timestamp.
+
+    None where logstash falls back to a random UUID (no string sensor id, or
+    neither a seq nor a timestamp the date filter parsed): there is nothing a
+    redelivery could be matched on, so the writer lets OpenSearch pick the id.
+    """
+    sensor_id = event.get("sensor_id")
+    if type(sensor_id) is not str:
+        return None
+    seq = event.get("seq")
+    if type(seq) is int:
+        doc_id = f"{sensor_id}#{seq}"
+    else:
+        ts_value = event.get("timestamp")
+        tags = event.get("tags")
+        if ts_value is None or ts_value is False or "_dateparsefailure" in (tags if isinstance(tags, list) else [tags]):
+            return None
+        doc_id = f"{sensor_id}:{stamp(event['@timestamp'])}"
+    return doc_id if len(doc_id.encode("utf-8")) <= MAX_DOC_ID_BYTES else None
+
+
+def document_id(event):
+    """The _id the output writes ``event`` under: deterministic, so a redelivered reading overwrites its first copy."""
+    metadata = event.get("@metadata")
+    return metadata.get("doc_id") if isinstance(metadata, dict) else None
+
+
+# The translate filter's dictionary: sensor_id -> greenhouse fields (registry.py keeps both in step with PocketBase).
+_registry = None
+_registry_required = False
+
+
+def use_registry(registry, required=False):
+    """Enrich every reading from ``registry`` (a dict, or a registry.SensorRegistry), None to stop.
+
+    A reading whose sensor_id is in it gets the entry's fields merged in. With
+    ``required`` (REGISTRY_REQUIRED in logstash.conf) an unknown sensor is a
+    validation error, so the reading goes to the error index.
+    """
+    global _registry, _registry_required
+    _registry = registry
+    _registry_required = bool(required) and registry is not None
+
+
+def _lookup(sensor_id):
+    # translate looks the field up by its string form.
+    if type(sensor_id) is str:
+        return _registry.get(sensor_id)
+    if is_numeric(sensor_id):
+        return _registry.get(ruby_to_s(sensor_id))
+    return None
+
+
+_day_suffixes = {}
+
+
+def _day_suffix(ts):
+    key = ts.utctimetuple()[:3]
+    day = _day_suffixes.get(key)
+    if day is None:
+        if len(_day_suffixes) > 4096:
+            _day_suffixes.clear()
+        day = _day_suffixes[key] = "%04d.%02d.%02d" % key
+    return day
+
+
+def run_index(run_id, errors=False):
+    return f"{RUN_INDEX_PREFIX}{run_id}-{'errors' if errors else 'sensors'}"
+
+
+def route(event):
+    """The output section: which index the event is written to."""
+    run_id = event.get("test_run_id")
+    if isinstance(run_id, str) and _TEST_RUN_ID.fullmatch(run_id):
+        return run_index(run_id, bool(event.get("pipeline_errors")))
+    day = _day_suffix(event["@timestamp"])
+    if event.get("pipeline_errors"):
+        return ERROR_INDEX_PREFIX + day
+    sensor_id = event.get("sensor_id")
+    if isinstance(sensor_id, str) and _IT_SENSOR.search(sensor_id):
+        return IT_INDEX_PREFIX + day
+    return SENSOR_INDEX_PREFIX + day
+
+
+def index_family(index):
+    """Strip the date (or run id) part: sensors-errors-2025.09.24 -> sensors-errors, it-run-ab12-errors -> it-run-errors."""
+    if index.startswith(RUN_INDEX_PREFIX):
+        return RUN_INDEX_PREFIX + index.rsplit("-", 1)[1]
+    return index.rsplit("-", 1)[0]
+
+
+def to_document(event):
+    doc = dict(event)
+    doc.pop("@metadata", None)
+    ts = doc["@timestamp"].astimezone(timezone.utc)
+    doc["@timestamp"] = ts.strftime("%Y-%m-%dT%H:%M:%S.") + f"{ts.microsecond // 1000:03d}Z"
+    return doc
+
+
+def process(message, received_at=None, fields=None):
+    event = transform(message, received_at, fields)
+    return route(event), event
+
+
+def process_all(message, received_at=None, fields=None):
+    """[(index, event), ...] for every reading in the message (one, unless it is a batch envelope)."""
+    return [(route(event), event) for event in transform_all(message, received_at, fields)]
+
+
+def process_compact(data, received_at=None, fields=None):
+    event = transform_compact(data, received_at, fields)
+    return route(event), event
+
+
+def process_compact_all(data, received_at=None, fields=None):
+    return [(route(event), event) for event in transform_compact_all(data, received_at, fields)]
+
+
+def process_batch(messages, received_at=None):
+    """Transform and route a list of raw messages; returns [(index, event), ...] in input order."""
+    if received_at is None:
+        received_at = datetime.now(timezone.utc)
+    return [pair for m in messages for pair in process_all(m, received_at)]
@@ -0,0 +1,166 @@
+"""Per-stage ingest latency from the ``stages.*`` stamps on indexed readings.
+
+Every reading carries the time it passed each stage of the pipeline:
+
+    published   node publish time, from the payload's published_at (epoch seconds, optional)
+    received    filebeat received the MQTT message (logstash.conf, first filter)
+    filter_in   logstash started filtering it
+    filter_out  logstash finished filtering it
+    indexed     OpenSearch ingest time (gha-stage-stamps pipeline, see provision.py)
+
+This streams the matching documents with a point-in-time (only the stamps,
+sensor_id and @timestamp are fetched) and reports percentiles and a histogram
+for each hop, overall, per sensor and per hour of receive time. Hops with a
+negative duration are counted separately: they mean clock skew between the
+node, the logstash host and the OpenSearch nodes, not a fast pipeline.
+
+    python stage_report.py                               # sensors-* and it-sensors-*, last hour
+    python stage_report.py --since now-24h --by sensor   # only the per-sensor table
+    python stage_report.py --indices 'sensors-*' --json stages.json
+"""
+import argparse
+import json
+import math
+from datetime import datetime
+
+from bridge import make_opensearch_client, opensearch_settings
+from latency import format_seconds, histogram, latency_summary, render_histogram
+from replay_errors import build_query, prefetch, stream_pages
+
+DEFAULT_INDICES = "sensors-*,it-sensors-*,-sensors-errors-*,-sensors-rollup-*"
+STAGES = ("published", "received", "filter_in", "filter_out", "indexed")
+# (name, from stage, to stage)
+HOPS = (
+    ("publish->filebeat", "published", "received"),
+    ("filebeat->logstash", "received", "filter_in"),
+    ("logstash filter", "filter_in", "filter_out"),
+    ("output+ingest", "filter_out", "indexed"),
+    ("end to end", "published", "indexed"),
+    ("pipeline", "received", "indexed"),
+)
+SOURCE_FIELDS = ["sensor_id", "@timestamp"] + [f"stages.{s}" for s in STAGES]
+
+
+def parse_stamp(value):
+    if not isinstance(value, str):
+        return None
+    try:
+        return datetime.fromisoformat(value)
+    except ValueError:
+        return None
+
+
+def hop_durations(stages):
+    """{"hop name": seconds} for every hop both of whose stamps are present."""
+    times = {stage: parse_stamp(stages.get(stage)) for stage in STAGES}
+    return {
+        name: (times[end] - times[start]).total_seconds()
+        for name, start, end in HOPS
+        if times[start] is not None and times[end] is not None
+    }
+
+
+class StageStats:
+    """Hop durations grouped overall, by sensor_id and by hour of receive time."""
+
+    def __init__(self):
+        self.docs = 0
+        self.unstamped = 0
+        self.groups = {"all": {}, "sensor": {}, "hour": {}}
+
+    def _add(self, by, key, durations):
+        hops = self.groups[by].setdefault(key, {})
+        for name, seconds in durations.items():
+            hops.setdefault(name, []).append(seconds)
+
+    def add(self, doc):
+        self.docs += 1
+        stages = doc.get("stages")
+        durations = hop_durations(stages) if isinstance(stages, dict) else {}
+        if not durations:
+            self.unstamped += 1
+            return
+        received = parse_stamp(stages.get("received")) or parse_stamp(doc.get("@timestamp"))
+        self._add("all", "all", durations)
+        self._add("sensor", str(doc.get("sensor_id")), durations)
+        if received is not None:
+            self._add("hour", received.strftime("%Y-%m-%dT%H:00Z"), durations)
+
+    def report(self, ps=(50, 90, 95, 99)):
+        def summarize(hops):
+            out = {}
+            for name, _, _ in HOPS:
+                values = hops.get(name)
+                if values:
+                    out[name] = dict(latency_summary(values, ps), negative=sum(1 for v in values if v < 0))
+            return out
+
+        return {
+            "docs": self.docs,
+            "unstamped": self.unstamped,
+            "all": summarize(self.groups["all"].get("all", {})),
+            "by_sensor": {k: summarize(v) for k, v in sorted(self.groups["sensor"].items())},
+            "by_hour": {k: summarize(v) for k, v in sorted(self.groups["hour"].items())},
+            # [upper bound in seconds (None: overflow), count], empty buckets left out.
+            "histograms": {
+                name: [[None if bound == math.inf else bound, count] for bound, count in histogram(values) if count]
+                for name, values in self.groups["all"].get("all", {}).items()
+            },
+        }
+
+
+def collect(client, indices=DEFAULT_INDICES, since="now-1h", until=None, page_size=2000):
+    filters = build_query(since, until).get("bool", {}).get("filter", [])
+    query = {"bool": {"filter": filters + [{"exists": {"field": "stages.received"}}]}}
+    stats = StageStats()
+    for page in prefetch(stream_pages(client, indices, query, page_size=page_size, source=SOURCE_FIELDS)):
+        for hit in page["hits"]:
+            stats.add(hit["_source"])
+    return stats
+
+
+def _table(title, groups, ps):
+    print(f"\n{title}")
+    header = f"  {'':<24} {'hop':<20} {'count':>8}" + "".join(f" {'p' + str(p):>8}" for p in ps) + f" {'max':>8} {'neg':>5}"
+    print(header)
+    for key, hops in groups.items():
+        for name, s in hops.items():
+            cells = "".join(f" {format_seconds(s['p' + str(p)]):>8}" for p in ps)
+            print(f"  {key:<24} {name:<20} {s['count']:>8}{cells} {format_seconds(s['max']):>8} {s['negative']:>5}")
+
+
+def print_report(report, by=("all", "sensor", "hour"), ps=(50, 90, 95, 99)):
+    print(f"[stages] {report['docs']} documents, {report['unstamped']} without stage stamps")
+    if "all" in by:
+        _table("overall", {"all": report["all"]}, ps)
+        for name, buckets in report["histograms"].items():
+            print(f"\n{name}")
+            for line in render_histogram([(math.inf if bound is None else bound, count) for bound, count in buckets]):
+                print(line)
+    if "sensor" in by:
+        _table("per sensor", report["by_sensor"], ps)
+    if "hour" in by:
+        _table("per hour (receive time)", report["by_hour"], ps)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--indices", default=DEFAULT_INDICES, help="indices to read (default %(default)s)")
+    parser.add_argument("--since", default="now-1h", help="readings with @timestamp >= this (default %(default)s)")
+    parser.add_argument("--until", help="readings with @timestamp < this")
+    parser.add_argument("--by", action="append", choices=("all", "sensor", "hour"), help="tables to print (repeatable)")
+    parser.add_argument("--page-size", type=int, default=2000)
+    parser.add_argument("--json", help="also write the full report to this file")
+    args = parser.parse_args(argv)
+
+    client = make_opensearch_client(**opensearch_settings())
+    report = collect(client, args.indices, args.since, args.until, args.page_size).report()
+    print_report(report, by=args.by or ("all", "sensor", "hour"))
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump(report, f, indent=2)
+    return 0 if report["docs"] else 1
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
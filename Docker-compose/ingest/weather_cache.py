@@ -0,0 +1,296 @@
+"""Caching, request-coalescing proxy for the Open-Meteo forecast API.
+
+nginx sends /weather/ here instead of straight to api.open-meteo.com. Requests
+are keyed on their query with latitude/longitude rounded to WEATHER_GRID degrees
+(Open-Meteo's own model grid is coarser than that), so every user looking at
+the same greenhouse shares one cache entry. The key is the only thing changed:
+the upstream gets the rounded coordinates too.
+
+* Freshness follows the upstream's update cycle: an entry is fresh until the
+  next ``current`` value is due (``current.time`` + ``current.interval``, plus
+  WEATHER_PUBLISH_LAG), between WEATHER_MIN_TTL (so an overdue update does
+  not mean a fetch per request) and WEATHER_TTL; responses without ``current``
+  just get WEATHER_TTL.
+* Concurrent misses for one key make a single upstream request; the other
+  callers wait for it (X-Cache: COALESCED).
+* For WEATHER_STALE seconds after that, the old response is still served at
+  once (X-Cache: STALE) while one background request refreshes it. If the
+  upstream fails, a stale response of any age is served over an error.
+* Upstream errors (4xx included) are passed through and not cached.
+
+    GET /v1/forecast?latitude=..&longitude=..&current=..   what the frontend calls
+    GET /stats                                             hit rate, counters, latency percentiles
+
+    python weather_cache.py                                # :8082, settings from the environment
+"""
+import json
+import os
+import threading
+import time
+import urllib.error
+import urllib.request
+from collections import OrderedDict, deque
+from datetime import datetime, timezone
+from decimal import Decimal
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qsl, urlencode, urlsplit
+
+from latency import latency_summary
+
+
+def settings():
+    return {
+        "upstream": os.getenv("WEATHER_UPSTREAM", "https://api.open-meteo.com"),
+        "port": int(os.getenv("WEATHER_PORT", "8082")),
+        "grid": float(os.getenv("WEATHER_GRID", "0.01")),
+        "ttl": float(os.getenv("WEATHER_TTL", "900")),
+        "min_ttl": float(os.getenv("WEATHER_MIN_TTL", "60")),
+        "stale": float(os.getenv("WEATHER_STALE", "3600")),
+        "publish_lag": float(os.getenv("WEATHER_PUBLISH_LAG", "60")),
+        "timeout": float(os.getenv("WEATHER_TIMEOUT", "10")),
+        "max_entries": int(os.getenv("WEATHER_MAX_ENTRIES", "10000")),
+    }
+
+
+def snap(value, grid):
+    """``value`` rounded to the nearest multiple of ``grid``, as the shortest decimal string."""
+    step = Decimal(str(grid))
+    number = Decimal(value.strip())
+    if not number.is_finite():
+        raise ArithmeticError(value)
+    text = format((number / step).to_integral_value() * step, "f")
+    if "." in text:
+        text = text.rstrip("0").rstrip(".")
+    return "0" if text == "-0" else text
+
+
+def cache_key(path, query, grid):
+    """(path, canonical query) with coordinates snapped to the grid; None if a coordinate is not a number."""
+    params = []
+    for name, value in parse_qsl(query, keep_blank_values=True):
+        if name in ("latitude", "longitude"):
+            try:
+                value = snap(value, grid)
+            except ArithmeticError:
+                return None
+        params.append((name, value))
+    return path, urlencode(sorted(params))
+
+
+def fresh_for(body, now, ttl, publish_lag, min_ttl=60.0):
+    """Seconds until Open-Meteo publishes the next ``current`` value for this response, within [min_ttl, ttl]."""
+    try:
+        current = json.loads(body)["current"]
+        due = datetime.fromisoformat(current["time"]).replace(tzinfo=timezone.utc).timestamp() + current["interval"]
+    except (ValueError, KeyError, TypeError):
+        return ttl
+    return max(min(min_ttl, ttl), min(ttl, due + publish_lag - now))
+
+
+class Entry:
+    __slots__ = ("status", "body", "content_type", "fetched_at", "fresh_until")
+
+    def __init__(self, status, body, content_type, fetched_at, fresh_until):
+        self.status = status
+        self.body = body
+        self.content_type = content_type
+        self.fetched_at = fetched_at
+        self.fresh_until = fresh_until
+
+
+class Flight:
+    """One upstream request that any number of callers can wait on."""
+
+    def __init__(self):
+        self.done = threading.Event()
+        self.entry = None
+
+
+def _ms(summary):
+    return {k: (round(v * 1000, 2) if isinstance(v, float) else v) for k, v in summary.items()}
+
+
+class WeatherStats:
+    def __init__(self, samples=10000):
+        self.lock = threading.Lock()
+        self.counts = {k: 0 for k in ("hit", "stale", "miss", "coalesced", "error", "upstream", "upstream_error")}
+        self.serve = deque(maxlen=samples)
+        self.upstream = deque(maxlen=samples)
+
+    def count(self, outcome, seconds=None):
+        with self.lock:
+            self.counts[outcome] += 1
+            if seconds is not None:
+                self.serve.append(seconds)
+
+    def snapshot(self, entries=0):
+        with self.lock:
+            counts = dict(self.counts)
+            serve, upstream = list(self.serve), list(self.upstream)
+        requests = sum(counts[k] for k in ("hit", "stale", "miss", "coalesced", "error"))
+        served_from_cache = counts["hit"] + counts["stale"] + counts["coalesced"]
+        return {
+            "requests": requests,
+            "hit_rate": round(served_from_cache / requests, 4) if requests else None,
+            **counts,
+            "entries": entries,
+            "serve_ms": _ms(latency_summary(serve)),
+            "upstream_ms": _ms(latency_summary(upstream)),
+        }
+
+
+class WeatherCache:
+    def __init__(self, upstream, grid=0.01, ttl=900.0, min_ttl=60.0, stale=3600.0, publish_lag=60.0, timeout=10.0,
+                 max_entries=10000, clock=time.time):
+        self.upstream = upstream.rstrip("/")
+        self.grid = grid
+        self.ttl = ttl
+        self.min_ttl = min_ttl
+        self.stale = stale
+        self.publish_lag = publish_lag
+        self.timeout = timeout
+        self.max_entries = max_entries
+        self.clock = clock
+        self.stats = WeatherStats()
+        self._entries = OrderedDict()
+        self._flights = {}
+        self._lock = threading.Lock()
+
+    def _fetch(self, key):
+        path, query = key
+        request = urllib.request.Request(f"{self.upstream}{path}?{query}", headers={"Accept": "application/json"})
+        started = time.perf_counter()
+        try:
+            with urllib.request.urlopen(request, timeout=self.timeout) as response:
+                status, body, content_type = response.status, response.read(), response.headers.get("Content-Type")
+        except urllib.error.HTTPError as e:
+            status, body, content_type = e.code, e.read(), e.headers.get("Content-Type")
+        except (OSError, ValueError) as e:
+            print(f"[weather] upstream request failed: {e!r}")
+            status, body, content_type = 502, json.dumps({"error": True, "reason": "upstream unavailable"}).encode(), None
+        with self.stats.lock:
+            self.stats.counts["upstream"] += 1
+            self.stats.upstream.append(time.perf_counter() - started)
+            if status >= 300:
+                self.stats.counts["upstream_error"] += 1
+        now = self.clock()
+        fresh = fresh_for(body, now, self.ttl, self.publish_lag, self.min_ttl) if status == 200 else 0.0
+        return Entry(status, body, content_type or "application/json", now, now + fresh)
+
+    def _fly(self, key):
+        """Run the upstream request for ``key`` (the caller is the leader) and publish the result."""
+        flight = self._flights[key]
+        entry = None
+        try:
+            entry = self._fetch(key)
+        finally:
+            with self._lock:
+                if entry is not None and entry.status == 200:
+                    self._entries[key] = entry
+                    self._entries.move_to_end(key)
+                    while len(self._entries) > self.max_entries:
+                        self._entries.popitem(last=False)
+                del self._flights[key]
+            flight.entry = entry
+            flight.done.set()
+        return entry
+
+    def get(self, path, query):
+        """(Entry, outcome) for a request; outcome is what X-Cache reports."""
+        key = cache_key(path, query, self.grid)
+        if key is None:
+            body = json.dumps({"error": True, "reason": "latitude and longitude must be numbers"}).encode()
+            return Entry(400, body, "application/json", 0, 0), "error"
+        now = self.clock()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and now < entry.fresh_until:
+                self._entries.move_to_end(key)
+                return entry, "hit"
+            flight = self._flights.get(key)
+            leader = flight is None
+            if leader:
+                flight = self._flights[key] = Flight()
+        if entry is not None and now < entry.fresh_until + self.stale:
+            if leader:
+                threading.Thread(target=self._fly, args=(key,), daemon=True).start()
+            return entry, "stale"
+        if leader:
+            fetched = self._fly(key)
+            outcome = "miss"
+        else:
+            flight.done.wait(self.timeout * 2)
+            fetched = flight.entry
+            outcome = "coalesced"
+        if fetched is not None and fetched.status == 200:
+            return fetched, outcome
+        if entry is not None:
+            return entry, "stale"  # stale-if-error, however old
+        if fetched is None:
+            fetched = Entry(504, json.dumps({"error": True, "reason": "upstream timed out"}).encode(), "application/json", 0, 0)
+        return fetched, "error"
+
+    def __len__(self):
+        return len(self._entries)
+
+
+class WeatherHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    server_version = "gha-weather"
+    disable_nagle_algorithm = True
+
+    def log_message(self, format, *args):
+        pass
+
+    def _send(self, status, body, content_type="application/json", headers=()):
+        self.send_response(status)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(body)))
+        for name, value in headers:
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_GET(self):
+        started = time.perf_counter()
+        url = urlsplit(self.path)
+        cache = self.server.cache
+        if url.path == "/stats":
+            self._send(200, json.dumps(cache.stats.snapshot(len(cache))).encode(), headers=[("Cache-Control", "no-store")])
+            return
+        entry, outcome = cache.get(url.path, url.query)
+        age = max(0, int(cache.clock() - entry.fetched_at)) if entry.fetched_at else 0
+        max_age = max(0, int(entry.fresh_until - cache.clock()))
+        self._send(
+            entry.status,
+            entry.body,
+            entry.content_type,
+            [("X-Cache", outcome.upper()), ("Age", str(age)), ("Cache-Control", f"public, max-age={max_age}")],
+        )
+        cache.stats.count(outcome, time.perf_counter() - started)
+
+
+class WeatherServer(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def __init__(self, address, cache):
+        super().__init__(address, WeatherHandler)
+        self.cache = cache
+
+
+def main():
+    s = settings()
+    cache = WeatherCache(
+        s["upstream"], s["grid"], s["ttl"], s["min_ttl"], s["stale"], s["publish_lag"], s["timeout"], s["max_entries"]
+    )
+    server = WeatherServer(("0.0.0.0", s["port"]), cache)
+    print(f"[weather] :{s['port']} -> {s['upstream']} (grid {s['grid']}, ttl {s['ttl']:.0f}s, stale {s['stale']:.0f}s)")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
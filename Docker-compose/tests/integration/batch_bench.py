@@ -0,0 +1,150 @@
+"""Throughput of batch envelopes against one reading per message.
+
+For each batch size the same number of readings is published as fast as the
+broker acknowledges them (batch size 1: one plain message per reading) into a
+fresh test run index, and timed until every reading is searchable. Reported
+per size: messages and bytes on the wire, publish rate, end-to-end readings
+per second, and the reference pipeline's CPU per reading for the same
+payloads (sensor_pipeline.py, no stack involved).
+
+    python batch_bench.py --readings 20000 --sizes 1,5,20,50     # against the compose stack
+    IT_BACKEND=local python batch_bench.py --readings 5000       # in-process broker and bridge
+    python batch_bench.py --offline                               # pipeline CPU only
+"""
+import argparse
+import json
+import os
+import random
+import time
+from datetime import datetime, timezone
+
+from helpers import (
+    delete_run_indices,
+    make_opensearch_client,
+    mqtt_settings,
+    new_test_run_id,
+    opensearch_settings,
+    refresh_indices,
+    run_index,
+)
+from publisher import MqttPublisher, ReadingBatcher, batch_envelope
+
+import sensor_pipeline
+
+
+def make_readings(n, sensors=50, seed=0):
+    rng = random.Random(seed)
+    start = datetime(2025, 9, 24, tzinfo=timezone.utc).timestamp()
+    return [
+        {
+            "Sensor ID": f"it-sensors-batch-{i % sensors:03d}",
+            "temperature": round(rng.uniform(12.0, 32.0), 2),
+            "humidity": round(rng.uniform(30.0, 90.0), 1),
+            "light": round(rng.uniform(0.0, 20000.0), 1),
+            "timestamp": datetime.fromtimestamp(start + i, timezone.utc).strftime("%Y-%m-%dT%H:%M:%SZ"),
+        }
+        for i in range(n)
+    ]
+
+
+def messages_for(readings, size, shared):
+    if size <= 1:
+        return [json.dumps(dict(r, **shared)) for r in readings]
+    return [batch_envelope(readings[i : i + size], shared) for i in range(0, len(readings), size)]
+
+
+def pipeline_cpu_us(messages, readings):
+    received_at = datetime.now(timezone.utc)
+    started = time.process_time()
+    for message in messages:
+        sensor_pipeline.process_all(message, received_at, sensor_pipeline.FILEBEAT_FIELDS)
+    return round((time.process_time() - started) / readings * 1e6, 2)
+
+
+def _wait_for_count(client, index, expected, timeout):
+    deadline = time.time() + timeout
+    count = 0
+    while time.time() < deadline:
+        refresh_indices(client, index)
+        count = client.count(index=index, ignore_unavailable=True)["count"]
+        if count >= expected:
+            break
+        time.sleep(0.1)
+    return count
+
+
+def run_size(client, settings, readings, size, timeout):
+    run_id = new_test_run_id()
+    shared = {"test_run_id": run_id}
+    with MqttPublisher.from_settings(settings, max_inflight=200) as publisher:
+        batcher = ReadingBatcher(publisher, max_readings=size, max_age=float("inf"), shared=shared)
+        started = time.perf_counter()
+        futures = []
+        if size <= 1:
+            futures = [publisher.publish(m) for m in messages_for(readings, 1, shared)]
+        else:
+            for reading in readings:
+                fut = batcher.add(reading)
+                if fut is not None:
+                    futures.append(fut)
+            fut = batcher.flush()
+            if fut is not None:
+                futures.append(fut)
+        for fut in futures:
+            fut.result(timeout=timeout)
+        acked = time.perf_counter() - started
+    indexed = _wait_for_count(client, run_index(run_id), len(readings), timeout)
+    visible = time.perf_counter() - started
+    delete_run_indices(client, run_id)
+    messages = messages_for(readings, size, shared)
+    return {
+        "batch_size": size,
+        "messages": len(messages),
+        "bytes_per_reading": round(sum(len(m.encode("utf-8")) for m in messages) / len(readings), 1),
+        "publish_readings_per_sec": round(len(readings) / acked, 1),
+        "end_to_end_readings_per_sec": round(indexed / visible, 1),
+        "indexed": indexed,
+        "pipeline_cpu_us_per_reading": pipeline_cpu_us(messages, len(readings)),
+    }
+
+
+def offline(readings, sizes):
+    shared = {"test_run_id": "bench"}
+    return [
+        {"batch_size": size, "pipeline_cpu_us_per_reading": pipeline_cpu_us(messages_for(readings, size, shared), len(readings))}
+        for size in sizes
+    ]
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--readings", type=int, default=20000)
+    parser.add_argument("--sizes", default="1,5,20,50", help="comma-separated batch sizes")
+    parser.add_argument("--timeout", type=float, default=300.0, help="seconds to wait for each size's readings")
+    parser.add_argument("--offline", action="store_true", help="only the reference pipeline's CPU per reading")
+    parser.add_argument("--json", help="also write the results to this file")
+    args = parser.parse_args(argv)
+
+    sizes = [int(s) for s in args.sizes.split(",")]
+    readings = make_readings(args.readings)
+    if args.offline:
+        results = offline(readings, sizes)
+    elif os.getenv("IT_BACKEND") == "local":
+        from local_stack import LocalStack
+
+        with LocalStack(pipeline="bridge") as stack:
+            results = [run_size(stack.opensearch, stack.mqtt_settings(), readings, s, args.timeout) for s in sizes]
+    else:
+        client = make_opensearch_client(**opensearch_settings())
+        results = [run_size(client, mqtt_settings(), readings, s, args.timeout) for s in sizes]
+
+    for row in results:
+        print(f"[batch] {json.dumps(row)}")
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump(results, f, indent=2)
+    return 0 if all(row.get("indexed", args.readings) == args.readings for row in results) else 1
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -0,0 +1,298 @@
+"""Chaos run: sequence-numbered readings stream while compose services are stopped and restarted on a plan.
+
+Each step of --plan is ``service:action@seconds`` (stop, start, restart,
+kill, pause, unpause), run with ``docker <action> <service>``; the compose
+services' container names are their service names. That needs the docker CLI,
+so compose chaos runs go from the host, not from the integration-tests
+container, with IT_MQTT_HOST / IT_OS_HOST set to the services' fixed addresses
+on network-gha_gha (172.19.2.6 and 172.19.2.4). Every reading carries a
+run-wide seq (loadgen.make_reading) and is written under its sensor#seq
+document id, so once the backlog has drained the run's index says exactly
+what happened:
+
+* missing: seqs the broker acknowledged that never became searchable (lost
+  downstream of it) and seqs it never acknowledged (lost at the publisher)
+* duplicates: readings written more than once -- documents with _version > 1,
+  overwritten by a redelivery -- and extra documents for one seq, which would
+  mean the ids stopped being deterministic
+* per outage (from the step taking a service down to the one bringing it
+  back): readings published meanwhile and how many were lost, the stall
+  until a reading published after the outage began became visible, the time
+  to recover (from the service being back until everything published before
+  that is searchable) and the catch-up rate over that time
+
+The report is one JSON document (--json); --history appends it as one line to
+an NDJSON file so runs can be compared over time.
+
+    python chaos.py --plan logstash:stop@30,logstash:start@90 --duration 150
+    python chaos.py --plan opensearch:restart@60 --nodes 50 --rate 1 --history chaos.ndjson
+    python chaos.py --plan filebeat:stop@30,filebeat:start@60,mqtt:restart@100 --duration 160
+    IT_BACKEND=local python chaos.py --plan pipeline:stop@10,pipeline:start@20 --duration 30
+"""
+import argparse
+import json
+import os
+import subprocess
+import time
+from datetime import datetime, timezone
+
+from helpers import (
+    delete_run_indices,
+    latency_summary,
+    make_opensearch_client,
+    mqtt_settings,
+    new_test_run_id,
+    opensearch_settings,
+    refresh_indices,
+    run_index,
+)
+from loadgen import VisibilityObserver, positive_float, positive_int
+from publisher import MqttPublisher
+from soak import SteadyTraffic
+
+ACTIONS = ("stop", "start", "restart", "kill", "pause", "unpause")
+DOWN = {"stop", "kill", "pause"}
+UP = {"start", "unpause"}
+
+
+def parse_plan(text):
+    """'logstash:stop@30,logstash:start@90' -> [(30.0, 'logstash', 'stop'), (90.0, 'logstash', 'start')]"""
+    steps = []
+    for part in filter(None, (p.strip() for p in text.split(","))):
+        target, _, at = part.partition("@")
+        service, _, action = target.partition(":")
+        if not service or action not in ACTIONS or not at:
+            raise ValueError(f"plan step {part!r} is not service:action@seconds with action one of {', '.join(ACTIONS)}")
+        steps.append((float(at), service, action))
+    return sorted(steps)
+
+
+def docker_action(service, action):
+    subprocess.run(["docker", action, service], capture_output=True, text=True, timeout=180, check=True)
+
+
+def local_action(stack):
+    """The local stack's one disruptable service: ``pipeline`` (the emulator or bridge)."""
+
+    def act(service, action):
+        if service != "pipeline" or action not in ("stop", "start", "restart"):
+            raise ValueError(f"the local stack can only stop/start/restart 'pipeline', not {service}:{action}")
+        if action in ("stop", "restart"):
+            stack.stop_pipeline()
+        if action in ("start", "restart"):
+            stack.start_pipeline()
+
+    return act
+
+
+def outages(events):
+    """Pair each step that takes a service down with the step that brings it back; a restart is both."""
+    windows, down = [], {}
+    for event in events:
+        if event.get("error"):
+            continue
+        service, action = event["service"], event["action"]
+        if action == "restart":
+            windows.append({"service": service, "action": action, "down_at": event["issued_at"], "up_at": event["done_at"]})
+        elif action in DOWN:
+            down.setdefault(service, event)
+        elif action in UP and service in down:
+            first = down.pop(service)
+            windows.append({"service": service, "action": first["action"], "down_at": first["issued_at"],
+                            "up_at": event["done_at"]})
+    for service, first in down.items():
+        windows.append({"service": service, "action": first["action"], "down_at": first["issued_at"], "up_at": None})
+    return sorted(windows, key=lambda w: w["down_at"])
+
+
+def scan_versions(client, index, page_size=5000):
+    """{seq: [_version of each document with that seq]} for the whole index."""
+    versions, search_after = {}, None
+    while True:
+        body = {"query": {"match_all": {}}, "_source": ["seq"], "sort": [{"seq": "asc"}, {"_id": "asc"}],
+                "size": page_size, "version": True}
+        if search_after is not None:
+            body["search_after"] = search_after
+        hits = client.search(index=index, body=body, ignore_unavailable=True)["hits"]["hits"]
+        for hit in hits:
+            versions.setdefault(int(hit["_source"]["seq"]), []).append(hit.get("_version", 1))
+        if len(hits) < page_size:
+            return versions
+        search_after = hits[-1]["sort"]
+
+
+def ranges(seqs):
+    """[3, 4, 5, 9] -> '3-5,9'"""
+    out, seqs = [], sorted(seqs)
+    i = 0
+    while i < len(seqs):
+        j = i
+        while j + 1 < len(seqs) and seqs[j + 1] == seqs[j] + 1:
+            j += 1
+        out.append(str(seqs[i]) if i == j else f"{seqs[i]}-{seqs[j]}")
+        i = j + 1
+    return ",".join(out)
+
+
+def outage_report(window, seen, published, lost, t0, previous_up):
+    """Numbers for one outage; ``seen`` is {seq: (published_at, seen_at)}, ``published`` {seq: published_at}."""
+    down_at, up_at = window["down_at"], window["up_at"]
+    row = {"service": window["service"], "action": window["action"], "down_at_s": round(down_at - t0, 1)}
+    end = up_at if up_at is not None else float("inf")
+    during = [s for s, at in published.items() if down_at <= at < end]
+    row["published_while_down"] = len(during)
+    row["lost"] = sum(1 for s in during if s in lost)
+    after = [seen_at for at, seen_at in seen.values() if at >= down_at]
+    row["stall_s"] = round(min(after) - down_at, 2) if after else None
+    if up_at is None:
+        row["up_at_s"] = None
+        return row
+    row["up_at_s"] = round(up_at - t0, 1)
+    row["down_s"] = round(up_at - down_at, 1)
+    backlog = [seen_at for at, seen_at in seen.values() if previous_up <= at < up_at]
+    recovered_at = max([up_at] + backlog)
+    row["time_to_recover_s"] = round(recovered_at - up_at, 2)
+    drained = sum(1 for at, seen_at in seen.values() if up_at <= seen_at <= recovered_at and at < recovered_at)
+    row["catch_up_per_sec"] = round(drained / (recovered_at - up_at), 1) if recovered_at > up_at else None
+    return row
+
+
+def run(client, settings, plan, duration, nodes=20, rate=1.0, act=docker_action, drain_timeout=300.0, quiet=30.0,
+        poll_interval=0.5, keep=False):
+    run_id = new_test_run_id()
+    index = run_index(run_id)
+    print(f"[chaos] run_id={run_id} {nodes} sensors x {rate}/s for {duration:.0f}s, plan: "
+          + ", ".join(f"{service}:{action}@{at:g}" for at, service, action in plan))
+    observer = VisibilityObserver(client, index, poll_interval=poll_interval)
+    observer.start()
+    events = []
+    with MqttPublisher.from_settings(settings, max_inflight=1000) as publisher:
+        traffic = SteadyTraffic(publisher, run_id, nodes, rate, track=True)
+        t0 = time.time()
+        traffic.start()
+        for at, service, action in plan:
+            delay = t0 + at - time.time()
+            if delay > 0:
+                time.sleep(delay)
+            event = {"service": service, "action": action, "issued_at": time.time()}
+            try:
+                act(service, action)
+            except (OSError, subprocess.SubprocessError, ValueError) as e:
+                event["error"] = getattr(e, "stderr", None) or repr(e)
+                print(f"[chaos] {service}:{action} failed: {event['error']}")
+            event["done_at"] = time.time()
+            took = event["done_at"] - event["issued_at"]
+            print(f"[chaos] t={event['issued_at'] - t0:.1f}s {service}:{action} took {took:.1f}s")
+            events.append(event)
+        remaining = t0 + duration - time.time()
+        if remaining > 0:
+            time.sleep(remaining)
+        traffic.stop()
+        traffic.join()
+        t_stopped = time.time()
+        publisher.flush(timeout=drain_timeout)
+    published_total = traffic.published + traffic.failed
+
+    # Drained once every acked reading is visible, or nothing new has shown up for ``quiet`` seconds.
+    deadline = time.time() + drain_timeout
+    last_count, last_change = len(observer.seen), time.time()
+    while time.time() < deadline and not traffic.acked_seqs <= observer.seen.keys():
+        if len(observer.seen) != last_count:
+            last_count, last_change = len(observer.seen), time.time()
+        elif time.time() - last_change > quiet:
+            break
+        time.sleep(poll_interval)
+    observer.stop()
+    observer.join()
+    refresh_indices(client, index)
+    versions = scan_versions(client, index)
+
+    seen = dict(observer.seen)
+    # published_at of every seq, from the index for the ones that made it and spread evenly for the others.
+    published = {s: at for s, (at, _) in seen.items()}
+    for seq in range(published_total):
+        published.setdefault(seq, t0 + seq / (nodes * rate))
+    lost = traffic.acked_seqs - versions.keys()
+    unacked = set(range(published_total)) - traffic.acked_seqs - versions.keys()
+    windows = outages(events)
+    first_down = windows[0]["down_at"] if windows else float("inf")
+    steady = [seen_at - at for at, seen_at in seen.values() if at < first_down]
+
+    report = {
+        "run_id": run_id,
+        "started": datetime.fromtimestamp(t0, timezone.utc).isoformat(timespec="seconds"),
+        "plan": [f"{service}:{action}@{at:g}" for at, service, action in plan],
+        "duration_s": round(t_stopped - t0, 1),
+        "publish_per_sec": round(nodes * rate, 1),
+        "published": published_total,
+        "acked": len(traffic.acked_seqs),
+        "searchable": len(versions),
+        "missing_acked": len(lost),
+        "missing_acked_seqs": ranges(lost),
+        "missing_unacked": len(unacked),
+        "duplicate_documents": sum(len(v) - 1 for v in versions.values()),
+        "overwritten_readings": sum(1 for v in versions.values() if max(v) > 1),
+        "extra_writes": sum(version - 1 for v in versions.values() for version in v),
+        "steady_latency_s": latency_summary(steady),
+        "step_errors": [f"{e['service']}:{e['action']}: {e['error']}" for e in events if e.get("error")],
+        "outages": [],
+    }
+    previous_up = t0
+    for window in windows:
+        report["outages"].append(outage_report(window, seen, published, lost | unacked, t0, previous_up))
+        previous_up = window["up_at"] or previous_up
+    if not keep:
+        delete_run_indices(client, run_id)
+    return report
+
+
+def print_report(report):
+    keys = ("published", "acked", "searchable", "missing_acked", "missing_unacked", "duplicate_documents",
+            "overwritten_readings", "extra_writes")
+    print("[chaos] " + " ".join(f"{k}={report[k]}" for k in keys))
+    if report["missing_acked_seqs"]:
+        print(f"[chaos] lost after the broker acked them: seqs {report['missing_acked_seqs']}")
+    for row in report["outages"]:
+        print(f"[chaos] {json.dumps(row)}")
+    for error in report["step_errors"]:
+        print(f"[chaos] step failed: {error}")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--plan", required=True, help="comma-separated service:action@seconds steps")
+    parser.add_argument("--duration", type=float, default=180.0, help="seconds of traffic")
+    parser.add_argument("--nodes", type=positive_int, default=20, help="simulated sensors")
+    parser.add_argument("--rate", type=positive_float, default=1.0, help="readings per second per sensor")
+    parser.add_argument("--drain-timeout", type=float, default=300.0, help="max wait for the backlog after the traffic")
+    parser.add_argument("--quiet", type=float, default=30.0,
+                        help="stop waiting for the backlog after this many seconds without a new reading")
+    parser.add_argument("--poll-interval", type=float, default=0.5, help="visibility poll interval (timing resolution)")
+    parser.add_argument("--keep", action="store_true", help="do not delete the run's index")
+    parser.add_argument("--json", help="write the report to this file")
+    parser.add_argument("--history", help="append the report as one line to this NDJSON file")
+    args = parser.parse_args(argv)
+    plan = parse_plan(args.plan)
+    options = {"nodes": args.nodes, "rate": args.rate, "drain_timeout": args.drain_timeout,
+               "quiet": args.quiet, "poll_interval": args.poll_interval, "keep": args.keep}
+
+    if os.getenv("IT_BACKEND") == "local":
+        from local_stack import LocalStack
+
+        with LocalStack(pipeline=os.getenv("IT_PIPELINE", "reference")) as stack:
+            report = run(stack.opensearch, stack.mqtt_settings(), plan, args.duration, act=local_action(stack), **options)
+    else:
+        report = run(make_opensearch_client(**opensearch_settings()), mqtt_settings(), plan, args.duration, **options)
+
+    print_report(report)
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump(report, f, indent=2)
+    if args.history:
+        with open(args.history, "a") as f:
+            f.write(json.dumps(report) + "\n")
+    return 1 if report["missing_acked"] or report["duplicate_documents"] else 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -0,0 +1,109 @@
+import json
+import os
+
+import pytest
+
+from helpers import (
+    delete_run_indices,
+    make_opensearch_client,
+    mqtt_settings,
+    new_test_run_id,
+    opensearch_settings,
+    visibility_metrics,
+)
+from phases import phase
+from publisher import MqttPublisher
+import readiness
+
+# Per-phase timings checked against phase_baseline.json; see phases.py.
+pytest_plugins = ["phases"]
+
+# docker: the compose stack (default). local: in-process broker, reference pipeline and in-memory OpenSearch.
+BACKEND = os.getenv("IT_BACKEND", "docker")
+# Seconds readiness.py may take to get the whole pipeline hot before anything is published; 0 skips it.
+READY_TIMEOUT = float(os.getenv("IT_READY_TIMEOUT", "300"))
+warmup_report = {}
+
+
+@pytest.fixture(scope="session")
+def local_stack():
+    if BACKEND != "local":
+        yield None
+        return
+    from local_stack import LocalStack
+
+    # reference: messages go straight through sensor_pipeline.py; bridge: through ingest/bridge.py.
+    with LocalStack(pipeline=os.getenv("IT_PIPELINE", "reference")) as stack:
+        yield stack
+
+
+@pytest.fixture(scope="session")
+def opensearch_client(local_stack):
+    if local_stack is not None:
+        return local_stack.opensearch
+    return make_opensearch_client(**opensearch_settings())
+
+
+@pytest.fixture(scope="session")
+def test_run_id(opensearch_client):
+    run_id = new_test_run_id()
+    print(f"\n[run] test_run_id={run_id}")
+    yield run_id
+    if os.getenv("IT_KEEP_INDICES") != "1":
+        delete_run_indices(opensearch_client, run_id)
+
+
+@pytest.fixture(scope="session")
+def pipeline_ready(local_stack, opensearch_client):
+    """Every hop up and a canary searchable end to end, or the session stops here instead of timing out per test."""
+    if not READY_TIMEOUT:
+        return None
+    settings = local_stack.mqtt_settings() if local_stack is not None else mqtt_settings()
+    hops = readiness.NO_HOPS if local_stack is not None else readiness.hop_settings()
+    try:
+        warmup_report.update(readiness.wait_until_ready(opensearch_client, settings, hops, timeout=READY_TIMEOUT))
+    except readiness.NotReady as err:
+        pytest.exit(f"pipeline not ready: {err}", returncode=1)
+    return warmup_report
+
+
+@pytest.fixture(scope="session")
+def mqtt_publisher(local_stack, pipeline_ready):
+    settings = local_stack.mqtt_settings() if local_stack is not None else mqtt_settings()
+    publisher = MqttPublisher.from_settings(settings)
+    with phase("mqtt_connect"):
+        publisher.connect()
+    try:
+        yield publisher
+    finally:
+        publisher.close()
+
+
+@pytest.fixture
+def publish(mqtt_publisher):
+    def publish(payload):
+        with phase("publish_ack"):
+            result = mqtt_publisher.publish(payload).result(timeout=10)
+        print(f"[publish] mid={result.mid} ack_latency={result.ack_latency * 1000:.1f}ms")
+        return result
+
+    return publish
+
+
+def pytest_terminal_summary(terminalreporter):
+    if warmup_report:
+        terminalreporter.section("pipeline warm-up (seconds)")
+        for stage in warmup_report["stages"]:
+            terminalreporter.write_line(json.dumps(stage))
+    summary = visibility_metrics.summary()
+    if not summary["samples"]:
+        return
+    terminalreporter.section("pipeline time-to-visible (seconds)")
+    terminalreporter.write_line(f"all: {summary['all']}")
+    for index, stats in summary["by_index"].items():
+        terminalreporter.write_line(f"{index}: {stats}")
+    path = os.getenv("IT_METRICS_FILE")
+    if path:
+        with open(path, "w") as f:
+            json.dump(summary, f, indent=2)
+        terminalreporter.write_line(f"written to {path}")
@@ -0,0 +1,428 @@
+"""Property-based fuzz corpus for the sensor payload validation in logstash.conf.
+
+Generates structured-random MQTT payloads the way production nodes get them
+wrong (comma decimals, ``%`` suffixes, ``Z+200`` offsets, numbers as strings,
+nulls, booleans, NaN, huge numbers, missing keys, broken JSON) together with
+the outcome each one must have: sensors or errors index, the pipeline_errors
+list, the coerced floats and ``*_raw`` strings, and the parsed @timestamp.
+The expectations come from the rules in logstash.conf, written out here per
+rendering, not from ingest/sensor_pipeline.py, so ``--offline`` checks the
+reference implementation against them.
+
+Against a stack the payloads are published in one pipelined burst, routed by a
+fuzz-only test_run_id into it-run-<id>-sensors/-errors (mapped by the templates
+from provision.py), and verified with one aggregation per index: per expected
+outcome group the document count, the pipeline_errors terms, the reading stats
+(count/min/max/sum) and raw counts, the @timestamp range and parse-failure
+tags. Payloads that are not valid JSON carry no test_run_id, land in the daily
+sensors-errors-* index and are counted there with a match_phrase.
+
+    python fuzz_corpus.py --offline --count 50000 --seed 7   # oracle vs sensor_pipeline.py, no stack needed
+    python fuzz_corpus.py --count 20000                      # publish, wait, verify with aggregations
+    python fuzz_corpus.py --dump fuzz.ndjson --count 1000    # write messages and expectations
+"""
+import argparse
+import json
+import math
+import random
+import struct
+import sys
+import time
+import uuid
+from dataclasses import asdict, dataclass, field
+from datetime import datetime, timedelta, timezone
+from typing import Dict, List, Optional
+
+from helpers import delete_docs_matching, make_opensearch_client, mqtt_settings, opensearch_settings, refresh_indices
+from publisher import MqttPublisher
+
+import sensor_pipeline
+
+READINGS = (("temperature", "temperature_c"), ("humidity", "humidity_pct"), ("light", "light"))
+RANGES = {"temperature": (-25.0, 55.0), "humidity": (0.0, 100.0), "light": (0.0, 120000.0)}
+JSON_FAILURE = "json_failure"
+ERROR_ORDER = ["missing_sensor_id"] + [f"missing_{n}" for n, _ in READINGS] + [f"invalid_{n}" for n, _ in READINGS]
+
+
+@dataclass
+class Case:
+    message: str
+    group: str
+    index: str  # "sensors", "errors" (run-scoped) or "sensors-errors" (no test_run_id survived)
+    errors: List[str] = field(default_factory=list)
+    readings: Dict[str, float] = field(default_factory=dict)
+    raws: Dict[str, str] = field(default_factory=dict)
+    timestamp: Optional[str] = None
+    date_failure: bool = False
+
+
+# --- values ------------------------------------------------------------------
+
+
+def _number(rng, name):
+    roll = rng.random()
+    if roll < 0.04:
+        return rng.choice([1.0, -1.0]) * 10 ** rng.uniform(15, 37)  # huge, still inside float32
+    if roll < 0.08:
+        return rng.choice([0.0, 1.0, -0.5, 100.0])
+    low, high = RANGES[name]
+    return round(rng.uniform(low, high), rng.choice([0, 1, 2, 3]))
+
+
+def render_value(rng, name):
+    """(JSON fragment or None for an absent key, kind, expected) for one reading.
+
+    kind is "valid" (expected: the float logstash stores), "invalid" (expected: the *_raw string),
+    "missing" (null or absent) or "broken" (the whole payload stops being JSON).
+    """
+    x = _number(rng, name)
+    roll = rng.random()
+    if roll < 0.30:
+        return repr(x), "valid", x
+    if roll < 0.36:
+        n = int(x) if abs(x) < 1e15 else 12345
+        return str(n), "valid", float(n)
+    if roll < 0.44:
+        pad = rng.choice(["", " ", "  "])
+        return json.dumps(f"{pad}{repr(x)}{pad}"), "valid", x
+    if roll < 0.52 and abs(x) < 1e15 and x != int(x):
+        text = repr(x).replace(".", ",")
+        return json.dumps(text), "valid", x
+    if roll < 0.58 and abs(x) < 1e15:
+        # gsub strips every % from the message, quoted or not.
+        quoted = rng.random() < 0.5
+        text = f"{repr(x)}%"
+        return (json.dumps(text) if quoted else text), "valid", x
+    if roll < 0.61:
+        n = rng.randint(1000, 999999)
+        grouped = f"{n:_}"
+        return json.dumps(grouped), "valid", float(n)
+    if roll < 0.63:
+        # Float() accepts hex, but the coercion is String#to_f, which stops at the "x".
+        return json.dumps(f"0x{rng.randint(1, 4095):X}"), "valid", 0.0
+    if roll < 0.66:
+        mantissa, exp = round(rng.uniform(1, 9), 2), rng.randint(-3, 6)
+        return json.dumps(f"{mantissa}e{exp}"), "valid", float(f"{mantissa}e{exp}")
+    if roll < 0.76:
+        text = rng.choice(["hot", "", "   ", "NaN", "Infinity", "-Infinity", "21.5abc", "1,234.5", "--5", "5.", "n/a",
+                           "1e", "0x", "1__0", "_1"])
+        return json.dumps(text), "invalid", text
+    if roll < 0.80:
+        value = rng.choice([True, False])
+        return json.dumps(value), "invalid", "true" if value else "false"
+    if roll < 0.83:
+        return rng.choice([("[1, 2]", "invalid", "[1, 2]"), ('{"v": 1}', "invalid", '{"v"=>1}'), ("[]", "invalid", "[]")])
+    if roll < 0.89:
+        return "null", "missing", None
+    if roll < 0.985:
+        return None, "missing", None
+    return rng.choice(["NaN", "Infinity", "-Infinity", "1e400x"]), "broken", None
+
+
+def render_sensor(rng, i):
+    roll = rng.random()
+    if roll < 0.80:
+        return json.dumps(f"fz-{i % 97}"), "valid", f"fz-{i % 97}"
+    if roll < 0.85:
+        return json.dumps(f"fz%-{i % 97}%"), "valid", f"fz-{i % 97}"
+    if roll < 0.88:
+        return str(i % 997), "valid", i % 997
+    if roll < 0.90:
+        return '""', "valid", ""
+    if roll < 0.95:
+        return "null", "missing", None
+    return None, "missing", None
+
+
+def render_timestamp(rng):
+    """(JSON fragment or None, class, expected ISO @timestamp or None)."""
+    roll = rng.random()
+    if roll < 0.55:
+        return None, "none", None
+    base = datetime(2025, 9, 24, tzinfo=timezone.utc) + timedelta(seconds=rng.randint(0, 30 * 86400))
+    local = base.strftime("%Y-%m-%dT%H:%M:%S")
+    expected = base.strftime("%Y-%m-%dT%H:%M:%S.000Z")
+    if roll < 0.70:
+        return json.dumps(local + "Z"), "valid", expected
+    hours = rng.choice([1, 2, 3])
+    shifted = (base + timedelta(hours=hours)).strftime("%Y-%m-%dT%H:%M:%S")
+    if roll < 0.80:
+        return json.dumps(f"{shifted}Z+{hours}00"), "valid", expected  # the node firmware's offset format
+    if roll < 0.90:
+        return json.dumps(f"{shifted}+0{hours}:00"), "valid", expected
+    return json.dumps(rng.choice(["yesterday", "24/09/2025 10:00", "2025-13-40T99:00:00Z"])), "bad", None
+
+
+def generate(count, seed=0, run_id="fuzz"):
+    rng = random.Random(seed)
+    cases = []
+    for i in range(count):
+        parts = [("Sensor ID", render_sensor(rng, i))]
+        parts += [(name, render_value(rng, name)) for name, _ in READINGS]
+        ts_fragment, ts_class, ts_expected = render_timestamp(rng)
+        fragments = [(k, frag) for k, (frag, _, _) in parts if frag is not None]
+        if ts_fragment is not None:
+            fragments.append(("timestamp", ts_fragment))
+        rng.shuffle(fragments)
+
+        if any(kind == "broken" for _, (_, kind, _) in parts):
+            body = ", ".join(f'"{k}": {frag}' for k, frag in fragments)
+            message = '{"fuzz_run": "' + run_id + '", ' + body + "}"
+            cases.append(Case(message, JSON_FAILURE, "sensors-errors",
+                              errors=["missing_sensor_id"] + [f"missing_{n}" for n, _ in READINGS]))
+            continue
+
+        errors, readings, raws = [], {}, {}
+        if parts[0][1][1] == "missing":
+            errors.append("missing_sensor_id")
+        for (name, target), (_, (fragment, kind, expected)) in zip(READINGS, parts[1:]):
+            if kind == "missing":
+                errors.append(f"missing_{name}")
+                continue
+            if kind == "invalid":
+                errors.append(f"invalid_{name}")
+            readings[target] = expected
+            # Error documents keep every present value as to_s, taken after the % gsub.
+            raws[f"{name}_raw"] = expected if kind == "invalid" else _raw(fragment)
+        errors.sort(key=ERROR_ORDER.index)
+        if errors:
+            readings = {}
+        else:
+            raws = {}
+        group = f"{'+'.join(errors) or 'ok'}|ts={ts_class}"
+        keyed = [("test_run_id", json.dumps(run_id)), ("fuzz_run", json.dumps(run_id)), ("fuzz_group", json.dumps(group))]
+        body = ", ".join(f'"{k}": {frag}' for k, frag in keyed + fragments)
+        cases.append(Case("{" + body + "}", group, "errors" if errors else "sensors", errors, readings, raws,
+                          ts_expected, ts_class == "bad"))
+    return cases
+
+
+def _raw(fragment):
+    return sensor_pipeline.ruby_to_s(json.loads(fragment.replace("%", "")))
+
+
+# --- offline check -------------------------------------------------------------
+
+
+def check_reference(cases, received_at=None):
+    """Run every case through sensor_pipeline.py; returns [(case, {field: (expected, actual)}), ...] that differ."""
+    received_at = received_at or datetime.now(timezone.utc)
+    mismatches = []
+    for case in cases:
+        index, event = sensor_pipeline.process(case.message, received_at)
+        doc = sensor_pipeline.to_document(event)
+        family = sensor_pipeline.index_family(index)
+        actual_index = {"it-run-sensors": "sensors", "it-run-errors": "errors"}.get(family, family)
+        delta = {}
+        if actual_index != case.index:
+            delta["index"] = (case.index, actual_index)
+        if (doc.get("pipeline_errors") or []) != case.errors:
+            delta["pipeline_errors"] = (case.errors, doc.get("pipeline_errors"))
+        for target, want in case.readings.items():
+            got = doc.get(target)
+            if got != want and not (isinstance(got, float) and math.isclose(got, want, rel_tol=1e-12)):
+                delta[target] = (want, got)
+        for raw, want in case.raws.items():
+            if doc.get(raw) != want:
+                delta[raw] = (want, doc.get(raw))
+        if case.timestamp is not None and doc["@timestamp"] != case.timestamp:
+            delta["@timestamp"] = (case.timestamp, doc["@timestamp"])
+        if case.date_failure != ("_dateparsefailure" in (doc.get("tags") or [])):
+            delta["_dateparsefailure"] = (case.date_failure, not case.date_failure)
+        if delta:
+            mismatches.append((case, delta))
+    return mismatches
+
+
+# --- stack run -----------------------------------------------------------------
+
+
+def f32(value):
+    return struct.unpack("f", struct.pack("f", value))[0]
+
+
+def expected_groups(cases):
+    groups = {}
+    for case in cases:
+        if case.group == JSON_FAILURE:
+            continue
+        g = groups.setdefault(case.group, {"index": case.index, "count": 0, "errors": case.errors, "date_failures": 0,
+                                           "readings": {}, "raws": {}, "timestamps": []})
+        g["count"] += 1
+        g["date_failures"] += case.date_failure
+        for target, value in case.readings.items():
+            g["readings"].setdefault(target, []).append(value)
+        for raw in case.raws:
+            g["raws"][raw] = g["raws"].get(raw, 0) + 1
+        if case.timestamp is not None:
+            g["timestamps"].append(case.timestamp)
+    return groups
+
+
+def verification_aggs():
+    per_group = {
+        "index": {"terms": {"field": "_index", "size": 5}},
+        "errors": {"terms": {"field": "pipeline_errors", "size": 10}},
+        "date_failures": {"filter": {"term": {"tags": "_dateparsefailure"}}},
+        "ts_min": {"min": {"field": "@timestamp"}},
+        "ts_max": {"max": {"field": "@timestamp"}},
+    }
+    for _, target in READINGS:
+        per_group[target] = {"stats": {"field": target}}
+    for name, _ in READINGS:
+        per_group[f"{name}_raw"] = {"value_count": {"field": f"{name}_raw"}}
+    return {"groups": {"terms": {"field": "fuzz_group", "size": 10000}, "aggs": per_group}}
+
+
+def _close(want, got, scale):
+    return got is not None and abs(got - want) <= 1e-6 * scale + 1e-9
+
+
+def compare(expected, buckets, run_id):
+    """{group: [problem, ...]} for every group whose aggregated outcome differs."""
+    problems = {}
+    seen = set()
+    for bucket in buckets:
+        name = bucket["key"]
+        seen.add(name)
+        want = expected.get(name)
+        issues = problems.setdefault(name, [])
+        if want is None:
+            issues.append(f"{bucket['doc_count']} unexpected documents")
+            continue
+        if bucket["doc_count"] != want["count"]:
+            issues.append(f"count {bucket['doc_count']} != {want['count']}")
+        index = sensor_pipeline.run_index(run_id, errors=want["index"] == "errors")
+        got_index = {b["key"]: b["doc_count"] for b in bucket["index"]["buckets"]}
+        if got_index != {index: bucket["doc_count"]}:
+            issues.append(f"indices {got_index}, expected all in {index}")
+        got_errors = {b["key"]: b["doc_count"] for b in bucket["errors"]["buckets"]}
+        if got_errors != {e: bucket["doc_count"] for e in want["errors"]}:
+            issues.append(f"pipeline_errors {got_errors}")
+        if bucket["date_failures"]["doc_count"] != want["date_failures"]:
+            issues.append(f"_dateparsefailure on {bucket['date_failures']['doc_count']}, expected {want['date_failures']}")
+        for _, target in READINGS:
+            values = [f32(v) for v in want["readings"].get(target, [])]
+            stats = bucket[target]
+            if stats["count"] != len(values):
+                issues.append(f"{target} count {stats['count']} != {len(values)}")
+            elif values:
+                scale = sum(abs(v) for v in values) or 1.0
+                for stat, value in (("min", min(values)), ("max", max(values)), ("sum", sum(values))):
+                    if not _close(value, stats[stat], scale if stat == "sum" else abs(value) or 1.0):
+                        issues.append(f"{target} {stat} {stats[stat]!r} != {value!r}")
+        for name_, _ in READINGS:
+            raw = f"{name_}_raw"
+            if bucket[raw]["value"] != want["raws"].get(raw, 0):
+                issues.append(f"{raw} on {bucket[raw]['value']} docs, expected {want['raws'].get(raw, 0)}")
+        if want["timestamps"] and want["date_failures"] == 0 and len(want["timestamps"]) == want["count"]:
+            low = sensor_pipeline.parse_timestamp(min(want["timestamps"])).timestamp() * 1000
+            high = sensor_pipeline.parse_timestamp(max(want["timestamps"])).timestamp() * 1000
+            if (bucket["ts_min"]["value"], bucket["ts_max"]["value"]) != (low, high):
+                issues.append(f"@timestamp range {bucket['ts_min']['value']}..{bucket['ts_max']['value']} != {low}..{high}")
+        if not issues:
+            del problems[name]
+    for name in set(expected) - seen:
+        problems[name] = [f"no documents, expected {expected[name]['count']}"]
+    return problems
+
+
+def _wait_for_counts(client, targets, timeout_seconds):
+    """targets: [(index, query, expected count)]; polls until every count is reached. Returns the last counts."""
+    deadline = time.time() + timeout_seconds
+    while True:
+        counts = []
+        for index, query, _ in targets:
+            refresh_indices(client, index)
+            res = client.count(index=index, body={"query": query}, ignore_unavailable=True, allow_no_indices=True)
+            counts.append(res["count"])
+        if all(c >= want for c, (_, _, want) in zip(counts, targets)) or time.time() >= deadline:
+            return counts
+        time.sleep(1.0)
+
+
+def run(client, publisher, cases, run_id, timeout_seconds=300):
+    """Publish ``cases`` and verify them; returns a report dict (``problems`` empty when everything matched)."""
+    run_indices = f"{sensor_pipeline.RUN_INDEX_PREFIX}{run_id}-*"
+    json_query = {"match_phrase": {"message": run_id}}
+    try:
+        started = time.perf_counter()
+        publisher.publish_many([c.message for c in cases], timeout=max(30, len(cases) / 200))
+        published = time.perf_counter() - started
+        broken = sum(1 for c in cases if c.group == JSON_FAILURE)
+        counts = _wait_for_counts(
+            client,
+            [(run_indices, {"match_all": {}}, len(cases) - broken),
+             (sensor_pipeline.ERROR_INDEX_PREFIX + "*", json_query, broken)],
+            timeout_seconds,
+        )
+        visible = time.perf_counter() - started
+
+        res = client.search(index=run_indices, body={"size": 0, "aggs": verification_aggs()})
+        problems = compare(expected_groups(cases), res["aggregations"]["groups"]["buckets"], run_id)
+        if counts[1] != broken:
+            problems[JSON_FAILURE] = [f"{counts[1]} documents in sensors-errors-*, expected {broken}"]
+        return {
+            "cases": len(cases),
+            "groups": len(expected_groups(cases)),
+            "invalid_json": broken,
+            "published_per_sec": round(len(cases) / published, 1),
+            "all_visible_s": round(visible, 2),
+            "problems": problems,
+        }
+    finally:
+        client.indices.delete(index=run_indices, ignore_unavailable=True)
+        delete_docs_matching(client, [sensor_pipeline.ERROR_INDEX_PREFIX + "*"], json_query)
+
+
+def print_report(report):
+    for group, issues in sorted(report["problems"].items()):
+        print(f"[fuzz] MISMATCH {group}")
+        for issue in issues:
+            print(f"    {issue}")
+    summary = {k: v for k, v in report.items() if k != "problems"}
+    print(f"[fuzz] {json.dumps(summary)}")
+    print(f"[fuzz] {report['groups'] - len(report['problems'])}/{report['groups']} outcome groups match")
+
+
+def new_fuzz_run_id():
+    return "fz" + uuid.uuid4().hex[:10]
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--count", type=int, default=20000)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--offline", action="store_true", help="check sensor_pipeline.py against the expectations")
+    parser.add_argument("--dump", help="write the cases (message + expectations) as ndjson and exit")
+    parser.add_argument("--timeout", type=float, default=300.0, help="seconds to wait for every document")
+    args = parser.parse_args(argv)
+
+    run_id = new_fuzz_run_id()
+    t0 = time.perf_counter()
+    cases = generate(args.count, args.seed, run_id)
+    print(f"[fuzz] {len(cases)} cases (seed {args.seed}) in {time.perf_counter() - t0:.2f}s", file=sys.stderr)
+
+    if args.dump:
+        with open(args.dump, "w", encoding="utf-8") as f:
+            for case in cases:
+                f.write(json.dumps(asdict(case)) + "\n")
+        return 0
+    if args.offline:
+        t0 = time.perf_counter()
+        mismatches = check_reference(cases)
+        for case, delta in mismatches[:50]:
+            print(f"[fuzz] MISMATCH {case.message}\n    {delta}")
+        print(f"[fuzz] {len(cases) - len(mismatches)}/{len(cases)} cases match sensor_pipeline.py "
+              f"({time.perf_counter() - t0:.2f}s)")
+        return 1 if mismatches else 0
+
+    client = make_opensearch_client(**opensearch_settings())
+    with MqttPublisher.from_settings(mqtt_settings()) as publisher:
+        report = run(client, publisher, cases, run_id, args.timeout)
+    print_report(report)
+    return 1 if report["problems"] else 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
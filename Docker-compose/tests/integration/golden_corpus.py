@@ -0,0 +1,189 @@
+"""Golden-corpus check of the Python reference pipeline against the real logstash.
+
+Every corpus line is one raw MQTT message. The reference outcome comes from
+ingest/sensor_pipeline.py; in replay mode the same messages are published to
+the broker and the indexed documents are diffed against it.
+
+Replayed JSON objects carry a test_run_id, so they land in the run's
+it-run-<id>-sensors/-errors indices and never in the production sensors-*
+indices that rollups, latest and alerts read. Lines that are not valid JSON
+cannot carry one and end up in the daily sensors-errors-* index. They are
+deleted from there afterwards. How readings without a test_run_id are routed
+is checked against the reference in tests/unit/test_sensor_pipeline.py and by
+--offline.
+
+    python golden_corpus.py --offline          # reference outcomes only, no stack needed
+    python golden_corpus.py                    # replay through mosquitto/filebeat/logstash and diff
+"""
+import argparse
+import json
+import os
+import sys
+import time
+import uuid
+from datetime import datetime, timezone
+
+from helpers import (
+    backoff_delays,
+    delete_docs_matching,
+    make_opensearch_client,
+    mqtt_settings,
+    new_test_run_id,
+    opensearch_settings,
+)
+from publisher import MqttPublisher
+
+import sensor_pipeline
+
+DEFAULT_CORPUS = os.path.join(os.path.dirname(os.path.abspath(__file__)), "golden_corpus.ndjson")
+# Unparseable lines carry no test_run_id and go to the daily error index.
+UNROUTED_INDICES = sensor_pipeline.ERROR_INDEX_PREFIX + "*"
+COMPARED_FIELDS = (
+    "sensor_id",
+    "temperature_c",
+    "humidity_pct",
+    "light",
+    "pipeline_errors",
+    "temperature_raw",
+    "humidity_raw",
+    "light_raw",
+    "message",
+    "timestamp",
+)
+COMPARED_TAGS = {"ingest_error", "_jsonparsefailure", "_dateparsefailure", "_timestampparsefailure"}
+
+
+def load_corpus(path):
+    with open(path, encoding="utf-8") as f:
+        return [line.rstrip("\n") for line in f if line.strip()]
+
+
+def tag_message(line, golden_id, run_id):
+    """Make a line findable and run-scoped: golden_id and test_run_id keys in objects, the id appended otherwise."""
+    stripped = line.lstrip()
+    if stripped.startswith("{"):
+        rest = stripped[1:].lstrip()
+        sep = "" if rest.startswith("}") else ", "
+        return '{"golden_id": "' + golden_id + '", "test_run_id": "' + run_id + '"' + sep + rest
+    return f"{line} {golden_id}"
+
+
+def project(index, doc, compare_timestamp):
+    out = {"index": sensor_pipeline.index_family(index)}
+    for field in COMPARED_FIELDS:
+        if field in doc:
+            out[field] = doc[field]
+    tags = doc.get("tags") or []
+    out["tags"] = sorted(COMPARED_TAGS.intersection(tags if isinstance(tags, list) else [tags]))
+    if compare_timestamp:
+        out["@timestamp"] = doc.get("@timestamp")
+    return out
+
+
+def reference_outcomes(messages, received_at=None):
+    if received_at is None:
+        received_at = datetime.now(timezone.utc)
+    outcomes = []
+    for message in messages:
+        index, event = sensor_pipeline.process(message, received_at)
+        compare_timestamp = event["@timestamp"] is not received_at
+        outcomes.append((project(index, sensor_pipeline.to_document(event), compare_timestamp), compare_timestamp))
+    return outcomes
+
+
+def diff(expected, actual):
+    keys = sorted(set(expected) | set(actual))
+    return {k: (expected.get(k), actual.get(k)) for k in keys if expected.get(k) != actual.get(k)}
+
+
+def _golden_query(golden_id):
+    return {
+        "query": {
+            "bool": {
+                "should": [{"match_phrase": {"golden_id": golden_id}}, {"match_phrase": {"message": golden_id}}],
+                "minimum_should_match": 1,
+            }
+        },
+        "size": 2,
+    }
+
+
+def replay(client, publisher, lines, run_id, timeout_seconds=90):
+    run = uuid.uuid4().hex[:8]
+    golden_ids = [f"golden{run}n{i}" for i in range(len(lines))]
+    messages = [tag_message(line, gid, run_id) for line, gid in zip(lines, golden_ids)]
+    search_indices = f"{sensor_pipeline.RUN_INDEX_PREFIX}{run_id}-*,{UNROUTED_INDICES}"
+    expected = reference_outcomes(messages)
+
+    try:
+        publisher.publish_many(messages)
+        pending = dict(enumerate(golden_ids))
+        found = {}
+        deadline = time.time() + timeout_seconds
+        delays = backoff_delays()
+        while pending and time.time() < deadline:
+            body = []
+            for gid in pending.values():
+                body += [{"index": search_indices, "ignore_unavailable": True}, _golden_query(gid)]
+            responses = client.msearch(body=body)["responses"]
+            for i, res in zip(list(pending), responses):
+                hits = res.get("hits", {}).get("hits", [])
+                if hits:
+                    found[i] = hits
+                    del pending[i]
+            if pending:
+                time.sleep(min(next(delays), max(0.0, deadline - time.time())))
+
+        results = []
+        for i, line in enumerate(lines):
+            want, compare_timestamp = expected[i]
+            hits = found.get(i)
+            if hits is None:
+                results.append({"line": line, "expected": want, "actual": None, "diff": {"missing": True}})
+                continue
+            got = project(hits[0]["_index"], hits[0]["_source"], compare_timestamp)
+            delta = diff(want, got)
+            if len(hits) > 1:
+                delta["duplicates"] = (1, len(hits))
+            results.append({"line": line, "expected": want, "actual": got, "diff": delta})
+        return results
+    finally:
+        clauses = [clause for gid in golden_ids for clause in _golden_query(gid)["query"]["bool"]["should"]]
+        delete_docs_matching(client, [search_indices], {"bool": {"should": clauses, "minimum_should_match": 1}})
+
+
+def print_results(results):
+    drift = [r for r in results if r["diff"]]
+    for r in drift:
+        print(f"\n[golden] DRIFT for: {r['line']}")
+        for key, (want, got) in r["diff"].items():
+            print(f"    {key}: reference={want!r} logstash={got!r}")
+    print(f"\n[golden] {len(results) - len(drift)}/{len(results)} corpus lines match the reference pipeline")
+    return drift
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--corpus", default=DEFAULT_CORPUS)
+    parser.add_argument("--offline", action="store_true", help="only print the reference outcomes")
+    parser.add_argument("--timeout", type=float, default=90.0)
+    args = parser.parse_args(argv)
+
+    lines = load_corpus(args.corpus)
+    if args.offline:
+        t0 = time.perf_counter()
+        outcomes = reference_outcomes(lines)
+        elapsed = time.perf_counter() - t0
+        for line, (outcome, _) in zip(lines, outcomes):
+            print(json.dumps({"line": line, "outcome": outcome}, default=str))
+        print(f"[golden] {len(lines)} lines through the reference pipeline in {elapsed * 1000:.2f} ms", file=sys.stderr)
+        return 0
+
+    client = make_opensearch_client(**opensearch_settings())
+    with MqttPublisher.from_settings(mqtt_settings()) as publisher:
+        results = replay(client, publisher, lines, new_test_run_id(), timeout_seconds=args.timeout)
+    return 1 if print_results(results) else 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -0,0 +1,383 @@
+import json
+import os
+import random
+import re
+import sys
+import threading
+import time
+import uuid
+from dataclasses import dataclass, field
+from pprint import pprint
+from typing import Callable, List, Tuple
+
+from opensearchpy import OpenSearch
+from opensearchpy.exceptions import AuthenticationException, AuthorizationException, NotFoundError, RequestError
+
+# Shared pipeline code (e.g. the logstash reference implementation) lives in Docker-compose/ingest.
+INGEST_DIR = os.path.abspath(os.path.join(os.path.dirname(__file__), "..", "..", "ingest"))
+if INGEST_DIR not in sys.path:
+    sys.path.append(INGEST_DIR)
+
+from latency import latency_summary  # noqa: E402
+from phases import phase  # noqa: E402
+from sensor_pipeline import RUN_INDEX_PREFIX, run_index  # noqa: E402
+
+
+def mqtt_settings():
+    return {
+        "host": os.getenv("IT_MQTT_HOST", "mqtt"),
+        "port": os.getenv("IT_MQTT_PORT", "1883"),
+        "username": os.getenv("IT_MQTT_USER", "ghasensor"),
+        "password": os.getenv("IT_MQTT_PASS", "*****"),
+        "topic": os.getenv("IT_MQTT_TOPIC", "ghanode/sensor"),
+        "compact_topic": os.getenv("IT_MQTT_COMPACT_TOPIC", "ghanode/sensor/cbor"),
+    }
+
+
+def opensearch_settings():
+    return {
+        "host": os.getenv("IT_OS_HOST", "opensearch"),
+        "port": os.getenv("IT_OS_PORT", "9200"),
+        "username": os.getenv("IT_OS_USER", "admin"),
+        "password": os.getenv("IT_OS_PASS", os.getenv("PASSWORD_OPENSEARCH", "")),
+    }
+
+
+def make_opensearch_client(host, port, username, password):
+    return OpenSearch(
+        hosts=[{"host": host, "port": int(port)}],
+        http_auth=(username, password),
+        use_ssl=True,
+        verify_certs=False,
+        ssl_show_warn=False,
+    )
+
+
+class VisibilityMetrics:
+    """Time-to-visible samples collected by the waiters, reported at the end of the run."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.samples = []
+
+    def record(self, label, index_pattern, seconds):
+        with self._lock:
+            self.samples.append({"label": label, "index": index_pattern, "seconds": seconds})
+
+    def summary(self):
+        with self._lock:
+            samples = list(self.samples)
+        by_index = {}
+        for sample in samples:
+            by_index.setdefault(sample["index"], []).append(sample["seconds"])
+        return {
+            "all": latency_summary([sample["seconds"] for sample in samples]),
+            "by_index": {index: latency_summary(values) for index, values in sorted(by_index.items())},
+            "samples": samples,
+        }
+
+
+visibility_metrics = VisibilityMetrics()
+
+
+class WaitTimeout(AssertionError):
+    pass
+
+
+def backoff_delays(initial=0.1, maximum=2.0, factor=2.0):
+    """Exponential backoff with jitter: each delay is drawn from [d/2, d] and d doubles up to ``maximum``."""
+    delay = initial
+    while True:
+        yield random.uniform(delay / 2, delay)
+        delay = min(maximum, delay * factor)
+
+
+def _is_fatal(err):
+    # A malformed query or bad credentials will not fix themselves by waiting.
+    return isinstance(err, (RequestError, AuthenticationException, AuthorizationException))
+
+
+def _is_index_missing(err):
+    if isinstance(err, NotFoundError):
+        return True
+    if isinstance(err, dict):
+        return (err.get("type") or err.get("root_cause", [{}])[0].get("type")) == "index_not_found_exception"
+    return False
+
+
+def search_once(client, index_pattern, query):
+    """One search; returns (hits, index_exists). Raises only for real query errors."""
+    try:
+        res = client.search(index=index_pattern, body=query, ignore_unavailable=True, allow_no_indices=True)
+    except NotFoundError:
+        return [], False
+    index_exists = res.get("_shards", {}).get("total", 0) > 0
+    return res.get("hits", {}).get("hits", []), index_exists
+
+
+def refresh_indices(client, index_pattern):
+    try:
+        client.indices.refresh(index=index_pattern, ignore_unavailable=True, allow_no_indices=True)
+    except Exception as e:
+        print(f"[wait] refresh of {index_pattern} failed: {e}")
+
+
+@phase("visibility")
+def wait_for_document(
+    client,
+    index_pattern,
+    query,
+    timeout_seconds=30,
+    since=None,
+    refresh=False,
+    label=None,
+    initial_delay=0.1,
+    max_delay=2.0,
+    metrics=None,
+):
+    """Poll until ``query`` has a hit in ``index_pattern`` and return the first hit.
+
+    Polls back off exponentially with jitter, so a fast stack is not held up by
+    a fixed sleep. With ``refresh`` the pattern is refreshed before every poll
+    after the first. The time from ``since`` (default: now) until the document
+    became visible is recorded in ``metrics``. On timeout the error says whether
+    the index never existed, the document never showed up, or searches failed.
+    """
+    metrics = visibility_metrics if metrics is None else metrics
+    t0 = time.time() if since is None else since
+    deadline = time.time() + timeout_seconds
+    delays = backoff_delays(initial_delay, max_delay)
+    attempts = 0
+    index_seen = False
+    last_err = None
+    while True:
+        if refresh and attempts:
+            refresh_indices(client, index_pattern)
+        attempts += 1
+        try:
+            hits, index_exists = search_once(client, index_pattern, query)
+            index_seen = index_seen or index_exists
+            last_err = None
+            if hits:
+                metrics.record(label or index_pattern, index_pattern, time.time() - t0)
+                return hits[0]
+        except Exception as e:
+            if _is_fatal(e):
+                raise
+            last_err = e
+        remaining = deadline - time.time()
+        if remaining <= 0:
+            break
+        time.sleep(min(next(delays), remaining))
+
+    if last_err is not None:
+        reason = f"searches were failing, last error: {last_err!r}"
+    elif not index_seen:
+        reason = f"no index matching {index_pattern} exists"
+    else:
+        reason = "index exists but the document never became visible"
+    raise WaitTimeout(
+        f"Document not found in {index_pattern} within {timeout_seconds}s after {attempts} searches: {reason}"
+    )
+
+
+@phase("negative_window")
+def assert_not_indexed(client, index_pattern, query, timeout_seconds=20):
+    """Fail if ``query`` currently has a hit; transient search errors are retried until the timeout."""
+    deadline = time.time() + timeout_seconds
+    delays = backoff_delays()
+    last_err = None
+    while True:
+        try:
+            hits, _ = search_once(client, index_pattern, query)
+            if hits:
+                hit = hits[0]
+                raise AssertionError(
+                    f"Expected NO document, but found one in index {hit.get('_index')} id={hit.get('_id')}"
+                )
+            return
+        except AssertionError:
+            raise
+        except Exception as e:
+            if _is_fatal(e):
+                raise
+            last_err = e
+        remaining = deadline - time.time()
+        if remaining <= 0:
+            break
+        time.sleep(min(next(delays), remaining))
+    raise AssertionError(f"Search kept failing for {index_pattern}. Last error: {last_err!r}")
+
+
+@phase("cleanup")
+def delete_docs_matching(client: OpenSearch, index_patterns: List[str], query: dict) -> None:
+    for index_pat in index_patterns:
+        try:
+            resp = client.delete_by_query(
+                index=index_pat,
+                body={"query": query},
+                conflicts="proceed",
+                refresh=True,
+            )
+            print(f"\n[cleanup] index={index_pat} query={query}")
+            print(f"[cleanup] Response: {resp}\n")
+        except Exception as e:
+            print(f"\n[cleanup] WARNING index={index_pat} query={query}: {e}\n")
+
+
+def new_test_run_id():
+    """Run id that logstash routes into it-run-<id>-sensors / it-run-<id>-errors (IT_RUN_ID overrides)."""
+    run_id = os.getenv("IT_RUN_ID") or uuid.uuid4().hex[:12]
+    if not re.fullmatch(r"[a-z0-9]{1,32}", run_id):
+        raise ValueError(f"IT_RUN_ID must be 1-32 lowercase letters/digits, got {run_id!r}")
+    return run_id
+
+
+@phase("cleanup")
+def delete_run_indices(client: OpenSearch, run_id: str) -> None:
+    """Drop every index of a test run in one call; cost does not depend on how much data piled up elsewhere."""
+    pattern = f"{RUN_INDEX_PREFIX}{run_id}-*"
+    try:
+        names = sorted(client.indices.get(index=pattern, ignore_unavailable=True, allow_no_indices=True))
+        if names:
+            client.indices.delete(index=",".join(names))
+        print(f"\n[cleanup] deleted run indices {names}\n")
+    except Exception as e:
+        print(f"\n[cleanup] WARNING could not delete {pattern}: {e}\n")
+
+
+@dataclass
+class Scenario:
+    """One published payload plus where its document must (and must not) show up."""
+
+    name: str
+    payload: dict
+    expected_index: str
+    expected_query: dict
+    check: Callable[[dict], None]
+    forbidden: List[Tuple[str, dict]] = field(default_factory=list)
+    timeout_seconds: int = 30
+
+
+def run_scenario(client, scenario, publish, forbidden_timeout_seconds=25):
+    print(f"\n===== MQTT payload sent ({scenario.name}) =====")
+    pprint(scenario.payload)
+    print("============================\n")
+
+    publish(json.dumps(scenario.payload))
+    t_published = time.time()
+
+    for index_pattern, query in scenario.forbidden:
+        assert_not_indexed(client, index_pattern, query, timeout_seconds=forbidden_timeout_seconds)
+
+    hit = wait_for_document(
+        client,
+        scenario.expected_index,
+        scenario.expected_query,
+        timeout_seconds=scenario.timeout_seconds,
+        since=t_published,
+        label=scenario.name,
+    )
+    print(f"\n===== OpenSearch document found ({scenario.name}) =====")
+    print(f"Index: {hit.get('_index')}")
+    print(f"Document ID: {hit.get('_id')}")
+    pprint(hit["_source"])
+    print("====================================\n")
+    scenario.check(hit["_source"])
+    return hit
+
+
+def _msearch(client, searches):
+    body = []
+    for index_pattern, query in searches:
+        body.append({"index": index_pattern, "ignore_unavailable": True, "allow_no_indices": True})
+        body.append(query)
+    return client.msearch(body=body)["responses"]
+
+
+def run_scenarios_concurrently(client, scenarios, publish_many, timeout_seconds=60, refresh=False, max_delay=2.0):
+    """Publish every scenario up front, then resolve all of them with batched msearch calls.
+
+    Wall-clock time is roughly one pipeline latency instead of the sum of every
+    scenario's own timeout. Forbidden documents are checked once every expected
+    document has landed: logstash routes each event to exactly one output, so
+    once the expected copy is searchable no other copy can still be in flight.
+    """
+    names = [s.name for s in scenarios]
+    if len(set(names)) != len(names):
+        raise ValueError("Scenario names must be unique")
+
+    with phase("publish_ack"):
+        publish_many([json.dumps(s.payload) for s in scenarios])
+    t_published = time.time()
+
+    pending = {s.name: s for s in scenarios}
+    found = {}
+    last_errors = {}
+    deadline = t_published + timeout_seconds
+    delays = backoff_delays(maximum=max_delay)
+    rounds = 0
+    with phase("visibility"):
+        while pending:
+            batch = list(pending.values())
+            if refresh and rounds:
+                refresh_indices(client, ",".join(sorted({s.expected_index for s in batch})))
+            rounds += 1
+            try:
+                responses = _msearch(client, [(s.expected_index, s.expected_query) for s in batch])
+            except Exception as e:
+                if _is_fatal(e):
+                    raise
+                responses = [{"error": repr(e)}] * len(batch)
+            for scenario, res in zip(batch, responses):
+                if "error" in res:
+                    if not _is_index_missing(res["error"]):
+                        last_errors[scenario.name] = res["error"]
+                    continue
+                last_errors.pop(scenario.name, None)
+                hits = res.get("hits", {}).get("hits", [])
+                if hits:
+                    found[scenario.name] = hits[0]
+                    visibility_metrics.record(scenario.name, scenario.expected_index, time.time() - t_published)
+                    del pending[scenario.name]
+            remaining = deadline - time.time()
+            if not pending or remaining <= 0:
+                break
+            time.sleep(min(next(delays), remaining))
+
+    print(f"\n[concurrent] {len(found)}/{len(scenarios)} scenarios resolved in {time.time() - t_published:.1f}s\n")
+
+    failures = []
+    for name, scenario in pending.items():
+        err = last_errors.get(name)
+        reason = f"last error: {err}" if err else "searches succeeded but the document never became visible"
+        failures.append(
+            f"{name}: expected document not found in {scenario.expected_index} after {rounds} rounds, {reason}"
+        )
+
+    forbidden = [(s.name, index_pattern, query) for s in scenarios for index_pattern, query in s.forbidden]
+    if forbidden:
+        responses = _msearch(client, [(index_pattern, query) for _, index_pattern, query in forbidden])
+        for (name, index_pattern, _), res in zip(forbidden, responses):
+            if "error" in res:
+                failures.append(f"{name}: search on {index_pattern} failed: {res['error']}")
+                continue
+            hits = res.get("hits", {}).get("hits", [])
+            if hits:
+                failures.append(
+                    f"{name}: expected NO document in {index_pattern}, "
+                    f"but found one in index {hits[0].get('_index')} id={hits[0].get('_id')}"
+                )
+
+    for scenario in scenarios:
+        hit = found.get(scenario.name)
+        if hit is None:
+            continue
+        try:
+            scenario.check(hit["_source"])
+        except AssertionError as e:
+            failures.append(f"{scenario.name}: {e or 'check failed'}\n{json.dumps(hit['_source'], indent=2)}")
+
+    if failures:
+        raise AssertionError("\n".join(failures))
+    return found
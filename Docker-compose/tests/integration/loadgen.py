@@ -0,0 +1,345 @@
+"""Greenhouse fleet load generator.
+
+Simulates N sensor nodes publishing to ghanode/sensor and measures how long
+each reading takes to become searchable. Readings carry a test_run_id, so they
+land in the run's own it-run-<id>-sensors index, which is dropped at the end.
+
+    python loadgen.py --nodes 50 --rate 0.5 --duration 120
+    python loadgen.py --nodes 200 --pattern burst --burst-size 5 --burst-interval 10 --json report.json
+    python loadgen.py --nodes 50 --rate 0.5 --batch-size 20   # each node sends batch envelopes of 20 readings
+
+To compare ingest chains, run the same load against each and sample the containers:
+
+    python loadgen.py --nodes 200 --rate 2 --containers filebeat,logstash
+    python loadgen.py --nodes 200 --rate 2 --containers ingest-bridge   # docker-compose-tests-bridge.yml
+"""
+import argparse
+import json
+import random
+import re
+import subprocess
+import threading
+import time
+import uuid
+
+from helpers import (
+    delete_run_indices,
+    latency_summary,
+    make_opensearch_client,
+    mqtt_settings,
+    opensearch_settings,
+    run_index,
+)
+from publisher import MqttPublisher, ReadingBatcher
+
+
+def steady_schedule(nodes, rate, duration):
+    """Each node publishes every 1/rate seconds, with node start times spread over one period."""
+    period = 1.0 / rate
+    offsets = [random.uniform(0, period) for _ in range(nodes)]
+    events = []
+    for node, offset in enumerate(offsets):
+        t = offset
+        while t < duration:
+            events.append((t, node))
+            t += period
+    events.sort()
+    return events
+
+
+def burst_schedule(nodes, burst_size, burst_interval, duration, jitter=0.2):
+    """Every burst_interval seconds each node fires burst_size readings back to back."""
+    events = []
+    t = 0.0
+    while t < duration:
+        for node in range(nodes):
+            start = t + random.uniform(0, jitter)
+            events.extend((start, node) for _ in range(burst_size))
+        t += burst_interval
+    events.sort()
+    return events
+
+
+def ramp_schedule(nodes, rate, duration):
+    """Per-node rate grows linearly from zero to ``rate`` over the run."""
+    events = []
+    for node in range(nodes):
+        # The k-th reading goes out when the cumulative count rate * t^2 / (2 * duration) reaches k.
+        k = random.uniform(0, 1)
+        while True:
+            t = (2.0 * k * duration / rate) ** 0.5
+            if t >= duration:
+                break
+            events.append((t, node))
+            k += 1
+    events.sort()
+    return events
+
+
+def make_reading(run_id, node, seq):
+    return {
+        "Sensor ID": f"it-sensors-load-{run_id}-{node:05d}",
+        "temperature": round(random.uniform(12.0, 32.0), 2),
+        "humidity": round(random.uniform(30.0, 90.0), 1),
+        "light": round(random.uniform(0.0, 20000.0), 1),
+        "test_run_id": run_id,
+        "seq": seq,
+        "published_at": time.time(),
+    }
+
+
+class VisibilityObserver(threading.Thread):
+    """Polls the run's index and records when each reading first becomes searchable.
+
+    The query only asks for seq >= the lowest sequence number not yet seen, so the
+    cost of a poll is bounded by the out-of-order window rather than the run size.
+    """
+
+    def __init__(self, client, index, poll_interval=0.5, page_size=5000):
+        super().__init__(daemon=True)
+        self.client = client
+        self.index = index
+        self.poll_interval = poll_interval
+        self.page_size = page_size
+        self.seen = {}
+        self.errors = 0
+        self._watermark = 0
+        self._stop_event = threading.Event()
+
+    def stop(self):
+        self._stop_event.set()
+
+    def poll(self):
+        search_after = None
+        now = time.time()
+        while True:
+            body = {
+                "query": {"range": {"seq": {"gte": self._watermark}}},
+                "_source": ["seq", "published_at"],
+                "sort": [{"seq": "asc"}],
+                "size": self.page_size,
+            }
+            if search_after is not None:
+                body["search_after"] = search_after
+            res = self.client.search(index=self.index, body=body, ignore_unavailable=True)
+            hits = res.get("hits", {}).get("hits", [])
+            for hit in hits:
+                src = hit["_source"]
+                seq = int(src["seq"])
+                if seq not in self.seen:
+                    self.seen[seq] = (float(src["published_at"]), now)
+            if len(hits) < self.page_size:
+                break
+            search_after = hits[-1]["sort"]
+        while self._watermark in self.seen:
+            self._watermark += 1
+
+    def run(self):
+        while not self._stop_event.is_set():
+            try:
+                self.poll()
+            except Exception as e:
+                self.errors += 1
+                print(f"[loadgen] observer search failed: {e}")
+            self._stop_event.wait(self.poll_interval)
+
+
+_MEM_UNITS = {"B": 1e-6, "KiB": 1024 / 1e6, "MiB": 1024**2 / 1e6, "GiB": 1024**3 / 1e6, "kB": 1e-3, "MB": 1.0, "GB": 1e3}
+
+
+def parse_mem_mb(usage):
+    """'123.4MiB / 7.6GiB' (docker stats MemUsage) -> 129.4"""
+    m = re.match(r"\s*([\d.]+)\s*([A-Za-z]+)", usage)
+    if not m or m.group(2) not in _MEM_UNITS:
+        return None
+    return float(m.group(1)) * _MEM_UNITS[m.group(2)]
+
+
+class ContainerSampler(threading.Thread):
+    """Samples ``docker stats`` for the given containers; keeps peak memory and mean CPU."""
+
+    def __init__(self, containers, interval=5.0):
+        super().__init__(daemon=True)
+        self.containers = containers
+        self.interval = interval
+        self.samples = {name: {"mem_mb": [], "cpu_pct": []} for name in containers}
+        self._stop_event = threading.Event()
+
+    def stop(self):
+        self._stop_event.set()
+
+    def sample(self):
+        out = subprocess.run(
+            ["docker", "stats", "--no-stream", "--format", "{{json .}}", *self.containers],
+            capture_output=True, text=True, timeout=30, check=True,
+        ).stdout
+        for line in out.splitlines():
+            row = json.loads(line)
+            series = self.samples.get(row.get("Name"))
+            if series is None:
+                continue
+            mem = parse_mem_mb(row.get("MemUsage", ""))
+            if mem is not None:
+                series["mem_mb"].append(mem)
+            try:
+                series["cpu_pct"].append(float(row.get("CPUPerc", "").rstrip("%")))
+            except ValueError:
+                pass
+
+    def run(self):
+        while not self._stop_event.is_set():
+            try:
+                self.sample()
+            except (OSError, subprocess.SubprocessError, ValueError) as e:
+                print(f"[loadgen] docker stats failed: {e}")
+            self._stop_event.wait(self.interval)
+
+    def report(self):
+        return {
+            name: {
+                "peak_mem_mb": round(max(s["mem_mb"]), 1) if s["mem_mb"] else None,
+                "mean_cpu_pct": round(sum(s["cpu_pct"]) / len(s["cpu_pct"]), 1) if s["cpu_pct"] else None,
+                "samples": len(s["mem_mb"]),
+            }
+            for name, s in self.samples.items()
+        }
+
+
+def run_load(args):
+    run_id = uuid.uuid4().hex[:8]
+    if args.pattern == "burst":
+        schedule = burst_schedule(args.nodes, args.burst_size, args.burst_interval, args.duration)
+    elif args.pattern == "ramp":
+        schedule = ramp_schedule(args.nodes, args.rate, args.duration)
+    else:
+        schedule = steady_schedule(args.nodes, args.rate, args.duration)
+
+    print(f"[loadgen] run_id={run_id} pattern={args.pattern} nodes={args.nodes} messages={len(schedule)}")
+
+    publishers = [
+        MqttPublisher.from_settings(mqtt_settings(), max_inflight=args.max_inflight).connect()
+        for _ in range(args.connections)
+    ]
+    client = make_opensearch_client(**opensearch_settings())
+    observer = VisibilityObserver(client, run_index(run_id), poll_interval=args.poll_interval)
+    observer.start()
+    sampler = None
+    if args.containers:
+        sampler = ContainerSampler(args.containers.split(","), interval=args.stats_interval)
+        sampler.start()
+
+    batchers = {}
+    if args.batch_size > 1:
+        batchers = {
+            node: ReadingBatcher(publishers[node % len(publishers)], args.batch_size, max_age=args.batch_age)
+            for node in range(args.nodes)
+        }
+    futures = []
+    t_start = time.time()
+    for seq, (offset, node) in enumerate(schedule):
+        delay = t_start + offset - time.time()
+        if delay > 0:
+            time.sleep(delay)
+        reading = make_reading(run_id, node, seq)
+        if batchers:
+            fut = batchers[node].add(reading)
+        else:
+            fut = publishers[node % len(publishers)].publish(json.dumps(reading))
+        if fut is not None:
+            futures.append(fut)
+    futures.extend(f for f in (b.flush() for b in batchers.values()) if f is not None)
+    t_published = time.time()
+
+    acks = []
+    for fut in futures:
+        try:
+            acks.append(fut.result(timeout=args.ack_timeout).ack_latency)
+        except Exception as e:
+            print(f"[loadgen] publish not acknowledged: {e}")
+    t_acked = time.time()
+    for publisher in publishers:
+        publisher.close()
+
+    deadline = time.time() + args.drain_timeout
+    while len(observer.seen) < len(schedule) and time.time() < deadline:
+        time.sleep(args.poll_interval)
+    observer.stop()
+    observer.join()
+    if sampler is not None:
+        sampler.stop()
+        sampler.join()
+
+    visible = [seen_at - published_at for published_at, seen_at in observer.seen.values()]
+    last_visible = max((seen_at for _, seen_at in observer.seen.values()), default=t_start)
+    report = {
+        "run_id": run_id,
+        "pattern": args.pattern,
+        "nodes": args.nodes,
+        "connections": args.connections,
+        "published": len(schedule),
+        "batch_size": args.batch_size,
+        "messages": len(futures),
+        "acked_messages": len(acks),
+        "searchable": len(observer.seen),
+        "missing": len(schedule) - len(observer.seen),
+        "publish_seconds": round(t_published - t_start, 3),
+        "publish_messages_per_sec": round(len(acks) / max(t_acked - t_start, 1e-9), 1),
+        "indexed_events_per_sec": round(len(observer.seen) / max(last_visible - t_start, 1e-9), 1),
+        "ack_latency_s": latency_summary(acks),
+        "publish_to_searchable_s": latency_summary(visible),
+        "visibility_resolution_s": args.poll_interval,
+        "observer_errors": observer.errors,
+    }
+    if sampler is not None:
+        report["containers"] = sampler.report()
+
+    if not args.keep:
+        delete_run_indices(client, run_id)
+    return report
+
+
+def positive_float(text):
+    value = float(text)
+    if not value > 0:
+        raise argparse.ArgumentTypeError(f"must be greater than 0, got {text}")
+    return value
+
+
+def positive_int(text):
+    value = int(text)
+    if value < 1:
+        raise argparse.ArgumentTypeError(f"must be at least 1, got {text}")
+    return value
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--nodes", type=positive_int, default=10, help="number of simulated greenhouse nodes")
+    parser.add_argument("--rate", type=positive_float, default=1.0, help="readings per second per node (steady/ramp)")
+    parser.add_argument("--duration", type=float, default=60.0, help="seconds of publishing")
+    parser.add_argument("--pattern", choices=["steady", "burst", "ramp"], default="steady")
+    parser.add_argument("--burst-size", type=positive_int, default=5, help="readings per node per burst")
+    parser.add_argument("--burst-interval", type=positive_float, default=10.0, help="seconds between bursts")
+    parser.add_argument("--connections", type=positive_int, default=1, help="MQTT connections to spread nodes over")
+    parser.add_argument("--max-inflight", type=int, default=200)
+    parser.add_argument("--batch-size", type=int, default=1, help="readings per batch envelope (1: one per message)")
+    parser.add_argument("--batch-age", type=float, default=30.0, help="max seconds a reading waits in a node's batch")
+    parser.add_argument("--poll-interval", type=positive_float, default=0.5, help="visibility poll interval (latency resolution)")
+    parser.add_argument("--ack-timeout", type=float, default=30.0)
+    parser.add_argument("--drain-timeout", type=float, default=120.0, help="max wait for stragglers after publishing")
+    parser.add_argument("--containers", help="comma-separated containers to sample with docker stats")
+    parser.add_argument("--stats-interval", type=float, default=5.0, help="seconds between docker stats samples")
+    parser.add_argument("--keep", action="store_true", help="do not delete the run's index")
+    parser.add_argument("--json", help="also write the report to this file")
+    args = parser.parse_args(argv)
+
+    report = run_load(args)
+    print(json.dumps(report, indent=2))
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump(report, f, indent=2)
+    return 0 if report["missing"] == 0 else 1
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
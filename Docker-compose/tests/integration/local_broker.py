@@ -0,0 +1,274 @@
+"""Minimal in-process MQTT 3.1.1 broker for the Docker-free test tier.
+
+Supports what the tests and tools need from mosquitto: username/password auth,
+QoS 0/1 (QoS 2 is acknowledged with the full handshake but delivered as QoS 1),
+retained messages, ``+``/``#`` wildcards, keepalive pings and clean disconnects.
+No persistence, no will messages, no sessions across reconnects.
+"""
+import socket
+import socketserver
+import struct
+import threading
+
+CONNECT, CONNACK, PUBLISH, PUBACK, PUBREC, PUBREL, PUBCOMP = 1, 2, 3, 4, 5, 6, 7
+SUBSCRIBE, SUBACK, UNSUBSCRIBE, UNSUBACK, PINGREQ, PINGRESP, DISCONNECT = 8, 9, 10, 11, 12, 13, 14
+
+CONNACK_ACCEPTED = 0
+CONNACK_BAD_CREDENTIALS = 4
+
+
+def topic_matches(topic_filter, topic):
+    filter_parts = topic_filter.split("/")
+    topic_parts = topic.split("/")
+    if topic.startswith("$") and filter_parts[0] in ("+", "#"):
+        return False
+    for i, part in enumerate(filter_parts):
+        if part == "#":
+            return True
+        if i >= len(topic_parts):
+            return False
+        if part != "+" and part != topic_parts[i]:
+            return False
+    return len(filter_parts) == len(topic_parts)
+
+
+def _encode_length(n):
+    out = bytearray()
+    while True:
+        byte, n = n % 128, n // 128
+        out.append(byte | (0x80 if n else 0))
+        if not n:
+            return bytes(out)
+
+
+def _packet(packet_type, flags, body):
+    return bytes([(packet_type << 4) | flags]) + _encode_length(len(body)) + body
+
+
+def _string(s):
+    raw = s.encode("utf-8") if isinstance(s, str) else s
+    return struct.pack("!H", len(raw)) + raw
+
+
+class _Reader:
+    def __init__(self, data):
+        self.data = data
+        self.pos = 0
+
+    def u8(self):
+        self.pos += 1
+        return self.data[self.pos - 1]
+
+    def u16(self):
+        self.pos += 2
+        return struct.unpack_from("!H", self.data, self.pos - 2)[0]
+
+    def string(self):
+        n = self.u16()
+        self.pos += n
+        return self.data[self.pos - n : self.pos]
+
+    def rest(self):
+        return self.data[self.pos :]
+
+
+class _Session:
+    def __init__(self, broker, sock):
+        self.broker = broker
+        self.sock = sock
+        self.client_id = None
+        self.subscriptions = {}
+        self._write_lock = threading.Lock()
+        self._next_mid = 0
+
+    def send(self, data):
+        with self._write_lock:
+            self.sock.sendall(data)
+
+    def next_mid(self):
+        with self._write_lock:
+            self._next_mid = self._next_mid % 65535 + 1
+            return self._next_mid
+
+    def deliver(self, topic, payload, qos, retain=False):
+        body = _string(topic)
+        if qos:
+            body += struct.pack("!H", self.next_mid())
+        flags = (qos << 1) | (1 if retain else 0)
+        try:
+            self.send(_packet(PUBLISH, flags, body + payload))
+        except OSError:
+            pass
+
+
+class _Handler(socketserver.BaseRequestHandler):
+    def _read_exact(self, n):
+        buf = bytearray()
+        while len(buf) < n:
+            chunk = self.request.recv(n - len(buf))
+            if not chunk:
+                raise ConnectionError("client went away")
+            buf += chunk
+        return bytes(buf)
+
+    def _read_packet(self):
+        header = self._read_exact(1)[0]
+        length, multiplier = 0, 1
+        while True:
+            byte = self._read_exact(1)[0]
+            length += (byte & 0x7F) * multiplier
+            if not byte & 0x80:
+                break
+            multiplier *= 128
+        return header >> 4, header & 0x0F, self._read_exact(length) if length else b""
+
+    def handle(self):
+        broker = self.server.broker
+        session = _Session(broker, self.request)
+        try:
+            packet_type, _, body = self._read_packet()
+            if packet_type != CONNECT or not self._handle_connect(session, body):
+                return
+            broker._register(session)
+            while True:
+                packet_type, flags, body = self._read_packet()
+                if packet_type == PUBLISH:
+                    self._handle_publish(session, flags, body)
+                elif packet_type == PUBREL:
+                    session.send(_packet(PUBCOMP, 0, body[:2]))
+                elif packet_type == SUBSCRIBE:
+                    self._handle_subscribe(session, body)
+                elif packet_type == UNSUBSCRIBE:
+                    r = _Reader(body)
+                    mid = r.u16()
+                    while r.pos < len(body):
+                        session.subscriptions.pop(r.string().decode("utf-8"), None)
+                    session.send(_packet(UNSUBACK, 0, struct.pack("!H", mid)))
+                elif packet_type == PINGREQ:
+                    session.send(_packet(PINGRESP, 0, b""))
+                elif packet_type == DISCONNECT:
+                    return
+                # PUBACK/PUBREC/PUBCOMP from subscribers need no action: there are no retries.
+        except (ConnectionError, OSError, struct.error, IndexError):
+            return
+        finally:
+            broker._unregister(session)
+
+    def _handle_connect(self, session, body):
+        r = _Reader(body)
+        r.string()  # protocol name
+        r.u8()  # protocol level
+        flags = r.u8()
+        r.u16()  # keepalive
+        session.client_id = r.string().decode("utf-8")
+        if flags & 0x04:
+            r.string()
+            r.string()
+        username = r.string().decode("utf-8") if flags & 0x80 else None
+        password = r.string().decode("utf-8") if flags & 0x40 else None
+        broker = self.server.broker
+        if broker.users is not None and broker.users.get(username) != password:
+            session.send(_packet(CONNACK, 0, bytes([0, CONNACK_BAD_CREDENTIALS])))
+            return False
+        session.send(_packet(CONNACK, 0, bytes([0, CONNACK_ACCEPTED])))
+        return True
+
+    def _handle_publish(self, session, flags, body):
+        qos = (flags >> 1) & 0x03
+        retain = bool(flags & 0x01)
+        r = _Reader(body)
+        topic = r.string().decode("utf-8")
+        mid = r.u16() if qos else None
+        payload = r.rest()
+        self.server.broker.publish(topic, payload, qos=min(qos, 1), retain=retain)
+        if qos == 1:
+            session.send(_packet(PUBACK, 0, struct.pack("!H", mid)))
+        elif qos == 2:
+            session.send(_packet(PUBREC, 0, struct.pack("!H", mid)))
+
+    def _handle_subscribe(self, session, body):
+        r = _Reader(body)
+        mid = r.u16()
+        granted = []
+        new_filters = []
+        while r.pos < len(body):
+            topic_filter = r.string().decode("utf-8")
+            qos = min(r.u8() & 0x03, 1)
+            session.subscriptions[topic_filter] = qos
+            granted.append(qos)
+            new_filters.append((topic_filter, qos))
+        session.send(_packet(SUBACK, 0, struct.pack("!H", mid) + bytes(granted)))
+        for topic_filter, qos in new_filters:
+            for topic, payload in self.server.broker.retained_matching(topic_filter):
+                session.deliver(topic, payload, qos, retain=True)
+
+
+class _Server(socketserver.ThreadingTCPServer):
+    daemon_threads = True
+    allow_reuse_address = True
+
+
+class LocalBroker:
+    """Start with ``LocalBroker(users={"user": "pw"}).start()``; ``port`` is picked by the OS unless given."""
+
+    def __init__(self, host="127.0.0.1", port=0, users=None):
+        self.users = users
+        self._server = _Server((host, port), _Handler)
+        self._server.broker = self
+        self._lock = threading.Lock()
+        self._sessions = set()
+        self._retained = {}
+        self.published = 0
+        self._thread = None
+
+    @property
+    def host(self):
+        return self._server.server_address[0]
+
+    @property
+    def port(self):
+        return self._server.server_address[1]
+
+    def start(self):
+        self._thread = threading.Thread(target=self._server.serve_forever, daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._server.shutdown()
+        self._server.server_close()
+        with self._lock:
+            sessions = list(self._sessions)
+        for session in sessions:
+            try:
+                session.sock.shutdown(socket.SHUT_RDWR)
+            except OSError:
+                pass
+
+    def _register(self, session):
+        with self._lock:
+            self._sessions.add(session)
+
+    def _unregister(self, session):
+        with self._lock:
+            self._sessions.discard(session)
+
+    def retained_matching(self, topic_filter):
+        with self._lock:
+            return [(t, p) for t, p in self._retained.items() if topic_matches(topic_filter, t)]
+
+    def publish(self, topic, payload, qos=0, retain=False):
+        with self._lock:
+            self.published += 1
+            if retain:
+                if payload:
+                    self._retained[topic] = payload
+                else:
+                    self._retained.pop(topic, None)
+            targets = []
+            for session in self._sessions:
+                granted = [q for f, q in session.subscriptions.items() if topic_matches(f, topic)]
+                if granted:
+                    targets.append((session, max(granted)))
+        for session, granted_qos in targets:
+            session.deliver(topic, payload, min(qos, granted_qos))
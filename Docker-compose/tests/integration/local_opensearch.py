@@ -0,0 +1,666 @@
+"""In-memory stand-in for the parts of the opensearch-py client the tests and tools use.
+
+Implements index/bulk/get/count/search/msearch/delete_by_query, a few
+``indices`` calls and an always-green ``cluster.health`` over plain dicts, with
+the query DSL subset the suite relies on: match_all, match, match_phrase,
+term(s), range, exists, prefix, ids and bool, plus point-in-time snapshots for
+(sliced) search_after paging and the common aggregations (terms, composite,
+date_histogram, filter, metrics, top_hits).
+Text matching uses a crude standard-analyzer approximation (lowercased
+alphanumeric tokens), and documents are searchable as soon as they are indexed.
+"""
+import copy
+import fnmatch
+import json
+import re
+import threading
+import uuid
+import zlib
+from datetime import datetime, timedelta, timezone
+
+from opensearchpy.exceptions import NotFoundError, RequestError
+
+_TOKEN = re.compile(r"[0-9a-z]+")
+_DATE_MATH = re.compile(r"now(?:([+-])(\d+)([smhdwMy]))?(?:/[smhdwMy])?$")
+_UNIT_SECONDS = {"s": 1, "m": 60, "h": 3600, "d": 86400, "w": 604800, "M": 2592000, "y": 31536000}
+_MISSING = object()
+
+
+def _tokens(value):
+    if isinstance(value, list):
+        return [t for v in value for t in _tokens(v)]
+    if isinstance(value, bool):
+        value = "true" if value else "false"
+    return _TOKEN.findall(str(value).lower())
+
+
+def _field_values(doc, field):
+    if field.endswith(".keyword"):
+        field = field[: -len(".keyword")]
+    if field in doc:
+        value = doc[field]
+    else:
+        value = doc
+        for part in field.split("."):
+            if not isinstance(value, dict) or part not in value:
+                return []
+            value = value[part]
+    if value is None:
+        return []
+    return value if isinstance(value, list) else [value]
+
+
+def _parse_date(value):
+    if isinstance(value, datetime):
+        return value if value.tzinfo else value.replace(tzinfo=timezone.utc)
+    if not isinstance(value, str):
+        return None
+    m = _DATE_MATH.match(value)
+    if m:
+        now = datetime.now(timezone.utc)
+        if m.group(1):
+            delta = timedelta(seconds=int(m.group(2)) * _UNIT_SECONDS[m.group(3)])
+            now = now + delta if m.group(1) == "+" else now - delta
+        return now
+    try:
+        parsed = datetime.fromisoformat(value.replace("Z", "+00:00"))
+    except ValueError:
+        return None
+    return parsed if parsed.tzinfo else parsed.replace(tzinfo=timezone.utc)
+
+
+def _comparable(value, like):
+    """Coerce ``value`` so it compares with ``like`` (numbers with numbers, dates with dates)."""
+    if isinstance(like, (int, float)) and not isinstance(like, bool):
+        try:
+            return float(value)
+        except (TypeError, ValueError):
+            date = _parse_date(value)
+            return date.timestamp() * 1000 if date else None
+    if isinstance(like, datetime):
+        if isinstance(value, (int, float)):
+            return datetime.fromtimestamp(value / 1000.0, timezone.utc)
+        return _parse_date(value)
+    return value
+
+
+def _range_bound(bound):
+    if isinstance(bound, (int, float)):
+        return float(bound)
+    date = _parse_date(bound)
+    return date if date is not None else bound
+
+
+def _phrase_in(needle, haystack):
+    n = len(needle)
+    return any(haystack[i : i + n] == needle for i in range(len(haystack) - n + 1))
+
+
+def matches(doc, query, doc_id=None):
+    if not query:
+        return True
+    (kind, spec), = query.items()
+    if kind == "match_all":
+        return True
+    if kind == "match_none":
+        return False
+    if kind == "bool":
+        for clause in _as_list(spec.get("must")) + _as_list(spec.get("filter")):
+            if not matches(doc, clause, doc_id):
+                return False
+        for clause in _as_list(spec.get("must_not")):
+            if matches(doc, clause, doc_id):
+                return False
+        should = _as_list(spec.get("should"))
+        if should:
+            has_required = bool(spec.get("must") or spec.get("filter"))
+            minimum = spec.get("minimum_should_match", 0 if has_required else 1)
+            if sum(1 for clause in should if matches(doc, clause, doc_id)) < int(minimum):
+                return False
+        return True
+    if kind == "ids":
+        return doc_id in spec.get("values", [])
+    (field, arg), = spec.items()
+    values = _field_values(doc, field)
+    if kind == "exists":
+        return bool(_field_values(doc, arg))
+    if kind == "match_phrase":
+        needle = _tokens(arg["query"] if isinstance(arg, dict) else arg)
+        return bool(needle) and any(_phrase_in(needle, _tokens(v)) for v in values)
+    if kind == "match":
+        wanted = set(_tokens(arg["query"] if isinstance(arg, dict) else arg))
+        return any(wanted & set(_tokens(v)) for v in values)
+    if kind == "term":
+        target = arg["value"] if isinstance(arg, dict) else arg
+        return any(v == target or (isinstance(v, str) and not field.endswith(".keyword") and str(target) in _tokens(v))
+                   for v in values)
+    if kind == "terms":
+        return any(v in arg for v in values)
+    if kind == "prefix":
+        target = arg["value"] if isinstance(arg, dict) else arg
+        return any(isinstance(v, str) and v.startswith(target) for v in values)
+    if kind == "range":
+        for v in values:
+            ok = True
+            for op, bound in arg.items():
+                if op not in ("gt", "gte", "lt", "lte"):
+                    continue
+                b = _range_bound(bound)
+                cv = _comparable(v, b)
+                if cv is None:
+                    ok = False
+                    break
+                if (op == "gt" and not cv > b) or (op == "gte" and not cv >= b) or (
+                    op == "lt" and not cv < b) or (op == "lte" and not cv <= b):
+                    ok = False
+                    break
+            if ok:
+                return True
+        return False
+    raise RequestError(400, "parsing_exception", {"error": f"query [{kind}] not supported by the in-memory stand-in"})
+
+
+def _as_list(value):
+    if value is None:
+        return []
+    return value if isinstance(value, list) else [value]
+
+
+def _sort_spec(sort):
+    spec = []
+    for item in _as_list(sort):
+        if isinstance(item, str):
+            spec.append((item, "desc" if item == "_score" else "asc"))
+        else:
+            (field, order), = item.items()
+            spec.append((field, order.get("order", "asc") if isinstance(order, dict) else order))
+    return spec
+
+
+def _sort_value(doc_id, doc, seq, field):
+    if field == "_doc":
+        return seq
+    if field == "_id":
+        return doc_id
+    values = _field_values(doc, field)
+    if not values:
+        return _MISSING
+    value = values[0]
+    if isinstance(value, str) and field.startswith("@timestamp"):
+        date = _parse_date(value)
+        return int(date.timestamp() * 1000) if date else value
+    return value
+
+
+class _Key:
+    """Sort key where missing values always sort last and mixed types do not blow up."""
+
+    __slots__ = ("values", "orders")
+
+    def __init__(self, values, orders):
+        self.values = values
+        self.orders = orders
+
+    def __lt__(self, other):
+        for a, b, order in zip(self.values, other.values, self.orders):
+            if a == b:
+                continue
+            if a is _MISSING:
+                return False
+            if b is _MISSING:
+                return True
+            try:
+                less = a < b
+            except TypeError:
+                less = str(a) < str(b)
+            return less if order == "asc" else not less
+        return False
+
+
+class _Indices:
+    def __init__(self, store):
+        self._store = store
+
+    def refresh(self, index=None, **kwargs):
+        return {"_shards": {"failed": 0}}
+
+    def exists(self, index, **kwargs):
+        return bool(self._store._resolve(index, ignore_unavailable=True))
+
+    def create(self, index, body=None, **kwargs):
+        with self._store._lock:
+            if index in self._store._indices:
+                raise RequestError(400, "resource_already_exists_exception", {"index": index})
+            self._store._indices[index] = {}
+            self._store._meta[index] = copy.deepcopy(body or {})
+        return {"acknowledged": True, "index": index}
+
+    def get(self, index, ignore_unavailable=False, allow_no_indices=True, **kwargs):
+        names = self._store._resolve(index, ignore_unavailable=ignore_unavailable)
+        return {name: copy.deepcopy(self._store._meta.get(name, {})) for name in names}
+
+    def delete(self, index, **kwargs):
+        names = self._store._resolve(index, ignore_unavailable=kwargs.get("ignore_unavailable", False))
+        with self._store._lock:
+            for name in names:
+                self._store._indices.pop(name, None)
+                self._store._meta.pop(name, None)
+                self._store._versions.pop(name, None)
+        return {"acknowledged": True}
+
+
+class _Cluster:
+    def health(self, **kwargs):
+        return {"status": "green", "number_of_nodes": 1}
+
+
+class InMemoryOpenSearch:
+    def __init__(self):
+        self._lock = threading.RLock()
+        self._indices = {}
+        self._meta = {}
+        self._versions = {}
+        self._seq = 0
+        self._pits = {}
+        self.indices = _Indices(self)
+        self.cluster = _Cluster()
+
+    # --- index resolution -------------------------------------------------
+
+    def _resolve(self, index, ignore_unavailable=False):
+        if index is None or index in ("_all", "*"):
+            return sorted(self._indices)
+        parts = index.split(",") if isinstance(index, str) else list(index)
+        selected = []
+        for part in parts:
+            part = part.strip()
+            if part.startswith("-"):
+                selected = [n for n in selected if not fnmatch.fnmatchcase(n, part[1:])]
+            elif "*" in part or "?" in part:
+                selected += [n for n in sorted(self._indices) if fnmatch.fnmatchcase(n, part) and n not in selected]
+            elif part in self._indices:
+                if part not in selected:
+                    selected.append(part)
+            elif not ignore_unavailable:
+                raise NotFoundError(404, "index_not_found_exception", {"error": {"type": "index_not_found_exception", "index": part}})
+        return selected
+
+    # --- document APIs ----------------------------------------------------
+
+    def index(self, index, body, id=None, op_type=None, refresh=None, **kwargs):
+        with self._lock:
+            docs = self._indices.setdefault(index, {})
+            doc_id = id if id is not None else uuid.uuid4().hex
+            exists = doc_id in docs
+            if exists and op_type == "create":
+                raise RequestError(409, "version_conflict_engine_exception", {"_id": doc_id})
+            self._seq += 1
+            docs[doc_id] = (self._seq, copy.deepcopy(body))
+            versions = self._versions.setdefault(index, {})
+            version = versions[doc_id] = versions.get(doc_id, 0) + 1 if exists else 1
+        return {"_index": index, "_id": doc_id, "_version": version, "result": "updated" if exists else "created"}
+
+    def create(self, index, id, body, **kwargs):
+        return self.index(index, body, id=id, op_type="create")
+
+    def get(self, index, id, **kwargs):
+        with self._lock:
+            entry = self._indices.get(index, {}).get(id)
+        if entry is None:
+            raise NotFoundError(404, "not_found", {"_index": index, "_id": id, "found": False})
+        return {"_index": index, "_id": id, "found": True, "_source": copy.deepcopy(entry[1])}
+
+    def delete(self, index, id, **kwargs):
+        with self._lock:
+            if self._indices.get(index, {}).pop(id, None) is None:
+                raise NotFoundError(404, "not_found", {"_index": index, "_id": id, "result": "not_found"})
+            self._versions.get(index, {}).pop(id, None)
+        return {"_index": index, "_id": id, "result": "deleted"}
+
+    def bulk(self, body, index=None, refresh=None, **kwargs):
+        lines = _ndjson_lines(body)
+        items = []
+        errors = False
+        i = 0
+        while i < len(lines):
+            (action, meta), = lines[i].items()
+            target = meta.get("_index", index)
+            doc_id = meta.get("_id")
+            try:
+                if action == "delete":
+                    res = self.delete(target, doc_id)
+                    i += 1
+                elif action == "update":
+                    source = lines[i + 1].get("doc", {})
+                    try:
+                        current = self.get(target, doc_id)["_source"]
+                    except NotFoundError:
+                        if not lines[i + 1].get("doc_as_upsert"):
+                            raise
+                        current = {}
+                    current.update(source)
+                    res = self.index(target, current, id=doc_id)
+                    i += 2
+                else:
+                    res = self.index(target, lines[i + 1], id=doc_id, op_type="create" if action == "create" else None)
+                    i += 2
+                res["status"] = 201 if res.get("result") == "created" else 200
+            except (NotFoundError, RequestError) as e:
+                errors = True
+                res = {"_index": target, "_id": doc_id, "status": e.status_code, "error": {"type": e.error}}
+                i += 1 if action == "delete" else 2
+            items.append({action: res})
+        return {"took": 0, "errors": errors, "items": items}
+
+    # --- search APIs ------------------------------------------------------
+
+    def _snapshot(self, index, ignore_unavailable=False):
+        with self._lock:
+            names = self._resolve(index, ignore_unavailable=ignore_unavailable)
+            # Stored documents are replaced, never mutated, so holding references is a frozen view.
+            return names, [(name, doc_id, seq, doc) for name in names for doc_id, (seq, doc) in self._indices[name].items()]
+
+    def _matching(self, index, query, ignore_unavailable=False, pit=None):
+        if pit is not None:
+            if pit["id"] not in self._pits:
+                raise NotFoundError(404, "search_context_missing_exception", {"pit_id": pit["id"]})
+            names, snapshot = self._pits[pit["id"]]
+        else:
+            names, snapshot = self._snapshot(index, ignore_unavailable)
+        return names, [(name, doc_id, seq, doc) for name, doc_id, seq, doc in snapshot if matches(doc, query, doc_id)]
+
+    def create_pit(self, index, keep_alive=None, **kwargs):
+        pit_id = uuid.uuid4().hex
+        self._pits[pit_id] = self._snapshot(index)
+        return {"pit_id": pit_id, "_shards": {"total": len(self._pits[pit_id][0]), "failed": 0}}
+
+    def delete_pit(self, body=None, **kwargs):
+        ids = (body or {}).get("pit_id", [])
+        return {"pits": [{"pit_id": i, "successful": self._pits.pop(i, None) is not None} for i in _as_list(ids)]}
+
+    def count(self, index=None, body=None, **kwargs):
+        _, hits = self._matching(index, (body or {}).get("query"), kwargs.get("ignore_unavailable", False))
+        return {"count": len(hits)}
+
+    def search(self, index=None, body=None, ignore_unavailable=False, allow_no_indices=True, size=None, **kwargs):
+        body = body or {}
+        names, hits = self._matching(index, body.get("query"), ignore_unavailable, body.get("pit"))
+        if body.get("slice"):
+            part, parts = body["slice"]["id"], body["slice"]["max"]
+            hits = [hit for hit in hits if zlib.crc32(hit[1].encode("utf-8")) % parts == part]
+        spec = _sort_spec(body.get("sort")) or [("_doc", "asc")]
+        orders = [order for _, order in spec]
+        keyed = [
+            (_Key([_sort_value(doc_id, doc, seq, field) for field, _ in spec], orders), name, doc_id, doc)
+            for name, doc_id, seq, doc in hits
+        ]
+        keyed.sort(key=lambda item: item[0])
+        if body.get("search_after") is not None:
+            after = _Key(list(body["search_after"]), orders)
+            keyed = [item for item in keyed if after < item[0]]
+        start = int(body.get("from", 0))
+        count = int(body.get("size", size if size is not None else 10))
+        page = keyed[start : start + count]
+        result_hits = []
+        for key, name, doc_id, doc in page:
+            hit = {"_index": name, "_id": doc_id, "_score": None, "_source": _filter_source(doc, body.get("_source"))}
+            if body.get("version"):
+                hit["_version"] = self._versions.get(name, {}).get(doc_id, 1)
+            if body.get("sort"):
+                hit["sort"] = [None if v is _MISSING else v for v in key.values]
+            result_hits.append(hit)
+        aggs = body.get("aggs", body.get("aggregations"))
+        res = {
+            "took": 0,
+            **({"pit_id": body["pit"]["id"]} if body.get("pit") else {}),
+            "timed_out": False,
+            "_shards": {"total": len(names), "successful": len(names), "skipped": 0, "failed": 0},
+            "hits": {"total": {"value": len(hits), "relation": "eq"}, "max_score": None, "hits": result_hits},
+        }
+        if aggs:
+            res["aggregations"] = _aggregate(aggs, hits)
+        return res
+
+    def msearch(self, body, index=None, **kwargs):
+        lines = _ndjson_lines(body)
+        responses = []
+        for header, query in zip(lines[::2], lines[1::2]):
+            try:
+                responses.append(
+                    self.search(
+                        index=header.get("index", index),
+                        body=query,
+                        ignore_unavailable=header.get("ignore_unavailable", False),
+                    )
+                )
+            except (NotFoundError, RequestError) as e:
+                responses.append({"error": {"type": e.error, "reason": str(e.info)}, "status": e.status_code})
+        return {"took": 0, "responses": responses}
+
+    def delete_by_query(self, index, body, conflicts=None, refresh=None, **kwargs):
+        _, hits = self._matching(index, body.get("query"), kwargs.get("ignore_unavailable", True))
+        with self._lock:
+            for name, doc_id, _, _ in hits:
+                self._indices.get(name, {}).pop(doc_id, None)
+        return {"deleted": len(hits), "failures": []}
+
+
+def _ndjson_lines(body):
+    if isinstance(body, (str, bytes)):
+        text = body.decode("utf-8") if isinstance(body, bytes) else body
+        return [json.loads(line) for line in text.splitlines() if line.strip()]
+    return list(body)
+
+
+def _filter_source(doc, source_filter):
+    doc = copy.deepcopy(doc)
+    if source_filter is None or source_filter is True:
+        return doc
+    if source_filter is False:
+        return {}
+    includes = source_filter if isinstance(source_filter, list) else source_filter.get("includes", [])
+    if isinstance(includes, str):
+        includes = [includes]
+    if not includes:
+        return doc
+    return _include(doc, includes)
+
+
+def _include(doc, patterns):
+    """Keep the keys matching ``patterns``; "a.b" reaches into the object under "a"."""
+    out = {}
+    for k, v in doc.items():
+        if any(fnmatch.fnmatchcase(k, pattern) for pattern in patterns):
+            out[k] = v
+        elif isinstance(v, dict):
+            nested = [p.split(".", 1)[1] for p in patterns if "." in p and fnmatch.fnmatchcase(k, p.split(".", 1)[0])]
+            if nested:
+                sub = _include(v, nested)
+                if sub:
+                    out[k] = sub
+    return out
+
+
+# --- aggregations ------------------------------------------------------------
+
+_INTERVAL = re.compile(r"(\d+)([smhd])$")
+_CALENDAR = {"minute": "1m", "hour": "1h", "day": "1d", "1m": "1m", "1h": "1h", "1d": "1d"}
+
+
+def _interval_ms(spec):
+    text = spec.get("fixed_interval") or _CALENDAR.get(spec.get("calendar_interval", ""), spec.get("interval"))
+    m = _INTERVAL.match(text or "")
+    if not m:
+        raise RequestError(400, "illegal_argument_exception", {"error": f"interval {text!r} not supported"})
+    return int(m.group(1)) * _UNIT_SECONDS[m.group(2)] * 1000
+
+
+def _numeric_values(doc, field):
+    out = []
+    for v in _field_values(doc, field):
+        if isinstance(v, bool):
+            out.append(1.0 if v else 0.0)
+        elif isinstance(v, (int, float)):
+            out.append(float(v))
+        elif isinstance(v, str):
+            date = _parse_date(v)
+            if date is not None:
+                out.append(date.timestamp() * 1000)
+    return out
+
+
+def _date_key(doc, field, interval):
+    values = _numeric_values(doc, field)
+    if not values:
+        return _MISSING
+    ms = int(values[0])
+    return ms - ms % interval
+
+
+def _key_as_string(ms):
+    return datetime.fromtimestamp(ms / 1000, timezone.utc).strftime("%Y-%m-%dT%H:%M:%S.000Z")
+
+
+def _metric(kind, spec, hits):
+    field = spec.get("field")
+    values = [v for _, _, _, doc in hits for v in _numeric_values(doc, field)] if field else []
+    if kind == "min":
+        return {"value": min(values) if values else None}
+    if kind == "max":
+        return {"value": max(values) if values else None}
+    if kind == "sum":
+        return {"value": sum(values)}
+    if kind == "avg":
+        return {"value": sum(values) / len(values) if values else None}
+    if kind == "value_count":
+        return {"value": sum(len(_field_values(doc, field)) for _, _, _, doc in hits)}
+    if kind == "stats":
+        return {
+            "count": len(values),
+            "min": min(values) if values else None,
+            "max": max(values) if values else None,
+            "avg": sum(values) / len(values) if values else None,
+            "sum": sum(values),
+        }
+    if kind == "cardinality":
+        return {"value": len({json.dumps(v, sort_keys=True) for _, _, _, doc in hits for v in _field_values(doc, field)})}
+    return None
+
+
+def _group(hits, key_fn):
+    groups = {}
+    for hit in hits:
+        key = key_fn(hit[3])
+        if key is _MISSING:
+            continue
+        groups.setdefault(key, []).append(hit)
+    return groups
+
+
+def _bucket(key, members, sub, extra=None):
+    bucket = {"key": key, "doc_count": len(members)}
+    bucket.update(extra or {})
+    if sub:
+        bucket.update(_aggregate(sub, members))
+    return bucket
+
+
+def _terms_key(field):
+    def key(doc):
+        values = _field_values(doc, field)
+        return values[0] if values else _MISSING
+
+    return key
+
+
+def _terms_groups(hits, field, missing=_MISSING):
+    """A document lands in the bucket of every distinct value of ``field``, as with a multi-valued keyword."""
+    groups = {}
+    for hit in hits:
+        values = [hit[0]] if field == "_index" else _field_values(hit[3], field)
+        if not values and missing is not _MISSING:
+            values = [missing]
+        for value in dict.fromkeys(v for v in values if not isinstance(v, (list, dict))):
+            groups.setdefault(value, []).append(hit)
+    return groups
+
+
+def _aggregate(aggs, hits):
+    out = {}
+    for name, spec in aggs.items():
+        sub = spec.get("aggs", spec.get("aggregations"))
+        (kind,) = [k for k in spec if k not in ("aggs", "aggregations", "meta")]
+        arg = spec[kind]
+        metric = _metric(kind, arg, hits)
+        if metric is not None:
+            out[name] = metric
+        elif kind == "filter":
+            members = [h for h in hits if matches(h[3], arg, h[1])]
+            out[name] = _bucket(None, members, sub)
+            del out[name]["key"]
+        elif kind == "terms":
+            groups = _terms_groups(hits, arg["field"], arg.get("missing", _MISSING))
+            ordered = sorted(groups.items(), key=lambda kv: (-len(kv[1]), str(kv[0])))
+            size = int(arg.get("size", 10))
+            out[name] = {
+                "doc_count_error_upper_bound": 0,
+                "sum_other_doc_count": sum(len(m) for _, m in ordered[size:]),
+                "buckets": [_bucket(k, m, sub) for k, m in ordered[:size]],
+            }
+        elif kind == "date_histogram":
+            interval = _interval_ms(arg)
+            groups = _group(hits, lambda doc: _date_key(doc, arg["field"], interval))
+            out[name] = {
+                "buckets": [
+                    _bucket(k, m, sub, {"key_as_string": _key_as_string(k)}) for k, m in sorted(groups.items())
+                ]
+            }
+        elif kind == "composite":
+            out[name] = _composite(arg, hits, sub)
+        elif kind == "top_hits":
+            body = {"sort": arg.get("sort"), "size": arg.get("size", 3), "_source": arg.get("_source")}
+            spec_sort = _sort_spec(body["sort"]) or [("_doc", "asc")]
+            orders = [o for _, o in spec_sort]
+            ranked = sorted(hits, key=lambda h: _Key([_sort_value(h[1], h[3], h[2], f) for f, _ in spec_sort], orders))
+            out[name] = {
+                "hits": {
+                    "total": {"value": len(hits), "relation": "eq"},
+                    "hits": [
+                        {"_index": n, "_id": i, "_source": _filter_source(d, body["_source"])}
+                        for n, i, _, d in ranked[: int(body["size"])]
+                    ],
+                }
+            }
+        else:
+            raise RequestError(400, "parsing_exception", {"error": f"aggregation [{kind}] not supported by the in-memory stand-in"})
+    return out
+
+
+def _composite(arg, hits, sub):
+    sources = []
+    for source in arg["sources"]:
+        (source_name, source_spec), = source.items()
+        (kind, spec), = source_spec.items()
+        if kind == "terms":
+            sources.append((source_name, _terms_key(spec["field"])))
+        elif kind == "date_histogram":
+            interval = _interval_ms(spec)
+            sources.append((source_name, lambda doc, f=spec["field"], i=interval: _date_key(doc, f, i)))
+        else:
+            raise RequestError(400, "parsing_exception", {"error": f"composite source [{kind}] not supported"})
+
+    def key(doc):
+        values = tuple(fn(doc) for _, fn in sources)
+        return _MISSING if _MISSING in values else values
+
+    groups = sorted(_group(hits, key).items(), key=lambda kv: _Key(list(kv[0]), ["asc"] * len(sources)))
+    after = arg.get("after")
+    if after:
+        after_key = _Key([after[n] for n, _ in sources], ["asc"] * len(sources))
+        groups = [g for g in groups if after_key < _Key(list(g[0]), ["asc"] * len(sources))]
+    page = groups[: int(arg.get("size", 10))]
+    buckets = [_bucket(dict(zip([n for n, _ in sources], k)), m, sub) for k, m in page]
+    result = {"buckets": buckets}
+    if buckets:
+        result["after_key"] = buckets[-1]["key"]
+    return result
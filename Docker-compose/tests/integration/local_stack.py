@@ -0,0 +1,149 @@
+"""Docker-free stand-in for mosquitto -> filebeat -> logstash -> OpenSearch.
+
+An in-process MQTT broker, a subscriber that runs every message through the
+reference pipeline (ingest/sensor_pipeline.py) and an in-memory OpenSearch.
+The integration tests use it with ``IT_BACKEND=local``:
+
+    IT_BACKEND=local python -m pytest -m "integration or integration_concurrent"
+    IT_BACKEND=local IT_PIPELINE=bridge python -m pytest ...   # through ingest/bridge.py instead
+
+It checks the tests and tooling, not logstash itself; the Docker stack stays
+the slower, authoritative tier (and golden_corpus.py keeps the reference
+pipeline honest against it).
+"""
+import asyncio
+import threading
+from datetime import datetime, timezone
+
+import paho.mqtt.client as mqtt
+
+import helpers  # noqa: F401  puts ingest/ on sys.path
+import sensor_pipeline
+from bridge import IngestBridge
+from local_broker import LocalBroker
+from local_opensearch import InMemoryOpenSearch
+
+USERNAME = "ghasensor"
+PASSWORD = "local-test-password"
+TOPIC = "ghanode/sensor"
+COMPACT_TOPIC = "ghanode/sensor/cbor"
+
+
+class PipelineEmulator:
+    """Subscribes like filebeat, transforms like logstash, indexes into ``store``.
+
+    Compact payloads on ``compact_topic`` are handled as the compact-ingest bridge does.
+    """
+
+    def __init__(self, broker, store, topic=TOPIC, compact_topic=COMPACT_TOPIC, username=USERNAME, password=PASSWORD):
+        self.store = store
+        self.topic = topic
+        self.compact_topic = compact_topic
+        self.processed = 0
+        self.failed = 0
+        self._subscribed = threading.Event()
+        self._client = mqtt.Client()
+        self._client.username_pw_set(username, password)
+        self._client.on_connect = self._on_connect
+        self._client.on_subscribe = self._on_subscribe
+        self._client.on_message = self._on_message
+        self._host = broker.host
+        self._port = broker.port
+
+    def _on_connect(self, client, userdata, flags, rc):
+        if rc == 0:
+            client.subscribe([(self.topic, 1), (self.compact_topic, 1)])
+
+    def _on_subscribe(self, client, userdata, mid, granted_qos):
+        self._subscribed.set()
+
+    def _on_message(self, client, userdata, msg):
+        try:
+            received_at = datetime.now(timezone.utc)
+            if msg.topic == self.compact_topic:
+                pairs = sensor_pipeline.process_compact_all(msg.payload, received_at, sensor_pipeline.FILEBEAT_FIELDS)
+            else:
+                message = msg.payload.decode("utf-8", errors="replace")
+                pairs = sensor_pipeline.process_all(message, received_at, sensor_pipeline.FILEBEAT_FIELDS)
+            for index, event in pairs:
+                doc_id = sensor_pipeline.document_id(event)
+                self.store.index(index=index, body=sensor_pipeline.to_document(event), id=doc_id)
+                self.processed += 1
+        except Exception as e:
+            self.failed += 1
+            print(f"[local] pipeline emulator dropped a message: {e!r}")
+
+    def start(self, timeout=10):
+        self._client.connect(self._host, self._port, keepalive=30)
+        self._client.loop_start()
+        if not self._subscribed.wait(timeout):
+            raise RuntimeError(f"pipeline emulator did not subscribe to {self.topic} within {timeout}s")
+        return self
+
+    def stop(self):
+        self._client.disconnect()
+        self._client.loop_stop()
+
+
+class BridgeRunner:
+    """Runs ingest/bridge.py's event loop on a background thread, flushing often so tests stay fast."""
+
+    def __init__(self, store, settings):
+        self.bridge = IngestBridge(store, settings, flush_interval=0.02, stats_interval=0)
+        self._thread = threading.Thread(target=asyncio.run, args=(self.bridge.run(),), daemon=True)
+
+    def start(self, timeout=10):
+        self._thread.start()
+        if not self.bridge.subscribed.wait(timeout):
+            raise RuntimeError(f"ingest bridge did not subscribe within {timeout}s")
+        return self
+
+    def stop(self):
+        self.bridge.stop()
+        self._thread.join(timeout=10)
+
+
+class LocalStack:
+    def __init__(self, pipeline="reference"):
+        self.broker = LocalBroker(users={USERNAME: PASSWORD})
+        self.opensearch = InMemoryOpenSearch()
+        self.pipeline_kind = pipeline
+        self.pipeline = None
+
+    def mqtt_settings(self):
+        return {
+            "host": self.broker.host,
+            "port": self.broker.port,
+            "username": USERNAME,
+            "password": PASSWORD,
+            "topic": TOPIC,
+            "compact_topic": COMPACT_TOPIC,
+        }
+
+    def start(self):
+        self.broker.start()
+        self.start_pipeline()
+        print(f"[local] broker on {self.broker.host}:{self.broker.port}, in-memory OpenSearch, {self.pipeline_kind} pipeline")
+        return self
+
+    def start_pipeline(self):
+        if self.pipeline_kind == "bridge":
+            self.pipeline = BridgeRunner(self.opensearch, self.mqtt_settings()).start()
+        else:
+            self.pipeline = PipelineEmulator(self.broker, self.opensearch).start()
+
+    def stop_pipeline(self):
+        """Take the pipeline down (chaos.py); the broker keeps no sessions, so what is published meanwhile is lost."""
+        if self.pipeline is not None:
+            self.pipeline.stop()
+            self.pipeline = None
+
+    def stop(self):
+        self.stop_pipeline()
+        self.broker.stop()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc):
+        self.stop()
@@ -0,0 +1,231 @@
+"""Per-test, per-phase timings for the integration suite, checked against a stored baseline.
+
+Loaded as a pytest plugin by conftest.py. Besides pytest's own setup / call /
+teardown, every test gets the time it spent in each phase that helpers.py and
+the fixtures mark with ``phase(name)``:
+
+    mqtt_connect     connecting the session publisher (charged to the first test that needs it)
+    publish_ack      waiting for the broker's PUBACK
+    visibility       polling until the expected document is searchable
+    negative_window  assert_not_indexed: making sure a document did not land somewhere
+    cleanup          delete_by_query / run index deletion
+
+IT_PHASES_FILE writes the run's timings as JSON. IT_PHASES_BASELINE names a
+baseline file (default phase_baseline.json next to this one, when it exists),
+holding timings per profile ("local-reference", "local-bridge", "docker"):
+a phase that takes longer than baseline * (1 + ratio) + slack_s fails the
+run. The defaults are ratio 0.5 and slack_s 1.0, and the file's "budget" can
+override them for every phase, per phase, per profile or per phase within a
+profile; the in-process profiles run their phases in milliseconds and get a
+smaller slack than the compose stack. Tests and phases missing from the
+baseline are only reported. IT_PHASES_UPDATE_BASELINE=1 records this
+run's timings as the baseline of its profile instead of checking them.
+
+    IT_PHASES_FILE=phases.json python -m pytest -m integration
+    IT_BACKEND=local IT_PHASES_UPDATE_BASELINE=1 python -m pytest -m "integration or integration_concurrent"
+    python phases.py phase_baseline.json phases.json          # compare two runs outside pytest
+    python phases.py phase_baseline.json phases.json --record # e.g. the docker profile, from CI's phase-timings artifact
+"""
+import argparse
+import json
+import os
+import threading
+import time
+from contextlib import contextmanager
+from datetime import datetime, timezone
+
+import pytest
+
+DEFAULT_BASELINE = os.path.join(os.path.dirname(os.path.abspath(__file__)), "phase_baseline.json")
+DEFAULT_BUDGET = {"ratio": 0.5, "slack_s": 1.0}
+
+_lock = threading.Lock()
+# Phase totals of the test that is running; None outside a test (tools importing helpers.py record nothing).
+_current = None
+
+
+@contextmanager
+def phase(name):
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        spent = time.perf_counter() - started
+        with _lock:
+            if _current is not None:
+                _current[name] = _current.get(name, 0.0) + spent
+
+
+def profile():
+    backend = os.getenv("IT_BACKEND", "docker")
+    return backend if backend != "local" else f"local-{os.getenv('IT_PIPELINE', 'reference')}"
+
+
+def budget_for(budget, name, profile=None):
+    """DEFAULT_BUDGET, then the file's budget, the profile's, the phase's and the profile's phase, later wins."""
+    budget = budget or {}
+    levels = (budget, budget.get("profiles", {}).get(profile, {}))
+    merged = dict(DEFAULT_BUDGET)
+    for level in levels:
+        merged.update({k: v for k, v in level.items() if k not in ("phases", "profiles")})
+    for level in levels:
+        merged.update(level.get("phases", {}).get(name, {}))
+    return merged
+
+
+def compare(baseline, current, budget=None, profile=None):
+    """Phases of ``current`` ({test: {phase: s}}) over budget against ``baseline``, worst overrun first."""
+    regressions = []
+    for test, phases in current.items():
+        for name, seconds in phases.items():
+            before = baseline.get(test, {}).get(name)
+            if before is None:
+                continue
+            b = budget_for(budget, name, profile)
+            limit = before * (1 + b["ratio"]) + b["slack_s"]
+            if seconds > limit:
+                regressions.append({"test": test, "phase": name, "baseline_s": round(before, 3),
+                                    "seconds": round(seconds, 3), "limit_s": round(limit, 3)})
+    return sorted(regressions, key=lambda r: r["seconds"] - r["limit_s"], reverse=True)
+
+
+def _rounded(tests):
+    return {test: {name: round(s, 3) for name, s in sorted(phases.items())} for test, phases in tests.items()}
+
+
+def write_baseline(path, stored, profile, tests):
+    """Store ``tests`` as the baseline of ``profile``, keeping the other profiles and the budget."""
+    stored.setdefault("budget", DEFAULT_BUDGET)
+    stored.setdefault("profiles", {})[profile] = _rounded(tests)
+    with open(path, "w") as f:
+        json.dump(stored, f, indent=2, sort_keys=True)
+        f.write("\n")
+
+
+def phase_totals(tests):
+    totals = {}
+    for phases in tests.values():
+        for name, seconds in phases.items():
+            totals[name] = totals.get(name, 0.0) + seconds
+    return {name: round(s, 3) for name, s in sorted(totals.items(), key=lambda item: -item[1])}
+
+
+class PhaseRecorder:
+    def __init__(self, baseline_path, report_path=None, update=False):
+        self.baseline_path = baseline_path
+        self.report_path = report_path
+        self.update = update
+        self.profile = profile()
+        self.tests = {}
+        self.regressions = []
+        self.unchecked = None
+        self.baseline_written = False
+
+    @pytest.hookimpl(hookwrapper=True)
+    def pytest_runtest_protocol(self, item, nextitem):
+        global _current
+        with _lock:
+            _current = self.tests.setdefault(item.nodeid, {})
+        try:
+            yield
+        finally:
+            with _lock:
+                _current = None
+
+    def pytest_runtest_logreport(self, report):
+        if report.nodeid in self.tests and not report.skipped:
+            self.tests[report.nodeid][report.when] = report.duration
+
+    def report(self):
+        return {
+            "profile": self.profile,
+            "finished_at": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+            "totals": phase_totals(self.tests),
+            "tests": _rounded(self.tests),
+            "regressions": self.regressions,
+        }
+
+    def _load_baseline(self):
+        if not self.baseline_path or not os.path.exists(self.baseline_path):
+            return {}
+        with open(self.baseline_path) as f:
+            return json.load(f)
+
+    def pytest_sessionfinish(self, session, exitstatus):
+        tests = {t: p for t, p in self.tests.items() if p}
+        if not tests:
+            return
+        # Timings of a run with failures say little about the pipeline: neither checked nor recorded as baseline.
+        if exitstatus == pytest.ExitCode.OK:
+            stored = self._load_baseline()
+            if self.update:
+                write_baseline(self.baseline_path, stored, self.profile, tests)
+                self.baseline_written = True
+            elif self.profile not in stored.get("profiles", {}):
+                self.unchecked = f"no {self.profile} baseline in {self.baseline_path}"
+            else:
+                self.regressions = compare(stored["profiles"][self.profile], tests, stored.get("budget"), self.profile)
+                if self.regressions:
+                    session.exitstatus = pytest.ExitCode.TESTS_FAILED
+        if self.report_path:
+            with open(self.report_path, "w") as f:
+                json.dump(self.report(), f, indent=2)
+
+    def pytest_terminal_summary(self, terminalreporter):
+        tests = {t: p for t, p in self.tests.items() if p}
+        if not tests:
+            return
+        terminalreporter.section(f"phase timings ({self.profile}, seconds)")
+        terminalreporter.write_line(f"totals: {json.dumps(phase_totals(tests))}")
+        slowest = sorted(tests.items(), key=lambda item: -sum(item[1].values()))[:5]
+        for test, phases in slowest:
+            terminalreporter.write_line(f"{test}: {json.dumps(_rounded({test: phases})[test])}")
+        if self.baseline_written:
+            terminalreporter.write_line(f"baseline for {self.profile} written to {self.baseline_path}")
+        elif self.unchecked:
+            terminalreporter.write_line(f"not checked: {self.unchecked}")
+        for r in self.regressions:
+            terminalreporter.write_line(
+                f"REGRESSION {r['test']} {r['phase']}: {r['seconds']}s > {r['limit_s']}s (baseline {r['baseline_s']}s)",
+                red=True,
+            )
+        if self.report_path:
+            terminalreporter.write_line(f"written to {self.report_path}")
+
+
+def pytest_configure(config):
+    recorder = PhaseRecorder(
+        os.getenv("IT_PHASES_BASELINE", DEFAULT_BASELINE),
+        os.getenv("IT_PHASES_FILE"),
+        update=os.getenv("IT_PHASES_UPDATE_BASELINE") == "1",
+    )
+    config.pluginmanager.register(recorder, "phase-recorder")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("baseline", help="baseline file (phase_baseline.json)")
+    parser.add_argument("report", help="a run's IT_PHASES_FILE")
+    parser.add_argument("--record", action="store_true", help="store the run as its profile's baseline instead")
+    args = parser.parse_args(argv)
+    with open(args.baseline) as f:
+        stored = json.load(f)
+    with open(args.report) as f:
+        run = json.load(f)
+    if args.record:
+        write_baseline(args.baseline, stored, run["profile"], {t: p for t, p in run["tests"].items() if p})
+        print(f"[phases] {run['profile']} baseline written to {args.baseline}")
+        return 0
+    baseline = stored.get("profiles", {}).get(run["profile"])
+    if baseline is None:
+        print(f"[phases] no {run['profile']} baseline in {args.baseline}")
+        return 1
+    regressions = compare(baseline, run["tests"], stored.get("budget"), run["profile"])
+    for r in regressions:
+        print(f"[phases] {json.dumps(r)}")
+    print(f"[phases] {len(regressions)} phases over budget")
+    return 1 if regressions else 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
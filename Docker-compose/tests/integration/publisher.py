@@ -0,0 +1,196 @@
+import json
+import threading
+import time
+from concurrent.futures import Future, wait
+from dataclasses import dataclass
+
+import paho.mqtt.client as mqtt
+
+
+@dataclass
+class PublishResult:
+    mid: int
+    sent_at: float
+    acked_at: float
+
+    @property
+    def ack_latency(self):
+        return self.acked_at - self.sent_at
+
+
+class MqttPublisher:
+    """Long-lived MQTT connection that pipelines QoS 1 publishes and tracks PUBACKs by message id.
+
+    One TCP connection and one auth round-trip serve every message. ``publish``
+    returns a Future that resolves to a PublishResult once the broker has
+    acknowledged the message, so ``close`` never races an unacknowledged publish.
+    """
+
+    def __init__(self, host, port, username, password, topic, qos=1, max_inflight=100, client_id="", keepalive=30):
+        self.host = host
+        self.port = int(port)
+        self.topic = topic
+        self.qos = qos
+        self._lock = threading.Lock()
+        self._pending = {}
+        self._early_acks = {}
+        self._connected = threading.Event()
+        self._connect_err = None
+
+        self._client = mqtt.Client(client_id=client_id)
+        self._client.username_pw_set(username, password)
+        self._client.max_inflight_messages_set(max_inflight)
+        self._client.max_queued_messages_set(0)
+        self._client.on_connect = self._on_connect
+        self._client.on_disconnect = self._on_disconnect
+        self._client.on_publish = self._on_publish
+        self._keepalive = keepalive
+
+    @classmethod
+    def from_settings(cls, settings, **kwargs):
+        return cls(
+            settings["host"], settings["port"], settings["username"], settings["password"], settings["topic"], **kwargs
+        )
+
+    def connect(self, timeout=10):
+        self._client.connect(self.host, self.port, keepalive=self._keepalive)
+        self._client.loop_start()
+        if not self._connected.wait(timeout):
+            self._client.loop_stop()
+            raise TimeoutError("MQTT connect did not complete in time")
+        if self._connect_err:
+            self._client.loop_stop()
+            raise self._connect_err
+        return self
+
+    def close(self, timeout=10):
+        self.flush(timeout)
+        self._client.disconnect()
+        self._client.loop_stop()
+
+    def __enter__(self):
+        return self.connect()
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def _on_connect(self, client, userdata, flags, rc):
+        if rc != 0:
+            self._connect_err = RuntimeError(f"MQTT connect failed rc={rc}")
+        self._connected.set()
+
+    def _on_disconnect(self, client, userdata, rc):
+        if rc != 0:
+            print(f"[publisher] unexpected disconnect rc={rc}, paho will reconnect and resend in-flight messages")
+
+    def _on_publish(self, client, userdata, mid):
+        if self.qos == 0:
+            # publish() already resolved the future; nothing will ever collect an early ack.
+            return
+        acked_at = time.time()
+        with self._lock:
+            entry = self._pending.pop(mid, None)
+            if entry is None:
+                # PUBACK can arrive before publish() has registered the mid.
+                self._early_acks[mid] = acked_at
+                return
+        fut, sent_at = entry
+        fut.set_result(PublishResult(mid, sent_at, acked_at))
+
+    def publish(self, payload, topic=None):
+        fut = Future()
+        sent_at = time.time()
+        # paho may invoke on_publish while holding its own outgoing-message lock,
+        # so the publish call itself must stay outside self._lock.
+        info = self._client.publish(topic or self.topic, payload, qos=self.qos)
+        if info.rc != mqtt.MQTT_ERR_SUCCESS:
+            raise RuntimeError(f"MQTT publish failed rc={info.rc}")
+        if self.qos == 0:
+            fut.set_result(PublishResult(info.mid, sent_at, sent_at))
+            return fut
+        with self._lock:
+            acked_at = self._early_acks.pop(info.mid, None)
+            if acked_at is None:
+                self._pending[info.mid] = (fut, sent_at)
+                return fut
+        fut.set_result(PublishResult(info.mid, sent_at, acked_at))
+        return fut
+
+    def publish_many(self, payloads, topic=None, timeout=30):
+        futures = [self.publish(p, topic) for p in payloads]
+        done, not_done = wait(futures, timeout=timeout)
+        if not_done:
+            raise TimeoutError(f"{len(not_done)} of {len(futures)} MQTT publishes were not acknowledged in time")
+        return [f.result() for f in futures]
+
+    def flush(self, timeout=10):
+        with self._lock:
+            futures = [fut for fut, _ in self._pending.values()]
+        wait(futures, timeout=timeout)
+
+    def in_flight(self):
+        with self._lock:
+            return len(self._pending)
+
+
+def batch_envelope(readings, shared=None):
+    """One batch message: ``readings`` (dicts in the single-reading shape) plus fields shared by all of them."""
+    return json.dumps(dict(shared or {}, readings=readings))
+
+
+class ReadingBatcher:
+    """Buffers readings and publishes them as batch envelopes through an MqttPublisher.
+
+    A batch is sent once it holds ``max_readings`` readings or ``max_bytes`` of
+    JSON, or when a reading arrives more than ``max_age`` seconds after the
+    oldest one still buffered; ``flush`` sends whatever is left. ``shared``
+    fields (a test_run_id, or the Sensor ID of a single-sensor node) go into
+    the envelope once instead of into every reading. Not thread-safe: use one
+    batcher per node or per publishing thread.
+    """
+
+    def __init__(self, publisher, max_readings=20, max_bytes=64 * 1024, max_age=30.0, shared=None, topic=None):
+        self.publisher = publisher
+        self.max_readings = max_readings
+        self.max_bytes = max_bytes
+        self.max_age = max_age
+        self.shared = shared or {}
+        self.topic = topic
+        self.sent_messages = 0
+        self.sent_readings = 0
+        self.sent_bytes = 0
+        self._buffer = []
+        self._buffer_bytes = 0
+        self._oldest = None
+
+    def add(self, reading, now=None):
+        """Buffer one reading; returns the publish Future if this sent a batch, else None."""
+        now = time.time() if now is None else now
+        size = len(json.dumps(reading)) + 1
+        fut = None
+        if self._buffer and (self._buffer_bytes + size > self.max_bytes or now - self._oldest >= self.max_age):
+            fut = self.flush()
+        if not self._buffer:
+            self._oldest = now
+        self._buffer.append(reading)
+        self._buffer_bytes += size
+        if len(self._buffer) >= self.max_readings:
+            fut = self.flush()
+        return fut
+
+    def flush(self):
+        """Publish the buffered readings as one message; returns its Future (None if there was nothing to send)."""
+        if not self._buffer:
+            return None
+        payload = batch_envelope(self._buffer, self.shared)
+        fut = self.publisher.publish(payload, self.topic)
+        self.sent_messages += 1
+        self.sent_readings += len(self._buffer)
+        self.sent_bytes += len(payload.encode("utf-8"))
+        self._buffer = []
+        self._buffer_bytes = 0
+        self._oldest = None
+        return fut
+
+    def __len__(self):
+        return len(self._buffer)
@@ -0,0 +1,308 @@
+"""Wait until the ingest pipeline is hot, hop by hop, before the integration tests publish anything.
+
+Each stage is retried with backoff until it passes or the overall --timeout
+runs out, and the tests start only once every stage has passed:
+
+1. opensearch: cluster health is yellow or green
+2. broker: the broker accepts a connect with the test credentials (refused
+   credentials fail at once: waiting will not fix them)
+3. logstash-beats: logstash's beats input accepts TCP connections
+   (IT_LOGSTASH_BEATS, logstash:5044)
+4. canaries: a canary reading goes out every --canary-interval seconds into
+   its own test run index until one is searchable, which is what shows that
+   filebeat's MQTT subscription is live (filebeat's stats only count events
+   across all its inputs, the log input's files included). Along the way the
+   stage notes when logstash's events in first move (the beats hop,
+   IT_LOGSTASH_API), then drops the canary index.
+5. compact: the same with a CBOR canary on IT_MQTT_COMPACT_TOPIC, for
+   whichever bridge subscribes to it.
+
+A hop whose setting is empty is skipped; the bridge compose file clears the
+logstash ones. Every stage reports when it became ready (seconds
+since the start) and how long it took on its own; for the canary hops, also
+which canary was the first through (the ones before it were lost while the hop
+warmed up).
+
+    python readiness.py                              # settings from the environment, as the tests use them
+    python readiness.py --timeout 600 --json ready.json
+    IT_BACKEND=local python readiness.py             # in-process stack (ready as soon as it starts)
+"""
+import argparse
+import json
+import os
+import socket
+import threading
+import time
+import urllib.request
+from datetime import datetime, timezone
+
+import paho.mqtt.client as mqtt
+
+from helpers import (
+    _is_fatal,
+    backoff_delays,
+    delete_run_indices,
+    make_opensearch_client,
+    mqtt_settings,
+    new_test_run_id,
+    opensearch_settings,
+    refresh_indices,
+    run_index,
+)
+from publisher import MqttPublisher
+
+import compact  # from ingest/, which importing helpers puts on the path
+
+# CONNACK return codes that no amount of waiting fixes.
+REFUSED = {1: "unacceptable protocol version", 4: "bad username or password", 5: "not authorized"}
+NO_HOPS = {"logstash_api": "", "logstash_beats": ""}
+
+
+def hop_settings():
+    return {
+        "logstash_api": os.getenv("IT_LOGSTASH_API", "http://logstash:9600"),
+        "logstash_beats": os.getenv("IT_LOGSTASH_BEATS", "logstash:5044"),
+    }
+
+
+class NotReady(Exception):
+    def __init__(self, stage, detail):
+        super().__init__(f"{stage}: {detail}")
+        self.stage = stage
+        self.detail = detail
+
+
+class Fatal(Exception):
+    """A check failure that retrying will not fix."""
+
+
+def opensearch_health(client):
+    try:
+        health = client.cluster.health()
+    except Exception as err:
+        if _is_fatal(err):
+            raise Fatal(repr(err)) from err
+        raise
+    if health["status"] not in ("yellow", "green"):
+        raise RuntimeError(f"cluster status {health['status']}")
+    return health["status"]
+
+
+def broker_auth(settings, timeout=5):
+    done = threading.Event()
+    result = {}
+
+    def on_connect(client, userdata, flags, rc):
+        result["rc"] = rc
+        # Disconnect from the network thread, or after a refusal it sits out paho's 1 s reconnect back-off and
+        # loop_stop() waits for it.
+        client.disconnect()
+        done.set()
+
+    client = mqtt.Client(client_id=f"it-ready-{new_test_run_id()}")
+    client.username_pw_set(settings["username"], settings["password"])
+    client.on_connect = on_connect
+    client.connect(settings["host"], int(settings["port"]), keepalive=30)
+    client.loop_start()
+    try:
+        if not done.wait(timeout):
+            raise TimeoutError("no CONNACK")
+    finally:
+        client.disconnect()
+        client.loop_stop()
+    rc = result["rc"]
+    if rc in REFUSED:
+        raise Fatal(f"connect refused as {settings['username']}: {REFUSED[rc]}")
+    if rc != 0:
+        raise RuntimeError(f"connect refused rc={rc}")
+    return "accepted"
+
+
+def tcp_open(address, timeout=3):
+    host, _, port = address.rpartition(":")
+    socket.create_connection((host, int(port)), timeout=timeout).close()
+    return "open"
+
+
+def _get_json(url, timeout=3):
+    with urllib.request.urlopen(url, timeout=timeout) as response:
+        return json.load(response)
+
+
+def logstash_in(api):
+    return _get_json(f"{api.rstrip('/')}/_node/stats/events")["events"]["in"]
+
+
+class Warmup:
+    """Per-stage timings, each measured from the orchestrator's start and from the previous stage."""
+
+    def __init__(self, log=print):
+        self.started = time.monotonic()
+        self.stages = []
+        self.log = log
+        self._last = self.started
+
+    def elapsed(self):
+        return time.monotonic() - self.started
+
+    def ready(self, stage, attempts=1, detail=None, since=None, **extra):
+        now = time.monotonic()
+        row = {
+            "stage": stage,
+            "ready_at_s": round(now - self.started, 3),
+            "took_s": round(now - (self._last if since is None else since), 3),
+            "attempts": attempts,
+        }
+        if detail is not None:
+            row["detail"] = detail
+        row.update(extra)
+        self.stages.append(row)
+        self._last = max(self._last, now)
+        self.log(f"[ready] {stage}: {detail or 'ok'} after {row['took_s']}s ({attempts} attempts)")
+
+    def skipped(self, stage, reason):
+        self.stages.append({"stage": stage, "skipped": reason})
+        self.log(f"[ready] {stage}: skipped ({reason})")
+
+    def report(self):
+        return {"ready": True, "total_s": round(self.elapsed(), 3), "stages": self.stages}
+
+
+def retry(stage, check, deadline, warmup):
+    attempts, last = 0, None
+    for delay in backoff_delays(initial=0.2, maximum=5.0):
+        attempts += 1
+        try:
+            detail = check()
+        except Fatal as err:
+            raise NotReady(stage, str(err)) from err
+        except Exception as err:
+            last = err
+        else:
+            warmup.ready(stage, attempts, detail)
+            return detail
+        if time.monotonic() + delay > deadline:
+            raise NotReady(stage, f"not ready after {attempts} attempts, last error {last!r}")
+        time.sleep(delay)
+
+
+def _counter(read):
+    """A hop's event counter as a probe: reads the baseline now, then tells whether it has moved since."""
+    baseline = read()
+
+    def moved():
+        try:
+            return read() > baseline
+        except Exception:
+            return False
+
+    return moved
+
+
+def _searchable(client, index, sensor):
+    refresh_indices(client, index)
+    body = {"size": 1, "sort": [{"seq": "asc"}], "query": {"match_phrase": {"sensor_id": sensor}}}
+    hits = client.search(index=index, body=body, ignore_unavailable=True)["hits"]["hits"]
+    return hits[0]["_source"]["seq"] if hits else None
+
+
+def canaries(client, settings, hops, deadline, warmup, interval=2.0, poll=0.25):
+    """Publish canaries until one of each kind is searchable; the probes record the hops in between."""
+    run_id = new_test_run_id()
+    index = run_index(run_id)
+    sensors = {"end-to-end": f"it-sensors-canary-{run_id}"}
+    if settings.get("compact_topic"):
+        sensors["compact"] = f"it-sensors-canary-cbor-{run_id}"
+    probes = {}
+    api = hops.get("logstash_api")
+    if not api:
+        warmup.skipped("logstash", "no stats API configured")
+    else:
+        try:
+            probes["logstash"] = _counter(lambda: logstash_in(api))
+        except Exception as err:
+            warmup.skipped("logstash", f"stats unavailable: {err!r}")
+    pending = list(probes) + list(sensors)
+    started = time.monotonic()
+    sent, next_send = 0, started
+
+    try:
+        with MqttPublisher.from_settings(settings) as publisher:
+            while pending:
+                now = time.monotonic()
+                if now >= next_send:
+                    reading = {"temperature": 20.0, "humidity": 50, "light": 0, "seq": sent, "test_run_id": run_id,
+                               "published_at": time.time()}
+                    publisher.publish(json.dumps(dict(reading, **{"Sensor ID": sensors["end-to-end"]})))
+                    if "compact" in pending:
+                        data = compact.encode_reading(dict(reading, **{"Sensor ID": sensors["compact"]}))
+                        publisher.publish(data, topic=settings["compact_topic"])
+                    sent += 1
+                    next_send = now + interval
+                for stage in list(pending):
+                    if stage in probes:
+                        if probes[stage]():
+                            warmup.ready(stage, sent, "events moving", since=started)
+                            pending.remove(stage)
+                        continue
+                    seq = _searchable(client, index, sensors[stage])
+                    if seq is not None:
+                        warmup.ready(stage, sent, f"canary {seq} searchable", since=started, first_canary=seq)
+                        pending.remove(stage)
+                if pending and time.monotonic() > deadline:
+                    raise NotReady(pending[0], f"{sent} canaries sent, none seen there yet")
+                time.sleep(poll)
+    finally:
+        delete_run_indices(client, run_id)
+    return sent
+
+
+def wait_until_ready(client, settings, hops=None, timeout=300.0, canary_interval=2.0, log=print):
+    """Run every stage in turn; returns the warm-up report, or raises NotReady naming the stage that never came up."""
+    hops = hop_settings() if hops is None else hops
+    warmup = Warmup(log=log)
+    deadline = warmup.started + timeout
+    retry("opensearch", lambda: opensearch_health(client), deadline, warmup)
+    retry("broker", lambda: broker_auth(settings), deadline, warmup)
+    if hops.get("logstash_beats"):
+        retry("logstash-beats", lambda: tcp_open(hops["logstash_beats"]), deadline, warmup)
+    else:
+        warmup.skipped("logstash-beats", "no beats address configured")
+    sent = canaries(client, settings, hops, deadline, warmup, interval=canary_interval)
+    report = warmup.report()
+    report["canaries_sent"] = sent
+    report["finished_at"] = datetime.now(timezone.utc).isoformat(timespec="seconds")
+    log(f"[ready] pipeline hot after {report['total_s']}s")
+    return report
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--timeout", type=float, default=300.0, help="seconds for every stage together")
+    parser.add_argument("--canary-interval", type=float, default=2.0, help="seconds between canaries")
+    parser.add_argument("--json", help="also write the warm-up report to this file")
+    args = parser.parse_args(argv)
+
+    def run(client, settings, hops):
+        try:
+            return wait_until_ready(client, settings, hops, args.timeout, args.canary_interval)
+        except NotReady as err:
+            print(f"[ready] NOT READY {err}")
+            return {"ready": False, "stage": err.stage, "detail": err.detail}
+
+    if os.getenv("IT_BACKEND") == "local":
+        from local_stack import LocalStack
+
+        with LocalStack(pipeline=os.getenv("IT_PIPELINE", "reference")) as stack:
+            report = run(stack.opensearch, stack.mqtt_settings(), NO_HOPS)
+    else:
+        report = run(make_opensearch_client(**opensearch_settings()), mqtt_settings(), hop_settings())
+
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump(report, f, indent=2)
+    return 0 if report["ready"] else 1
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
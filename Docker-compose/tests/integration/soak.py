@@ -0,0 +1,446 @@
+"""Soak run: steady sensor traffic for hours or days while the stack's vitals are sampled.
+
+docker-compose.yml gives OpenSearch a 1 GB heap and logstash 512 MB; this is
+how to find out whether that holds up. Every --interval seconds one sample
+is appended to --out (one JSON object per line):
+
+* OpenSearch ``_nodes/stats``: heap, young/old GC count and time, documents
+  indexed, write thread pool queue and rejections
+* the logstash node stats API (IT_LOGSTASH_API): events in/filtered/out,
+  time inputs spent blocked on the queue, queued events, heap and GC
+* mosquitto ``$SYS/broker/#``: messages received/sent/dropped, stored
+  messages (persistent sessions' backlog included), connected clients
+* the readings published, acknowledged and searchable in the run's index
+
+When --duration is up (or on Ctrl-C) the series is analysed and flagged:
+
+* heap growth: the heap floor (the lowest heap use in each of 8 windows,
+  roughly what survives GC) trends up by more than --heap-growth of the max
+  heap over the run
+* rising GC: the share of wall time spent in GC over the last quarter of the
+  run is more than --gc-rise times that of the first quarter
+* divergence: a backlog (logstash in - out, broker stored messages,
+  acknowledged - searchable) still growing over the second half of the run by
+  more than --backlog-rate of the publish rate, where a healthy one holds steady
+
+    python soak.py --duration 86400 --nodes 50 --rate 0.2 --out soak.ndjson --json summary.json
+    python soak.py --duration 600 --interval 10                  # smoke run
+    python soak.py --analyse soak.ndjson                          # re-analyse a finished run
+    IT_BACKEND=local python soak.py --duration 60 --interval 2    # in-process stack (no JVMs, no $SYS)
+"""
+import argparse
+import functools
+import heapq
+import json
+import os
+import random
+import threading
+import time
+import urllib.request
+from datetime import datetime, timezone
+
+import paho.mqtt.client as mqtt
+
+from helpers import (
+    delete_run_indices,
+    make_opensearch_client,
+    mqtt_settings,
+    new_test_run_id,
+    opensearch_settings,
+    run_index,
+)
+from loadgen import make_reading, positive_float, positive_int
+from publisher import MqttPublisher
+
+# $SYS/broker/<suffix> -> sample key
+SYS_TOPICS = {
+    "messages/received": "received",
+    "messages/sent": "sent",
+    "publish/messages/dropped": "dropped",
+    "store/messages/count": "stored",
+    "clients/connected": "clients",
+    "heap/current": "heap",
+}
+WINDOWS = 8
+
+
+def logstash_api():
+    return os.getenv("IT_LOGSTASH_API", "http://logstash:9600")
+
+
+class SteadyTraffic(threading.Thread):
+    """``nodes`` sensors publishing ``rate`` readings per second each, on spread-out phases, until stopped.
+
+    Unlike loadgen.py nothing is scheduled up front and no future is kept, so
+    memory stays flat however long it runs. With ``track`` the acknowledged
+    sequence numbers are kept in ``acked_seqs`` (chaos.py). A reading the
+    client refuses still uses up its seq.
+    """
+
+    def __init__(self, publisher, run_id, nodes, rate, track=False):
+        super().__init__(daemon=True)
+        self.publisher = publisher
+        self.run_id = run_id
+        self.nodes = nodes
+        self.period = 1.0 / rate
+        self.published = 0
+        self.acked = 0
+        self.failed = 0
+        self.acked_seqs = set() if track else None
+        self._lock = threading.Lock()
+        self._stop_event = threading.Event()
+
+    def stop(self):
+        self._stop_event.set()
+
+    def _on_ack(self, seq, fut):
+        if fut.exception() is None:
+            with self._lock:
+                self.acked += 1
+                if self.acked_seqs is not None:
+                    self.acked_seqs.add(seq)
+
+    def run(self):
+        start = time.time()
+        due = [(start + random.uniform(0, self.period), node) for node in range(self.nodes)]
+        heapq.heapify(due)
+        seq = 0
+        while not self._stop_event.is_set():
+            at, node = due[0]
+            delay = at - time.time()
+            if delay > 0:
+                self._stop_event.wait(delay)
+                continue
+            heapq.heapreplace(due, (at + self.period, node))
+            reading = make_reading(self.run_id, node, seq)
+            seq += 1
+            try:
+                fut = self.publisher.publish(json.dumps(reading))
+            except RuntimeError as e:
+                self.failed += 1
+                if self.failed == 1 or self.failed % 1000 == 0:
+                    print(f"[soak] publish failed ({self.failed} so far): {e}")
+                continue
+            self.published += 1
+            fut.add_done_callback(functools.partial(self._on_ack, reading["seq"]))
+
+
+class BrokerSys:
+    """Keeps the latest value of the mosquitto $SYS topics in SYS_TOPICS (the broker publishes them every sys_interval)."""
+
+    def __init__(self, settings):
+        self.values = {}
+        self._client = mqtt.Client()
+        self._client.username_pw_set(settings["username"], settings["password"])
+        self._client.on_connect = lambda client, userdata, flags, rc: client.subscribe("$SYS/broker/#", qos=0)
+        self._client.on_message = self._on_message
+        self._host, self._port = settings["host"], int(settings["port"])
+
+    def _on_message(self, client, userdata, msg):
+        key = SYS_TOPICS.get(msg.topic[len("$SYS/broker/"):])
+        if key is not None:
+            try:
+                self.values[key] = float(msg.payload)
+            except ValueError:
+                pass
+
+    def start(self):
+        self._client.connect(self._host, self._port, keepalive=30)
+        self._client.loop_start()
+        return self
+
+    def stop(self):
+        self._client.disconnect()
+        self._client.loop_stop()
+
+    def sample(self):
+        if not self.values:
+            raise LookupError("no $SYS values received yet")
+        return dict(self.values)
+
+
+def _gc_ms(collectors, name):
+    return collectors.get(name, {}).get("collection_time_in_millis", 0)
+
+
+def opensearch_vitals(client):
+    """Summed over the cluster's nodes (one, in this stack)."""
+    nodes = client.nodes.stats(metric="jvm,indices,thread_pool", index_metric="indexing")["nodes"].values()
+    out = dict.fromkeys(("heap_used", "heap_max", "gc_young_ms", "gc_old_ms", "gc_old_count", "indexed",
+                         "write_queue", "write_rejected"), 0)
+    for node in nodes:
+        mem, collectors = node["jvm"]["mem"], node["jvm"]["gc"]["collectors"]
+        write = node.get("thread_pool", {}).get("write", {})
+        out["heap_used"] += mem["heap_used_in_bytes"]
+        out["heap_max"] += mem["heap_max_in_bytes"]
+        out["gc_young_ms"] += _gc_ms(collectors, "young")
+        out["gc_old_ms"] += _gc_ms(collectors, "old")
+        out["gc_old_count"] += collectors.get("old", {}).get("collection_count", 0)
+        out["indexed"] += node["indices"]["indexing"]["index_total"]
+        out["write_queue"] += write.get("queue", 0)
+        out["write_rejected"] += write.get("rejected", 0)
+    return out
+
+
+def logstash_vitals(url, timeout=5):
+    with urllib.request.urlopen(f"{url.rstrip('/')}/_node/stats", timeout=timeout) as response:
+        stats = json.load(response)
+    mem, collectors = stats["jvm"]["mem"], stats["jvm"]["gc"]["collectors"]
+    pipelines = stats.get("pipelines", {}).values()
+    return {
+        "heap_used": mem["heap_used_in_bytes"],
+        "heap_max": mem["heap_max_in_bytes"],
+        "gc_young_ms": _gc_ms(collectors, "young"),
+        "gc_old_ms": _gc_ms(collectors, "old"),
+        "in": stats["events"]["in"],
+        "filtered": stats["events"]["filtered"],
+        "out": stats["events"]["out"],
+        "queue_push_ms": stats["events"].get("queue_push_duration_in_millis", 0),
+        "queued": sum(p.get("queue", {}).get("events_count", 0) or 0 for p in pipelines),
+    }
+
+
+class Vitals:
+    """Samples every source; one that fails is recorded as null and tried again next time."""
+
+    def __init__(self, client, index, logstash_url=None, broker=None):
+        self.sources = {"opensearch": lambda: opensearch_vitals(client)}
+        if logstash_url:
+            self.sources["logstash"] = lambda: logstash_vitals(logstash_url)
+        if broker is not None:
+            self.sources["mosquitto"] = broker.sample
+        self.sources["indexed"] = lambda: client.count(index=index, ignore_unavailable=True)["count"]
+        self.errors = dict.fromkeys(self.sources, 0)
+        self.started = time.time()
+
+    def sample(self, traffic):
+        now = time.time()
+        record = {
+            "time": datetime.fromtimestamp(now, timezone.utc).isoformat(timespec="seconds"),
+            "t": round(now - self.started, 1),
+            "published": traffic.published,
+            "acked": traffic.acked,
+            "publish_failed": traffic.failed,
+        }
+        for name, source in self.sources.items():
+            try:
+                record[name] = source()
+            except Exception as e:
+                record[name] = None
+                self.errors[name] += 1
+                if self.errors[name] == 1:
+                    print(f"[soak] {name} not sampled (will keep trying): {e!r}")
+        return record
+
+
+def _slope(points):
+    """Least-squares slope of [(t, y), ...], per second."""
+    n = len(points)
+    if n < 2:
+        return 0.0
+    mt = sum(t for t, _ in points) / n
+    my = sum(y for _, y in points) / n
+    var = sum((t - mt) ** 2 for t, _ in points)
+    return sum((t - mt) * (y - my) for t, y in points) / var if var else 0.0
+
+
+def _mean(values):
+    values = list(values)
+    return sum(values) / len(values) if values else 0.0
+
+
+def _chunks(items, n):
+    size = len(items) / n
+    return [items[round(i * size) : round((i + 1) * size)] for i in range(n)]
+
+
+def heap_floors(points):
+    """[(t, lowest heap_used in the window), ...] for WINDOWS windows of [(t, jvm sample), ...]."""
+    floors = []
+    for window in _chunks(points, WINDOWS):
+        if window:
+            floors.append((_mean(t for t, _ in window), min(v["heap_used"] for _, v in window)))
+    return floors
+
+
+def gc_shares(points):
+    """[(t, share of wall time spent in GC since the previous sample), ...]."""
+    shares = []
+    for (t0, a), (t1, b) in zip(points, points[1:]):
+        gc = (b["gc_young_ms"] + b["gc_old_ms"]) - (a["gc_young_ms"] + a["gc_old_ms"])
+        if t1 > t0 and gc >= 0:  # a restarted JVM resets its counters
+            shares.append((t1, gc / ((t1 - t0) * 1000)))
+    return shares
+
+
+def analyse(samples, heap_growth=0.10, gc_rise=2.0, backlog_rate=0.01):
+    """Summary of a soak series with the ``flags`` that failed; too short a series is not judged."""
+    summary = {"samples": len(samples), "flags": []}
+    if len(samples) < 2 * WINDOWS:
+        summary["note"] = f"fewer than {2 * WINDOWS} samples, not judged"
+        return summary
+    first, last = samples[0], samples[-1]
+    duration = last["t"] - first["t"]
+    publish_rate = (last["acked"] - first["acked"]) / duration if duration else 0.0
+    summary.update(
+        duration_s=round(duration, 1),
+        published=last["published"],
+        acked=last["acked"],
+        indexed=last.get("indexed"),
+        publish_per_sec=round(publish_rate, 2),
+    )
+    flags = summary["flags"]
+
+    for jvm in ("opensearch", "logstash"):
+        points = [(s["t"], s[jvm]) for s in samples if s.get(jvm)]
+        if len(points) < 2 * WINDOWS:
+            continue
+        heap_max = points[-1][1]["heap_max"]
+        floors = heap_floors(points)
+        growth = _slope(floors) * duration / heap_max if heap_max else 0.0
+        shares = gc_shares(points)
+        quarter = max(1, len(shares) // 4)
+        gc_first, gc_last = _mean(s for _, s in shares[:quarter]), _mean(s for _, s in shares[-quarter:])
+        summary[jvm] = {
+            "heap_max_mb": round(heap_max / 1e6, 1),
+            "heap_floor_first_mb": round(floors[0][1] / 1e6, 1),
+            "heap_floor_last_mb": round(floors[-1][1] / 1e6, 1),
+            "heap_floor_mb_per_hour": round(_slope(floors) * 3600 / 1e6, 2),
+            "heap_growth_of_max": round(growth, 4),
+            "gc_share_first_quarter": round(gc_first, 4),
+            "gc_share_last_quarter": round(gc_last, 4),
+        }
+        if growth > heap_growth:
+            flags.append(f"{jvm}: heap floor grew {growth:.0%} of the {heap_max / 1e6:.0f} MB heap over the run")
+        if gc_last > gc_rise * max(gc_first, 0.001):
+            flags.append(f"{jvm}: GC took {gc_last:.1%} of wall time in the last quarter, {gc_first:.1%} in the first")
+
+    backlogs = {
+        "logstash in - out": [(s["t"], s["logstash"]["in"] - s["logstash"]["out"]) for s in samples if s.get("logstash")],
+        "broker stored messages": [(s["t"], s["mosquitto"]["stored"]) for s in samples
+                                   if s.get("mosquitto") and "stored" in s["mosquitto"]],
+        "acked - searchable": [(s["t"], s["acked"] - s["indexed"]) for s in samples if s.get("indexed") is not None],
+    }
+    summary["backlogs"] = {}
+    for name, points in backlogs.items():
+        second_half = points[len(points) // 2 :]
+        if len(second_half) < WINDOWS:
+            continue
+        slope = _slope(second_half)
+        summary["backlogs"][name] = {"last": second_half[-1][1], "growth_per_sec": round(slope, 3)}
+        if slope > max(backlog_rate * publish_rate, 1e-3):
+            flags.append(f"{name}: backlog still growing {slope:.2f}/s over the second half "
+                         f"(publishing {publish_rate:.1f}/s)")
+    return summary
+
+
+def _progress(record):
+    parts = [f"t={record['t']:.0f}s", f"published={record['published']}", f"acked={record['acked']}"]
+    if record.get("indexed") is not None:
+        parts.append(f"searchable={record['indexed']}")
+    for jvm in ("opensearch", "logstash"):
+        v = record.get(jvm)
+        if v:
+            parts.append(f"{jvm}_heap={v['heap_used'] / v['heap_max']:.0%}")
+    if record.get("logstash"):
+        parts.append(f"logstash_in-out={record['logstash']['in'] - record['logstash']['out']}")
+    if record.get("mosquitto") and "stored" in record["mosquitto"]:
+        parts.append(f"broker_stored={record['mosquitto']['stored']:.0f}")
+    print("[soak] " + " ".join(parts))
+
+
+def run(client, settings, duration, nodes=50, rate=0.2, interval=30.0, out=None, logstash_url=None, keep=False,
+        **thresholds):
+    """Drive traffic for ``duration`` seconds, sampling every ``interval``; returns analyse() of the series."""
+    run_id = new_test_run_id()
+    index = run_index(run_id)
+    print(f"[soak] run_id={run_id} nodes={nodes} rate={rate}/s each, {duration:.0f}s, sampling every {interval:.0f}s")
+    samples = []
+    broker = None
+    try:
+        broker = BrokerSys(settings).start()
+    except OSError as e:
+        print(f"[soak] cannot watch $SYS: {e!r}")
+    sink = open(out, "a") if out else None
+    vitals = Vitals(client, index, logstash_url, broker)
+    with MqttPublisher.from_settings(settings, max_inflight=1000) as publisher:
+        traffic = SteadyTraffic(publisher, run_id, nodes, rate)
+        traffic.start()
+        deadline = time.time() + duration
+        try:
+            while True:
+                record = vitals.sample(traffic)
+                samples.append(record)
+                _progress(record)
+                if sink:
+                    sink.write(json.dumps(record) + "\n")
+                    sink.flush()
+                remaining = deadline - time.time()
+                if remaining <= 0:
+                    break
+                time.sleep(min(interval, remaining))
+        except KeyboardInterrupt:
+            print("[soak] interrupted, analysing what was sampled")
+        finally:
+            traffic.stop()
+            traffic.join()
+            if sink:
+                sink.close()
+            if broker is not None:
+                broker.stop()
+    summary = analyse(samples, **thresholds)
+    summary["run_id"] = run_id
+    summary["source_errors"] = vitals.errors
+    if not keep:
+        delete_run_indices(client, run_id)
+    return summary
+
+
+def print_summary(summary):
+    print(f"[soak] {json.dumps({k: v for k, v in summary.items() if k != 'flags'})}")
+    for flag in summary["flags"]:
+        print(f"[soak] FLAG {flag}")
+    if not summary["flags"]:
+        print("[soak] nothing flagged" + (f" ({summary['note']})" if "note" in summary else ""))
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--duration", type=float, default=3600.0, help="seconds of traffic")
+    parser.add_argument("--nodes", type=positive_int, default=50, help="simulated sensors")
+    parser.add_argument("--rate", type=positive_float, default=0.2, help="readings per second per sensor")
+    parser.add_argument("--interval", type=float, default=30.0, help="seconds between samples")
+    parser.add_argument("--out", help="append every sample to this NDJSON file")
+    parser.add_argument("--json", help="also write the summary to this file")
+    parser.add_argument("--analyse", metavar="NDJSON", help="only analyse an earlier run's samples")
+    parser.add_argument("--heap-growth", type=float, default=0.10,
+                        help="flag a heap floor rise above this share of max heap")
+    parser.add_argument("--gc-rise", type=float, default=2.0, help="flag a last/first quarter GC share ratio above this")
+    parser.add_argument("--backlog-rate", type=float, default=0.01,
+                        help="flag a backlog growing faster than this share of the publish rate")
+    parser.add_argument("--keep", action="store_true", help="do not delete the run's index")
+    args = parser.parse_args(argv)
+    thresholds = {"heap_growth": args.heap_growth, "gc_rise": args.gc_rise, "backlog_rate": args.backlog_rate}
+
+    if args.analyse:
+        with open(args.analyse) as f:
+            summary = analyse([json.loads(line) for line in f if line.strip()], **thresholds)
+    elif os.getenv("IT_BACKEND") == "local":
+        from local_stack import LocalStack
+
+        with LocalStack(pipeline=os.getenv("IT_PIPELINE", "reference")) as stack:
+            summary = run(stack.opensearch, stack.mqtt_settings(), args.duration, args.nodes, args.rate, args.interval,
+                          args.out, None, args.keep, **thresholds)
+    else:
+        summary = run(make_opensearch_client(**opensearch_settings()), mqtt_settings(), args.duration, args.nodes,
+                      args.rate, args.interval, args.out, logstash_api(), args.keep, **thresholds)
+
+    print_summary(summary)
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump(summary, f, indent=2)
+    return 1 if summary["flags"] else 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
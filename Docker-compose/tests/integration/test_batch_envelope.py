@@ -0,0 +1,39 @@
+import uuid
+
+import pytest
+
+from helpers import refresh_indices, run_index, wait_for_document
+from publisher import ReadingBatcher
+
+
+@pytest.mark.integration
+def test_batch_envelope_is_split_and_validated_per_reading(opensearch_client, mqtt_publisher, test_run_id):
+    sensors = [f"it-sensors-batch-{uuid.uuid4().hex[:8]}-{i}" for i in range(2)]
+    batcher = ReadingBatcher(mqtt_publisher, max_readings=6, shared={"test_run_id": test_run_id})
+    futures = []
+    for i in range(6):
+        temperature = "hot" if i == 5 else 20.0 + i
+        reading = {"Sensor ID": sensors[i % 2], "temperature": temperature, "humidity": 40, "light": 100 + i,
+                   "timestamp": f"2025-09-20T12:0{i}:00Z"}
+        futures.append(batcher.add(reading))
+    assert futures[:5] == [None] * 5 and futures[5] is not None
+    futures[5].result(timeout=10)
+    assert batcher.sent_messages == 1 and batcher.sent_readings == 6
+
+    error = wait_for_document(opensearch_client, run_index(test_run_id, errors=True),
+                              {"query": {"match_phrase": {"sensor_id": sensors[1]}}}, timeout_seconds=60, refresh=True,
+                              label="batch:error")["_source"]
+    assert error["pipeline_errors"] == ["invalid_temperature"]
+    assert error["light_raw"] == "105"
+
+    index = run_index(test_run_id)
+    body = {"size": 0, "query": {"terms": {"sensor_id": sensors}},
+            "aggs": {"sensors": {"terms": {"field": "sensor_id"}, "aggs": {"light": {"sum": {"field": "light"}}}}}}
+    last = {"query": {"bool": {"filter": [{"match_phrase": {"sensor_id": sensors[0]}}, {"term": {"light": 104}}]}}}
+    wait_for_document(opensearch_client, index, last, timeout_seconds=60, refresh=True, label="batch:last")
+    refresh_indices(opensearch_client, index)
+    buckets = opensearch_client.search(index=index, body=body)["aggregations"]["sensors"]["buckets"]
+    assert {b["key"]: (b["doc_count"], b["light"]["value"]) for b in buckets} == {
+        sensors[0]: (3, 100.0 + 102 + 104),
+        sensors[1]: (2, 101.0 + 103),
+    }
@@ -0,0 +1,37 @@
+import os
+import shutil
+
+import pytest
+
+from chaos import local_action, parse_plan, print_report, run
+from helpers import mqtt_settings
+
+# Against the compose stack this stops real services, so it only runs when asked to.
+CHAOS_PLAN = os.getenv("IT_CHAOS_PLAN")
+
+
+@pytest.mark.integration
+def test_pipeline_outage_is_accounted_for(opensearch_client, local_stack):
+    if local_stack is None:
+        pytest.skip("stopping the ingest pipeline needs IT_BACKEND=local; see test_chaos_plan for the compose stack")
+    report = run(opensearch_client, local_stack.mqtt_settings(), parse_plan("pipeline:stop@2,pipeline:start@4"), 6,
+                 nodes=10, rate=5, act=local_action(local_stack), drain_timeout=30, quiet=2, poll_interval=0.2)
+    print_report(report)
+    assert report["acked"] == report["published"] == report["searchable"] + report["missing_acked"]
+    assert report["duplicate_documents"] == 0
+    # The local broker keeps no sessions: what was published while nothing subscribed is gone, and nothing else.
+    outage, = report["outages"]
+    assert outage["service"] == "pipeline" and outage["down_s"] >= 2
+    assert 0 < outage["lost"] <= report["missing_acked"] <= outage["published_while_down"] + 10
+    assert outage["time_to_recover_s"] is not None
+
+
+@pytest.mark.chaos
+@pytest.mark.skipif(not CHAOS_PLAN, reason="set IT_CHAOS_PLAN, e.g. logstash:stop@30,logstash:start@90")
+# The integration-tests image has neither the docker CLI nor the socket: run this one from the host.
+@pytest.mark.skipif(shutil.which("docker") is None, reason="needs the docker CLI; runs from the host only")
+def test_chaos_plan(opensearch_client):
+    report = run(opensearch_client, mqtt_settings(), parse_plan(CHAOS_PLAN), float(os.getenv("IT_CHAOS_SECONDS", "150")))
+    print_report(report)
+    assert not report["step_errors"]
+    assert report["duplicate_documents"] == 0
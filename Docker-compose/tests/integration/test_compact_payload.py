@@ -0,0 +1,46 @@
+import json
+import uuid
+
+import pytest
+
+import compact
+from helpers import mqtt_settings, run_index, wait_for_document
+
+READING_FIELDS = ("sensor_id", "temperature_c", "humidity_pct", "light", "@timestamp")
+
+
+@pytest.mark.integration
+def test_compact_reading_is_indexed_like_its_json_twin(opensearch_client, local_stack, mqtt_publisher, test_run_id, publish):
+    compact_topic = (local_stack.mqtt_settings() if local_stack is not None else mqtt_settings())["compact_topic"]
+    sensors = {kind: f"it-sensors-{kind}-{uuid.uuid4().hex[:8]}" for kind in ("json", "cbor")}
+    reading = {"temperature": 21.37, "humidity": 45.2, "light": 300, "timestamp": "2025-09-20T12:00:00Z",
+               "test_run_id": test_run_id}
+
+    publish(json.dumps(dict(reading, **{"Sensor ID": sensors["json"]})))
+    data = compact.encode_reading(dict(reading, **{"Sensor ID": sensors["cbor"]}))
+    mqtt_publisher.publish(data, topic=compact_topic).result(timeout=10)
+
+    docs = {
+        kind: wait_for_document(opensearch_client, run_index(test_run_id), {"query": {"match_phrase": {"sensor_id": sensor}}},
+                                timeout_seconds=60, refresh=True, label=f"compact:{kind}")["_source"]
+        for kind, sensor in sensors.items()
+    }
+    for field in READING_FIELDS[1:]:
+        assert docs["cbor"][field] == docs["json"][field]
+    assert docs["cbor"]["tags"] == docs["json"]["tags"]
+
+
+@pytest.mark.integration
+def test_broken_compact_payload_lands_in_the_run_error_index(opensearch_client, local_stack, mqtt_publisher, test_run_id):
+    compact_topic = (local_stack.mqtt_settings() if local_stack is not None else mqtt_settings())["compact_topic"]
+    sensor = f"it-sensors-cbor-{uuid.uuid4().hex[:8]}"
+    data = compact.reading(sensor, "hot", 45.2, 300, test_run_id=test_run_id)
+    mqtt_publisher.publish(data, topic=compact_topic).result(timeout=10)
+
+    query = {"query": {"match_phrase": {"sensor_id": sensor}}}
+    hit = wait_for_document(opensearch_client, run_index(test_run_id, errors=True), query, timeout_seconds=60, refresh=True,
+                            label="compact:error")
+    doc = hit["_source"]
+    assert doc["pipeline_errors"] == ["invalid_temperature"]
+    assert doc["temperature_raw"] == "hot"
+    assert json.loads(doc["message"])["Sensor ID"] == sensor
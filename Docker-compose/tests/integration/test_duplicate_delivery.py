@@ -0,0 +1,62 @@
+import json
+import os
+import time
+import uuid
+
+import pytest
+
+from helpers import refresh_indices, run_index, wait_for_document
+from publisher import batch_envelope
+
+COPIES = 3
+# How long the counts must stay put after the last message is visible, for stragglers from the burst.
+SETTLE_SECONDS = float(os.getenv("IT_DUPLICATE_SETTLE", "3"))
+
+
+def _per_sensor(client, index, sensors):
+    body = {"size": 0, "query": {"terms": {"sensor_id": sensors}},
+            "aggs": {"sensors": {"terms": {"field": "sensor_id"}, "aggs": {"light": {"sum": {"field": "light"}}}}}}
+    refresh_indices(client, index)
+    buckets = client.search(index=index, body=body)["aggregations"]["sensors"]["buckets"]
+    return {b["key"]: (b["doc_count"], b["light"]["value"]) for b in buckets}
+
+
+@pytest.mark.integration
+def test_redelivered_readings_are_indexed_exactly_once(opensearch_client, mqtt_publisher, test_run_id):
+    sensors = [f"it-sensors-dup-{uuid.uuid4().hex[:8]}-{i}" for i in range(3)]
+    # Keyed on sensor + timestamp: every reading is published COPIES times, the copies interleaved.
+    timed = [{"Sensor ID": sensors[i % 3], "temperature": 20.0 + i, "humidity": 40, "light": 10 + i,
+              "timestamp": f"2025-09-21T12:{i:02d}:00Z", "test_run_id": test_run_id} for i in range(12)]
+    messages = [json.dumps(r) for r in timed] * COPIES
+    # Keyed on sensor + seq (which wins over the timestamp), delivered twice as the same batch envelope.
+    counted = [{"temperature": 18.5, "humidity": 50, "light": 1000 + i, "seq": i, "timestamp": "2025-09-21T13:00:00Z"}
+               for i in range(4)]
+    envelope = batch_envelope(counted, {"Sensor ID": sensors[2], "test_run_id": test_run_id})
+    messages += [envelope, envelope]
+    for fut in [mqtt_publisher.publish(m) for m in messages]:
+        fut.result(timeout=10)
+
+    last = {"query": {"bool": {"filter": [{"match_phrase": {"sensor_id": sensors[2]}}, {"term": {"light": 1003}}]}}}
+    index = run_index(test_run_id)
+    wait_for_document(opensearch_client, index, last, timeout_seconds=60, refresh=True, label="duplicates:last")
+
+    expected = {
+        sensors[0]: (4, float(sum(10 + i for i in range(0, 12, 3)))),
+        sensors[1]: (4, float(sum(10 + i for i in range(1, 12, 3)))),
+        sensors[2]: (4 + 4, float(sum(10 + i for i in range(2, 12, 3)) + sum(1000 + i for i in range(4)))),
+    }
+    # Wait for every reading, then make sure no late copy adds to the counts.
+    deadline, settled_at = time.time() + 60, None
+    while True:
+        counts = _per_sensor(opensearch_client, index, sensors)
+        assert all(counts.get(s, (0, 0))[0] <= n for s, (n, _) in expected.items()), (
+            f"duplicates indexed: {counts} from {len(messages)} deliveries of {len(timed) + len(counted)} readings"
+        )
+        if counts == expected:
+            settled_at = settled_at or time.time()
+            if time.time() - settled_at >= SETTLE_SECONDS:
+                break
+        else:
+            settled_at = None
+            assert time.time() < deadline, f"readings missing: {counts} != {expected}"
+        time.sleep(0.5)
@@ -0,0 +1,75 @@
+import csv
+import http.client
+import io
+import threading
+import time
+
+import pytest
+
+from export import CsvWriter, ExportServer, build_query, export, sliced_pages
+from helpers import refresh_indices
+
+SENSORS = ("exp-a", "exp-b", "exp-c")
+
+
+@pytest.fixture(scope="module")
+def history(opensearch_client, test_run_id):
+    """Three sensors, a reading every 15 minutes each, for a little over three days."""
+    index = f"it-run-{test_run_id}-export-sensors"
+    base = 1_758_326_400  # 2025-09-20T00:00:00Z
+    lines = []
+    for i in range(900):
+        ts = time.strftime("%Y-%m-%dT%H:%M:%S.000Z", time.gmtime(base + (i // 3) * 900))
+        lines += [{"index": {"_index": index, "_id": f"{i}"}},
+                  {"@timestamp": ts, "sensor_id": SENSORS[i % 3], "temperature_c": 20.0, "humidity_pct": 50.0,
+                   "light": float(i)}]
+    opensearch_client.bulk(body=lines)
+    refresh_indices(opensearch_client, index)
+    return index
+
+
+def _rows(data):
+    return list(csv.DictReader(io.StringIO(data.decode("utf-8"))))
+
+
+@pytest.mark.integration
+def test_sliced_export_writes_every_matching_row_once(opensearch_client, history):
+    query = build_query(["exp-a", "exp-b"], "2025-09-20T12:00:00Z", "2025-09-22T00:00:00Z")
+    expected = opensearch_client.count(index=history, body={"query": query})["count"]
+    stream = io.BytesIO()
+    report = export(opensearch_client, CsvWriter(stream=stream), history, query, slices=3, page_size=50)
+    rows = _rows(stream.getvalue())
+    assert expected > 100 and report["rows"] == report["total"] == len(rows) == expected
+    assert report["pages"] >= expected // 50 and report["peak_rss_mb"] > 0
+    assert len({row["light"] for row in rows}) == expected
+    assert {row["sensor_id"] for row in rows} == {"exp-a", "exp-b"}
+    assert min(row["@timestamp"] for row in rows) >= "2025-09-20T12:00:00"
+
+
+@pytest.mark.integration
+def test_readers_stop_when_the_consumer_does(opensearch_client, history):
+    pages = sliced_pages(opensearch_client, history, {"match_all": {}}, slices=2, page_size=10)
+    assert len(next(pages)["hits"]) == 10
+    pages.close()
+    assert not [t for t in threading.enumerate() if t.name.startswith("export-slice-")]
+
+
+@pytest.mark.integration
+def test_export_streams_over_http(opensearch_client, history):
+    server = ExportServer(("127.0.0.1", 0), opensearch_client, history, slices=2)
+    threading.Thread(target=server.serve_forever, args=(0.05,), daemon=True).start()
+    conn = http.client.HTTPConnection("127.0.0.1", server.server_address[1], timeout=30)
+    try:
+        conn.request("GET", "/export?sensor_id=exp-c&until=2025-09-21T00:00:00Z")
+        response = conn.getresponse()
+        assert response.status == 200 and response.getheader("Transfer-Encoding") == "chunked"
+        rows = _rows(response.read())
+        assert len(rows) == 96 and {row["sensor_id"] for row in rows} == {"exp-c"}
+        conn.request("GET", "/export?format=xlsx")
+        response = conn.getresponse()
+        assert response.status == 400
+        response.read()
+    finally:
+        conn.close()
+        server.shutdown()
+        server.server_close()
@@ -0,0 +1,22 @@
+import os
+
+import pytest
+
+from fuzz_corpus import check_reference, generate, new_fuzz_run_id, print_report, run
+
+FUZZ_COUNT = int(os.getenv("IT_FUZZ_COUNT", "5000"))
+FUZZ_SEED = int(os.getenv("IT_FUZZ_SEED", "0"))
+
+
+@pytest.mark.integration
+def test_reference_pipeline_matches_fuzz_expectations():
+    mismatches = check_reference(generate(FUZZ_COUNT, FUZZ_SEED))
+    assert not mismatches, f"{len(mismatches)} cases differ, first: {mismatches[0]}"
+
+
+@pytest.mark.integration
+def test_fuzz_corpus_outcomes(opensearch_client, mqtt_publisher):
+    run_id = new_fuzz_run_id()
+    report = run(opensearch_client, mqtt_publisher, generate(FUZZ_COUNT, FUZZ_SEED, run_id), run_id)
+    print_report(report)
+    assert not report["problems"], f"{len(report['problems'])} outcome groups differ from the fuzz expectations"
@@ -0,0 +1,10 @@
+import pytest
+
+from golden_corpus import DEFAULT_CORPUS, load_corpus, print_results, replay
+
+
+@pytest.mark.integration
+def test_reference_pipeline_matches_logstash(opensearch_client, mqtt_publisher, test_run_id):
+    results = replay(opensearch_client, mqtt_publisher, load_corpus(DEFAULT_CORPUS), test_run_id)
+    drift = print_results(results)
+    assert not drift, f"{len(drift)} corpus lines differ between logstash and ingest/sensor_pipeline.py"
@@ -0,0 +1,47 @@
+import json
+import time
+
+import pytest
+
+from helpers import mqtt_settings, refresh_indices, run_index
+from latest import LatestReadings, MqttFeed, warm_up
+
+
+def wait_for(predicate, timeout=10.0):
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        if predicate():
+            return True
+        time.sleep(0.05)
+    return False
+
+
+@pytest.mark.integration
+def test_latest_reading_warms_up_and_follows_mqtt(opensearch_client, local_stack, test_run_id, publish):
+    index = run_index(test_run_id)
+    sensors = [f"it-sensors-latest-{test_run_id}-{i}" for i in range(3)]
+    for sensor in sensors:
+        for minute, temperature in ((0, 18.0), (5, 19.0)):
+            doc = {"@timestamp": f"2025-09-24T12:0{minute}:00.000Z", "sensor_id": sensor, "temperature_c": temperature,
+                   "humidity_pct": 50.0, "light": 100.0, "test_run_id": test_run_id}
+            opensearch_client.index(index=index, body=doc)
+    refresh_indices(opensearch_client, index)
+
+    readings = LatestReadings()
+    settings = dict(local_stack.mqtt_settings() if local_stack is not None else mqtt_settings(), client_id="")
+    feed = MqttFeed(readings, settings).start()
+    try:
+        assert feed.subscribed.wait(10)
+        warmed = warm_up(opensearch_client, readings, indices=index, since="2025-09-24")
+        assert warmed == 3
+        assert readings.get(sensors[0]) is not None
+        assert readings.many(sensors).count(b'"temperature_c": 19.0') == 3
+
+        for sensor, temperature in ((sensors[1], 25.5), (sensors[2], "hot")):
+            payload = {"Sensor ID": sensor, "temperature": temperature, "humidity": 40, "light": 200}
+            publish(json.dumps(dict(payload, test_run_id=test_run_id)))
+        assert wait_for(lambda: b"25.5" in (readings.get(sensors[1]) or b""))
+        assert wait_for(lambda: feed.rejected >= 1)
+        assert b'"temperature_c": 19.0' in readings.get(sensors[2])
+    finally:
+        feed.stop()
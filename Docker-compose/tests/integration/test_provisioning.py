@@ -0,0 +1,22 @@
+import uuid
+
+import pytest
+
+from provision import apply, check
+
+
+@pytest.mark.integration
+def test_templates_are_installed_and_applied_to_new_indices(opensearch_client, local_stack):
+    if local_stack is not None:
+        pytest.skip("index templates and ISM need a real cluster")
+    apply(opensearch_client)
+    assert check(opensearch_client) == []
+
+    index = f"it-sensors-provision-{uuid.uuid4().hex[:8]}"
+    try:
+        opensearch_client.indices.create(index=index)
+        mapping = opensearch_client.indices.get_mapping(index=index)[index]["mappings"]
+        assert mapping["properties"]["sensor_id"]["type"] == "keyword"
+        assert mapping["properties"]["humidity_pct"]["type"] == "float"
+    finally:
+        opensearch_client.indices.delete(index=index, ignore_unavailable=True)
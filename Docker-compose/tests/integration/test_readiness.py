@@ -0,0 +1,54 @@
+import socket
+import threading
+import time
+
+import pytest
+
+import readiness
+
+
+@pytest.fixture
+def stack(local_stack):
+    if local_stack is None:
+        pytest.skip("taking hops down needs IT_BACKEND=local")
+    return local_stack
+
+
+@pytest.mark.integration
+def test_refused_credentials_fail_at_once(opensearch_client, stack):
+    settings = dict(stack.mqtt_settings(), password="wrong")
+    started = time.monotonic()
+    with pytest.raises(readiness.NotReady) as err:
+        readiness.wait_until_ready(opensearch_client, settings, readiness.NO_HOPS, timeout=30)
+    assert err.value.stage == "broker" and "bad username or password" in err.value.detail
+    assert time.monotonic() - started < 10
+
+
+@pytest.mark.integration
+def test_closed_beats_port_names_the_hop(opensearch_client, stack):
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        closed = f"127.0.0.1:{s.getsockname()[1]}"
+    hops = dict(readiness.NO_HOPS, logstash_beats=closed)
+    with pytest.raises(readiness.NotReady) as err:
+        readiness.wait_until_ready(opensearch_client, stack.mqtt_settings(), hops, timeout=2)
+    assert err.value.stage == "logstash-beats"
+
+
+@pytest.mark.integration
+def test_waits_for_a_canary_through_a_late_pipeline(opensearch_client, stack):
+    stack.stop_pipeline()
+    late = threading.Timer(1.5, stack.start_pipeline)
+    late.start()
+    try:
+        report = readiness.wait_until_ready(opensearch_client, stack.mqtt_settings(), readiness.NO_HOPS, timeout=30,
+                                            canary_interval=0.5)
+    finally:
+        late.join()
+    stages = {row["stage"]: row for row in report["stages"]}
+    # Canaries published while nothing subscribed are lost; the first one through came after the restart.
+    assert stages["end-to-end"]["first_canary"] >= 1
+    assert stages["end-to-end"]["took_s"] >= 1.5
+    assert report["total_s"] >= stages["end-to-end"]["ready_at_s"]
+    canaries = {"query": {"prefix": {"sensor_id": "it-sensors-canary-"}}}
+    assert opensearch_client.count(index="it-run-*", body=canaries, ignore_unavailable=True)["count"] == 0
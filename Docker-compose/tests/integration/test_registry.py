@@ -0,0 +1,51 @@
+import json
+import time
+import uuid
+
+import pytest
+
+import sensor_pipeline
+from helpers import run_index, wait_for_document
+from registry import SensorRegistry
+
+
+@pytest.mark.integration
+def test_readings_carry_their_greenhouse_and_unknown_sensors_wait_in_the_error_index(
+    opensearch_client, local_stack, test_run_id, publish
+):
+    if local_stack is None:
+        pytest.skip("the compose stack's logstash gets its registry from the registry service; needs IT_BACKEND=local")
+    sensors = {kind: f"it-sensors-reg-{kind}-{uuid.uuid4().hex[:8]}" for kind in ("known", "late")}
+    records = [{"sensor_id": sensors["known"], "greenhouse_id": "gh-it", "greenhouse_title": "Integration"}]
+    registry = SensorRegistry(lambda: list(records), ttl=3600, debounce=0.05).start()
+    sensor_pipeline.use_registry(registry, required=True)
+    try:
+        def reading(sensor, seq):
+            return json.dumps({"Sensor ID": sensor, "seq": seq, "temperature": 21.5, "humidity": 40, "light": 300,
+                               "timestamp": "2025-09-20T12:00:00Z", "test_run_id": test_run_id})
+
+        publish(reading(sensors["known"], 1))
+        publish(reading(sensors["late"], 1))
+        query = {"query": {"term": {"greenhouse_id": "gh-it"}}}
+        known = wait_for_document(opensearch_client, run_index(test_run_id), query, timeout_seconds=30, refresh=True,
+                                  label="registry:known")["_source"]
+        assert known["sensor_id"] == sensors["known"] and known["greenhouse_title"] == "Integration"
+        unknown = wait_for_document(opensearch_client, run_index(test_run_id, errors=True),
+                                    {"query": {"match_phrase": {"sensor_id": sensors["late"]}}},
+                                    timeout_seconds=30, refresh=True, label="registry:unknown")["_source"]
+        assert unknown["pipeline_errors"] == ["unknown_sensor"]
+
+        # Registered later: the change notice reloads the table, no per-event lookup involved.
+        records.append({"sensor_id": sensors["late"], "greenhouse_id": "gh-it"})
+        registry.invalidate("test registered a sensor")
+        deadline = time.time() + 10
+        while registry.get(sensors["late"]) is None and time.time() < deadline:
+            time.sleep(0.02)
+        publish(reading(sensors["late"], 2))
+        query = {"query": {"bool": {"filter": [{"term": {"greenhouse_id": "gh-it"}},
+                                               {"match_phrase": {"sensor_id": sensors["late"]}}]}}}
+        assert wait_for_document(opensearch_client, run_index(test_run_id), query, timeout_seconds=30, refresh=True,
+                                 label="registry:registered")["_source"]["seq"] == 2
+    finally:
+        sensor_pipeline.use_registry(None)
+        registry.stop()
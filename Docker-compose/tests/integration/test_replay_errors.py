@@ -0,0 +1,55 @@
+import json
+
+import pytest
+
+from helpers import refresh_indices, run_index
+from replay_errors import replay
+
+
+def error_doc(run_id, sensor_id, humidity, timestamp):
+    """What the pipeline stored for a reading rejected under an older, stricter rule."""
+    message = json.dumps(
+        {"Sensor ID": sensor_id, "temperature": 21.5, "humidity": humidity, "light": 300, "test_run_id": run_id}
+    )
+    return {
+        "@timestamp": timestamp,
+        "message": message,
+        "sensor_id": sensor_id,
+        "test_run_id": run_id,
+        "tags": ["mqtt", "ghanode", "ingest_error"],
+        "pipeline_errors": ["invalid_humidity"],
+        "temperature_raw": "21.5",
+        "humidity_raw": str(humidity),
+        "light_raw": "300",
+    }
+
+
+@pytest.mark.integration
+def test_replay_recovers_readings_with_original_timestamp(opensearch_client, test_run_id):
+    errors_index = run_index(test_run_id, errors=True)
+    sensors_index = run_index(test_run_id)
+    seeded = {
+        "fixed-1": error_doc(test_run_id, "it-sensors-replay-1", "41", "2025-09-20T08:00:00.000Z"),
+        "fixed-2": error_doc(test_run_id, "it-sensors-replay-2", "42.5", "2025-09-20T09:00:00.000Z"),
+        "fixed-3": error_doc(test_run_id, "it-sensors-replay-3", "43", "2025-09-20T10:00:00.000Z"),
+        "broken": error_doc(test_run_id, "it-sensors-replay-4", "wet", "2025-09-20T11:00:00.000Z"),
+    }
+    for doc_id, doc in seeded.items():
+        opensearch_client.index(index=errors_index, id=doc_id, body=doc)
+    refresh_indices(opensearch_client, errors_index)
+
+    # The run's error index is shared with the other scenarios, so only replay what was seeded here.
+    query = {"terms": {"sensor_id": [doc["sensor_id"] for doc in seeded.values()]}}
+    report = replay(opensearch_client, indices=errors_index, query=query, page_size=2, delete=True)
+    print(f"[replay] {report}")
+    assert report["scanned"] == 4
+    assert report["recovered"] == 3 and report["deleted"] == 3
+    assert report["still_invalid"] == 1
+
+    refresh_indices(opensearch_client, f"{errors_index},{sensors_index}")
+    recovered = opensearch_client.get(index=sensors_index, id="fixed-2")["_source"]
+    assert recovered["@timestamp"] == "2025-09-20T09:00:00.000Z"
+    assert recovered["humidity_pct"] == 42.5
+    assert "replayed" in recovered["tags"] and "ingest_error" not in recovered["tags"]
+    left = opensearch_client.search(index=errors_index, body={"query": query})["hits"]["hits"]
+    assert [hit["_id"] for hit in left] == ["broken"]
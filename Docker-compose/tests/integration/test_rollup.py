@@ -0,0 +1,49 @@
+import time
+
+import pytest
+
+from helpers import refresh_indices
+from rollup import align, iso, run_once
+
+
+def seed(client, index, base_ms, readings):
+    lines = []
+    for i, (sensor, offset_s, temperature) in enumerate(readings):
+        doc = {"@timestamp": iso(base_ms + offset_s * 1000), "sensor_id": sensor,
+               "temperature_c": temperature, "humidity_pct": 50.0, "light": 100.0}
+        lines += [{"index": {"_index": index}}, doc]
+    client.bulk(body=lines)
+    refresh_indices(client, index)
+
+
+def rollups(client, pattern, sensor):
+    refresh_indices(client, pattern)
+    res = client.search(index=pattern, body={"query": {"term": {"sensor_id": sensor}}, "size": 100,
+                                             "sort": [{"@timestamp": "asc"}]})
+    return [hit["_source"] for hit in res["hits"]["hits"]]
+
+
+@pytest.mark.integration
+def test_rollup_is_incremental_and_idempotent(opensearch_client, test_run_id):
+    raw = f"it-run-{test_run_id}-rollupsrc-sensors"
+    prefix = f"it-run-{test_run_id}-rollup-"
+    opts = {"raw_indices": raw, "prefix": prefix, "state_index": f"it-run-{test_run_id}-rollupstate"}
+    base = align(int(time.time() * 1000) - 2 * 3600_000, 3600_000)
+    seed(opensearch_client, raw, base, [("a", 0, 20.0), ("a", 20, 22.0), ("a", 70, 30.0), ("b", 10, 10.0)])
+
+    report = run_once(opensearch_client, settle_ms=0, **opts)
+    assert report["buckets_1m"] == 3 and report["buckets_1h"] == 2
+    minute = rollups(opensearch_client, f"{prefix}1m-*", "a")
+    assert [(m["doc_count"], m["temperature_c_min"], m["temperature_c_max"]) for m in minute] == [(2, 20.0, 22.0), (1, 30.0, 30.0)]
+    hour = rollups(opensearch_client, f"{prefix}1h-*", "a")
+    assert len(hour) == 1 and hour[0]["doc_count"] == 3 and hour[0]["temperature_c_avg"] == pytest.approx(24.0)
+
+    # Nothing new inside the lateness window: nothing is re-aggregated.
+    assert run_once(opensearch_client, settle_ms=0, **opts)["buckets_1m"] == 0
+
+    # A straggler for an old minute is folded in when the window reaches back far enough, without duplicates.
+    seed(opensearch_client, raw, base, [("a", 30, 26.0)])
+    run_once(opensearch_client, settle_ms=0, lateness_ms=3 * 3600_000, **opts)
+    minute = rollups(opensearch_client, f"{prefix}1m-*", "a")
+    assert [m["doc_count"] for m in minute] == [3, 1]
+    assert rollups(opensearch_client, f"{prefix}1h-*", "a")[0]["doc_count"] == 4
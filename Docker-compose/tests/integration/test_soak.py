@@ -0,0 +1,26 @@
+import os
+
+import pytest
+
+from helpers import mqtt_settings
+from soak import logstash_api, print_summary, run
+
+SOAK_SECONDS = float(os.getenv("IT_SOAK_SECONDS", "0"))
+
+
+@pytest.mark.soak
+@pytest.mark.skipif(not SOAK_SECONDS, reason="set IT_SOAK_SECONDS to run a soak")
+def test_soak(opensearch_client, local_stack):
+    settings = local_stack.mqtt_settings() if local_stack is not None else mqtt_settings()
+    summary = run(
+        opensearch_client,
+        settings,
+        SOAK_SECONDS,
+        nodes=int(os.getenv("IT_SOAK_NODES", "50")),
+        rate=float(os.getenv("IT_SOAK_RATE", "0.2")),
+        interval=float(os.getenv("IT_SOAK_INTERVAL", "30")),
+        out=os.getenv("IT_SOAK_OUT"),
+        logstash_url=None if local_stack is not None else logstash_api(),
+    )
+    print_summary(summary)
+    assert not summary["flags"]
@@ -0,0 +1,10 @@
+import os
+import sys
+
+INGEST_DIR = os.path.abspath(os.path.join(os.path.dirname(__file__), "..", "..", "ingest"))
+if INGEST_DIR not in sys.path:
+    sys.path.append(INGEST_DIR)
+# The pure parts of the integration tooling (soak analysis, phase budgets) are tested here too.
+INTEGRATION_DIR = os.path.abspath(os.path.join(os.path.dirname(__file__), "..", "integration"))
+if INTEGRATION_DIR not in sys.path:
+    sys.path.append(INTEGRATION_DIR)
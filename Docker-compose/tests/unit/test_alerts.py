@@ -0,0 +1,134 @@
+import json
+import random
+import threading
+import time
+from datetime import datetime, timedelta, timezone
+
+import pytest
+
+import sensor_pipeline
+from alerts import STATS, AlertEngine, QueuedSink, Receiver, Rule, Window, load_rules, scan_stat, webhook_sink
+
+START = datetime(2025, 9, 24, 12, tzinfo=timezone.utc)
+
+
+def doc(sensor_id, seconds, temperature=20.0, humidity=50.0):
+    return {"sensor_id": sensor_id, "@timestamp": sensor_pipeline.stamp(START + timedelta(seconds=seconds)),
+            "temperature_c": temperature, "humidity_pct": humidity, "light": 100.0}
+
+
+class Clock:
+    def __init__(self):
+        self.now = 1_000_000.0
+
+    def __call__(self):
+        return self.now
+
+
+def engine_with(*specs):
+    alerts = []
+    clock = Clock()
+    return AlertEngine([Rule(s) for s in specs], alerts.append, clock=clock), alerts, clock
+
+
+def test_window_stats_match_a_rescan_through_eviction_and_capacity():
+    rng = random.Random(7)
+    window = Window(30, capacity=8)
+    t = 0.0
+    for _ in range(500):
+        t += rng.choice([0.0, 0.5, 1.0, 3.0, 12.0])
+        if not window.push(t, round(rng.uniform(-5, 5), 1)):
+            continue
+        expected = list(window.samples)
+        assert len(expected) <= 8 and expected[-1][0] - expected[0][0] <= 30
+        for stat in STATS:
+            assert window.stat(stat) == pytest.approx(scan_stat(expected, stat)), stat
+
+
+def test_late_and_repeated_readings_are_left_out():
+    window = Window(60)
+    assert window.push(10.0, 1.0)
+    assert not window.push(10.0, 1.0)
+    assert not window.push(9.0, 5.0)
+    assert window.push(10.0, 2.0)
+    assert [v for _, v in window.samples] == [1.0, 2.0]
+    assert window.stat("rate") is None
+
+
+def test_threshold_fires_once_and_resolves_once():
+    engine, alerts, _ = engine_with({"name": "hot", "field": "temperature_c", "stat": "max", "op": ">", "value": 30,
+                                     "window_s": 60})
+    for seconds, temperature in [(0, 25), (10, 31), (20, 32), (30, 25), (75, 25), (85, 24)]:
+        engine.offer(doc("a", seconds, temperature))
+    assert [(a["state"], a["observed"]) for a in alerts] == [("firing", 31.0), ("resolved", 25.0)]
+    assert alerts[0]["reading_at"] == "2025-09-24T12:00:10.000Z" and alerts[0]["window_s"] == 60
+    assert engine.evaluations == 6 and engine.firing() == []
+
+
+def test_rate_of_change_is_per_minute_and_sensors_are_separate():
+    engine, alerts, _ = engine_with({"name": "heating", "field": "temperature_c", "stat": "rate", "op": ">",
+                                     "value": 1.5, "window_s": 600, "sensors": "gh1-*"})
+    for minute in range(4):
+        engine.offer(doc("gh1-a", minute * 60, 20 + 2 * minute))
+        engine.offer(doc("gh1-b", minute * 60, 20 + minute))
+        engine.offer(doc("gh2-a", minute * 60, 20 + 5 * minute))
+    assert [(a["sensor_id"], a["observed"]) for a in alerts] == [("gh1-a", 2.0)]
+
+
+def test_late_reading_is_counted_not_evaluated():
+    engine, alerts, _ = engine_with({"name": "cold", "field": "temperature_c", "op": "<", "value": 5})
+    engine.offer(doc("a", 10, 20))
+    assert engine.offer(doc("a", 5, 1)) == 0
+    assert engine.late == 1 and alerts == []
+
+
+def test_silent_sensor_goes_stale_once_and_recovers_when_heard_again():
+    engine, alerts, clock = engine_with({"name": "silent", "stale_after_s": 60})
+    engine.offer(doc("a", 0))
+    engine.offer(doc("b", 0))
+    clock.now += 30
+    engine.offer(doc("b", 30))
+    clock.now += 45
+    assert engine.sweep() == 1
+    assert engine.sweep() == 0
+    assert [(a["sensor_id"], a["state"], a["observed"]) for a in alerts] == [("a", "firing", 75.0)]
+    engine.offer(doc("a", 80))
+    assert [(a["sensor_id"], a["state"]) for a in alerts[1:]] == [("a", "resolved")]
+
+
+@pytest.mark.parametrize("spec, message", [
+    ({"field": "temperature_c", "op": ">", "value": 1}, "without a name"),
+    ({"name": "x", "field": "temperature_c", "op": "!=", "value": 1}, "unknown '!='"),
+    ({"name": "x", "field": "temperature_c", "stat": "median", "op": ">", "value": 1}, "stat must be one of"),
+    ({"name": "x", "stale_after_s": 0}, "must be positive"),
+])
+def test_malformed_rules_are_refused(spec, message):
+    with pytest.raises(ValueError, match=message):
+        Rule(spec)
+
+
+def test_default_rules_load_and_names_must_be_unique(tmp_path):
+    assert {rule.kind for rule in load_rules()} == {"threshold", "stale"}
+    path = tmp_path / "rules.json"
+    path.write_text(json.dumps([{"name": "a", "stale_after_s": 5}, {"name": "a", "stale_after_s": 9}]))
+    with pytest.raises(ValueError, match="duplicate"):
+        load_rules(str(path))
+
+
+def test_webhook_sink_delivers_off_the_evaluating_thread():
+    receiver = Receiver(("127.0.0.1", 0))
+    threading.Thread(target=receiver.serve_forever, args=(0.05,), daemon=True).start()
+    sink = QueuedSink("webhook", webhook_sink(f"http://127.0.0.1:{receiver.server_address[1]}/alerts"))
+    try:
+        engine = AlertEngine([Rule({"name": "hot", "field": "temperature_c", "op": ">", "value": 30})], sink)
+        engine.offer(doc("a", 0, 35))
+        sink.queue.join()
+        deadline = time.time() + 5
+        while not receiver.received and time.time() < deadline:
+            time.sleep(0.01)
+        assert [(a["rule"], a["state"]) for a in receiver.received] == [("hot", "firing")]
+        assert sink.delivered == 1 and sink.failed == 0
+    finally:
+        sink.close()
+        receiver.shutdown()
+        receiver.server_close()
@@ -0,0 +1,65 @@
+import asyncio
+import json
+from datetime import datetime, timezone
+
+from bridge import IngestBridge, encode
+
+RECEIVED = datetime(2025, 9, 24, 12, 0, tzinfo=timezone.utc)
+
+
+class FlakyBulkClient:
+    """Answers each bulk call with the next list of per-item statuses."""
+
+    def __init__(self, *rounds):
+        self.rounds = list(rounds)
+        self.bodies = []
+
+    def bulk(self, body):
+        self.bodies.append(body)
+        statuses = self.rounds.pop(0)
+        return {"errors": True, "items": [{"index": {"status": s, "_index": "x"}} for s in statuses]}
+
+
+def reading(sensor_id, **extra):
+    return json.dumps({"Sensor ID": sensor_id, "temperature": 21, "humidity": 40, "light": 5, **extra})
+
+
+def test_encode_routes_like_logstash():
+    action, source = encode(reading("it-sensors-a"), RECEIVED).decode().splitlines()
+    assert json.loads(action) == {"index": {"_index": "it-sensors-2025.09.24"}}
+    doc = json.loads(source)
+    assert doc["temperature_c"] == 21.0
+    assert doc["@timestamp"] == "2025-09-24T12:00:00.000Z"
+    assert doc["tags"] == ["mqtt", "ghanode"]
+
+
+def test_timestamped_reading_is_written_under_a_deterministic_id():
+    message = reading("abcdef", timestamp="2025-09-24T10:00:00Z")
+    first, again = encode(message, RECEIVED), encode(message, datetime.now(timezone.utc))
+    assert first.split(b"\n")[0] == again.split(b"\n")[0]
+    assert json.loads(first.split(b"\n")[0]) == {"index": {"_index": "sensors-2025.09.24", "_id": "abcdef:2025-09-24T10:00:00.000Z"}}
+
+
+def test_retryable_items_are_resent_and_rejected_ones_dropped():
+    client = FlakyBulkClient([201, 429, 400], [201])
+    bridge = IngestBridge(client, {}, max_retry_delay=0.01)
+    batch = [encode(reading(f"s{i}"), RECEIVED) for i in range(3)]
+    asyncio.run(bridge._send(batch))
+    assert bridge.stats.indexed == 2
+    assert bridge.stats.rejected == 1
+    assert bridge.stats.retried == 1
+    assert client.bodies[1] == batch[1]
+
+
+def test_batches_are_cut_at_batch_size():
+    async def scenario():
+        bridge = IngestBridge(None, {}, batch_size=3, flush_interval=0.05)
+        bridge.loop = asyncio.get_running_loop()
+        bridge.queue = asyncio.Queue(10)
+        for i in range(5):
+            bridge.queue.put_nowait(b"x")
+        first, _ = await bridge._next_batch()
+        second, _ = await asyncio.wait_for(bridge._next_batch(), 1)
+        return len(first), len(second)
+
+    assert asyncio.run(scenario()) == (3, 2)
@@ -0,0 +1,116 @@
+import json
+from datetime import datetime, timezone
+
+import pytest
+
+import compact
+import sensor_pipeline
+
+RECEIVED = datetime(2025, 9, 24, 12, 0, tzinfo=timezone.utc)
+
+
+@pytest.mark.parametrize(
+    "value",
+    [0, 23, 24, 255, 65536, -1, -500, 2**63, 21.5, 21.37, -0.1, 0.30000000000000004, 1e30, 3.4e38, "", "gh1-a", "é",
+     True, False, None, [1, "a", [2.5]], {"a": {"b": [None]}}],
+)
+def test_round_trip(value):
+    assert compact.decode(compact.encode(value)) == value
+
+
+def test_known_encodings():
+    # RFC 8949 appendix A vectors for the forms the encoder picks.
+    assert compact.encode(1.5).hex() == "f93e00"
+    assert compact.encode(100000.0).hex() == "fa47c35000"
+    assert compact.encode(-1000).hex() == "3903e7"
+    assert compact.encode(273.15).hex() == "c48221196ab3"
+    assert compact.decode(bytes.fromhex("c48221196ab3")) == 273.15
+
+
+def test_readings_are_shortest_exact_and_decode_like_json():
+    reading = {"Sensor ID": "gh1-node-07", "temperature": 21.37, "humidity": 45.2, "light": 300, "timestamp": 1758715200}
+    data = compact.encode_reading(reading)
+    text = json.dumps(dict(reading, timestamp="2025-09-24T12:00:00Z"))
+    assert len(data) < len(text) / 2
+    assert compact.decode_reading(data) == json.loads(text)
+
+
+@pytest.mark.parametrize("seconds, text", [(1758700000.123, "2025-09-24T07:46:40.123Z"),
+                                           (1758700000.001, "2025-09-24T07:46:40.001Z"),
+                                           (1758700000.9996, "2025-09-24T07:46:41Z")])
+def test_epoch_timestamps_keep_their_milliseconds(seconds, text):
+    assert compact.decode_reading(compact.reading("s1", 20, 40, 5, timestamp=seconds))["timestamp"] == text
+
+
+def test_unknown_keys_and_iso_timestamps_pass_through():
+    data = compact.reading("s1", 20, 40, 5, timestamp="2025-09-24T12:00:00Z+200", test_run_id="abc", note="x")
+    assert compact.decode_reading(data) == {"Sensor ID": "s1", "temperature": 20, "humidity": 40, "light": 5,
+                                            "timestamp": "2025-09-24T12:00:00Z+200", "test_run_id": "abc", "note": "x"}
+
+
+@pytest.mark.parametrize("hexdata", ["", "a1", "63616263ff", "f97c00", "fb7ff8000000000000", "5f", "4161", "1a0001", "c48219"])
+def test_malformed_payloads_are_rejected(hexdata):
+    with pytest.raises(ValueError):
+        compact.decode(bytes.fromhex(hexdata))
+
+
+def test_non_finite_floats_are_not_encoded():
+    with pytest.raises(ValueError):
+        compact.encode(float("nan"))
+
+
+def _same_outcome(json_text, data):
+    json_index, json_event = sensor_pipeline.process(json_text, RECEIVED)
+    cbor_index, cbor_event = sensor_pipeline.process_compact(data, RECEIVED)
+    for event in (json_event, cbor_event):
+        event.pop("stages")
+    assert cbor_index == json_index
+    return sensor_pipeline.to_document(json_event), sensor_pipeline.to_document(cbor_event)
+
+
+@pytest.mark.parametrize(
+    "payload",
+    [
+        {"Sensor ID": "s1", "temperature": 21.37, "humidity": 45, "light": 300.5, "timestamp": "2025-09-24T10:00:00Z"},
+        {"Sensor ID": "s1", "temperature": "21,5", "humidity": 45, "light": 3},
+        {"Sensor ID": "s1", "temperature": "hot", "humidity": True, "light": [1, 2]},
+        {"temperature": 21.0, "humidity": 45, "light": 3, "test_run_id": "abc123"},
+    ],
+)
+def test_compact_payloads_validate_and_route_like_json(payload):
+    json_doc, cbor_doc = _same_outcome(json.dumps(payload), compact.encode_reading(payload))
+    if json_doc.get("pipeline_errors"):
+        assert json.loads(cbor_doc.pop("message")) == json.loads(json_doc.pop("message"))
+    assert cbor_doc == json_doc
+
+
+def test_undecodable_compact_payload_goes_to_the_error_index():
+    index, event = sensor_pipeline.process_compact(b"\xa1\x00", RECEIVED)
+    assert index == "sensors-errors-2025.09.24"
+    assert event["pipeline_errors"][0] == "missing_sensor_id"
+    assert "_cborparsefailure" in event["tags"]
+    assert event["message"] == "a100"
+
+
+@pytest.mark.parametrize("payload", [b"\x81" * 5000, b"\xc4" * 5000, b"\xa1\x07" * 3000])
+def test_deeply_nested_payloads_go_to_the_error_index(payload):
+    with pytest.raises(ValueError, match="nested"):
+        compact.decode(payload)
+    (index, event), = sensor_pipeline.process_compact_all(payload, RECEIVED)
+    assert index == "sensors-errors-2025.09.24" and "_cborparsefailure" in event["tags"]
+
+
+def test_bench_reports_both_paths():
+    report = compact.bench(readings=200)
+    assert report["bytes_per_reading"]["cbor"] < report["bytes_per_reading"]["json"]
+    assert set(report["cpu_us_per_reading"]) >= {"json_pipeline", "cbor_pipeline"}
+
+
+def test_compact_batch_envelope_splits_like_json():
+    envelope = {"Sensor ID": "s1", "readings": [{"temperature": 21.37, "humidity": 45, "light": 3, "timestamp": 1758715200},
+                                                {"temperature": "hot", "humidity": 45, "light": 3}]}
+    pairs = sensor_pipeline.process_compact_all(compact.encode_reading(envelope), RECEIVED)
+    assert [sensor_pipeline.index_family(index) for index, _ in pairs] == ["sensors", "sensors-errors"]
+    assert pairs[0][1]["temperature_c"] == 21.37
+    assert pairs[0][1]["@timestamp"] == datetime(2025, 9, 24, 12, 0, tzinfo=timezone.utc)
+    assert json.loads(pairs[1][1]["message"]) == {"Sensor ID": "s1", "temperature": "hot", "humidity": 45, "light": 3}
@@ -0,0 +1,59 @@
+import csv
+import gzip
+import io
+
+import pytest
+
+from export import COLUMNS, CsvWriter, ParquetWriter, build_query
+
+
+def hits(n, start_ms=1_758_000_000_000):
+    return [
+        {"_source": {"@timestamp": f"2025-09-16T05:{i // 60:02d}:{i % 60:02d}.000Z", "sensor_id": f"s{i % 3}",
+                     "temperature_c": 20.0 + i, "humidity_pct": 50.0, "light": None if i == 1 else float(i)},
+         "sort": [start_ms + i * 1000, i]}
+        for i in range(n)
+    ]
+
+
+def test_query_filters():
+    assert build_query() == {"match_all": {}}
+    query = build_query(["a", "b"], since="2025-03-01", sensor_field="sensor_id.keyword")
+    assert query["bool"]["filter"] == [
+        {"terms": {"sensor_id.keyword": ["a", "b"]}},
+        {"range": {"@timestamp": {"gte": "2025-03-01"}}},
+    ]
+
+
+def test_csv_is_split_into_chunks_of_exactly_chunk_rows(tmp_path):
+    writer = CsvWriter(str(tmp_path / "readings.csv.gz"), chunk_rows=5)
+    for page in (hits(12)[:7], hits(12)[7:]):
+        writer.write(page)
+    written = writer.close()
+    assert [p.rsplit("/", 1)[1] for p in written["files"]] == [f"readings-0000{i}.csv.gz" for i in range(3)]
+    parts = [list(csv.reader(gzip.open(p, "rt", newline=""))) for p in written["files"]]
+    assert all(part[0] == list(COLUMNS) for part in parts)
+    assert [len(part) - 1 for part in parts] == [5, 5, 2]
+    assert parts[0][2] == ["2025-09-16T05:00:01.000Z", "s1", "21.0", "50.0", ""]
+    assert written["bytes"] == sum((tmp_path / p.rsplit("/", 1)[1]).stat().st_size for p in written["files"])
+
+
+def test_empty_csv_export_still_has_a_header():
+    stream = io.BytesIO()
+    written = CsvWriter(stream=stream).close()
+    assert stream.getvalue() == b"@timestamp,sensor_id,temperature_c,humidity_pct,light\r\n"
+    assert written == {"files": [], "bytes": len(stream.getvalue())}
+
+
+def test_parquet_takes_timestamps_from_the_sort_values():
+    pq = pytest.importorskip("pyarrow.parquet")
+    stream = io.BytesIO()
+    writer = ParquetWriter(stream, row_group=4)
+    writer.write(hits(10))
+    written = writer.close()
+    table = pq.read_table(io.BytesIO(stream.getvalue()))
+    assert written["bytes"] == len(stream.getvalue())
+    assert table.num_rows == 10 and pq.ParquetFile(io.BytesIO(stream.getvalue())).num_row_groups == 3
+    rows = table.to_pylist()
+    assert rows[1]["@timestamp"].isoformat() == "2025-09-16T05:20:01+00:00" and rows[1]["light"] is None
+    assert [r["sensor_id"] for r in rows[:3]] == ["s0", "s1", "s2"]
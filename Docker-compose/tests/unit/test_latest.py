@@ -0,0 +1,60 @@
+import http.client
+import json
+import threading
+
+import pytest
+
+from latest import LatestReadings, LatestServer
+
+
+def reading(sensor_id, timestamp, temperature):
+    return {"sensor_id": sensor_id, "@timestamp": timestamp, "temperature_c": temperature, "humidity_pct": 40.0,
+            "light": 10.0, "tags": ["mqtt"]}
+
+
+def test_newer_reading_wins_whatever_the_arrival_order():
+    readings = LatestReadings()
+    assert readings.offer(reading("a", "2025-09-24T12:00:01.000Z", 21.0))
+    assert not readings.offer(reading("a", "2025-09-24T12:00:00.000Z", 20.0))
+    assert readings.offer(reading("a", "2025-09-24T12:00:01.000Z", 22.0))
+    assert json.loads(readings.get("a")) == {
+        "sensor_id": "a", "@timestamp": "2025-09-24T12:00:01.000Z", "temperature_c": 22.0, "humidity_pct": 40.0,
+        "light": 10.0,
+    }
+    assert readings.out_of_order == 1
+    assert json.loads(readings.many(["a", "missing"]))["missing"] is None
+
+
+@pytest.fixture
+def server():
+    readings = LatestReadings()
+    readings.offer(reading("a", "2025-09-24T12:00:00.000Z", 21.0))
+    readings.offer(reading("b/1", "2025-09-24T12:00:00.000Z", 19.0))
+    server = LatestServer(("127.0.0.1", 0), readings)
+    threading.Thread(target=server.serve_forever, args=(0.05,), daemon=True).start()
+    yield server
+    server.shutdown()
+    server.server_close()
+
+
+def call(server, method, path, body=None):
+    conn = http.client.HTTPConnection(*server.server_address, timeout=5)
+    try:
+        conn.request(method, path, body=body)
+        response = conn.getresponse()
+        return response.status, json.loads(response.read())
+    finally:
+        conn.close()
+
+
+def test_single_and_batch_lookups(server):
+    assert call(server, "GET", "/latest/a")[1]["temperature_c"] == 21.0
+    assert call(server, "GET", "/latest/b%2F1")[1]["temperature_c"] == 19.0
+    assert call(server, "GET", "/latest/zzz")[0] == 404
+    status, batch = call(server, "GET", "/latest?sensor_id=a,zzz")
+    assert status == 200 and batch["a"]["temperature_c"] == 21.0 and batch["zzz"] is None
+    assert set(call(server, "GET", "/latest")[1]) == {"a", "b/1"}
+    status, batch = call(server, "POST", "/latest", json.dumps({"sensor_ids": ["b/1"]}))
+    assert status == 200 and list(batch) == ["b/1"]
+    assert call(server, "POST", "/latest", "{}")[0] == 400
+    assert call(server, "GET", "/health")[1]["sensors"] == 2
@@ -0,0 +1,57 @@
+import json
+from types import SimpleNamespace
+
+import pytest
+
+from phases import PhaseRecorder, budget_for, compare
+
+BASELINE = {"t::a": {"visibility": 2.0, "cleanup": 0.1}, "t::b": {"publish_ack": 0.01}}
+
+
+def test_only_phases_past_their_budget_are_regressions():
+    budget = {"ratio": 0.5, "slack_s": 1.0, "phases": {"cleanup": {"slack_s": 0.05}}}
+    assert budget_for(budget, "cleanup") == {"ratio": 0.5, "slack_s": 0.05}
+    current = {"t::a": {"visibility": 5.0, "cleanup": 0.2}, "t::b": {"publish_ack": 1.0}, "t::new": {"call": 60.0}}
+    assert [(r["test"], r["phase"], r["limit_s"]) for r in compare(BASELINE, current, budget)] == [
+        ("t::a", "visibility", 4.0)]
+    current["t::a"]["cleanup"] = 0.21
+    assert [r["phase"] for r in compare(BASELINE, current, budget)] == ["visibility", "cleanup"]
+
+
+def test_profiles_can_tighten_the_budget():
+    budget = {"ratio": 0.5, "slack_s": 1.0, "phases": {"cleanup": {"slack_s": 0.05}},
+              "profiles": {"local-reference": {"slack_s": 0.25, "phases": {"cleanup": {"ratio": 1.0}}}}}
+    assert budget_for(budget, "visibility", "local-reference") == {"ratio": 0.5, "slack_s": 0.25}
+    assert budget_for(budget, "cleanup", "local-reference") == {"ratio": 1.0, "slack_s": 0.05}
+    assert budget_for(budget, "visibility", "docker") == {"ratio": 0.5, "slack_s": 1.0}
+    current = {"t::a": {"visibility": 3.5, "cleanup": 0.2}}
+    assert compare(BASELINE, current, budget, "docker") == []
+    assert [(r["phase"], r["limit_s"]) for r in compare(BASELINE, current, budget, "local-reference")] == [
+        ("visibility", 3.25)]
+
+
+def test_recorder_fails_a_green_run_that_regressed_and_records_baselines(tmp_path, monkeypatch):
+    monkeypatch.setenv("IT_BACKEND", "local")
+    monkeypatch.setenv("IT_PIPELINE", "reference")
+    baseline_path = tmp_path / "baseline.json"
+
+    recorder = PhaseRecorder(str(baseline_path), update=True)
+    recorder.tests = {"t::a": {"visibility": 2.0}, "t::skipped": {}}
+    recorder.pytest_sessionfinish(SimpleNamespace(exitstatus=0), pytest.ExitCode.OK)
+    stored = json.loads(baseline_path.read_text())
+    assert stored["profiles"] == {"local-reference": {"t::a": {"visibility": 2.0}}} and recorder.baseline_written
+
+    report_path = tmp_path / "report.json"
+    recorder = PhaseRecorder(str(baseline_path), str(report_path))
+    recorder.tests = {"t::a": {"visibility": 4.5}}
+    session = SimpleNamespace(exitstatus=0)
+    recorder.pytest_sessionfinish(session, pytest.ExitCode.OK)
+    assert session.exitstatus == pytest.ExitCode.TESTS_FAILED
+    assert json.loads(report_path.read_text())["regressions"][0]["limit_s"] == 4.0
+
+    monkeypatch.setenv("IT_PIPELINE", "bridge")
+    recorder = PhaseRecorder(str(baseline_path))
+    recorder.tests = {"t::a": {"visibility": 60.0}}
+    session = SimpleNamespace(exitstatus=0)
+    recorder.pytest_sessionfinish(session, pytest.ExitCode.OK)
+    assert session.exitstatus == 0 and recorder.unchecked.startswith("no local-bridge baseline")
@@ -0,0 +1,50 @@
+from provision import INDEX_TEMPLATES, ISM_POLICIES, _policy_view, composed, diff, flatten, template_for
+
+
+def test_error_indices_get_their_own_template():
+    assert template_for("sensors-errors-2025.09.24") == "gha-sensors-errors"
+    assert template_for("sensors-2025.09.24") == "gha-sensors"
+    assert template_for("it-sensors-2025.09.24") == "gha-it-sensors"
+    assert template_for("it-run-ab12-sensors") == "gha-it-sensors"
+    assert template_for("it-run-ab12-errors") == "gha-sensors-errors"
+    assert template_for("it-run-ab12-rollup-1h-2025") == "gha-sensors-rollup"
+
+
+def test_composed_template_has_strict_readings_and_keyword_sensor_id():
+    settings, mappings = composed("gha-it-sensors")
+    assert settings["index.refresh_interval"] == "1s"
+    assert settings["index.number_of_shards"] == "1"
+    assert mappings["dynamic"] is False
+    assert mappings["properties"]["sensor_id"]["type"] == "keyword"
+    assert mappings["properties"]["temperature_c"] == {"type": "float", "coerce": False}
+    _, error_mappings = composed("gha-sensors-errors")
+    assert "temperature_c" not in error_mappings["properties"]
+
+
+def test_diff_compares_the_way_opensearch_echoes_values():
+    desired = flatten({"dynamic": False, "properties": {"seq": {"type": "long"}}, "x": 1})
+    live = flatten({"dynamic": "false", "properties": {"seq": {"type": "long"}}, "x": "1", "extra": "ignored"})
+    assert diff(desired, live) == {}
+    assert diff(desired, {}) == {k: (v, None) for k, v in desired.items()}
+
+
+def test_policy_comparison_ignores_server_added_fields():
+    policy = ISM_POLICIES["gha-sensors"]["policy"]
+    live = dict(policy, policy_id="gha-sensors", last_updated_time=1, schema_version=17)
+    live["states"] = [
+        dict(state, actions=[dict(a, retry={"count": 3}) for a in state["actions"]]) for state in policy["states"]
+    ]
+    live["ism_template"] = [dict(policy["ism_template"][0], last_updated_time=1)]
+    assert _policy_view(live) == _policy_view(policy)
+
+
+def test_every_template_has_a_policy_for_its_patterns():
+    patterns = {p for spec in INDEX_TEMPLATES.values() for p in spec["index_patterns"]}
+    policy_patterns = {p for body in ISM_POLICIES.values() for t in body["policy"]["ism_template"] for p in t["index_patterns"]}
+    assert patterns == policy_patterns
+
+
+def test_no_policy_blocks_writes_to_old_indices():
+    actions = [a for body in ISM_POLICIES.values() for state in body["policy"]["states"] for a in state["actions"]]
+    assert {"force_merge": {"max_num_segments": 1}} in actions
+    assert not [a for a in actions if "read_only" in a]
@@ -0,0 +1,178 @@
+import json
+import queue
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlsplit
+
+import pytest
+
+import sensor_pipeline
+from registry import PocketBase, SensorRegistry, bench_ingest, build_table, read_dictionary
+
+COLLECTION = "sensor_registry"
+
+
+def record(sensor_id, greenhouse_id, title="Tomatoes"):
+    return {"sensor_id": sensor_id, "greenhouse_id": greenhouse_id, "greenhouse_title": title, "owner_id": "u1"}
+
+
+class FakePocketBase(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+
+    def log_message(self, format, *args):
+        pass
+
+    def _send(self, status, body):
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_GET(self):
+        pb = self.server
+        url = urlsplit(self.path)
+        if url.path == "/api/realtime":
+            self.send_response(200)
+            self.send_header("Content-Type", "text/event-stream")
+            self.end_headers()
+            self.wfile.write(b'id:c1\nevent:PB_CONNECT\ndata:{"clientId":"c1"}\n\n')
+            self.wfile.flush()
+            pb.subscribed.wait(5)
+            for change in iter(pb.changes.get, None):
+                self.wfile.write(f"event:{COLLECTION}/*\ndata:{json.dumps(change)}\n\n".encode())
+                self.wfile.flush()
+            return
+        with pb.lock:
+            pb.requests.append(self.path)
+        if pb.failing:
+            self._send(503, b'{"message": "unavailable"}')
+            return
+        params = parse_qs(url.query)
+        page, per_page = int(params["page"][0]), int(params["perPage"][0])
+        items = pb.records[(page - 1) * per_page:page * per_page]
+        self._send(200, json.dumps({"page": page, "perPage": per_page, "totalItems": -1, "items": items}).encode())
+
+    def do_POST(self):
+        body = json.loads(self.rfile.read(int(self.headers["Content-Length"])))
+        self.server.subscriptions.append(body)
+        self.server.subscribed.set()
+        self._send(204, b"")
+
+
+@pytest.fixture
+def pocketbase():
+    server = ThreadingHTTPServer(("127.0.0.1", 0), FakePocketBase)
+    server.daemon_threads = True
+    server.lock, server.requests, server.failing = threading.Lock(), [], False
+    server.records = [record("gh1-a", "gh1"), record("gh1-b", "gh1"), record("gh2-a", "gh2", "Peppers")]
+    server.subscribed, server.subscriptions, server.changes = threading.Event(), [], queue.Queue()
+    threading.Thread(target=server.serve_forever, args=(0.05,), daemon=True).start()
+    yield server
+    server.changes.put(None)
+    server.shutdown()
+    server.server_close()
+
+
+def source_for(pocketbase, page_size=500):
+    return PocketBase(f"http://127.0.0.1:{pocketbase.server_address[1]}", COLLECTION, page_size=page_size, timeout=5)
+
+
+class Clock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+
+@pytest.fixture
+def no_registry():
+    yield
+    sensor_pipeline.use_registry(None)
+
+
+def test_table_keeps_registered_sensors_only():
+    table = build_table([record(" gh1-a ", "gh1"), {"sensor_id": "orphan", "greenhouse_id": ""}, {"greenhouse_id": "x"},
+                         dict(record("gh2-a", "gh2"), greenhouse_title=None, created="2025-09-24")])
+    assert table == {"gh1-a": {"greenhouse_id": "gh1", "greenhouse_title": "Tomatoes", "owner_id": "u1"},
+                     "gh2-a": {"greenhouse_id": "gh2", "owner_id": "u1"}}
+
+
+def test_collection_is_read_in_pages(pocketbase):
+    pocketbase.records = [record(f"s{i}", "gh1") for i in range(5)]
+    source = source_for(pocketbase, page_size=2)
+    assert [r["sensor_id"] for r in source.records()] == [f"s{i}" for i in range(5)]
+    assert source.pages == 3 and all("skipTotal=1" in path for path in pocketbase.requests)
+
+
+def test_reload_swaps_the_table_and_writes_the_translate_dictionary(pocketbase, tmp_path):
+    path = str(tmp_path / "sensors.json")
+    registry = SensorRegistry(source_for(pocketbase).records, path=path)
+    assert registry.reload() and registry.version == 1 and len(registry) == 3
+    with open(path) as f:
+        assert json.loads(json.load(f)["gh2-a"])["greenhouse_title"] == "Peppers"
+    assert registry.reload() and registry.version == 1  # nothing changed, nothing rewritten
+
+    pocketbase.failing = True
+    assert not registry.reload()
+    assert registry.failures == 1 and registry.get("gh1-a")["greenhouse_id"] == "gh1"
+
+    restarted = SensorRegistry(source_for(pocketbase).records, path=path)
+    assert len(restarted) == 3 and restarted.version == 0  # warm start from the file
+    assert read_dictionary(str(tmp_path / "missing.json")) == {}
+
+
+def test_reload_is_due_once_the_ttl_runs_out(pocketbase):
+    clock = Clock()
+    registry = SensorRegistry(source_for(pocketbase).records, ttl=300, clock=clock)
+    assert registry.due_in() == 0.0
+    registry.reload()
+    clock.now += 200
+    assert registry.due_in() == 100.0
+    clock.now += 150
+    assert registry.due_in() == 0.0
+
+
+def test_a_realtime_change_triggers_one_bulk_reload(pocketbase):
+    registry = SensorRegistry(source_for(pocketbase).records, ttl=3600, debounce=0.1).start(source_for(pocketbase))
+    try:
+        assert pocketbase.subscribed.wait(5)
+        assert pocketbase.subscriptions[0] == {"clientId": "c1", "subscriptions": [f"{COLLECTION}/*"]}
+        assert registry.get("gh3-a") is None
+        pocketbase.records.append(record("gh3-a", "gh3"))
+        for action in ("create", "update"):
+            pocketbase.changes.put({"action": action, "record": record("gh3-a", "gh3")})
+        deadline = time.time() + 5
+        while registry.get("gh3-a") is None and time.time() < deadline:
+            time.sleep(0.02)
+        assert registry.get("gh3-a")["greenhouse_id"] == "gh3"
+        assert registry.invalidations == 2 and registry.reloads == 2
+    finally:
+        registry.stop(timeout=0.5)
+
+
+def test_readings_are_enriched_and_unknown_sensors_go_to_the_error_index(no_registry):
+    message = json.dumps({"Sensor ID": "{}", "temperature": 21.5, "humidity": 40, "light": 300,
+                          "timestamp": "2025-09-24T12:00:00Z"})
+    table = build_table([record("gh1-a", "gh1")])
+
+    sensor_pipeline.use_registry(table)
+    index, event = sensor_pipeline.process(message.replace("{}", "gh1-a"))
+    assert index == "sensors-2025.09.24" and event["greenhouse_id"] == "gh1" and event["owner_id"] == "u1"
+    index, event = sensor_pipeline.process(message.replace("{}", "nobody"))
+    assert index == "sensors-2025.09.24" and "greenhouse_id" not in event
+
+    sensor_pipeline.use_registry(table, required=True)
+    index, event = sensor_pipeline.process(message.replace("{}", "nobody"))
+    assert index == "sensors-errors-2025.09.24" and event["pipeline_errors"] == ["unknown_sensor"]
+    index, event = sensor_pipeline.process(message.replace("{}", "gh1-a").replace("21.5", '"warm"'))
+    assert event["pipeline_errors"] == ["invalid_temperature"] and event["greenhouse_id"] == "gh1"
+
+
+def test_bench_reports_both_paths_and_leaves_the_pipeline_alone(no_registry):
+    report = bench_ingest(greenhouses=3, sensors=4, readings=300, rounds=1)
+    assert report["sensors"] == 12 and report["plain_per_s"] > 0 and report["enriched_per_s"] > 0
+    assert sensor_pipeline.process(json.dumps({"Sensor ID": "x", "temperature": 1, "humidity": 1, "light": 1}))[1].get(
+        "greenhouse_id") is None
@@ -0,0 +1,33 @@
+from replay_errors import build_query, revalidate
+
+
+def test_raw_fields_are_used_when_the_message_is_gone():
+    doc = {
+        "@timestamp": "2025-09-20T08:00:00.000Z",
+        "sensor_id": "abc",
+        "temperature_raw": "21.5",
+        "humidity_raw": "40",
+        "light_raw": "1,5",
+        "tags": ["mqtt", "ingest_error"],
+        "pipeline_errors": ["invalid_light"],
+    }
+    index, recovered = revalidate(doc)
+    assert index == "sensors-2025.09.20"
+    assert recovered["@timestamp"] == "2025-09-20T08:00:00.000Z"
+    assert (recovered["temperature_c"], recovered["humidity_pct"], recovered["light"]) == (21.5, 40.0, 1.5)
+    assert recovered["tags"] == ["mqtt", "replayed"]
+    assert "pipeline_errors" not in recovered
+
+
+def test_still_invalid_documents_are_left_alone():
+    doc = {"@timestamp": "2025-09-20T08:00:00.000Z", "message": '{"Sensor ID": "abc", "temperature": "hot"}'}
+    assert revalidate(doc) is None
+
+
+def test_query_filters():
+    assert build_query() == {"match_all": {}}
+    query = build_query(since="now-7d", errors=["invalid_light"])
+    assert query["bool"]["filter"] == [
+        {"range": {"@timestamp": {"gte": "now-7d"}}},
+        {"terms": {"pipeline_errors": ["invalid_light"]}},
+    ]
@@ -0,0 +1,32 @@
+from rollup import align, bucket_doc, parse_duration, rollup_index
+
+
+def test_bucket_alignment_and_index_names():
+    assert align(1758355265123, 60_000) == 1758355260000
+    assert rollup_index("1m", 1758355260000) == "sensors-rollup-1m-2025.09"
+    assert rollup_index("1h", 1758355260000) == "sensors-rollup-1h-2025"
+    assert parse_duration("10m") == 600_000
+
+
+def test_minute_bucket_from_raw_stats():
+    stats = {"count": 2, "min": 20.0, "max": 22.0, "avg": 21.0, "sum": 42.0}
+    empty = {"count": 0, "min": None, "max": None, "avg": None, "sum": 0.0}
+    bucket = {"key": {"sensor_id": "a", "bucket": 1758355260000}, "doc_count": 2,
+              "temperature_c": stats, "humidity_pct": stats, "light": empty}
+    doc = bucket_doc("1m", bucket)
+    assert doc["@timestamp"] == "2025-09-20T08:01:00.000Z"
+    assert doc["temperature_c_avg"] == 21.0 and doc["temperature_c_count"] == 2
+    assert doc["light_count"] == 0 and "light_avg" not in doc
+
+
+def test_hour_bucket_weights_minutes_by_count():
+    def col(count, low, high, total):
+        return {"_count": {"value": count}, "_min": {"value": low}, "_max": {"value": high}, "_sum": {"value": total}}
+
+    bucket = {"key": {"sensor_id": "a", "bucket": 1758355200000}, "doc_count": 2, "readings": {"value": 4}}
+    for field in ("temperature_c", "humidity_pct", "light"):
+        for suffix, value in col(4, 10.0, 40.0, 70.0).items():
+            bucket[field + suffix] = value
+    doc = bucket_doc("1h", bucket)
+    assert doc["doc_count"] == 4
+    assert doc["temperature_c_avg"] == 17.5
@@ -0,0 +1,210 @@
+import json
+from datetime import datetime, timezone
+
+import pytest
+
+import sensor_pipeline
+from sensor_pipeline import process, process_batch, ruby_float_to_s, ruby_float_valid, ruby_to_f
+
+RECEIVED = datetime(2025, 9, 24, 12, 0, tzinfo=timezone.utc)
+
+
+def run(payload):
+    message = payload if isinstance(payload, str) else json.dumps(payload)
+    return process(message, RECEIVED)
+
+
+def test_valid_reading_is_coerced_and_routed_to_it_index():
+    index, event = run({"Sensor ID": "it-sensors-a", "temperature": 21, "humidity": "45%", "light": "1,5"})
+    assert index == "it-sensors-2025.09.24"
+    assert event["sensor_id"] == "it-sensors-a"
+    assert event["temperature_c"] == 21.0 and isinstance(event["temperature_c"], float)
+    assert event["humidity_pct"] == 45.0
+    assert event["light"] == 1.5
+    assert "message" not in event and "timestamp" not in event
+
+
+def test_production_sensor_goes_to_sensors_index():
+    index, _ = run({"Sensor ID": "abcdef", "temperature": 1, "humidity": 2, "light": 3})
+    assert index == "sensors-2025.09.24"
+
+
+def test_offset_fixup_sets_timestamp_in_utc():
+    index, event = run(
+        '{"Sensor ID": "abcdef", "timestamp":"2025-09-23T01:00:00Z+200", "temperature":23.0, "humidity": 60, "light": 5000}'
+    )
+    assert event["@timestamp"] == datetime(2025, 9, 22, 23, 0, tzinfo=timezone.utc)
+    assert index == "sensors-2025.09.22"
+
+
+def test_unparseable_timestamp_is_tagged_and_keeps_receive_time():
+    _, event = run({"Sensor ID": "a", "timestamp": "yesterday", "temperature": 1, "humidity": 2, "light": 3})
+    assert event["@timestamp"] == RECEIVED
+    assert "_dateparsefailure" in event["tags"]
+
+
+def test_missing_fields_go_to_error_index_with_raw_values():
+    index, event = run({"Sensor ID": "it-sensors-a", "temperature": "hot", "humidity": 45.2})
+    assert index == "sensors-errors-2025.09.24"
+    assert event["pipeline_errors"] == ["missing_light", "invalid_temperature"]
+    assert event["temperature_raw"] == "hot"
+    assert event["humidity_raw"] == "45.2"
+    assert "temperature_c" not in event and "humidity_pct" not in event
+    assert "ingest_error" in event["tags"]
+    assert "message" in event
+
+
+def test_invalid_json_reports_every_field_missing():
+    index, event = run('{"Sensor ID": "x", "temperature": 21,5}')
+    assert index.startswith("sensors-errors-")
+    assert event["pipeline_errors"] == ["missing_sensor_id", "missing_temperature", "missing_humidity", "missing_light"]
+
+
+@pytest.mark.parametrize(
+    "value,valid,coerced",
+    [
+        ("21.5", True, 21.5),
+        (" 21,5 ", True, 21.5),
+        ("1_000", True, 1000.0),
+        ("2.15e1", True, 21.5),
+        (".5", True, 0.5),
+        ("0x1A", True, 0.0),
+        ("21.", False, None),
+        ("NaN", False, None),
+        ("", False, None),
+        (True, False, None),
+        ([1], False, None),
+    ],
+)
+def test_ruby_numeric_semantics(value, valid, coerced):
+    assert ruby_float_valid(value) is valid
+    if valid:
+        assert ruby_to_f(value) == coerced
+
+
+@pytest.mark.parametrize(
+    "value,text",
+    [(21.5, "21.5"), (100.0, "100.0"), (1e-5, "1.0e-05"), (1e15, "1.0e+15"), (123456789012345.0, "123456789012345.0")],
+)
+def test_ruby_float_to_s(value, text):
+    assert ruby_float_to_s(value) == text
+
+
+def test_batch_preserves_order():
+    messages = [json.dumps({"Sensor ID": f"it-sensors-{i}", "temperature": i, "humidity": 1, "light": 1}) for i in range(50)]
+    results = process_batch(messages, RECEIVED)
+    assert [event["sensor_id"] for _, event in results] == [f"it-sensors-{i}" for i in range(50)]
+    assert {sensor_pipeline.index_family(index) for index, _ in results} == {"it-sensors"}
+
+
+def test_test_run_id_routes_to_run_scoped_indices():
+    index, _ = run({"Sensor ID": "x", "temperature": 1, "humidity": 2, "light": 3, "test_run_id": "ab12"})
+    assert index == "it-run-ab12-sensors"
+    index, _ = run({"Sensor ID": "x", "test_run_id": "ab12"})
+    assert index == "it-run-ab12-errors"
+    assert sensor_pipeline.index_family(index) == "it-run-errors"
+
+
+def test_malformed_test_run_id_falls_back_to_daily_indices():
+    index, _ = run({"Sensor ID": "it-sensors-a", "temperature": 1, "humidity": 2, "light": 3, "test_run_id": "../x"})
+    assert index == "it-sensors-2025.09.24"
+
+
+def test_beat_fields_are_copied_and_keep_their_tags():
+    fields = {"tags": ["mqtt", "ghanode"], "app": "ghanode_sensor"}
+    _, event = sensor_pipeline.process(json.dumps({"Sensor ID": "x"}), RECEIVED, fields)
+    assert event["app"] == "ghanode_sensor"
+    assert event["tags"] == ["mqtt", "ghanode", "ingest_error"]
+    assert fields["tags"] == ["mqtt", "ghanode"]
+
+
+def test_stage_stamps_match_logstash():
+    _, event = run({"Sensor ID": "a", "temperature": 1, "humidity": 2, "light": 3, "published_at": 1758715199.5})
+    stages = event["stages"]
+    assert stages["received"] == "2025-09-24T12:00:00.000Z"
+    assert stages["published"] == "2025-09-24T11:59:59.500Z"
+    assert stages["filter_in"] <= stages["filter_out"]
+    _, rejected = run({"Sensor ID": "a", "stages": "bogus", "published_at": "soon"})
+    assert set(rejected["stages"]) == {"filter_out"}
+
+
+def test_batch_envelope_becomes_one_event_per_reading():
+    envelope = {
+        "Sensor ID": "abcdef",
+        "test_run_id": "abc123",
+        "readings": [
+            {"temperature": 21.5, "humidity": "45%", "light": 3, "timestamp": "2025-09-24T10:00:00Z"},
+            {"Sensor ID": "other", "temperature": "hot", "humidity": 40, "light": 3},
+            {"temperature": 1e-05, "humidity": 40},
+        ],
+    }
+    pairs = sensor_pipeline.process_all(json.dumps(envelope), RECEIVED)
+    assert [index for index, _ in pairs] == ["it-run-abc123-sensors", "it-run-abc123-errors", "it-run-abc123-errors"]
+    first, second, third = (event for _, event in pairs)
+    assert first["sensor_id"] == "abcdef" and first["humidity_pct"] == 45.0
+    assert first["@timestamp"] == datetime(2025, 9, 24, 10, 0, tzinfo=timezone.utc)
+    assert "readings" not in first and "message" not in first
+    assert second["sensor_id"] == "other" and second["pipeline_errors"] == ["invalid_temperature"]
+    # Error documents keep the one-reading message, as LogStash::Json.dump writes it.
+    assert second["message"] == '{"Sensor ID":"other","test_run_id":"abc123","temperature":"hot","humidity":40,"light":3}'
+    assert third["pipeline_errors"] == ["missing_light"]
+    assert '"temperature":1.0E-5' in third["message"]
+    assert sensor_pipeline.process(second["message"], RECEIVED)[1]["pipeline_errors"] == ["invalid_temperature"]
+
+
+@pytest.mark.parametrize("readings", [[], "x", {"temperature": 1}])
+def test_malformed_batch_is_one_error_event(readings):
+    pairs = sensor_pipeline.process_all(json.dumps({"Sensor ID": "abcdef", "readings": readings}), RECEIVED)
+    assert len(pairs) == 1
+    index, event = pairs[0]
+    assert index == "sensors-errors-2025.09.24"
+    assert "_batchfailure" in event["tags"] and "readings" not in event
+
+
+def test_non_object_batch_entry_is_a_json_failure():
+    (_, event), = sensor_pipeline.process_all(json.dumps({"Sensor ID": "abcdef", "readings": [5]}), RECEIVED)
+    assert "_jsonparsefailure" in event["tags"]
+    assert event["message"] == "5"
+
+
+def test_single_event_helpers_refuse_a_batch():
+    with pytest.raises(ValueError):
+        run({"readings": [{"temperature": 1}, {"temperature": 2}]})
+
+
+@pytest.mark.parametrize(
+    "value, expected",
+    [(21.5, "21.5"), (300.0, "300.0"), (0.001, "0.001"), (1e7, "1.0E7"), (1.5e-5, "1.5E-5"), (-2.5e20, "-2.5E20"),
+     (0.0, "0.0")],
+)
+def test_java_double_to_s(value, expected):
+    assert sensor_pipeline.java_double_to_s(value) == expected
+
+
+@pytest.mark.parametrize(
+    "extra, expected",
+    [
+        ({"timestamp": "2025-09-24T12:00:00+0200"}, "abcdef:2025-09-24T10:00:00.000Z"),
+        ({"timestamp": "2025-09-24T12:00:00Z", "seq": 17}, "abcdef#17"),
+        ({"seq": 17.0}, None),
+        ({}, None),
+        ({"timestamp": "yesterday"}, None),
+    ],
+)
+def test_document_id_is_sensor_plus_seq_or_timestamp(extra, expected):
+    _, event = run({"Sensor ID": "abcdef", "temperature": 1, "humidity": 2, "light": 3, **extra})
+    assert sensor_pipeline.document_id(event) == expected
+    assert "@metadata" not in sensor_pipeline.to_document(event)
+
+
+def test_redelivered_error_document_keeps_its_id():
+    payload = {"Sensor ID": "abcdef", "temperature": "hot", "humidity": 2, "light": 3, "timestamp": "2025-09-24T12:00:00Z"}
+    first, again = run(payload)[1], run(payload)[1]
+    assert first["pipeline_errors"] == ["invalid_temperature"]
+    assert sensor_pipeline.document_id(first) == sensor_pipeline.document_id(again) == "abcdef:2025-09-24T12:00:00.000Z"
+
+
+def test_batch_readings_get_their_own_ids():
+    readings = [{"temperature": 1, "humidity": 2, "light": 3, "seq": i} for i in range(3)]
+    pairs = sensor_pipeline.process_all(json.dumps({"Sensor ID": "abcdef", "readings": readings}), RECEIVED)
+    assert [sensor_pipeline.document_id(event) for _, event in pairs] == ["abcdef#0", "abcdef#1", "abcdef#2"]
@@ -0,0 +1,30 @@
+from soak import analyse
+
+
+def synthetic(n=120, heap_leak=0.0, gc_ms_per_s=lambda i: 5.0, lost_per_s=0.0):
+    """Samples every 10 s of a sawtooth heap over a rising floor, and logstash forwarding all but ``lost_per_s``."""
+    samples, gc = [], 0.0
+    for i in range(n):
+        t = i * 10.0
+        gc += gc_ms_per_s(i) * 10
+        jvm = {"heap_used": 200e6 + heap_leak * t + (i % 5) * 40e6, "heap_max": 512e6, "gc_young_ms": gc, "gc_old_ms": 0}
+        events = int(10 * t)
+        samples.append({
+            "t": t, "published": events, "acked": events, "indexed": events - 10,
+            "logstash": dict(jvm, **{"in": events, "out": events - 5 - int(lost_per_s * t)}),
+        })
+    return samples
+
+
+def test_soak_analysis_flags_leaks_gc_and_backlogs():
+    assert analyse(synthetic())["flags"] == []
+    assert analyse(synthetic()[:10])["note"]
+
+    leaking = analyse(synthetic(heap_leak=100e3))["flags"]  # +120 MB over 20 minutes of a 512 MB heap
+    assert len(leaking) == 1 and leaking[0].startswith("logstash: heap floor grew")
+
+    thrashing = analyse(synthetic(gc_ms_per_s=lambda i: 5.0 if i < 60 else 80.0))["flags"]
+    assert len(thrashing) == 1 and thrashing[0].startswith("logstash: GC took")
+
+    falling_behind = analyse(synthetic(lost_per_s=1.0))["flags"]
+    assert len(falling_behind) == 1 and falling_behind[0].startswith("logstash in - out: backlog still growing")
@@ -0,0 +1,39 @@
+import math
+
+from latency import histogram, latency_summary
+from stage_report import StageStats, hop_durations
+
+
+def stamps(**offsets_ms):
+    return {stage: f"2025-09-24T12:00:{ms // 1000:02d}.{ms % 1000:03d}Z" for stage, ms in offsets_ms.items()}
+
+
+def test_hops_need_both_stamps():
+    hops = hop_durations(stamps(received=0, filter_in=40, filter_out=42, indexed=1100))
+    assert hops == {
+        "filebeat->logstash": 0.04,
+        "logstash filter": 0.002,
+        "output+ingest": 1.058,
+        "pipeline": 1.1,
+    }
+
+
+def test_stats_group_by_sensor_and_hour_and_count_skew():
+    stats = StageStats()
+    stats.add({"sensor_id": "a", "stages": stamps(published=500, received=100, indexed=900)})
+    stats.add({"sensor_id": "b", "stages": stamps(published=0, received=100, indexed=300)})
+    stats.add({"sensor_id": "c"})
+    report = stats.report()
+    assert (report["docs"], report["unstamped"]) == (3, 1)
+    assert report["all"]["publish->filebeat"]["negative"] == 1
+    assert report["by_sensor"]["b"]["end to end"]["max"] == 0.3
+    assert list(report["by_hour"]) == ["2025-09-24T12:00Z"]
+
+
+def test_summary_and_histogram():
+    values = [0.001 * i for i in range(1, 101)]
+    summary = latency_summary(values)
+    assert (summary["count"], summary["p50"], summary["p99"], summary["max"]) == (100, 0.05, 0.099, 0.1)
+    buckets = dict(histogram(values + [5000]))
+    assert buckets[0.001] == 1 and buckets[0.1] == 50 and buckets[math.inf] == 1
+    assert sum(buckets.values()) == 101
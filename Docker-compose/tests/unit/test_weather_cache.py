@@ -0,0 +1,150 @@
+import http.client
+import json
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlsplit
+
+import pytest
+
+from weather_cache import WeatherCache, WeatherServer, cache_key, fresh_for, snap
+
+FORECAST = "/v1/forecast"
+QUERY = "latitude=47.406525&longitude=18.938877&current=temperature_2m"
+
+
+class FakeOpenMeteo(BaseHTTPRequestHandler):
+    def log_message(self, format, *args):
+        pass
+
+    def do_GET(self):
+        upstream = self.server
+        with upstream.lock:
+            upstream.requests.append(self.path)
+            n = len(upstream.requests)
+        time.sleep(upstream.delay)
+        if upstream.failing:
+            self.send_response(503)
+            self.send_header("Content-Length", "0")
+            self.end_headers()
+            return
+        params = parse_qs(urlsplit(self.path).query)
+        body = json.dumps({
+            "latitude": float(params["latitude"][0]),
+            "current": {"time": "2025-09-24T12:00", "interval": 900, "temperature_2m": 20.0 + n},
+        }).encode()
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+
+@pytest.fixture
+def upstream():
+    server = ThreadingHTTPServer(("127.0.0.1", 0), FakeOpenMeteo)
+    server.daemon_threads = True
+    server.lock, server.requests, server.delay, server.failing = threading.Lock(), [], 0.0, False
+    threading.Thread(target=server.serve_forever, args=(0.05,), daemon=True).start()
+    yield server
+    server.shutdown()
+    server.server_close()
+
+
+class Clock:
+    def __init__(self, now):
+        self.now = now
+
+    def __call__(self):
+        return self.now
+
+
+# 12:00 reading, next one due at 12:15, published a minute later.
+T0 = 1758715200.0
+
+
+@pytest.fixture
+def cache(upstream):
+    return WeatherCache(f"http://127.0.0.1:{upstream.server_address[1]}", grid=0.01, ttl=900, stale=600,
+                        publish_lag=60, timeout=5, clock=Clock(T0 + 60))
+
+
+def temperature(entry):
+    return json.loads(entry.body)["current"]["temperature_2m"]
+
+
+def test_coordinates_snap_to_the_grid():
+    assert snap("47.406525", 0.01) == "47.41" and snap("18.938877", 0.25) == "19"
+    assert cache_key(FORECAST, "longitude=18.9412&latitude=47.4071&current=x", 0.01) == cache_key(FORECAST, QUERY.replace(
+        "temperature_2m", "x"), 0.01)
+    assert cache_key(FORECAST, "latitude=abc&longitude=1", 0.01) is None
+
+
+def test_freshness_follows_the_update_interval():
+    body = json.dumps({"current": {"time": "2025-09-24T12:00", "interval": 900}})
+    assert fresh_for(body, T0 + 60, ttl=900, publish_lag=60) == 900
+    assert fresh_for(body, T0 + 600, ttl=900, publish_lag=60) == 360
+    assert fresh_for(body, T0 + 3600, ttl=900, publish_lag=60, min_ttl=60) == 60
+    assert fresh_for(b"{}", T0, ttl=300, publish_lag=60) == 300
+
+
+def test_hit_after_miss_and_upstream_gets_rounded_coordinates(cache, upstream):
+    entry, outcome = cache.get(FORECAST, QUERY)
+    assert outcome == "miss" and entry.status == 200
+    assert cache.get(FORECAST, QUERY.replace("47.406525", "47.4071"))[1] == "hit"
+    assert len(upstream.requests) == 1 and "latitude=47.41" in upstream.requests[0]
+
+
+def test_concurrent_misses_share_one_upstream_request(cache, upstream):
+    upstream.delay = 0.2
+    with ThreadPoolExecutor(20) as pool:
+        results = list(pool.map(lambda _: cache.get(FORECAST, QUERY), range(20)))
+    assert len(upstream.requests) == 1
+    assert sorted(outcome for _, outcome in results).count("coalesced") == 19
+    assert {temperature(entry) for entry, _ in results} == {21.0}
+
+
+def test_stale_is_served_while_one_refresh_runs(cache, upstream):
+    cache.get(FORECAST, QUERY)
+    cache.clock.now = T0 + 1000  # past 12:16, within the stale window
+    upstream.delay = 0.2
+    entry, outcome = cache.get(FORECAST, QUERY)
+    assert (outcome, temperature(entry)) == ("stale", 21.0)
+    assert cache.get(FORECAST, QUERY)[1] == "stale"
+    deadline = time.time() + 5
+    while cache.get(FORECAST, QUERY)[1] != "hit" and time.time() < deadline:
+        time.sleep(0.02)
+    assert temperature(cache.get(FORECAST, QUERY)[0]) == 22.0
+    assert len(upstream.requests) == 2
+
+
+def test_upstream_failure_falls_back_to_stale_and_is_not_cached(cache, upstream):
+    upstream.failing = True
+    assert cache.get(FORECAST, QUERY)[0].status == 503
+    upstream.failing = False
+    cache.get(FORECAST, QUERY)
+    cache.clock.now = T0 + 5000  # beyond the stale window
+    upstream.failing = True
+    entry, outcome = cache.get(FORECAST, QUERY)
+    assert (entry.status, outcome) == (200, "stale")
+
+
+def test_http_headers_and_stats(cache, upstream):
+    server = WeatherServer(("127.0.0.1", 0), cache)
+    threading.Thread(target=server.serve_forever, args=(0.05,), daemon=True).start()
+    conn = http.client.HTTPConnection(*server.server_address, timeout=5)
+    try:
+        for expected in ("MISS", "HIT"):
+            conn.request("GET", f"{FORECAST}?{QUERY}")
+            response = conn.getresponse()
+            response.read()
+            assert response.status == 200 and response.headers["X-Cache"] == expected
+        conn.request("GET", "/stats")
+        stats = json.loads(conn.getresponse().read())
+    finally:
+        conn.close()
+        server.shutdown()
+        server.server_close()
+    assert (stats["requests"], stats["hit"], stats["miss"], stats["upstream"]) == (2, 1, 1, 1)
+    assert stats["hit_rate"] == 0.5 and stats["serve_ms"]["count"] == 2